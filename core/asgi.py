@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Periodic CMMS jobs run in the web server process (opt out with CMMS_JOB_QUEUE_AUTOSTART = False
+# and run `manage.py run_job_queue` instead). Only server entry points load this module, so
+# management commands, shells and test runs never start the queue.
+from maintenance.tasks import start_maintenance_tasks  # noqa: E402
+
+start_maintenance_tasks()
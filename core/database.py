@@ -0,0 +1,197 @@
+"""
+Database configuration and read-replica routing.
+
+DATABASES is built from environment variables so one settings file serves the
+single-box SQLite install and a PostgreSQL deployment:
+
+* SQLite (the default): WAL journal, a busy timeout instead of failing at once
+  with "database is locked", and BEGIN IMMEDIATE so a transaction takes the
+  write lock up front rather than failing when it upgrades from a read.
+* PostgreSQL (DB_ENGINE=postgresql): persistent connections with health checks,
+  or a psycopg connection pool with DB_POOL=1 (needs ``psycopg[pool]``). When
+  DB_REPLICA_HOST is set a "replica" alias is added, and GET requests to the
+  dashboard/report paths read from it through ReplicaRouter.
+
+Nothing here imports a database driver; the engine is only loaded when Django
+opens the first connection.
+"""
+
+import contextvars
+import os
+import re
+from contextlib import contextmanager
+
+DEFAULT_ALIAS = 'default'
+REPLICA_ALIAS = 'replica'
+
+# Pragmas applied on every new SQLite connection (journal_mode is persistent in
+# the file, the rest are per connection)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # safe with WAL: only the last commits can be lost on power failure
+    'cache_size': -20000,  # negative = KiB, so ~20 MB of page cache per connection
+    'temp_store': 'MEMORY',
+    'mmap_size': 128 * 1024 * 1024,
+}
+
+# Requests served from the replica (regexes on request.path, GET/HEAD only)
+DEFAULT_REPLICA_PATHS = [
+    r'^/maintenance/dashboard/',
+    r'/export-report/$',
+]
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+def _env(name, default=None, env=None):
+    value = (env if env is not None else os.environ).get(name)
+    return default if value in (None, '') else value
+
+
+def _env_int(name, default, env=None):
+    return int(_env(name, default, env))
+
+
+def _env_bool(name, default=False, env=None):
+    value = _env(name, None, env)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def sqlite_options(timeout=20, transaction_mode='IMMEDIATE', **pragmas):
+    """OPTIONS for the sqlite3 backend; pragma overrides replace SQLITE_PRAGMAS entries (None drops one)"""
+    values = {**SQLITE_PRAGMAS, **pragmas}
+    init_command = ';'.join(f'PRAGMA {name}={value}' for name, value in values.items() if value is not None)
+    options = {'timeout': timeout, 'init_command': init_command}
+    if transaction_mode:
+        options['transaction_mode'] = transaction_mode
+    return options
+
+
+def _sqlite_settings(base_dir, env):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _env('DB_NAME', base_dir / 'db.sqlite3', env),
+        'OPTIONS': sqlite_options(
+            timeout=_env_int('SQLITE_BUSY_TIMEOUT', 20, env),
+            transaction_mode=_env('SQLITE_TRANSACTION_MODE', 'IMMEDIATE', env),
+            journal_mode=_env('SQLITE_JOURNAL_MODE', SQLITE_PRAGMAS['journal_mode'], env),
+            synchronous=_env('SQLITE_SYNCHRONOUS', SQLITE_PRAGMAS['synchronous'], env),
+        ),
+    }
+
+
+def _postgresql_settings(env, prefix='DB_', fallback=None):
+    fallback = fallback or {}
+
+    def value(name, default=None):
+        return _env(f'{prefix}{name}', fallback.get(name, default), env)
+
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': value('NAME', 'hms'),
+        'USER': value('USER', 'hms'),
+        'PASSWORD': value('PASSWORD', ''),
+        'HOST': value('HOST', 'localhost'),
+        'PORT': value('PORT', '5432'),
+        'OPTIONS': {'connect_timeout': _env_int('DB_CONNECT_TIMEOUT', 10, env)},
+    }
+    if _env_bool('DB_POOL', False, env):
+        # Django's built-in psycopg 3 pool; CONN_MAX_AGE must stay 0 with it
+        config['OPTIONS']['pool'] = {
+            'min_size': _env_int('DB_POOL_MIN_SIZE', 5, env),
+            'max_size': _env_int('DB_POOL_MAX_SIZE', 15, env),
+            'timeout': _env_int('DB_POOL_TIMEOUT', 30, env),
+            'max_lifetime': _env_int('DB_POOL_MAX_LIFETIME', 3600, env),
+        }
+        config['CONN_MAX_AGE'] = 0
+    else:
+        config['CONN_MAX_AGE'] = _env_int('DB_CONN_MAX_AGE', 60, env)
+        config['CONN_HEALTH_CHECKS'] = True
+    return config
+
+
+def database_settings(base_dir, env=None):
+    """The DATABASES setting for the current environment"""
+    engine = _env('DB_ENGINE', 'sqlite', env).lower()
+    if engine in ('sqlite', 'sqlite3'):
+        return {DEFAULT_ALIAS: _sqlite_settings(base_dir, env)}
+    if engine not in ('postgres', 'postgresql'):
+        raise ValueError(f"Unsupported DB_ENGINE {engine!r} (use sqlite or postgresql)")
+
+    default = _postgresql_settings(env)
+    databases = {DEFAULT_ALIAS: default}
+    if _env('DB_REPLICA_HOST', None, env):
+        fields = ('NAME', 'USER', 'PASSWORD', 'PORT')
+        replica = _postgresql_settings(env, prefix='DB_REPLICA_', fallback={name: default[name] for name in fields})
+        # tests run against the primary only
+        replica['TEST'] = {'MIRROR': DEFAULT_ALIAS}
+        databases[REPLICA_ALIAS] = replica
+    return databases
+
+
+# ────────────────────────────  Routing  ────────────────────────────
+
+@contextmanager
+def use_replica(enabled=True):
+    """Send ORM reads in this block to the replica (when one is configured)"""
+    token = _use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_configured():
+    from django.conf import settings
+
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class ReplicaRouter:
+    """
+    Reads go to the replica only inside use_replica(), and never while the
+    primary has an open transaction (so a view reads its own writes).
+    Every write goes to the primary, including saves of rows loaded from the replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or not replica_configured():
+            return None
+        from django.db import connections
+
+        if connections[DEFAULT_ALIAS].in_atomic_block:
+            return DEFAULT_ALIAS
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_ALIAS, REPLICA_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Serve GET/HEAD requests to the DATABASE_REPLICA_PATHS from the replica"""
+
+    def __init__(self, get_response):
+        from django.conf import settings
+
+        self.get_response = get_response
+        paths = getattr(settings, 'DATABASE_REPLICA_PATHS', DEFAULT_REPLICA_PATHS)
+        self.patterns = [re.compile(path) for path in paths]
+
+    def __call__(self, request):
+        routed = request.method in ('GET', 'HEAD') and any(pattern.search(request.path) for pattern in self.patterns)
+        if not routed:
+            return self.get_response(request)
+        with use_replica():
+            return self.get_response(request)
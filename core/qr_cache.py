@@ -0,0 +1,84 @@
+"""
+Content-addressed cache of rendered QR images.
+
+An image is fully determined by (format, render parameters, payload), so its
+sha256 is both the cache key and the HTTP ETag. Entries live in a per-process
+LRU bounded by total bytes; a miss just renders again, so nothing has to be
+written to disk or invalidated when tokens are regenerated.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .qr_render import render_png, render_svg
+
+# Bump when the image parameters in qr_render change, so clients refetch
+RENDER_VERSION = 1
+
+FORMATS = {
+    'png': ('image/png', render_png),
+    'svg': ('image/svg+xml', render_svg),
+}
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+def image_digest(payload, fmt='png'):
+    return hashlib.sha256(f"{RENDER_VERSION}:{fmt}:{payload}".encode()).hexdigest()
+
+
+class QRImageCache:
+    """LRU of digest -> image bytes, bounded by the sum of image sizes"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _limit(self):
+        if self.max_bytes is not None:
+            return self.max_bytes
+        return getattr(settings, 'QR_IMAGE_CACHE_BYTES', DEFAULT_MAX_BYTES)
+
+    def get(self, payload, fmt='png'):
+        """Returns (digest, content_type, image bytes), rendering on a miss"""
+        content_type, render = FORMATS[fmt]
+        digest = image_digest(payload, fmt)
+        with self._lock:
+            image = self._entries.get(digest)
+            if image is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return digest, content_type, image
+            self.misses += 1
+
+        # render outside the lock; two threads racing on one miss both render the same bytes
+        image = render(payload)
+        with self._lock:
+            if digest not in self._entries:
+                self._entries[digest] = image
+                self._size += len(image)
+            limit = self._limit()
+            while self._size > limit and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return digest, content_type, image
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+
+image_cache = QRImageCache()
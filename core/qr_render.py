@@ -0,0 +1,264 @@
+"""
+Batched QR image rendering, off the save path.
+
+QRCodeMixin models only store qr_token; their images are rendered on request
+by the content-addressed cache in core.qr_cache. Models that still keep a
+stored QR image (the laboratory ones) register with register_target(): rows
+whose image field is empty are the render queue, and render_pending() picks
+them up in pk-ordered batches, renders the PNGs (in a process pool for large
+batches), writes them to storage and stores the paths with one bulk_update
+per batch. The 'qr_render' job in maintenance.job_queue runs it periodically
+and saves nudge it to run soon; ensure_qr_image() renders a single row on
+first download.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import qrcode
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 200
+# Below this many images a pool costs more to start than it saves
+POOL_THRESHOLD = 64
+
+# "app_label.model_name" -> {'field', 'payload', 'filename'}
+QR_TARGETS = {}
+
+
+def register_target(model, field, payload, filename):
+    """
+    Register a model whose `field` holds a QR image.
+    payload(instance) gives the encoded text, filename(instance) the file name.
+    """
+    QR_TARGETS[model._meta.label_lower] = {
+        'model': model,
+        'field': field,
+        'payload': payload,
+        'filename': filename,
+    }
+
+
+def get_targets():
+    return dict(QR_TARGETS)
+
+
+def target_for_model(model):
+    return QR_TARGETS.get(model._meta.label_lower)
+
+
+def token_models():
+    """QRCodeMixin models by label; they need a token but no stored image"""
+    from .qr_utils import QRCodeMixin
+
+    return {
+        model._meta.label_lower: model
+        for model in apps.get_models()
+        if issubclass(model, QRCodeMixin)
+    }
+
+
+def assign_missing_tokens(labels=None, batch_size=None):
+    """
+    Tokens for QRCodeMixin rows that skipped post_save (bulk_create, raw SQL imports).
+    Returns {label: count}.
+    """
+    batch_size = batch_size or getattr(settings, 'QR_RENDER_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    assigned = {}
+    for label, model in token_models().items():
+        if labels and label not in labels:
+            continue
+        count = 0
+        last_pk = None
+        while True:
+            queryset = model._default_manager.filter(Q(qr_token__isnull=True) | Q(qr_token='')).order_by('pk')
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            instances = list(queryset[:batch_size])
+            if not instances:
+                break
+            last_pk = instances[-1].pk
+            for instance in instances:
+                instance.qr_token = instance.generate_qr_token()
+            model._default_manager.bulk_update(instances, ['qr_token'])
+            count += len(instances)
+        if count:
+            assigned[label] = count
+    return assigned
+
+
+def regenerate_tokens(queryset, batch_size=None):
+    """
+    Re-derive qr_token for every row of a QRCodeMixin queryset with one bulk_update
+    per batch. Images follow the token through the cache, so nothing is written to disk.
+    """
+    batch_size = batch_size or getattr(settings, 'QR_RENDER_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    model = queryset.model
+    count = 0
+    batch = []
+    for instance in queryset.order_by('pk').iterator(chunk_size=batch_size):
+        instance.qr_token = instance.generate_qr_token()
+        batch.append(instance)
+        if len(batch) >= batch_size:
+            model._default_manager.bulk_update(batch, ['qr_token'])
+            count += len(batch)
+            batch = []
+    if batch:
+        model._default_manager.bulk_update(batch, ['qr_token'])
+        count += len(batch)
+    return count
+
+
+def render_png(payload):
+    """Module level so process pools can pickle it"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_svg(payload):
+    """Vector version of render_png for print layouts"""
+    from qrcode.image.svg import SvgPathImage
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+        image_factory=SvgPathImage,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    buffer = BytesIO()
+    qr.make_image().save(buffer)
+    return buffer.getvalue()
+
+
+def pending_queryset(target):
+    field = target['field']
+    return target['model']._default_manager.filter(Q(**{field: ''}) | Q(**{f'{field}__isnull': True}))
+
+
+def _workers():
+    return getattr(settings, 'QR_RENDER_WORKERS', min(4, os.cpu_count() or 1))
+
+
+def _render_many(payloads, pool):
+    if pool is None or len(payloads) < POOL_THRESHOLD:
+        return [render_png(payload) for payload in payloads]
+    chunksize = max(1, len(payloads) // (_workers() * 4))
+    return list(pool.map(render_png, payloads, chunksize=chunksize))
+
+
+def _store(target, instances, images):
+    field = target['field']
+    for instance, image in zip(instances, images):
+        getattr(instance, field).save(target['filename'](instance), ContentFile(image), save=False)
+
+
+def render_batch(target, instances, pool=None):
+    """Render and store images for already-loaded rows with one bulk_update"""
+    ready = []
+    payloads = []
+    for instance in instances:
+        payload = target['payload'](instance)
+        if payload:
+            ready.append(instance)
+            payloads.append(payload)
+
+    _store(target, ready, _render_many(payloads, pool))
+    if ready:
+        target['model']._default_manager.bulk_update(ready, [target['field']])
+    return len(ready)
+
+
+def render_pending(labels=None, batch_size=None, workers=None, limit=None):
+    """
+    Assign missing tokens, then render every stored image that is still missing.
+    Returns {'tokens': {label: count}, 'rendered': {label: count}, 'total', 'seconds', 'per_second'}.
+    """
+    batch_size = batch_size or getattr(settings, 'QR_RENDER_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    workers = _workers() if workers is None else workers
+    targets = get_targets()
+    if labels:
+        targets = {label: target for label, target in targets.items() if label in labels}
+
+    started = time.perf_counter()
+    tokens = assign_missing_tokens(labels, batch_size)
+    rendered = {}
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and targets else None
+    try:
+        for label, target in targets.items():
+            count = 0
+            last_pk = None
+            while limit is None or count < limit:
+                queryset = pending_queryset(target).order_by('pk')
+                if last_pk is not None:
+                    queryset = queryset.filter(pk__gt=last_pk)
+                instances = list(queryset[:batch_size])
+                if not instances:
+                    break
+                last_pk = instances[-1].pk
+                try:
+                    count += render_batch(target, instances, pool)
+                except Exception as e:
+                    # one bad batch must not stop the rest; its rows stay pending
+                    logger.error(f"QR render failed for {label} after pk {last_pk}: {e}")
+            if count:
+                rendered[label] = count
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    seconds = time.perf_counter() - started
+    total = sum(rendered.values())
+    return {
+        'tokens': tokens,
+        'rendered': rendered,
+        'total': total,
+        'seconds': round(seconds, 3),
+        'per_second': round(total / seconds, 1) if seconds else 0,
+    }
+
+
+def ensure_qr_image(instance):
+    """
+    Lazy path for downloads: render this row's image now if the queue has not
+    reached it yet, and return the field file.
+    """
+    target = target_for_model(type(instance))
+    field_file = getattr(instance, target['field'])
+    if not field_file:
+        render_batch(target, [instance])
+        field_file = getattr(instance, target['field'])
+    return field_file
+
+
+def request_render():
+    """Ask the render job to run soon, once the current transaction commits"""
+    from django.db import transaction
+
+    def trigger():
+        try:
+            from maintenance.job_queue import trigger_job
+            trigger_job('qr_render')
+        except Exception as e:
+            logger.error(f"Could not trigger QR rendering: {e}")
+
+    transaction.on_commit(trigger)
@@ -1,7 +1,4 @@
 from django.db import models
-import qrcode
-from io import BytesIO
-from django.core.files.base import ContentFile
 from django.conf import settings
 from urllib.parse import urlencode
 from .secure_qr import SecureQRToken
@@ -9,7 +6,8 @@ from .secure_qr import SecureQRToken
 
 class QRCodeMixin(models.Model):
     """Mixin to add QR code generation functionality to models
-    Now uses secure tokens with HMAC signatures and full URL generation
+    Now uses secure tokens with HMAC signatures and full URL generation.
+    Only qr_token is needed; qr_code holds legacy stored images and is no longer written.
     """
     qr_code = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
     qr_token = models.CharField(max_length=200, unique=True, blank=True, null=True)
@@ -48,41 +46,26 @@ class QRCodeMixin(models.Model):
     
     def generate_qr_code(self, ephemeral=False, metadata=None):
         """
-        Generate QR code image with simple permanent token (no domain, no expiry)
+        Assign the permanent token (no domain, no expiry).
+        The image is not stored: qr_image_url renders it on request through
+        the content-addressed cache in core.qr_cache.
         """
-        # Generate simple token
         token = self.generate_qr_token(ephemeral=ephemeral, metadata=metadata)
-        
-        # Update the qr_token field (always permanent now)
-        if hasattr(self, 'qr_token'):
-            self.qr_token = token
-        
-        # Generate QR code image with just the token (no URL)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(token)  # Just the token: entity_type:hash
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to BytesIO
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        # Generate filename based on entity type and ID
-        entity_type = self.__class__.__name__.lower()
-        filename = f"{entity_type}_{self.pk}_qr.png"
-        
-        # Save to model's qr_code field
-        if hasattr(self, 'qr_code'):
-            self.qr_code.save(
-                filename,
-                ContentFile(buffer.getvalue()),
-                save=False
-            )
-        return self.qr_code
+        self.qr_token = token
+        return token
+
+    def qr_image_url(self, fmt='png'):
+        """URL of this entity's QR image; the token is the whole payload"""
+        from django.urls import reverse
+
+        if not self.qr_token:
+            return ''
+        return f"{reverse('general:qr_image', args=[fmt])}?{urlencode({'data': self.qr_token})}"
+
+    @property
+    def qr_png_url(self):
+        return self.qr_image_url('png')
+
+    @property
+    def qr_svg_url(self):
+        return self.qr_image_url('svg')
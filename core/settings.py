@@ -8,6 +8,8 @@ from pathlib import Path
 import os
 from django.urls import reverse_lazy
 
+from core.database import DEFAULT_REPLICA_PATHS, database_settings
+
 
 
 
@@ -93,6 +95,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.database.ReplicaRoutingMiddleware",
 ]
   
 
@@ -127,12 +130,13 @@ LOGIN_REDIRECT_URL   = reverse_lazy("superadmin:hospital_list")  # تم تغيي
 WSGI_APPLICATION = "core.wsgi.application"
 
 # ────────────────────────────  Database  ──────────────────────────────────
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
-}
+# SQLite (WAL + busy timeout) by default; DB_ENGINE=postgresql with DB_NAME/DB_USER/
+# DB_PASSWORD/DB_HOST/DB_PORT, DB_POOL=1 for a connection pool and DB_REPLICA_HOST
+# for a read replica. See core/database.py for every variable.
+DATABASES = database_settings(BASE_DIR)
+DATABASE_ROUTERS = ["core.database.ReplicaRouter"]
+# GET requests to these paths read from the replica when one is configured
+DATABASE_REPLICA_PATHS = DEFAULT_REPLICA_PATHS
 
 # ────────────────────────────  Password validation  ───────────────────────
 AUTH_PASSWORD_VALIDATORS = [
@@ -167,8 +171,10 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL  = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
-# Path to the ICD‑11 Excel sheet—used by manager/icd_cache.py
-ICD11_XLSX_PATH = BASE_DIR / "core" / "static" / "icd" / "icd11.xlsx"
+# Path to the ICD‑11 Excel sheet—used by manager/icd_search.py
+ICD11_XLSX_PATH = BASE_DIR / "static" / "icd11.xlsx"
+# Pickled search index, rebuilt automatically when the sheet changes
+ICD11_INDEX_PATH = BASE_DIR / "static" / "icd11.index.pickle"
 
 # ────────────────────────────  Misc  ──────────────────────────────────────
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
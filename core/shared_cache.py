@@ -0,0 +1,22 @@
+"""
+Whether the configured cache is shared between worker processes.
+
+Django's default cache is LocMemCache, which lives inside one process: a value
+set or deleted by one gunicorn worker is invisible to the others. Code that
+relies on the cache for cross-request state (counters, invalidation, pending
+writes) checks is_shared_cache() and falls back to the database or to
+per-request state when it returns False.
+"""
+
+from django.conf import settings
+
+PROCESS_LOCAL_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def is_shared_cache(alias='default'):
+    """True when CACHES[alias] is a backend every process sees (Redis, Memcached, database, file)"""
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    return bool(backend) and backend not in PROCESS_LOCAL_BACKENDS
@@ -0,0 +1,22 @@
+"""
+Arabic text normalisation shared by the search features.
+
+The unified search index (maintenance.search_index) and the ICD-11 autocomplete
+(manager.icd_search) both match queries against text with diacritics and
+tatweel removed and the alef, ta marbuta and ya variants folded into one form,
+so "مستشفى" finds "مستشفي" and "إشعة" finds "أشعة".
+
+Normalisation only deletes characters (ARABIC_MARKS) or maps one character to
+one character (ARABIC_LETTERS), so callers can walk the original text character
+by character to map normalised offsets back for highlighting.
+"""
+
+import re
+
+ARABIC_MARKS = re.compile(r'[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTERS = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ة': 'ه', 'ى': 'ي', 'ؤ': 'و', 'ئ': 'ي'})
+
+
+def normalize_arabic(text):
+    """Strip Arabic diacritics/tatweel and unify alef, ta marbuta and ya forms"""
+    return ARABIC_MARKS.sub('', str(text or '')).translate(ARABIC_LETTERS)
@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import download_qr_code
+from .views import download_entity_qr, download_qr_code, qr_image
 
 app_name = 'general'
 
 urlpatterns = [
     path('qr/<int:patient_id>/', download_qr_code, name='download_qr_code'),
-]
\ No newline at end of file
+    path('qr/image.<str:fmt>', qr_image, name='qr_image'),
+    path('qr/<str:label>/<int:pk>/', download_entity_qr, name='download_entity_qr'),
+]
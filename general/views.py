@@ -1,20 +1,100 @@
-import qrcode
-from io import BytesIO
-from django.http import HttpResponse
+import os
+
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+
+from core.qr_cache import FORMATS, image_cache, image_digest
+from core.qr_render import ensure_qr_image, get_targets, token_models
 
 from manager.models import Patient # type: ignore
 
+# Longest payload the render endpoint accepts (tokens and scan URLs are far shorter)
+MAX_QR_PAYLOAD = 512
+# A given (data, format) URL always yields the same bytes
+QR_MAX_AGE = 365 * 24 * 3600
+
+# Models whose QR can be downloaded by label, with the lookup to their hospital;
+# any other label is a 404
+QR_DOWNLOAD_HOSPITAL_LOOKUPS = {
+    'hr.customuser': 'hospital',
+    'manager.patient': 'hospital',
+    'manager.room': 'department__hospital',
+    'manager.bed': 'room__department__hospital',
+    'maintenance.device': 'department__hospital',
+    'maintenance.deviceaccessory': 'device__department__hospital',
+    'laboratory.labrequest': 'patient__hospital',
+    'laboratory.labrequestitem': 'request__patient__hospital',
+}
+
+
+def _qr_response(request, payload, fmt='png', filename=None):
+    # the digest is known before rendering, so a revalidation costs one hash
+    etag = f'"{image_digest(payload, fmt)}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        _, content_type, image = image_cache.get(payload, fmt)
+        response = HttpResponse(image, content_type=content_type)
+        if filename:
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=QR_MAX_AGE, immutable=True)
+    return response
+
 
 def download_qr_code(request, patient_id):
     patient = get_object_or_404(Patient, id=patient_id, hospital=request.user.hospital)
     patient_detail_url = request.build_absolute_uri(f"/patients/{patient.id}/")
-    qr = qrcode.QRCode(version=1, box_size=10, border=4)
-    qr.add_data(patient_detail_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill='black', back_color='white')
-    buffer = BytesIO()
-    img.save(buffer, format="PNG")
-    response = HttpResponse(buffer.getvalue(), content_type='image/png')
-    response['Content-Disposition'] = f'attachment; filename="patient_{patient.mrn}_qrcode.png"'
-    return response
+    return _qr_response(request, patient_detail_url, filename=f"patient_{patient.mrn}_qrcode.png")
+
+
+@login_required
+def qr_image(request, fmt):
+    """
+    Render ?data=<token or URL> as a PNG or SVG QR image.
+    Images come from a bounded content-addressed cache; the digest is the ETag,
+    so repeat requests are answered with 304 without rendering.
+    """
+    payload = request.GET.get('data', '')
+    if fmt not in FORMATS:
+        raise Http404("Unknown QR format")
+    if not payload or len(payload) > MAX_QR_PAYLOAD:
+        return HttpResponseBadRequest("data is required (max 512 characters)")
+
+    filename = f"qr.{fmt}" if request.GET.get('download') else None
+    return _qr_response(request, payload, fmt, filename)
+
+
+@login_required
+def download_entity_qr(request, label, pk):
+    """
+    QR image of any QR-enabled model ("manager.bed", "laboratory.labrequestitem", ...).
+    QRCodeMixin models are rendered from their token; models with a stored image are
+    rendered on first download if the background queue has not reached the row yet.
+    Only rows of the user's hospital are served.
+    """
+    lookup = QR_DOWNLOAD_HOSPITAL_LOOKUPS.get(label)
+    if lookup is None:
+        raise Http404("Unknown QR target")
+    if not request.user.hospital_id:
+        raise Http404("No hospital assigned to this user")
+    scope = {lookup: request.user.hospital_id}
+
+    model = token_models().get(label)
+    if model is not None:
+        instance = get_object_or_404(model, pk=pk, **scope)
+        if not instance.qr_token:
+            raise Http404("No QR token yet")
+        return _qr_response(request, instance.qr_token, filename=f"{model._meta.model_name}_{pk}_qr.png")
+
+    target = get_targets().get(label)
+    if target is None:
+        raise Http404("Unknown QR target")
+    instance = get_object_or_404(target['model'], pk=pk, **scope)
+    field_file = ensure_qr_image(instance)
+    return FileResponse(
+        field_file.open('rb'), as_attachment=True,
+        filename=os.path.basename(field_file.name), content_type='image/png',
+    )
@@ -5,8 +5,8 @@ from django.contrib.auth import get_user_model
 from .models import (
     Certificate, ProfessionalPracticePermit, HealthInsurance,
     ShiftType, WorkArea, Schedule, StaffDailyAvailability,
-    ShiftAssignment, ShiftSwapRequest, Attendance, DeductionType,
-    BonusType, Payroll, Deduction, Bonus, VacationPolicy,
+    ShiftAssignment, ShiftSwapRequest, Attendance, AttendanceDevice, DeductionType,
+    BonusType, Payroll, PayrollRun, Deduction, Bonus, VacationPolicy,
     VacationBalance, LeaveRequest, StaffTask
 )
 
@@ -120,12 +120,24 @@ class AttendanceAdmin(admin.ModelAdmin):
     list_filter = ['date']
     search_fields = ['staff__username', 'staff__first_name', 'staff__last_name']
 
+@admin.register(AttendanceDevice)
+class AttendanceDeviceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'ip_address', 'port', 'hospital', 'is_active', 'last_punch_at', 'last_synced_at', 'last_punch_count']
+    list_filter = ['is_active', 'hospital']
+    readonly_fields = ['last_synced_at', 'last_punch_count', 'last_error']
+
 @admin.register(Payroll)
 class PayrollAdmin(admin.ModelAdmin):
     list_display = ['staff', 'period_start', 'period_end', 'base_salary', 'net_salary']
     list_filter = ['period_start']
     search_fields = ['staff__username', 'staff__first_name', 'staff__last_name']
 
+@admin.register(PayrollRun)
+class PayrollRunAdmin(admin.ModelAdmin):
+    list_display = ['period_start', 'period_end', 'hospital', 'staff_count', 'created_count', 'updated_count', 'seconds', 'created_at']
+    list_filter = ['period_start', 'hospital']
+    readonly_fields = ['timings', 'seconds', 'created_at']
+
 @admin.register(LeaveRequest)
 class LeaveRequestAdmin(admin.ModelAdmin):
     list_display = ['staff', 'leave_type', 'start_date', 'end_date', 'status']
@@ -0,0 +1,107 @@
+"""
+Bulk attendance delay/absence re-evaluation.
+
+Attendance.calculate_delay reads SystemSettings, joins the shift type and
+saves, once per row. Re-evaluating a period (e.g. after the delay allowance
+changes) instead loads the settings and every shift type's start time once,
+streams the period's rows as plain tuples, recomputes the flags in memory
+with Attendance.delay_flags and writes only the rows that changed, with
+bulk_update.
+"""
+import logging
+import time
+
+from django.db import transaction
+
+from superadmin.models import SystemSettings
+
+from .models import Attendance, ShiftType
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+EVAL_FIELDS = ['is_absent', 'is_delayed', 'delay_minutes']
+
+
+def attendance_rows(period_start, period_end, hospital=None, staff_ids=None, include_absent=False):
+    """
+    (pk, date, entry_time, flags, shift_type_id, attendance_method, role) for rows the
+    delay rules apply to. Absent rows are skipped unless include_absent, as in calculate_delay.
+    """
+    rows = Attendance.objects.filter(
+        date__range=[period_start, period_end],
+        entry_time__isnull=False,
+        shift_assignment__isnull=False,
+    )
+    if not include_absent:
+        rows = rows.filter(is_absent=False)
+    if hospital is not None:
+        rows = rows.filter(staff__hospital=hospital)
+    if staff_ids is not None:
+        rows = rows.filter(staff_id__in=staff_ids)
+    return rows.values_list(
+        'pk', 'date', 'entry_time', 'is_absent', 'is_delayed', 'delay_minutes',
+        'shift_assignment__shift_type_id', 'staff__attendance_method', 'staff__role',
+    ).order_by('pk')
+
+
+def evaluate_row(row, shift_starts, system_settings):
+    """New (is_absent, is_delayed, delay_minutes) for a row from attendance_rows."""
+    _, day, entry_time, _, _, _, shift_type_id, attendance_method, role = row
+    method = attendance_method or system_settings.default_attendance_method
+    if method == 'kpi' and role == 'doctor':
+        # Placeholder, same as Attendance.apply_delay_rules
+        return False, False, 0
+    return Attendance.delay_flags(
+        entry_time, day, shift_starts[shift_type_id], system_settings.delay_allowance_minutes,
+    )
+
+
+def reevaluate_attendance(period_start, period_end, hospital=None, staff_ids=None,
+                          include_absent=False, dry_run=False, batch_size=None):
+    """
+    Recompute delay/absence flags for a date range and bulk-update the rows that changed.
+
+    include_absent also re-evaluates rows already marked absent (which calculate_delay
+    never revisits), so raising the allowance can clear absences the rules set.
+    Returns {'rows', 'changed', 'delayed', 'absent', 'seconds', 'rows_per_second',
+    'changed_per_second', 'dry_run'}.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    started = time.monotonic()
+    result = {'rows': 0, 'changed': 0, 'delayed': 0, 'absent': 0, 'dry_run': dry_run}
+
+    system_settings = SystemSettings.objects.first()
+    if system_settings is not None:
+        shift_starts = dict(ShiftType.objects.values_list('pk', 'start_time'))
+        pending = []
+
+        def flush():
+            if pending and not dry_run:
+                with transaction.atomic():
+                    Attendance.objects.bulk_update(pending, EVAL_FIELDS, batch_size=batch_size)
+            pending.clear()
+
+        for row in attendance_rows(period_start, period_end, hospital, staff_ids, include_absent).iterator(
+            chunk_size=batch_size,
+        ):
+            result['rows'] += 1
+            flags = evaluate_row(row, shift_starts, system_settings)
+            result['absent'] += flags[0]
+            result['delayed'] += flags[1]
+            if flags != row[3:6]:
+                result['changed'] += 1
+                pending.append(Attendance(pk=row[0], is_absent=flags[0], is_delayed=flags[1], delay_minutes=flags[2]))
+                if len(pending) >= batch_size:
+                    flush()
+        flush()
+
+    result['seconds'] = time.monotonic() - started
+    result['rows_per_second'] = result['rows'] / result['seconds'] if result['seconds'] else 0
+    result['changed_per_second'] = result['changed'] / result['seconds'] if result['seconds'] else 0
+    logger.info(
+        f"Attendance {period_start} to {period_end}: {result['changed']} of {result['rows']} rows changed "
+        f"in {result['seconds']:.2f}s ({result['changed_per_second']:.0f} changed/s)"
+    )
+    return result
@@ -499,6 +499,31 @@ class PayrollForm(forms.ModelForm):
         return cleaned_data
 
 
+class PayrollRunForm(forms.Form):
+    period_start = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        label="Period Start"
+    )
+    period_end = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        label="Period End"
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        label="Preview only (do not save)"
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        period_start = cleaned_data.get('period_start')
+        period_end = cleaned_data.get('period_end')
+        if period_start and period_end and period_end < period_start:
+            raise forms.ValidationError("End date cannot be before start date.")
+        return cleaned_data
+
+
 class DeductionTypeForm(forms.ModelForm):
     class Meta:
         model = DeductionType
@@ -0,0 +1,54 @@
+"""
+Background ZKTeco attendance ingestion.
+Usage: python manage.py ingest_zkteco [--device ID] [--hospital ID] [--loop] [--interval 60]
+
+Each poll reads only punches newer than the device's high-water mark and
+upserts them in bulk, so it is safe to run as often as needed.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from hr.models import AttendanceDevice
+from hr.zkteco_ingest import ingest_all
+
+
+class Command(BaseCommand):
+    help = 'Ingest new attendance punches from ZKTeco terminals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', type=int, action='append', help='Only this device id (repeatable)')
+        parser.add_argument('--hospital', type=int, default=None, help='Only devices of this hospital id')
+        parser.add_argument('--loop', action='store_true', help='Keep polling until interrupted')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            self._poll(options)
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
+
+    def _poll(self, options):
+        devices = AttendanceDevice.objects.filter(is_active=True).order_by('pk')
+        if options['device']:
+            devices = devices.filter(pk__in=options['device'])
+        if options['hospital'] is not None:
+            devices = devices.filter(hospital_id=options['hospital'])
+
+        results = ingest_all(devices=devices)
+        if not results:
+            self.stdout.write(self.style.WARNING('No active devices'))
+        for result in results:
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f"{result['device']}: {result['error']}"))
+                continue
+            rate = result['new'] / result['seconds'] if result['seconds'] else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"{result['device']}: {result['new']} new of {result['read']} punches "
+                f"({result['unknown']} unknown), {result['created']} created, {result['updated']} updated "
+                f"in {result['seconds']:.2f}s ({rate:.0f} punches/s)"
+            ))
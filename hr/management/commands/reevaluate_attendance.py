@@ -0,0 +1,57 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hr.attendance_eval import reevaluate_attendance
+from superadmin.models import Hospital
+
+
+class Command(BaseCommand):
+    help = 'Recompute attendance delay/absence flags for a date range in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period_start', help='First day (YYYY-MM-DD)')
+        parser.add_argument('period_end', help='Last day (YYYY-MM-DD)')
+        parser.add_argument('--hospital', type=int, default=None, help='Only staff of this hospital id')
+        parser.add_argument(
+            '--include-absent',
+            action='store_true',
+            help='Also re-evaluate rows already marked absent (e.g. after raising the delay allowance)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Count the changes without saving them')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per read chunk and bulk update')
+
+    def handle(self, *args, **options):
+        try:
+            period_start = date.fromisoformat(options['period_start'])
+            period_end = date.fromisoformat(options['period_end'])
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+        if period_end < period_start:
+            raise CommandError('period_end cannot be before period_start')
+
+        hospital = None
+        if options['hospital'] is not None:
+            try:
+                hospital = Hospital.objects.get(pk=options['hospital'])
+            except Hospital.DoesNotExist:
+                raise CommandError(f"Hospital {options['hospital']} does not exist")
+
+        result = reevaluate_attendance(
+            period_start, period_end,
+            hospital=hospital,
+            include_absent=options['include_absent'],
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - nothing was saved'))
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['changed']} of {result['rows']} rows changed "
+            f"({result['delayed']} delayed, {result['absent']} absent)"
+        ))
+        self.stdout.write(
+            f"Timing: {result['seconds']:.3f}s, {result['rows_per_second']:.0f} rows/s, "
+            f"{result['changed_per_second']:.0f} changed rows/s"
+        )
@@ -0,0 +1,72 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hr.payroll import run_payroll
+from superadmin.models import Hospital
+
+
+class Command(BaseCommand):
+    help = 'Compute payroll for every eligible staff member for a period in one batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period_start', help='First day of the period (YYYY-MM-DD)')
+        parser.add_argument('period_end', help='Last day of the period (YYYY-MM-DD)')
+        parser.add_argument(
+            '--hospital',
+            type=int,
+            default=None,
+            help='Only staff of this hospital id (default: all hospitals)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Compute and print the preview without saving anything',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Rows per bulk insert/update statement',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            period_start = date.fromisoformat(options['period_start'])
+            period_end = date.fromisoformat(options['period_end'])
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+
+        hospital = None
+        if options['hospital'] is not None:
+            try:
+                hospital = Hospital.objects.get(pk=options['hospital'])
+            except Hospital.DoesNotExist:
+                raise CommandError(f"Hospital {options['hospital']} does not exist")
+
+        try:
+            report = run_payroll(
+                period_start, period_end,
+                hospital=hospital,
+                dry_run=options['dry_run'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - nothing was saved'))
+            for row in report['rows']:
+                self.stdout.write(
+                    f"  {row['staff']}: base {row['base_salary']} + bonuses {row['bonuses']} "
+                    f"- deductions {row['deductions']} - delays {row['delay_deductions']} "
+                    f"- absences {row['absence_deductions']} = {row['net_salary']} ({row['status']})"
+                )
+
+        timings = ', '.join(f'{phase} {seconds:.3f}s' for phase, seconds in report['timings'].items())
+        rate = report['staff'] / report['seconds'] if report['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['staff']} staff: {report['created']} created, {report['updated']} updated, "
+            f"{report['unchanged']} unchanged, total net {report['total_net']}"
+        ))
+        self.stdout.write(f"Timing: {timings}, total {report['seconds']:.3f}s ({rate:.0f} staff/s)")
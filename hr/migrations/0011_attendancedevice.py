@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0010_payrollrun'),
+        ('superadmin', '0002_systemsettings_default_attendance_method'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('ip_address', models.CharField(max_length=100)),
+                ('port', models.PositiveIntegerField(default=4370)),
+                ('password', models.PositiveIntegerField(default=0, help_text='Communication key configured on the terminal.')),
+                ('timeout', models.PositiveIntegerField(default=5)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_punch_at', models.DateTimeField(blank=True, help_text='Newest punch already ingested; older punches are skipped.', null=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_punch_count', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_devices', to='superadmin.hospital')),
+            ],
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from datetime import date, datetime, time
+from decimal import Decimal
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -337,13 +338,22 @@ class Attendance(models.Model):
     def calculate_delay(self):
         if self.is_absent or not self.entry_time or not self.shift_assignment:
             return
-        system_settings = SystemSettings.objects.first()
-        if not system_settings:
-            return
-        
+        if self.apply_delay_rules(SystemSettings.objects.first()):
+            self.save()
+
+    def apply_delay_rules(self, system_settings):
+        """
+        Set is_delayed / delay_minutes / is_absent in memory from the shift start.
+        Returns False when the rules do not apply (no settings, shift or entry).
+        Expects staff and shift_assignment.shift_type to be loaded; batch callers
+        use select_related so no query runs per row.
+        """
+        if self.is_absent or not self.entry_time or not self.shift_assignment_id or not system_settings:
+            return False
+
         # Determine attendance method
         attendance_method = self.staff.attendance_method or system_settings.default_attendance_method
-        
+
         if attendance_method == 'kpi' and self.staff.role == 'doctor':
             # TODO: Implement KPI logic once PatientAdmission model is defined
             # Example: Check if doctor has 10 patient admissions
@@ -351,43 +361,58 @@ class Attendance(models.Model):
             #     doctor=self.staff,
             #     admission_date=self.date
             # ).count()
-            # if admissions < 10:
-            #     self.is_absent = True
-            #     self.is_delayed = False
-            #     self.delay_minutes = 0
-            #     self.save()
-            #     return
-            # else:
-            #     self.is_absent = False
-            #     self.is_delayed = False
-            #     self.delay_minutes = 0
-            #     self.save()
-            #     return
+            # if admissions < 10: mark absent, otherwise present
             self.is_absent = False  # Placeholder: Assume present until KPI logic is implemented
             self.is_delayed = False
             self.delay_minutes = 0
-            self.save()
-            return
-        
+            return True
+
         # For fingerprint, facial_print, login_logout
-        expected_start = datetime.combine(self.date, self.shift_assignment.shift_type.start_time)
-        if self.entry_time > expected_start:
-            delay = (self.entry_time - expected_start).total_seconds() / 60
-            allowance = system_settings.delay_allowance_minutes
+        self.is_absent, self.is_delayed, self.delay_minutes = self.delay_flags(
+            self.entry_time, self.date, self.shift_assignment.shift_type.start_time,
+            system_settings.delay_allowance_minutes,
+        )
+        return True
+
+    @staticmethod
+    def delay_flags(entry_time, day, shift_start, allowance):
+        """(is_absent, is_delayed, delay_minutes) for an entry against the shift start."""
+        expected_start = datetime.combine(day, shift_start)
+        if timezone.is_aware(entry_time):
+            expected_start = timezone.make_aware(expected_start)
+        if entry_time > expected_start:
+            delay = (entry_time - expected_start).total_seconds() / 60
             if delay > allowance + 30:  # 30-minute threshold for absence
-                self.is_absent = True
-                self.is_delayed = False
-                self.delay_minutes = 0
-            elif delay > allowance:
-                self.is_delayed = True
-                self.delay_minutes = int(delay - allowance)
-            else:
-                self.is_delayed = False
-                self.delay_minutes = 0
-        else:
-            self.is_delayed = False
-            self.delay_minutes = 0
-        self.save()
+                return True, False, 0
+            if delay > allowance:
+                return False, True, int(delay - allowance)
+        return False, False, 0
+
+
+class AttendanceDevice(models.Model):
+    """A ZKTeco terminal polled by hr.zkteco_ingest, with its high-water mark."""
+    name = models.CharField(max_length=100)
+    ip_address = models.CharField(max_length=100)
+    port = models.PositiveIntegerField(default=4370)
+    password = models.PositiveIntegerField(default=0, help_text="Communication key configured on the terminal.")
+    timeout = models.PositiveIntegerField(default=5)
+    hospital = models.ForeignKey(
+        'superadmin.Hospital',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='attendance_devices',
+    )
+    is_active = models.BooleanField(default=True)
+    last_punch_at = models.DateTimeField(
+        null=True, blank=True, help_text="Newest punch already ingested; older punches are skipped."
+    )
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_punch_count = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ip_address}:{self.port})"
 
 
 class DeductionType(models.Model):
@@ -447,15 +472,23 @@ class Payroll(models.Model):
     def calculate_bonuses(self):
         return sum(bonus.amount for bonus in self.bonuses.all())
 
-    def calculate_delay_deductions(self):
-        system_settings = SystemSettings.objects.first()
+    def attendance_counts(self):
+        """(delays, absences) for the period in a single grouped query."""
+        counts = Attendance.objects.filter(
+            staff_id=self.staff_id,
+            date__range=[self.period_start, self.period_end],
+        ).aggregate(
+            delays=models.Count('pk', filter=models.Q(is_delayed=True)),
+            absences=models.Count('pk', filter=models.Q(is_absent=True)),
+        )
+        return counts['delays'], counts['absences']
+
+    def calculate_delay_deductions(self, system_settings=None, delay_count=None):
+        system_settings = system_settings or SystemSettings.objects.first()
         if not system_settings:
             return 0
-        delay_count = Attendance.objects.filter(
-            staff=self.staff,
-            date__range=[self.period_start, self.period_end],
-            is_delayed=True,
-        ).count()
+        if delay_count is None:
+            delay_count = self.attendance_counts()[0]
         if delay_count == 0:
             return 0
         days_in_period = (self.period_end - self.period_start).days + 1
@@ -463,22 +496,40 @@ class Payroll(models.Model):
         deduction_per_delay = daily_salary * (system_settings.delay_deduction_percentage / 100)
         return delay_count * deduction_per_delay
 
-    def calculate_absence_deductions(self):
-        system_settings = SystemSettings.objects.first()
+    def calculate_absence_deductions(self, system_settings=None, absence_count=None):
+        system_settings = system_settings or SystemSettings.objects.first()
         if not system_settings:
             return 0
-        absence_count = Attendance.objects.filter(
-            staff=self.staff,
-            date__range=[self.period_start, self.period_end],
-            is_absent=True,
-        ).count()
+        if absence_count is None:
+            absence_count = self.attendance_counts()[1]
         return absence_count * system_settings.absence_deduction_amount
 
+    def apply_totals(self, system_settings, delay_count, absence_count, bonuses, deductions):
+        """
+        Set delay/absence deductions and net salary from precomputed inputs.
+        `bonuses` and `deductions` are the sums of this payroll's Bonus and
+        Deduction rows. Shared by save() and the batch engine in hr.payroll.
+        """
+        cents = Decimal('0.01')
+        self.delay_deductions = Decimal(
+            self.calculate_delay_deductions(system_settings, delay_count) if system_settings else 0
+        ).quantize(cents)
+        self.absence_deductions = Decimal(
+            self.calculate_absence_deductions(system_settings, absence_count) if system_settings else 0
+        ).quantize(cents)
+        self.net_salary = (
+            Decimal(self.base_salary) + Decimal(bonuses) - Decimal(deductions)
+            - self.delay_deductions - self.absence_deductions
+        ).quantize(cents)
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.delay_deductions = self.calculate_delay_deductions()
-        self.absence_deductions = self.calculate_absence_deductions()
-        self.net_salary = self.base_salary + self.calculate_bonuses() - self.calculate_deductions()
+        # A new payroll cannot have bonuses or deductions yet, so one write is enough
+        if self.pk:
+            bonuses = self.bonuses.aggregate(total=models.Sum('amount'))['total'] or 0
+            deductions = self.deductions.aggregate(total=models.Sum('amount'))['total'] or 0
+        else:
+            bonuses = deductions = 0
+        self.apply_totals(SystemSettings.objects.first(), *self.attendance_counts(), bonuses, deductions)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -565,6 +616,40 @@ class Bonus(models.Model):
         super().save(*args, **kwargs)
 
 
+class PayrollRun(models.Model):
+    """One batch payroll computation (hr.payroll.run_payroll) with its timing report."""
+    period_start = models.DateField()
+    period_end = models.DateField()
+    hospital = models.ForeignKey(
+        'superadmin.Hospital',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='payroll_runs',
+    )
+    created_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='payroll_runs',
+    )
+    staff_count = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    unchanged_count = models.PositiveIntegerField(default=0)
+    total_net = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    timings = models.JSONField(default=dict, blank=True, help_text="Seconds spent per phase (load, compute, write).")
+    seconds = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Payroll run {self.period_start} to {self.period_end} ({self.staff_count} staff)"
+
+
 class VacationPolicy(models.Model):
     name = models.CharField(max_length=100, unique=True)
     annual_vacation_days = models.IntegerField(default=21)
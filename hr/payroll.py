@@ -0,0 +1,194 @@
+"""
+Batch payroll engine.
+
+Computes one period for every payroll-eligible staff member in a fixed
+number of queries: staff, existing payrolls, a grouped attendance
+aggregate and grouped bonus/deduction sums. New payrolls are written with
+bulk_create and recomputed ones with bulk_update, so the cost no longer
+grows with one Payroll.save() (and its settings/attendance queries) per
+employee.
+"""
+import logging
+import time
+from decimal import Decimal
+
+from django.db import models, transaction
+
+from superadmin.models import SystemSettings
+
+from .models import Attendance, Bonus, CustomUser, Deduction, Payroll, PayrollRun
+
+logger = logging.getLogger(__name__)
+
+# Same roles Payroll.staff accepts
+PAYROLL_ROLES = ('doctor', 'nurse', 'receptionist', 'pharmacist')
+
+BATCH_SIZE = 500
+
+COMPUTED_FIELDS = ['base_salary', 'delay_deductions', 'absence_deductions', 'net_salary']
+
+
+def eligible_staff(hospital=None, staff_ids=None):
+    staff = CustomUser.objects.filter(role__in=PAYROLL_ROLES, is_active=True)
+    if hospital is not None:
+        staff = staff.filter(hospital=hospital)
+    if staff_ids is not None:
+        staff = staff.filter(pk__in=staff_ids)
+    return staff.only('pk', 'salary_base', 'full_name', 'username').order_by('pk')
+
+
+def existing_payrolls(staff_ids, period_start, period_end):
+    """{staff_id: latest Payroll for exactly this period}"""
+    payrolls = {}
+    for payroll in Payroll.objects.filter(
+        staff_id__in=staff_ids, period_start=period_start, period_end=period_end,
+    ).order_by('pk'):
+        payrolls[payroll.staff_id] = payroll
+    return payrolls
+
+
+def attendance_counts(staff_ids, period_start, period_end):
+    """{staff_id: (delays, absences)} from one grouped query"""
+    rows = (
+        Attendance.objects.filter(staff_id__in=staff_ids, date__range=[period_start, period_end])
+        .values('staff_id')
+        .annotate(
+            delays=models.Count('pk', filter=models.Q(is_delayed=True)),
+            absences=models.Count('pk', filter=models.Q(is_absent=True)),
+        )
+        .order_by()
+    )
+    return {row['staff_id']: (row['delays'], row['absences']) for row in rows}
+
+
+def adjustment_totals(model, payroll_ids):
+    """{payroll_id: sum(amount)} of Bonus or Deduction rows attached to the payrolls"""
+    if not payroll_ids:
+        return {}
+    rows = (
+        model.objects.filter(payroll_id__in=payroll_ids)
+        .values('payroll_id')
+        .annotate(total=models.Sum('amount'))
+        .order_by()
+    )
+    return {row['payroll_id']: row['total'] for row in rows}
+
+
+def _preview_row(payroll, staff, status, bonuses, deductions, delays, absences):
+    return {
+        'staff_id': staff.pk,
+        'staff': staff.full_name or staff.username,
+        'status': status,
+        'base_salary': payroll.base_salary,
+        'bonuses': Decimal(bonuses),
+        'deductions': Decimal(deductions),
+        'delays': delays,
+        'absences': absences,
+        'delay_deductions': payroll.delay_deductions,
+        'absence_deductions': payroll.absence_deductions,
+        'net_salary': payroll.net_salary,
+    }
+
+
+def run_payroll(period_start, period_end, hospital=None, staff_ids=None, dry_run=False,
+                created_by=None, batch_size=None):
+    """
+    Compute (and unless dry_run, write) payroll for every eligible staff member.
+
+    A staff member's existing payroll for the exact period is recomputed in
+    place; otherwise a new one is created. Returns a report dict with the
+    created/updated/unchanged counts, per-staff preview rows, total net,
+    per-phase timings and the saved PayrollRun (None for a dry run).
+    """
+    if period_end < period_start:
+        raise ValueError("period_end cannot be before period_start")
+    batch_size = batch_size or BATCH_SIZE
+    started = time.monotonic()
+    timings = {}
+
+    # Load: settings once and every input in grouped queries
+    phase = time.monotonic()
+    system_settings = SystemSettings.objects.first()
+    staff = list(eligible_staff(hospital, staff_ids))
+    ids = [member.pk for member in staff]
+    payrolls = existing_payrolls(ids, period_start, period_end)
+    counts = attendance_counts(ids, period_start, period_end)
+    payroll_ids = [payroll.pk for payroll in payrolls.values()]
+    bonus_totals = adjustment_totals(Bonus, payroll_ids)
+    deduction_totals = adjustment_totals(Deduction, payroll_ids)
+    timings['load'] = time.monotonic() - phase
+
+    # Compute in memory
+    phase = time.monotonic()
+    to_create, to_update, rows = [], [], []
+    unchanged = 0
+    total_net = Decimal('0.00')
+    for member in staff:
+        payroll = payrolls.get(member.pk)
+        status = 'new'
+        if payroll is None:
+            payroll = Payroll(staff_id=member.pk, period_start=period_start, period_end=period_end)
+            bonuses = deductions = 0
+        else:
+            before = tuple(getattr(payroll, field) for field in COMPUTED_FIELDS)
+            bonuses = bonus_totals.get(payroll.pk) or 0
+            deductions = deduction_totals.get(payroll.pk) or 0
+        payroll.base_salary = member.salary_base
+        delays, absences = counts.get(member.pk, (0, 0))
+        payroll.apply_totals(system_settings, delays, absences, bonuses, deductions)
+
+        if payroll.pk is None:
+            to_create.append(payroll)
+        elif tuple(getattr(payroll, field) for field in COMPUTED_FIELDS) != before:
+            status = 'changed'
+            to_update.append(payroll)
+        else:
+            status = 'unchanged'
+            unchanged += 1
+        total_net += payroll.net_salary
+        rows.append(_preview_row(payroll, member, status, bonuses, deductions, delays, absences))
+    timings['compute'] = time.monotonic() - phase
+
+    report = {
+        'period_start': period_start,
+        'period_end': period_end,
+        'staff': len(staff),
+        'created': len(to_create),
+        'updated': len(to_update),
+        'unchanged': unchanged,
+        'total_net': total_net,
+        'rows': rows,
+        'timings': timings,
+        'dry_run': dry_run,
+        'run': None,
+    }
+    if dry_run:
+        report['seconds'] = time.monotonic() - started
+        return report
+
+    # Write: one transaction, batched
+    phase = time.monotonic()
+    with transaction.atomic():
+        Payroll.objects.bulk_create(to_create, batch_size=batch_size)
+        Payroll.objects.bulk_update(to_update, COMPUTED_FIELDS, batch_size=batch_size)
+    timings['write'] = time.monotonic() - phase
+
+    report['seconds'] = time.monotonic() - started
+    report['run'] = PayrollRun.objects.create(
+        period_start=period_start,
+        period_end=period_end,
+        hospital=hospital,
+        created_by=created_by,
+        staff_count=len(staff),
+        created_count=len(to_create),
+        updated_count=len(to_update),
+        unchanged_count=unchanged,
+        total_net=total_net,
+        timings=timings,
+        seconds=report['seconds'],
+    )
+    logger.info(
+        f"Payroll {period_start} to {period_end}: {len(to_create)} created, {len(to_update)} updated, "
+        f"{unchanged} unchanged for {len(staff)} staff in {report['seconds']:.2f}s"
+    )
+    return report
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser
+from .zkteco_ingest import invalidate_staff_map
+
+# Fields the ZKTeco national_id -> user map depends on
+STAFF_MAP_FIELDS = {'national_id', 'hospital', 'is_active'}
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_zkteco_staff_map_on_save(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save last_login only; those must not drop the cache
+    if update_fields is not None and not STAFF_MAP_FIELDS & set(update_fields):
+        return
+    invalidate_staff_map()
+
+
+@receiver(post_delete, sender=CustomUser)
+def invalidate_zkteco_staff_map_on_delete(sender, instance, **kwargs):
+    invalidate_staff_map()
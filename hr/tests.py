@@ -1,3 +1,395 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+
+from superadmin.models import Hospital, SystemSettings
+from zk.attendance import Attendance as Punch
+
+from maintenance.job_queue import acquire_lease, sync_jobs
+from maintenance.models import ScheduledJob
+from manager.models import Department
+
+from .models import (
+    Attendance, AttendanceDevice, Bonus, CustomUser, Deduction, Payroll, PayrollRun,
+    Schedule, ShiftAssignment, ShiftType, WorkArea,
+)
+from .attendance_eval import reevaluate_attendance
+from .payroll import run_payroll
+from .zkteco_ingest import PUNCH_IN, PUNCH_OUT, ingest_all, invalidate_staff_map
+
+
+class PayrollBatchTest(TestCase):
+    """The batch engine produces the same numbers as Payroll.save, in constant queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='Test Hospital', address='Address')
+        SystemSettings.objects.create(delay_deduction_percentage=Decimal('10'), absence_deduction_amount=Decimal('50'))
+        cls.start, cls.end = date(2025, 6, 1), date(2025, 6, 30)
+
+    def _staff(self, n, salary='3000', hospital=True):
+        return CustomUser.objects.create_user(
+            username=f'staff{n}', password='testpass123', role='nurse',
+            hospital=self.hospital if hospital else None, salary_base=Decimal(salary),
+        )
+
+    def _attendance(self, staff, day, delayed=False, absent=False):
+        Attendance.objects.create(
+            staff=staff, date=date(2025, 6, day), is_delayed=delayed, is_absent=absent,
+            entry_time=datetime(2025, 6, day, 9),
+        )
+
+    def test_batch_matches_single_save(self):
+        staff = self._staff(1)
+        self._attendance(staff, 2, delayed=True)
+        self._attendance(staff, 3, delayed=True)
+        self._attendance(staff, 4, absent=True)
+        self._attendance(staff, 20)
+        single = Payroll.objects.create(staff=staff, period_start=self.start, period_end=self.end, base_salary=staff.salary_base)
+        Bonus.objects.create(staff=staff, payroll=single, bonus_type='reward', amount=Decimal('200'))
+        Deduction.objects.create(staff=staff, payroll=single, deduction_type='other', amount=Decimal('75'))
+        single.save()
+        single.refresh_from_db()
+
+        expected = (single.delay_deductions, single.absence_deductions, single.net_salary)
+        # 2 delays at 10% of 100/day, 1 absence at 50
+        self.assertEqual(expected, (Decimal('20.00'), Decimal('50.00'), Decimal('3055.00')))
+
+        Payroll.objects.filter(pk=single.pk).update(net_salary=0, delay_deductions=0, absence_deductions=0)
+        report = run_payroll(self.start, self.end, hospital=self.hospital)
+        single.refresh_from_db()
+        self.assertEqual((single.delay_deductions, single.absence_deductions, single.net_salary), expected)
+        self.assertEqual((report['created'], report['updated']), (0, 1))
+
+    def test_constant_queries_regardless_of_staff_count(self):
+        for n in range(3):
+            self._attendance(self._staff(n), 2, delayed=True)
+        run_payroll(self.start, self.end, hospital=self.hospital)
+        self._staff(3)
+        with CaptureQueriesContext(connection) as small:
+            run_payroll(self.start, self.end, hospital=self.hospital)
+
+        for n in range(4, 20):
+            self._attendance(self._staff(n), 2, absent=True)
+        with CaptureQueriesContext(connection) as large:
+            report = run_payroll(self.start, self.end, hospital=self.hospital)
+
+        self.assertEqual(len(large), len(small))
+        self.assertEqual((report['created'], report['unchanged']), (16, 4))
+        self.assertEqual(Payroll.objects.filter(staff__hospital=self.hospital).count(), 20)
+        self.assertEqual(Payroll.objects.get(staff__username='staff5').net_salary, Decimal('2950.00'))
+
+    def test_dry_run_writes_nothing(self):
+        self._staff(1)
+        self._staff(2, hospital=False)
+
+        report = run_payroll(self.start, self.end, hospital=self.hospital, dry_run=True)
+
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['rows'][0]['net_salary'], Decimal('3000.00'))
+        self.assertIsNone(report['run'])
+        self.assertFalse(Payroll.objects.exists())
+        self.assertFalse(PayrollRun.objects.exists())
+
+    def test_run_report_is_recorded(self):
+        self._staff(1)
+        self._staff(2, salary='4500.50')
+
+        report = run_payroll(self.start, self.end)
+        again = run_payroll(self.start, self.end)
+
+        run = report['run']
+        self.assertEqual((run.staff_count, run.created_count, run.total_net), (2, 2, Decimal('7500.50')))
+        self.assertEqual(set(run.timings), {'load', 'compute', 'write'})
+        self.assertEqual((again['created'], again['updated'], again['unchanged']), (0, 0, 2))
+        self.assertEqual(PayrollRun.objects.count(), 2)
+
+    def test_save_writes_once(self):
+        staff = self._staff(1)
+        payroll = Payroll(staff=staff, period_start=self.start, period_end=self.end, base_salary=staff.salary_base)
+
+        # settings + attendance aggregate + insert
+        with self.assertNumQueries(3):
+            payroll.save()
+        self.assertEqual(payroll.net_salary, Decimal('3000.00'))
+
+    def test_command(self):
+        self._staff(1)
+        out = StringIO()
+
+        call_command('run_payroll', '2025-06-01', '2025-06-30', '--dry-run', stdout=out)
+        self.assertIn('DRY RUN', out.getvalue())
+        self.assertIn('1 staff: 1 created', out.getvalue())
+        self.assertFalse(Payroll.objects.exists())
+
+    def test_run_view_previews_and_saves(self):
+        self._staff(1)
+        hr_user = CustomUser.objects.create_user(username='hr', password='testpass123', role='hr', hospital=self.hospital)
+        self.client.force_login(hr_user)
+        data = {'period_start': '2025-06-01', 'period_end': '2025-06-30'}
+
+        response = self.client.post(reverse('hr:payroll_run'), {**data, 'dry_run': 'on'})
+        self.assertContains(response, 'Preview')
+        self.assertFalse(Payroll.objects.exists())
+
+        response = self.client.post(reverse('hr:payroll_run'), data)
+        self.assertContains(response, 'Run Report')
+        self.assertEqual(Payroll.objects.count(), 1)
+
+    def test_run_view_requires_a_hospital(self):
+        self._staff(1)
+        hr_user = CustomUser.objects.create_user(username='hr', password='testpass123', role='hr')
+        self.client.force_login(hr_user)
+
+        response = self.client.post(reverse('hr:payroll_run'), {'period_start': '2025-06-01', 'period_end': '2025-06-30'})
+        self.assertContains(response, 'not linked to a hospital')
+        self.assertFalse(Payroll.objects.exists())
+        self.assertFalse(PayrollRun.objects.exists())
+
+
+class FakeZKTerminal:
+    """Stands in for a pyzk connection: returns its punch buffer and records the calls."""
+
+    def __init__(self, punches=None, fail=False):
+        self.punches = list(punches or [])
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, device):
+        if self.fail:
+            raise ConnectionError('terminal unreachable')
+        self.calls.append('connect')
+        return self
+
+    def disable_device(self):
+        self.calls.append('disable')
+
+    def get_attendance(self):
+        return list(self.punches)
+
+    def enable_device(self):
+        self.calls.append('enable')
+
+    def disconnect(self):
+        self.calls.append('disconnect')
+
+    def punch(self, national_id, hour, minute=0, day=2, punch=PUNCH_IN[0]):
+        self.punches.append(Punch(national_id, datetime(2025, 6, day, hour, minute), 1, punch))
+
+
+class ZKTecoIngestTest(TestCase):
+    """Terminal punches land in Attendance once, in bulk, with delays evaluated."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='Test Hospital', address='Address')
+        SystemSettings.objects.create(delay_allowance_minutes=15)
+        cls.staff = [
+            CustomUser.objects.create_user(
+                username=f'nurse{n}', password='testpass123', role='nurse',
+                hospital=cls.hospital, national_id=f'100{n}',
+            )
+            for n in range(3)
+        ]
+        department = Department.objects.filter(hospital=cls.hospital).first() or Department.objects.create(
+            name='Nursing', hospital=cls.hospital,
+        )
+        schedule = Schedule.objects.create(department=department, start_date=date(2025, 6, 1), end_date=date(2025, 6, 30))
+        work_area = WorkArea.objects.create(name='ward', department=department)
+        morning = ShiftType.objects.create(name='Morning', start_time=time(8), end_time=time(16))
+        cls.shift = ShiftAssignment.objects.create(
+            schedule=schedule, staff=cls.staff[0], work_area=work_area, shift_type=morning, date=date(2025, 6, 2),
+        )
+        cls.device = AttendanceDevice.objects.create(name='Main gate', ip_address='10.0.0.5', hospital=cls.hospital)
+
+    def setUp(self):
+        invalidate_staff_map()
+
+    def _ingest(self, terminal):
+        results = ingest_all(connect=terminal)
+        self.device.refresh_from_db()
+        return results[0]
+
+    def test_punches_fold_into_one_row_per_day_with_delay(self):
+        terminal = FakeZKTerminal()
+        terminal.punch('1000', 8, 40)
+        terminal.punch('1000', 8, 30)
+        terminal.punch('1000', 16, 5, punch=PUNCH_OUT[0])
+        terminal.punch('9999', 9)
+
+        result = self._ingest(terminal)
+
+        self.assertEqual((result['new'], result['unknown'], result['created']), (4, 1, 1))
+        self.assertEqual(terminal.calls, ['connect', 'disable', 'enable', 'disconnect'])
+        attendance = Attendance.objects.get(staff=self.staff[0])
+        self.assertEqual(timezone.localtime(attendance.entry_time).time(), time(8, 30))
+        self.assertEqual(timezone.localtime(attendance.exit_time).time(), time(16, 5))
+        self.assertEqual((attendance.source, attendance.shift_assignment), ('zkteco', self.shift))
+        self.assertEqual((attendance.is_delayed, attendance.delay_minutes), (True, 15))
+
+    def test_high_water_mark_skips_old_punches_and_replay_is_idempotent(self):
+        terminal = FakeZKTerminal()
+        terminal.punch('1001', 9)
+        self._ingest(terminal)
+        mark = self.device.last_punch_at
+
+        terminal.punch('1001', 17, punch=PUNCH_OUT[0])
+        result = self._ingest(terminal)
+        self.assertEqual((result['read'], result['new'], result['updated']), (2, 2, 1))
+        self.assertGreater(self.device.last_punch_at, mark)
+
+        self.device.last_punch_at = None
+        self.device.save()
+        result = self._ingest(terminal)
+        self.assertEqual((result['created'], result['updated']), (0, 0))
+        self.assertEqual(Attendance.objects.filter(staff=self.staff[1]).count(), 1)
+
+    def test_constant_queries_regardless_of_punch_count(self):
+        self._ingest(FakeZKTerminal())  # loads the cached staff map
+        small = FakeZKTerminal()
+        small.punch('1000', 8)
+        with CaptureQueriesContext(connection) as few:
+            self._ingest(small)
+
+        large = FakeZKTerminal()
+        for day in range(3, 20):
+            for national_id in ('1000', '1001', '1002'):
+                large.punch(national_id, 8, day=day)
+                large.punch(national_id, 16, day=day, punch=PUNCH_OUT[0])
+        with CaptureQueriesContext(connection) as many:
+            result = self._ingest(large)
+
+        self.assertEqual(result['created'], 17 * 3)
+        self.assertEqual(len(many), len(few))
+
+    def test_failing_terminal_is_recorded(self):
+        result = self._ingest(FakeZKTerminal(fail=True))
+
+        self.assertIn('unreachable', result['error'])
+        self.assertIn('unreachable', self.device.last_error)
+
+    def test_staff_map_follows_national_id_changes(self):
+        terminal = FakeZKTerminal()
+        terminal.punch('2000', 9)
+        self.assertEqual(self._ingest(terminal)['unknown'], 1)
+
+        self.staff[2].national_id = '2000'
+        self.staff[2].save()
+        terminal.punch('2000', 9, day=3)
+        self.assertEqual(self._ingest(terminal)['unknown'], 0)
+        self.assertEqual(Attendance.objects.filter(staff=self.staff[2]).count(), 2)
+
+
+    def _sync(self):
+        hr_user = CustomUser.objects.create_user(username='hr', password='testpass123', role='hr', hospital=self.hospital)
+        self.client.force_login(hr_user)
+        with mock.patch('hr.zkteco_ingest.open_connection') as connect:
+            response = self.client.get(reverse('hr:sync_attendance'), follow=True)
+        connect.assert_not_called()
+        return [(m.level_tag, str(m)) for m in response.context['messages']]
+
+    def test_sync_view_queues_the_ingest_job(self):
+        sync_jobs()
+        job = ScheduledJob.objects.get(name='zkteco_ingest')
+        acquire_lease('leader')
+
+        messages = self._sync()
+
+        job.refresh_from_db()
+        self.assertLessEqual(job.next_run_at, timezone.now())
+        self.assertEqual(messages[0][0], 'info')
+
+    def test_sync_view_warns_when_no_worker_is_running(self):
+        sync_jobs()
+        messages = self._sync()
+        self.assertEqual(messages[0][0], 'warning')
+        self.assertIn('no job queue worker', messages[0][1])
+
+    def test_sync_view_reports_a_missing_job(self):
+        acquire_lease('leader')
+        messages = self._sync()
+        self.assertEqual(messages[0][0], 'error')
+        self.assertFalse(ScheduledJob.objects.filter(name='zkteco_ingest').exists())
+
+class AttendanceReevaluationTest(TestCase):
+    """Bulk re-evaluation gives the same flags as calculate_delay, in constant queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='Test Hospital', address='Address')
+        cls.settings = SystemSettings.objects.create(delay_allowance_minutes=15)
+        cls.staff = CustomUser.objects.create_user(username='nurse', password='testpass123', role='nurse', hospital=cls.hospital)
+        department = Department.objects.filter(hospital=cls.hospital).first() or Department.objects.create(
+            name='Nursing', hospital=cls.hospital,
+        )
+        cls.schedule = Schedule.objects.create(department=department, start_date=date(2025, 6, 1), end_date=date(2025, 6, 30))
+        cls.work_area = WorkArea.objects.create(name='ward', department=department)
+        cls.morning = ShiftType.objects.create(name='Morning', start_time=time(8), end_time=time(16))
+
+    def _attendance(self, day, minutes_late):
+        shift = ShiftAssignment.objects.create(
+            schedule=self.schedule, staff=self.staff, work_area=self.work_area,
+            shift_type=self.morning, date=date(2025, 6, day),
+        )
+        entry = timezone.make_aware(datetime(2025, 6, day, 8)) + timedelta(minutes=minutes_late)
+        return Attendance.objects.create(staff=self.staff, shift_assignment=shift, date=date(2025, 6, day), entry_time=entry)
+
+    def test_matches_calculate_delay(self):
+        rows = [self._attendance(day, late) for day, late in [(2, 5), (3, 25), (4, 60)]]
+        for row in rows:
+            row.calculate_delay()
+        expected = {row.pk: (row.is_absent, row.is_delayed, row.delay_minutes) for row in rows}
+        Attendance.objects.update(is_absent=False, is_delayed=False, delay_minutes=0)
+
+        result = reevaluate_attendance(date(2025, 6, 1), date(2025, 6, 30))
+
+        actual = {row.pk: (row.is_absent, row.is_delayed, row.delay_minutes) for row in Attendance.objects.all()}
+        self.assertEqual(actual, expected)
+        self.assertEqual(expected[rows[1].pk], (False, True, 10))
+        self.assertEqual((result['rows'], result['changed'], result['delayed'], result['absent']), (3, 2, 1, 1))
+
+    def test_allowance_change_in_constant_queries(self):
+        for day in range(1, 29):
+            self._attendance(day, 20)
+        reevaluate_attendance(date(2025, 6, 1), date(2025, 6, 30))
+        self.assertEqual(Attendance.objects.filter(is_delayed=True).count(), 28)
+
+        SystemSettings.objects.update(delay_allowance_minutes=30)
+        # settings + shift types + rows + savepoint + bulk update + savepoint
+        with self.assertNumQueries(6):
+            result = reevaluate_attendance(date(2025, 6, 1), date(2025, 6, 30))
+        self.assertEqual(result['changed'], 28)
+        self.assertFalse(Attendance.objects.filter(is_delayed=True).exists())
+        self.assertGreater(result['rows_per_second'], 0)
+
+    def test_include_absent_clears_rule_absences(self):
+        row = self._attendance(2, 50)
+        row.calculate_delay()
+        self.assertTrue(row.is_absent)
+        SystemSettings.objects.update(delay_allowance_minutes=60)
+
+        self.assertEqual(reevaluate_attendance(date(2025, 6, 1), date(2025, 6, 30))['rows'], 0)
+        result = reevaluate_attendance(date(2025, 6, 1), date(2025, 6, 30), include_absent=True, dry_run=True)
+        self.assertEqual(result['changed'], 1)
+        row.refresh_from_db()
+        self.assertTrue(row.is_absent)
+
+        reevaluate_attendance(date(2025, 6, 1), date(2025, 6, 30), include_absent=True)
+        row.refresh_from_db()
+        self.assertFalse(row.is_absent)
+
+    def test_command(self):
+        self._attendance(2, 20)
+        out = StringIO()
 
-# Create your tests here.
+        call_command('reevaluate_attendance', '2025-06-01', '2025-06-30', stdout=out)
+        self.assertIn('1 of 1 rows changed', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
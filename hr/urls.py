@@ -8,7 +8,7 @@ from .views import (
     ShiftAssignmentDeleteView, ShiftSwapRequestCreateView,
     ShiftSwapRequestListView, ShiftSwapApprovalView, staff_home,
     sync_attendance_from_zkteco, PayrollListView, PayrollCreateView,
-    PayrollUpdateView, PayrollDeleteView, DeductionTypeListView,
+    PayrollUpdateView, PayrollDeleteView, PayrollRunView, DeductionTypeListView,
     DeductionTypeCreateView, DeductionTypeUpdateView,
     DeductionTypeDeleteView, BonusTypeListView, BonusTypeCreateView,
     BonusTypeUpdateView, BonusTypeDeleteView, VacationPolicyListView,
@@ -39,6 +39,7 @@ urlpatterns = [
     path('attendance/sync/', sync_attendance_from_zkteco, name='sync_attendance'),
     path('payroll/', PayrollListView.as_view(), name='payroll_list'),
     path('payroll/new/', PayrollCreateView.as_view(), name='payroll_create'),
+    path('payroll/run/', PayrollRunView.as_view(), name='payroll_run'),
     path('payroll/<int:pk>/edit/', PayrollUpdateView.as_view(), name='payroll_update'),
     path('payroll/<int:pk>/delete/', PayrollDeleteView.as_view(), name='payroll_delete'),
     path('payroll/bonus/create/', GlobalBonusCreateView.as_view(), name='global_bonus_create'),
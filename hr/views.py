@@ -1,7 +1,7 @@
 from datetime import timedelta
 from typing import Self
 from django.http import JsonResponse
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, FormView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
 from django.shortcuts import render, redirect
@@ -12,15 +12,18 @@ from django.db.models import Count
 from django.views.decorators.http import require_GET
 from .models import (
     CustomUser, StaffTask, Attendance, Schedule, ShiftAssignment, ShiftSwapRequest,
-    ShiftType, Payroll, DeductionType, Deduction, BonusType, Bonus,
-    VacationPolicy, VacationBalance, LeaveRequest, WorkArea
+    ShiftType, Payroll, PayrollRun, DeductionType, Deduction, BonusType, Bonus,
+    VacationPolicy, VacationBalance, LeaveRequest, WorkArea, AttendanceDevice
 )
 from manager.models import Department, Doctor
 from superadmin.models import SystemSettings
+from .payroll import run_payroll
+from maintenance.job_queue import queue_is_running, trigger_job
+from maintenance.models import ScheduledJob
 from .forms import (
     GlobalBonusForm, GlobalDeductionForm,  StaffCreateForm , CertificateFormSet, PracticePermitFormSet, HealthInsuranceFormSet,
     StaffTaskForm, AttendanceForm, ScheduleForm, ShiftAssignmentForm,
-    ShiftSwapRequestForm, ShiftSwapApprovalForm, PayrollForm,
+    ShiftSwapRequestForm, ShiftSwapApprovalForm, PayrollForm, PayrollRunForm,
     DeductionTypeForm, DeductionFormSet, BonusTypeForm, BonusFormSet,
     VacationPolicyForm, VacationBalanceForm, LeaveRequestForm,
     LeaveApprovalForm, HRSystemSettingsForm, BonusForm, DeductionForm  # Added BonusForm, DeductionForm
@@ -624,42 +627,29 @@ class ShiftSwapApprovalView(LoginRequiredMixin, HRRequiredMixin, UpdateView):
 
 
 # ZKTeco Integration
-from zk import ZK, const
-
-
 def sync_attendance_from_zkteco(request):
+    """Bring the background ZKTeco ingest job forward so it runs on the scheduler's next pass."""
     if request.user.role != 'hr':
         return redirect('login')
-    zk = ZK('DEVICE_IP', port=4370, timeout=5)
-    try:
-        conn = zk.connect()
-        conn.disable_device()
-        attendances = conn.get_attendance()
-        for att in attendances:
-            staff = CustomUser.objects.filter(national_id=att.user_id, hospital=request.user.hospital).first()
-            if staff:
-                attendance, created = Attendance.objects.get_or_create(
-                    staff=staff,
-                    date=att.timestamp.date(),
-                    defaults={
-                        'entry_time': att.timestamp if att.status == const.MACHINE_STATE_IN else None,
-                        'exit_time': att.timestamp if att.status == const.MACHINE_STATE_OUT else None,
-                        'source': 'zkteco'
-                    }
-                )
-                if not created:
-                    if att.status == const.MACHINE_STATE_IN:
-                        attendance.entry_time = att.timestamp
-                    elif att.status == const.MACHINE_STATE_OUT:
-                        attendance.exit_time = att.timestamp
-                    attendance.source = 'zkteco'
-                    attendance.save()
-        conn.enable_device()
-        messages.success(request, "Attendance synced from ZKTeco.")
-    except Exception as e:
-        messages.error(request, f"Error syncing attendance: {str(e)}")
-    finally:
-        conn.disconnect()
+    if not AttendanceDevice.objects.filter(hospital=request.user.hospital, is_active=True).exists():
+        messages.warning(request, "No active ZKTeco devices are configured for this hospital.")
+        return redirect('hr:attendance_list')
+    # 0 rows also means the job is already due, so only a missing or disabled job is an error
+    queued = trigger_job('zkteco_ingest')
+    if not queued and not ScheduledJob.objects.filter(name='zkteco_ingest', enabled=True).exists():
+        messages.error(
+            request,
+            "The attendance sync job is not scheduled or is disabled. "
+            "Ask an administrator to start the job queue (manage.py run_job_queue).",
+        )
+    elif not queue_is_running():
+        messages.warning(
+            request,
+            "Attendance sync is queued, but no job queue worker is running, "
+            "so it will not run until one is started.",
+        )
+    else:
+        messages.info(request, "Attendance sync queued. New punches will appear here shortly.")
     return redirect('hr:attendance_list')
 
 
@@ -781,6 +771,41 @@ class PayrollDeleteView(LoginRequiredMixin, HRRequiredMixin, DeleteView):
         return Payroll.objects.filter(staff__hospital=self.request.user.hospital)
 
 
+class PayrollRunView(LoginRequiredMixin, HRRequiredMixin, FormView):
+    """Compute the whole hospital's payroll for a period, as a preview or for real."""
+    form_class = PayrollRunForm
+    template_name = 'payroll/payroll_run.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['recent_runs'] = PayrollRun.objects.filter(
+            hospital=self.request.user.hospital
+        ).select_related('created_by')[:10]
+        return context
+
+    def form_valid(self, form):
+        if self.request.user.hospital is None:
+            # run_payroll(hospital=None) covers every hospital; that is for the management command only
+            form.add_error(None, "Your account is not linked to a hospital, so payroll cannot be run from here.")
+            return self.form_invalid(form)
+        report = run_payroll(
+            form.cleaned_data['period_start'],
+            form.cleaned_data['period_end'],
+            hospital=self.request.user.hospital,
+            dry_run=form.cleaned_data['dry_run'],
+            created_by=self.request.user,
+        )
+        if report['dry_run']:
+            messages.info(self.request, f"Preview for {report['staff']} staff in {report['seconds']:.2f}s. Nothing was saved.")
+        else:
+            messages.success(
+                self.request,
+                f"Payroll run complete: {report['created']} created, {report['updated']} updated, "
+                f"{report['unchanged']} unchanged in {report['seconds']:.2f}s."
+            )
+        return self.render_to_response(self.get_context_data(form=form, report=report))
+
+
 # Deduction and Bonus Type Views
 class DeductionTypeListView(LoginRequiredMixin, HRRequiredMixin, ListView):
     model = DeductionType
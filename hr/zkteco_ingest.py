@@ -0,0 +1,226 @@
+"""
+Incremental ZKTeco attendance ingestion.
+
+Every active AttendanceDevice is polled for punches newer than its
+high-water mark (last_punch_at). New punches are resolved to staff through
+a cached national_id -> user id map, folded into one entry/exit pair per
+staff and day, and upserted in bulk: existing Attendance rows and the
+day's ShiftAssignment are loaded in one query each, delay rules are
+applied in memory and the result is written with bulk_create/bulk_update.
+
+Merging keeps the earliest check-in and the latest check-out, so reading
+the same punches twice (overlapping marks, retries) changes nothing.
+"""
+import logging
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from zk import ZK
+
+from superadmin.models import SystemSettings
+
+from .models import Attendance, AttendanceDevice, CustomUser, ShiftAssignment
+
+logger = logging.getLogger(__name__)
+
+# pyzk Attendance.punch values
+PUNCH_IN = (0, 4)    # check-in, overtime-in
+PUNCH_OUT = (1, 5)   # check-out, overtime-out
+
+BATCH_SIZE = 1000
+STAFF_MAP_TIMEOUT = 60 * 15
+STAFF_MAP_VERSION_KEY = 'hr:zkteco:staff_map:version'
+
+UPDATE_FIELDS = ['entry_time', 'exit_time', 'source', 'shift_assignment', 'is_delayed', 'delay_minutes', 'is_absent']
+
+
+def open_connection(device):
+    """Connect to a real terminal (the default connector)."""
+    return ZK(device.ip_address, port=device.port, timeout=device.timeout, password=device.password).connect()
+
+
+# Staff lookup cache
+
+def _staff_map_key(hospital_id):
+    version = cache.get(STAFF_MAP_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(STAFF_MAP_VERSION_KEY, version, None)
+    return f'hr:zkteco:staff_map:{version}:{hospital_id}'
+
+
+def staff_map(hospital_id):
+    """{national_id: user id} for the hospital's active staff, cached between polls."""
+    key = _staff_map_key(hospital_id)
+    mapping = cache.get(key)
+    if mapping is None:
+        mapping = dict(
+            CustomUser.objects.filter(hospital_id=hospital_id, is_active=True, national_id__isnull=False)
+            .values_list('national_id', 'pk')
+        )
+        cache.set(key, mapping, STAFF_MAP_TIMEOUT)
+    return mapping
+
+
+def invalidate_staff_map():
+    """Drop every hospital's cached map (a new version makes the old keys unreachable)."""
+    cache.set(STAFF_MAP_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+# Reading and folding punches
+
+def new_punches(records, since):
+    """Yield (national_id, aware timestamp, punch) for records at or after the mark."""
+    for record in records:
+        stamp = record.timestamp
+        if timezone.is_naive(stamp):
+            stamp = timezone.make_aware(stamp)
+        if since is None or stamp >= since:
+            yield str(record.user_id), stamp, record.punch
+
+
+def fold_punches(punches, staff_ids):
+    """
+    {(staff_id, date): [first check-in, last check-out]} for known staff.
+    Returns (days, unknown_count).
+    """
+    days = {}
+    unknown = 0
+    for national_id, stamp, punch in punches:
+        staff_id = staff_ids.get(national_id)
+        if staff_id is None:
+            unknown += 1
+            continue
+        day = days.setdefault((staff_id, timezone.localtime(stamp).date()), [None, None])
+        if punch in PUNCH_IN and (day[0] is None or stamp < day[0]):
+            day[0] = stamp
+        elif punch in PUNCH_OUT and (day[1] is None or stamp > day[1]):
+            day[1] = stamp
+    return days, unknown
+
+
+# Bulk upsert
+
+def upsert_days(days, system_settings):
+    """Merge folded punches into Attendance and apply delay rules. Returns (created, updated)."""
+    if not days:
+        return 0, 0
+    staff_ids = {staff_id for staff_id, _ in days}
+    dates = {day for _, day in days}
+
+    existing = {}
+    for attendance in Attendance.objects.filter(staff_id__in=staff_ids, date__in=dates).select_related(
+        'staff', 'shift_assignment__shift_type',
+    ).order_by('pk'):
+        existing.setdefault((attendance.staff_id, attendance.date), attendance)
+    shifts = {}
+    for shift in ShiftAssignment.objects.filter(staff_id__in=staff_ids, date__in=dates).select_related(
+        'shift_type',
+    ).order_by('pk'):
+        shifts.setdefault((shift.staff_id, shift.date), shift)
+    staff = CustomUser.objects.only('pk', 'role', 'attendance_method').in_bulk(
+        [staff_id for staff_id, day in days if (staff_id, day) not in existing]
+    )
+
+    to_create, to_update = [], []
+    for key, (entry, exit_) in days.items():
+        attendance = existing.get(key)
+        if attendance is None:
+            if key[0] not in staff:
+                continue
+            attendance = Attendance(staff=staff[key[0]], date=key[1], source='zkteco')
+            to_create.append(attendance)
+            before = None
+        else:
+            before = tuple(getattr(attendance, field) for field in UPDATE_FIELDS)
+        if entry and (attendance.entry_time is None or entry < attendance.entry_time):
+            attendance.entry_time = entry
+        if exit_ and (attendance.exit_time is None or exit_ > attendance.exit_time):
+            attendance.exit_time = exit_
+        attendance.source = 'zkteco'
+        if attendance.shift_assignment_id is None and key in shifts:
+            attendance.shift_assignment = shifts[key]
+        attendance.apply_delay_rules(system_settings)
+        if before is not None and tuple(getattr(attendance, field) for field in UPDATE_FIELDS) != before:
+            to_update.append(attendance)
+
+    with transaction.atomic():
+        Attendance.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        Attendance.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=BATCH_SIZE)
+    return len(to_create), len(to_update)
+
+
+# Devices
+
+def ingest_device(device, connect=None, system_settings=None):
+    """
+    Pull new punches from one terminal and upsert them.
+    Returns {'device', 'read', 'new', 'unknown', 'created', 'updated', 'seconds'}.
+    """
+    started = time.monotonic()
+    connect = connect or open_connection
+    conn = connect(device)
+    try:
+        conn.disable_device()
+        try:
+            records = conn.get_attendance()
+        finally:
+            conn.enable_device()
+    finally:
+        conn.disconnect()
+
+    if system_settings is None:
+        system_settings = SystemSettings.objects.first()
+    staff_ids = staff_map(device.hospital_id)
+    punches = list(new_punches(records, device.last_punch_at))
+    days, unknown = fold_punches(punches, staff_ids)
+    created, updated = upsert_days(days, system_settings)
+
+    if punches:
+        device.last_punch_at = max(stamp for _, stamp, _ in punches)
+    device.last_synced_at = timezone.now()
+    device.last_punch_count = len(punches)
+    device.last_error = ''
+    device.save(update_fields=['last_punch_at', 'last_synced_at', 'last_punch_count', 'last_error'])
+
+    return {
+        'device': device.name,
+        'read': len(records),
+        'new': len(punches),
+        'unknown': unknown,
+        'created': created,
+        'updated': updated,
+        'seconds': time.monotonic() - started,
+    }
+
+
+def ingest_all(hospital=None, devices=None, connect=None):
+    """
+    Ingest every active terminal (optionally one hospital's). A failing terminal
+    is recorded on its last_error and does not stop the others.
+    """
+    if devices is None:
+        devices = AttendanceDevice.objects.filter(is_active=True).order_by('pk')
+        if hospital is not None:
+            devices = devices.filter(hospital=hospital)
+    system_settings = SystemSettings.objects.first()
+    results = []
+    for device in devices:
+        try:
+            result = ingest_device(device, connect=connect, system_settings=system_settings)
+        except Exception as e:
+            logger.error(f"ZKTeco ingestion failed for {device}: {e}")
+            device.last_error = str(e)
+            device.last_synced_at = timezone.now()
+            device.save(update_fields=['last_error', 'last_synced_at'])
+            result = {'device': device.name, 'error': str(e)}
+        else:
+            logger.info(
+                f"ZKTeco {device}: {result['new']} new of {result['read']} punches, "
+                f"{result['created']} created, {result['updated']} updated in {result['seconds']:.2f}s"
+            )
+        results.append(result)
+    return results
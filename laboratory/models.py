@@ -1,13 +1,13 @@
 # laboratory/models.py
 import uuid
-from io import BytesIO
+from urllib.parse import urlencode
+
 from django.db import models
 from django.conf import settings
 from django.urls import reverse
-from django.core.files.base import ContentFile
 from django.utils import timezone
 
-import qrcode
+from core.qr_render import register_target, request_render
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
@@ -176,17 +176,18 @@ class LabRequest(models.Model):
    def get_scan_url(self):
         return reverse("laboratory:lab_request_scan", args=[str(self.token)])
 
-   def _generate_qr(self):
-        img = qrcode.make(self.get_scan_url())
-        buf = BytesIO(); img.save(buf, format="PNG")
-        return ContentFile(buf.getvalue(), name=f"{self.token}.png")
+   @property
+   def qr_png_url(self):
+        # الصورة المحفوظة لو اترسمت، وإلا نفس المحتوى من كاش general:qr_image من غير كتابة
+        if self.qr_code:
+            return self.qr_code.url
+        return f"{reverse('general:qr_image', args=['png'])}?{urlencode({'data': self.get_scan_url()})}"
 
-def save(self, *args, **kwargs):
-        is_new = self.pk is None
+   def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        if is_new or not self.qr_code:
-            self.qr_code.save(f"{self.token}.png", self._generate_qr(), save=False)
-            super().save(update_fields=["qr_code"])
+        if not self.qr_code:
+            # الصورة بتترسم على دفعات في core.qr_render أو أول ما حد يفتحها
+            request_render()
 
 @property
 def all_items_completed(self):
@@ -260,13 +261,10 @@ class LabRequestItem(models.Model):
         return f"{self.request_id} – {self.test.english_name}"
 
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
         super().save(*args, **kwargs)
-        if is_new or not self.sample_qr:
-            img = qrcode.make(reverse("laboratory:sample_scan", args=[str(self.sample_token)]))
-            buf = BytesIO(); img.save(buf, format="PNG")
-            self.sample_qr.save(f"{self.sample_token}.png", ContentFile(buf.getvalue()), save=False)
-            super().save(update_fields=["sample_qr"])
+        if not self.sample_qr:
+            # طلب فيه 30 تحليل ما يستناش رسم 30 صورة
+            request_render()
 
     @property
     def result_display(self):
@@ -369,4 +367,17 @@ class TestResult(models.Model):
             return False
         low  = (self.ref_min is not None and self.value_num < self.ref_min)
         high = (self.ref_max is not None and self.value_num > self.ref_max)
-        return low or high
\ No newline at end of file
+        return low or high
+
+
+# صور QR للطلب ولكل أنبوبة بتترسم في الخلفية (core.qr_render)
+register_target(
+    LabRequest, 'qr_code',
+    payload=lambda lab_request: lab_request.get_scan_url(),
+    filename=lambda lab_request: f"{lab_request.token}.png",
+)
+register_target(
+    LabRequestItem, 'sample_qr',
+    payload=lambda item: reverse("laboratory:sample_scan", args=[str(item.sample_token)]),
+    filename=lambda item: f"{item.sample_token}.png",
+)
@@ -45,7 +45,6 @@ from manager.models import Patient
 from .models import Test, TestGroup, TestOrder, LabRequest, Sample
 from .forms import LabRequestItemResultForm, TestResultForm, TestResultFormSet
 from django.forms import modelformset_factory
-import qrcode
 from .forms import TestResultForm , TestForm #, TestGroupForm
 from .forms import LabRequestForm, LabRequestItemResultForm, TestForm, TestGroupForm
 
@@ -57,9 +56,6 @@ from django.urls import reverse_lazy
 
 from .models import TestResult, Test, TestOrder, LabRequest, Sample 
 #from .forms import TestResultForm, TestResultFormSet
-import base64
-from io import BytesIO
-import qrcode
 from django.urls import reverse
 from datetime import timedelta
 from itertools import groupby
@@ -562,23 +558,6 @@ class LabRequestDetailView(LoginRequiredMixin, HospitalContextMixin, DetailView)
     template_name = "laboratory/lab_request_detail.html"
 
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        obj = self.object
-
-        # لو مافيش ملف QR محفوظ، نولّد واحد Base64 للعرض فقط
-        has_file = getattr(obj, "qr_code", None) and getattr(obj.qr_code, "name", "")
-        if not has_file:
-            scan_url = self.request.build_absolute_uri(
-                reverse("laboratory:lab_request_scan", args=[str(obj.token)])
-            )
-            img = qrcode.make(scan_url)
-            buf = BytesIO()
-            img.save(buf, format="PNG")
-            context["qr_data_uri"] = "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
-
-        return context
-
     def get_queryset(self):
         return LabRequest.objects.select_related("patient", "group").prefetch_related("items__test")
 
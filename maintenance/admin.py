@@ -10,7 +10,8 @@ from .models import (
 from .models import (
     ServiceRequest, WorkOrder, JobPlan, JobPlanStep, PreventiveMaintenanceSchedule,
     SLADefinition, Supplier, SparePart, SystemNotification, EmailLog,
-    NotificationPreference, NotificationTemplate, NotificationQueue
+    NotificationPreference, NotificationTemplate, NotificationQueue,
+    ScheduledJob, JobRun
 )
 from django.contrib import messages
 
@@ -314,3 +315,18 @@ class CalibrationRecordAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('device', 'calibrated_by')
 
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'enabled', 'interval_seconds', 'run_at', 'next_run_at', 'last_run_at', 'last_status', 'last_duration_ms']
+    list_filter = ['enabled', 'last_status']
+    list_editable = ['enabled']
+    readonly_fields = ['last_run_at', 'last_status', 'last_duration_ms']
+
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ['job', 'status', 'attempt', 'scheduled_for', 'started_at', 'duration_ms', 'worker']
+    list_filter = ['status', 'job']
+    readonly_fields = ['job', 'status', 'attempt', 'scheduled_for', 'started_at', 'finished_at', 'duration_ms', 'worker', 'error', 'created_at']
+    date_hierarchy = 'scheduled_for'
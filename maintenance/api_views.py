@@ -14,11 +14,12 @@ from .serializers import (
     DeviceSerializer, DeviceListSerializer, DeviceAccessorySerializer,
     ServiceRequestSerializer, ServiceRequestListSerializer, ServiceRequestCreateSerializer,
     WorkOrderSerializer, WorkOrderListSerializer, WorkOrderUpdateSerializer,
-    SparePartSerializer, SparePartTransactionSerializer, SparePartTransactionCreateSerializer,
+    SparePartSerializer, SparePartTransactionSerializer, SparePartTransactionCreateSerializer, SupplierSerializer,
     JobPlanSerializer, PreventiveMaintenanceScheduleSerializer,
     CalibrationSerializer, DowntimeSerializer, PurchaseOrderSerializer
 )
 from .kpi_utils import get_dashboard_summary, get_critical_alerts
+from . import search_index
 
 class StandardResultsSetPagination(PageNumberPagination):
     """
@@ -563,11 +564,21 @@ def maintenance_statistics(request):
 
 # ============= Search APIs =============
 
+# نوع النتيجة -> (مفتاح الرد، serializer)
+GLOBAL_SEARCH_SERIALIZERS = {
+    'device': ('devices', DeviceListSerializer),
+    'service_request': ('service_requests', ServiceRequestListSerializer),
+    'spare_part': ('spare_parts', SparePartSerializer),
+    'supplier': ('suppliers', SupplierSerializer),
+}
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def global_search(request):
     """
     API للبحث الشامل في النظام
+    النتايج مرتبة ومقسمة لصفحات من فهرس البحث الموحد (search_index)
+    ?q=...&type=device,spare_part&page=1&page_size=20
     """
     query = request.query_params.get('q', '').strip()
     
@@ -577,30 +588,32 @@ def global_search(request):
             'message': 'يجب أن يكون البحث أكثر من حرفين'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # البحث في الأجهزة
-    devices = Device.objects.filter(
-        Q(name__icontains=query) |
-        Q(serial_number__icontains=query) |
-        Q(model__icontains=query)
-    )[:5]
-    
-    # البحث في طلبات الخدمة
-    service_requests = ServiceRequest.objects.filter(
-        Q(title__icontains=query) |
-        Q(description__icontains=query)
-    )[:5]
-    
-    # البحث في قطع الغيار
-    spare_parts = SparePart.objects.filter(
-        Q(name__icontains=query) |
-        Q(part_number__icontains=query)
-    )[:5]
+    entities = [
+        entity for entity in request.query_params.get('type', '').split(',')
+        if entity in GLOBAL_SEARCH_SERIALIZERS
+    ] or list(GLOBAL_SEARCH_SERIALIZERS)
+    try:
+        page = int(request.query_params.get('page', 1))
+        page_size = int(request.query_params.get('page_size', 20))
+    except ValueError:
+        page, page_size = 1, 20
+    
+    result = search_index.search(query, entities=entities, page=page, page_size=page_size)
+    objects = search_index.load_objects(result['hits'])
+    
+    # نفس شكل الرد القديم (مجمع حسب النوع) بترتيب الصلة
+    grouped = {key: [] for key, _ in GLOBAL_SEARCH_SERIALIZERS.values()}
+    for hit in result['hits']:
+        key, serializer_class = GLOBAL_SEARCH_SERIALIZERS[hit['type']]
+        obj = objects.get(hit['type'], {}).get(hit['id'])
+        if obj is not None:
+            grouped[key].append(serializer_class(obj).data)
     
     return Response({
         'success': True,
-        'results': {
-            'devices': DeviceListSerializer(devices, many=True).data,
-            'service_requests': ServiceRequestListSerializer(service_requests, many=True).data,
-            'spare_parts': SparePartSerializer(spare_parts, many=True).data
-        }
+        'count': result['count'],
+        'page': result['page'],
+        'num_pages': result['num_pages'],
+        'hits': result['hits'],
+        'results': grouped,
     })
@@ -6,12 +6,5 @@ class MaintenanceConfig(AppConfig):
     name = 'maintenance'
     
     def ready(self):
-        """تشغيل المهام التلقائية عند بدء التطبيق"""
+        """ربط الإشارات (طابور المهام بيبدأ من core.wsgi / core.asgi مع السيرفر)"""
         import maintenance.signals
-        try:
-            from .tasks import start_maintenance_tasks
-            start_maintenance_tasks()
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"خطأ في بدء مهام الصيانة التلقائية: {str(e)}")
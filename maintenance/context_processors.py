@@ -6,9 +6,11 @@ def permissions_context(request):
     إضافة فاحص الصلاحيات لكل القوالب
     """
     if request.user.is_authenticated:
+        # الفاحص بيحمل لقطة الأدوار مرة واحدة للطلب كله
+        checker = PermissionChecker(request.user)
         return {
-            'perms_checker': PermissionChecker(request.user),
-            'user_roles': request.user.groups.values_list('name', flat=True)
+            'perms_checker': checker,
+            'user_roles': checker.user_roles
         }
     return {
         'perms_checker': None,
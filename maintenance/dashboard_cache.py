@@ -0,0 +1,233 @@
+# كاش نتايج مؤشرات الداشبورد لكل قسم
+# النتيجة بتتخزن بمفتاح (الدالة، القسم، الفترة) ومعاه رقم جيل للقسم، وأي تعديل في أوامر الشغل
+# أو البلاغات أو التوقف أو المعايرة بيزود جيل القسم بتاعه بس فكل مفاتيحه القديمة تبطل مرة واحدة
+# أرقام الأجيال في قاعدة البيانات (DashboardCacheGeneration) عشان الإبطال يوصل لكل العمليات
+# الإبطالات بتتجمع لحد الـ commit: زيادة واحدة لكل قسم في الـ transaction مهما اتحفظ فيها
+import contextvars
+import functools
+import inspect
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+
+from core.shared_cache import is_shared_cache
+
+KEY_PREFIX = 'cmms_dashboard'
+ALL_DEPARTMENTS = 'all'
+GLOBAL_SCOPE = 'global'
+
+# حد أقصى لعمر النتيجة حتى لو مفيش إشارة وصلت (مثلاً تعديل بـ update() من غير إشارات)
+DEFAULT_TIMEOUT = 300
+
+_cached_functions = []
+
+# عمق النداءات المتداخلة (get_dashboard_summary بتنادي دوال متخزنة تانية)
+_depth = contextvars.ContextVar('dashboard_cache_depth', default=0)
+
+# الإبطالات المستنية الـ commit في الـ thread ده
+_pending = threading.local()
+
+
+def _timeout():
+    return getattr(settings, 'CMMS_DASHBOARD_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _department_key(department_id):
+    return str(department_id) if department_id not in (None, '') else ALL_DEPARTMENTS
+
+
+def _stats_key(name, counter):
+    return f'{KEY_PREFIX}:stats:{name}:{counter}'
+
+
+def _incr(key):
+    # add بترجع False لو المفتاح موجود، وبعدها incr آمنة
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def _generations(department):
+    """(جيل النطاق العام، جيل القسم) في استعلام واحد"""
+    from .models import DashboardCacheGeneration
+
+    generations = DashboardCacheGeneration.objects
+    if department == GLOBAL_SCOPE:
+        return generations.filter(scope=GLOBAL_SCOPE).values_list('generation', flat=True).first() or 0, 0
+    if department == ALL_DEPARTMENTS:
+        # "كل الأقسام" بتتبطل مع أي قسم: مجموع أجيال الأقسام بدل صف واحد بيتحدث مع كل حفظ
+        totals = generations.aggregate(
+            global_gen=Sum('generation', filter=Q(scope=GLOBAL_SCOPE)),
+            department_gen=Sum('generation', filter=~Q(scope=GLOBAL_SCOPE)),
+        )
+        return totals['global_gen'] or 0, totals['department_gen'] or 0
+    values = dict(generations.filter(scope__in=[GLOBAL_SCOPE, department]).values_list('scope', 'generation'))
+    return values.get(GLOBAL_SCOPE, 0), values.get(department, 0)
+
+
+def _bump(*scopes):
+    """زيادة جيل النطاقات، والنطاق اللي لسه مالوش صف بيبدأ من 1"""
+    from .models import DashboardCacheGeneration
+
+    bumped = DashboardCacheGeneration.objects.filter(scope__in=scopes).update(generation=F('generation') + 1)
+    if bumped < len(scopes):
+        # الصفوف الموجودة اتزودت فوق، و ignore_conflicts بتسيبها زي ما هي
+        DashboardCacheGeneration.objects.bulk_create(
+            [DashboardCacheGeneration(scope=scope, generation=1) for scope in scopes], ignore_conflicts=True
+        )
+
+
+def cached_kpi(department_scoped=True):
+    """
+    ديكوريتر لدوال kpi_utils اللي بتاخد department_id
+    department_scoped=False للنتايج اللي مش بتتفلتر بالقسم (زي قطع الغيار) فبتتخزن مرة واحدة للكل
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            department = _department_key(params.pop('department_id', None))
+            if not department_scoped:
+                department = GLOBAL_SCOPE
+            window = ','.join(f'{key}={value}' for key, value in sorted(params.items()))
+
+            global_gen, department_gen = _generations(department)
+            key = f'{KEY_PREFIX}:{name}:{department}:{window}:{global_gen}.{department_gen}'
+
+            # العدادات للنداء الخارجي بس، عشان النداءات المتداخلة متتحسبش مرتين
+            outermost = _depth.get() == 0
+            result = cache.get(key)
+            if result is not None:
+                if outermost:
+                    _incr(_stats_key(name, 'hits'))
+                return result
+
+            if outermost:
+                _incr(_stats_key(name, 'misses'))
+            token = _depth.set(_depth.get() + 1)
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                _depth.reset(token)
+            cache.set(key, result, timeout=_timeout())
+            return result
+
+        wrapper.uncached = func
+        _cached_functions.append(name)
+        return wrapper
+    return decorator
+
+
+class _PendingInvalidation:
+    """
+    النطاقات والأجهزة والبلاغات اللي اتعدلت في الـ transaction الحالية
+    بعد الـ commit: استعلام واحد لأقسام الأجهزة وواحد للبلاغات وزيادة واحدة لكل الأقسام
+    """
+
+    def __init__(self):
+        self.scopes = set()
+        self.device_ids = set()
+        self.service_request_ids = set()
+        self.done = False
+
+    def __call__(self):
+        from .models import Device, ServiceRequest
+
+        self.done = True
+        scopes = set(self.scopes)
+        if self.device_ids:
+            scopes.update(map(_department_key, Device.objects.filter(
+                pk__in=self.device_ids
+            ).values_list('department_id', flat=True)))
+        if self.service_request_ids:
+            scopes.update(map(_department_key, ServiceRequest.objects.filter(
+                pk__in=self.service_request_ids
+            ).values_list('device__department_id', flat=True)))
+        if scopes:
+            _bump(*sorted(scopes))
+            _incr(_stats_key('all', 'invalidations'))
+
+
+def _schedule(scopes=(), device_ids=(), service_request_ids=()):
+    """إضافة للإبطال اللي مستني الـ commit، أو إبطال فوري لو مفيش transaction"""
+    batch = getattr(_pending, 'batch', None)
+    # الـ rollback بيشيل الـ callback من غير ما يبلغنا، فبنتأكد إنه لسه مستني في نفس الـ savepoint
+    savepoints = set(connection.savepoint_ids)
+    waiting = (
+        batch is not None and not batch.done and connection.in_atomic_block
+        and any(entry[1] is batch and entry[0] == savepoints for entry in connection.run_on_commit)
+    )
+    if not waiting:
+        batch = _pending.batch = _PendingInvalidation()
+    batch.scopes.update(scopes)
+    batch.device_ids.update(device_id for device_id in device_ids if device_id)
+    batch.service_request_ids.update(pk for pk in service_request_ids if pk)
+    if not waiting:
+        transaction.on_commit(batch)
+
+
+def invalidate_department(department_id):
+    """إبطال نتايج القسم (ونتايج "كل الأقسام" اللي بتشمله) بعد الـ commit"""
+    _schedule(scopes=[_department_key(department_id)])
+
+
+def invalidate_devices(device_ids):
+    """إبطال أقسام الأجهزة دي، والأقسام بتتقري مرة واحدة بعد الـ commit"""
+    _schedule(device_ids=device_ids)
+
+
+def invalidate_service_requests(service_request_ids):
+    """إبطال أقسام أجهزة البلاغات دي (أوامر الشغل)"""
+    _schedule(service_request_ids=service_request_ids)
+
+
+def invalidate_all():
+    """إبطال كل النتايج (تغييرات مش مربوطة بقسم زي قطع الغيار)"""
+    _schedule(scopes=[GLOBAL_SCOPE])
+
+
+def get_cache_stats():
+    """
+    عدادات الإصابة والإخفاق لكل دالة والإجمالي
+    العدادات في الكاش نفسه، فلو الكاش محلي (shared_cache=False) بتغطي العملية الحالية بس
+    """
+    keys = [_stats_key(name, counter) for name in _cached_functions for counter in ('hits', 'misses')]
+    keys.append(_stats_key('all', 'invalidations'))
+    values = cache.get_many(keys)
+
+    functions = {}
+    for name in _cached_functions:
+        hits = values.get(_stats_key(name, 'hits'), 0)
+        misses = values.get(_stats_key(name, 'misses'), 0)
+        functions[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses) * 100, 1) if hits + misses else 0,
+        }
+
+    hits = sum(item['hits'] for item in functions.values())
+    misses = sum(item['misses'] for item in functions.values())
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses) * 100, 1) if hits + misses else 0,
+        'invalidations': values.get(_stats_key('all', 'invalidations'), 0),
+        'shared_cache': is_shared_cache(),
+        'functions': functions,
+    }
+
+
+def reset_cache_stats():
+    keys = [_stats_key(name, counter) for name in _cached_functions for counter in ('hits', 'misses')]
+    keys.append(_stats_key('all', 'invalidations'))
+    cache.delete_many(keys)
@@ -0,0 +1,260 @@
+# تتبع توقف الأجهزة من تغييرات الحالة
+# بدل ما كل ساعة نلف على كل أوامر الشغل والبلاغات النشطة ونسأل عن كل جهاز لوحده:
+# كل تغيير حالة لأمر شغل أو بلاغ بيفتح أو يقفل DeviceDowntime في ساعتها (بدقة الدقيقة)
+# وبيتسجل في DowntimeTransition، والمطابقة الدورية بقت مقارنة مجموعات في كام استعلام ثابت
+# بتصلح بس اللي فات على الإشارات (update() أو bulk_create أو SQL مباشر)
+import logging
+
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import DeviceDowntime, DowntimeTransition, ServiceRequest, WorkOrder
+
+logger = logging.getLogger(__name__)
+
+# نفس الحالات اللي كانت مراقبة التوقف القديمة بتعتبر فيها الجهاز واقف
+ACTIVE_STATUSES = ('new', 'assigned', 'in_progress')
+
+# سبب التوقف حسب نوع أمر الشغل
+WO_TYPE_REASONS = {
+    'corrective': 'breakdown',
+    'preventive': 'maintenance',
+    'predictive': 'maintenance',
+    'emergency': 'breakdown',
+    'calibration': 'calibration',
+    'inspection': 'maintenance',
+}
+
+BATCH_SIZE = 500
+
+
+def is_active(status):
+    return status in ACTIVE_STATUSES
+
+
+def _source_name(instance):
+    return 'work_order' if isinstance(instance, WorkOrder) else 'service_request'
+
+
+def _device_id(instance):
+    if isinstance(instance, WorkOrder):
+        if instance.service_request_id is None:
+            return None
+        return instance.service_request.device_id
+    return instance.device_id
+
+
+def _downtime_values(instance):
+    """السبب والوصف والمبلغ للتوقف اللي بيبدأ بسبب أمر الشغل أو البلاغ ده"""
+    if isinstance(instance, WorkOrder):
+        return {
+            'reason': WO_TYPE_REASONS.get(instance.wo_type, 'other'),
+            'description': f"أمر شغل: {instance.title}\nالتأثير: توقف الجهاز عن العمل",
+            'reported_by_id': instance.created_by_id,
+            'work_order': instance,
+        }
+    return {
+        'reason': 'breakdown' if instance.priority in ('high', 'urgent') else 'maintenance',
+        'description': f"طلب خدمة: {instance.title}\nالتأثير: توقف الجهاز عن العمل",
+        'reported_by_id': instance.reporter_id,
+    }
+
+
+def _device_has_active_work(device_id, exclude=None):
+    """فيه أمر شغل أو بلاغ نشط تاني على الجهاز؟"""
+    work_orders = WorkOrder.objects.filter(service_request__device_id=device_id, status__in=ACTIVE_STATUSES)
+    requests = ServiceRequest.objects.filter(device_id=device_id, status__in=ACTIVE_STATUSES)
+    if isinstance(exclude, WorkOrder):
+        work_orders = work_orders.exclude(pk=exclude.pk)
+    elif exclude is not None:
+        requests = requests.exclude(pk=exclude.pk)
+    return work_orders.exists() or requests.exists()
+
+
+def record_transition(instance, from_status, to_status, at=None):
+    """
+    تطبيق تغيير حالة أمر شغل أو بلاغ على توقف الجهاز
+    from_status None يعني إنشاء جديد، و to_status None يعني حذف
+    بترجع الإجراء: opened / linked / closed / none
+    """
+    if is_active(from_status) == is_active(to_status):
+        return 'none'
+    device_id = _device_id(instance)
+    if device_id is None:
+        return 'none'
+
+    at = at or timezone.now()
+    open_downtime = DeviceDowntime.objects.filter(device_id=device_id, end_time__isnull=True).order_by('pk').first()
+    action = 'none'
+
+    if is_active(to_status):
+        if open_downtime is None:
+            open_downtime = DeviceDowntime.objects.create(device_id=device_id, start_time=at, **_downtime_values(instance))
+            action = 'opened'
+        elif isinstance(instance, WorkOrder) and open_downtime.work_order_id is None:
+            # البلاغ فتح التوقف وأمر الشغل بتاعه بيتربط بيه (زي المراقبة القديمة)
+            open_downtime.work_order = instance
+            open_downtime.reason = WO_TYPE_REASONS.get(instance.wo_type, 'other')
+            open_downtime.save(update_fields=['work_order', 'reason'])
+            action = 'linked'
+    elif open_downtime is not None and not _device_has_active_work(device_id, exclude=instance):
+        open_downtime.end_time = at
+        note = f"تم الإنهاء تلقائياً: {instance} - الحالة: {to_status or 'محذوف'}\nتاريخ النهاية: {at}"
+        open_downtime.description = f"{open_downtime.description}\n\n{note}" if open_downtime.description else note
+        open_downtime.save(update_fields=['end_time', 'description'])
+        action = 'closed'
+
+    if action != 'none':
+        DowntimeTransition.objects.create(
+            device_id=device_id,
+            downtime=open_downtime,
+            source=_source_name(instance),
+            object_id=instance.pk,
+            from_status=from_status or '',
+            to_status=to_status or '',
+            action=action,
+            occurred_at=at,
+        )
+    return action
+
+
+def record_bulk_open(work_orders, at=None):
+    """
+    فتح التوقف لأوامر شغل نشطة اتعملت بـ bulk_create (مفيش post_save)
+    work_orders لازم يكون service_request متحمل معاها. بترجع عدد التوقفات الجديدة
+    """
+    at = at or timezone.now()
+    by_device = {}
+    for work_order in work_orders:
+        if is_active(work_order.status):
+            by_device.setdefault(work_order.service_request.device_id, work_order)
+    if not by_device:
+        return 0
+
+    already_down = set(
+        DeviceDowntime.objects.filter(device_id__in=list(by_device), end_time__isnull=True)
+        .values_list('device_id', flat=True)
+    )
+    created = DeviceDowntime.objects.bulk_create([
+        DeviceDowntime(device_id=device_id, start_time=at, **_downtime_values(work_order))
+        for device_id, work_order in by_device.items()
+        if device_id not in already_down
+    ], batch_size=BATCH_SIZE)
+    DowntimeTransition.objects.bulk_create([
+        DowntimeTransition(
+            device_id=downtime.device_id, downtime=downtime, source='work_order',
+            object_id=downtime.work_order.pk, to_status=downtime.work_order.status,
+            action='opened', occurred_at=at,
+        )
+        for downtime in created
+    ], batch_size=BATCH_SIZE)
+    return len(created)
+
+
+def _active_device_ids():
+    """الأجهزة اللي عليها أمر شغل أو بلاغ نشط"""
+    return set(
+        WorkOrder.objects.filter(status__in=ACTIVE_STATUSES, service_request__isnull=False)
+        .values_list('service_request__device_id', flat=True).order_by().distinct()
+    ) | set(
+        ServiceRequest.objects.filter(status__in=ACTIVE_STATUSES).values_list('device_id', flat=True).order_by().distinct()
+    )
+
+
+def _sources(device_ids):
+    """{device_id: أقدم أمر شغل نشط، وإلا أقدم بلاغ نشط} للأجهزة دي بس"""
+    sources = {}
+    for work_order in WorkOrder.objects.filter(
+        status__in=ACTIVE_STATUSES, service_request__device_id__in=device_ids,
+    ).select_related('service_request').order_by('created_at', 'pk'):
+        sources.setdefault(work_order.service_request.device_id, work_order)
+    missing = [device_id for device_id in device_ids if device_id not in sources]
+    if missing:
+        for request in ServiceRequest.objects.filter(
+            status__in=ACTIVE_STATUSES, device_id__in=missing,
+        ).order_by('created_at', 'pk'):
+            sources.setdefault(request.device_id, request)
+    return sources
+
+
+def _started_at(device_ids):
+    """أقدم وقت إنشاء لشغل نشط على كل جهاز (بداية التوقف اللي فات على الإشارات)"""
+    started = {}
+    for device_id, created in WorkOrder.objects.filter(
+        status__in=ACTIVE_STATUSES, service_request__device_id__in=device_ids,
+    ).values_list('service_request__device_id').annotate(first=Min('created_at')):
+        started[device_id] = created
+    for device_id, created in ServiceRequest.objects.filter(
+        status__in=ACTIVE_STATUSES, device_id__in=device_ids,
+    ).values_list('device_id').annotate(first=Min('created_at')):
+        started[device_id] = min(created, started.get(device_id, created))
+    return started
+
+
+def _ended_at(device_ids):
+    """آخر تحديث لشغل على كل جهاز (أقرب تقدير لنهاية التوقف اللي فات على الإشارات)"""
+    ended = {}
+    for device_id, updated in WorkOrder.objects.filter(
+        service_request__device_id__in=device_ids,
+    ).values_list('service_request__device_id').annotate(last=Max('updated_at')):
+        ended[device_id] = updated
+    for device_id, updated in ServiceRequest.objects.filter(
+        device_id__in=device_ids,
+    ).values_list('device_id').annotate(last=Max('updated_at')):
+        ended[device_id] = max(updated, ended.get(device_id, updated))
+    return ended
+
+
+def reconcile(now=None, dry_run=False):
+    """
+    مطابقة التوقفات المفتوحة مع الشغل النشط
+    الأجهزة اللي عليها شغل نشط ومفيش توقف مفتوح بيتفتح لها توقف، والتوقفات المفتوحة لأجهزة
+    مفيهاش شغل نشط بتتقفل. بترجع {'opened', 'closed'}
+    """
+    now = now or timezone.now()
+    active = _active_device_ids()
+    open_downtimes = {}
+    for downtime in DeviceDowntime.objects.filter(end_time__isnull=True).order_by('pk').only(
+        'pk', 'device_id', 'description', 'end_time',
+    ):
+        open_downtimes.setdefault(downtime.device_id, []).append(downtime)
+
+    to_open = sorted(device_id for device_id in active if device_id not in open_downtimes)
+    to_close = [device_id for device_id in open_downtimes if device_id not in active]
+    result = {'opened': len(to_open), 'closed': sum(len(open_downtimes[d]) for d in to_close)}
+    if dry_run or not (to_open or to_close):
+        return result
+
+    sources = _sources(to_open) if to_open else {}
+    started = _started_at(to_open) if to_open else {}
+    created = DeviceDowntime.objects.bulk_create([
+        DeviceDowntime(device_id=device_id, start_time=started.get(device_id, now), **_downtime_values(sources[device_id]))
+        for device_id in to_open
+    ], batch_size=BATCH_SIZE)
+
+    ended = _ended_at(to_close) if to_close else {}
+    closed = []
+    for device_id in to_close:
+        for downtime in open_downtimes[device_id]:
+            downtime.end_time = ended.get(device_id) or now
+            note = f"تم الإنهاء تلقائياً: لا توجد أعمال نشطة للجهاز\nتاريخ النهاية: {downtime.end_time}"
+            downtime.description = f"{downtime.description}\n\n{note}" if downtime.description else note
+            closed.append(downtime)
+    DeviceDowntime.objects.bulk_update(closed, ['end_time', 'description'], batch_size=BATCH_SIZE)
+
+    DowntimeTransition.objects.bulk_create([
+        DowntimeTransition(
+            device_id=downtime.device_id, downtime=downtime, source='reconcile',
+            action='opened', occurred_at=downtime.start_time,
+        )
+        for downtime in created
+    ] + [
+        DowntimeTransition(
+            device_id=downtime.device_id, downtime=downtime, source='reconcile',
+            action='closed', occurred_at=downtime.end_time,
+        )
+        for downtime in closed
+    ], batch_size=BATCH_SIZE)
+
+    logger.info(f"مطابقة التوقف: فتح {result['opened']} توقف وإنهاء {result['closed']}")
+    return result
@@ -0,0 +1,86 @@
+# كاش في الذاكرة متربوط ببصمة من قاعدة البيانات
+# البصمة عدد الصفوف وآخر updated_at لكل جدول في استعلام واحد (UNION)، وبتتقري كل check_interval
+# ثانية على الأكتر. لو اتغيرت (حفظ أو حذف من أي عملية) كل الأجزاء المتخزنة بتتمسح وبتتحمل تاني
+# أول ما حد يطلبها، والعملية اللي عدلت بتنادي clear() بعد الـ commit فبتشوف التعديل فوراً
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Count, Max, Value
+
+# كل كام ثانية نقرا البصمة من القاعدة (التعديلات في نفس العملية بتبطل فوراً)
+DEFAULT_CHECK_INTERVAL = 5
+
+
+def fingerprint(*models):
+    """(عدد الصفوف، آخر updated_at) لكل جدول، في استعلام واحد"""
+    parts = [
+        model.objects.order_by().values(table=Value(model._meta.db_table)).annotate(
+            rows=Count('pk'), last=Max('updated_at'),
+        )
+        for model in models
+    ]
+    rows = {row['table']: (row['rows'], row['last']) for row in parts[0].union(*parts[1:], all=True)}
+    return tuple(sorted(rows.items()))
+
+
+class FingerprintedCache:
+    """
+    أجزاء بتتحمل من القاعدة بالاسم (section) وبتتمسح كلها لما البصمة تتغير
+    الفرعية بتحدد models (labels زي 'maintenance.SLAMatrix' وكلها فيها updated_at)
+    و check_interval_setting (اسم الإعداد اللي بيغير فترة الفحص)
+    """
+
+    models = ()
+    check_interval_setting = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+        self._sections = {}
+        self.loads = 0
+
+    def check_interval(self):
+        if self.check_interval_setting is None:
+            return DEFAULT_CHECK_INTERVAL
+        return getattr(settings, self.check_interval_setting, DEFAULT_CHECK_INTERVAL)
+
+    def current_version(self):
+        return fingerprint(*(apps.get_model(label) for label in self.models))
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._checked_at = 0
+            self._sections = {}
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval():
+            return
+        version = self.current_version()
+        with self._lock:
+            if version != self._version:
+                self._sections = {}
+                self._version = version
+            self._checked_at = now
+
+    def section(self, name, loader):
+        """الجزء المتخزن، أو loader() لو لسه متحملش أو البصمة اتغيرت"""
+        self._refresh()
+        data = self._sections.get(name)
+        if data is None:
+            version = self._version
+            data = loader()
+            self.loads += 1
+            with self._lock:
+                # لو حصل إبطال أثناء التحميل منحفظش النسخة القديمة
+                if self._version == version:
+                    self._sections[name] = data
+        return data
+
+    def cached(self, name):
+        """الجزء لو متحمل (للإحصائيات)، من غير تحميل ولا فحص"""
+        return self._sections.get(name)
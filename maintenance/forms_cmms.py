@@ -57,75 +57,25 @@ class ServiceRequestForm(forms.ModelForm):
         sla_name = None
         
         try:
-            from .models import SLAMatrix
-            sla_matrix = SLAMatrix.objects.filter(
-                device_category=instance.device.category,
-                severity=instance.severity,
-                impact=instance.impact,
-                priority=instance.priority,
-                is_active=True
-            ).first()
+            from .sla_resolver import resolver
+            response_time, resolution_time, sla_matrix = resolver.resolve_times(
+                instance.device.category_id, instance.severity, instance.impact, instance.priority
+            )
+            instance.estimated_hours = resolution_time
             
             if sla_matrix:
-                # استخدام الأوقات المحسوبة من المصفوفة
-                response_time = sla_matrix.response_time_hours
-                resolution_time = sla_matrix.resolution_time_hours
-                sla_name = sla_matrix.sla_definition.name
-                instance.estimated_hours = resolution_time
-                
-                # إضافة معلومات SLA للوصف
+                # الأوقات المحسوبة من المصفوفة
+                sla_name = sla_matrix.sla_name
                 sla_info = f"\n\n[SLA المطبق: {sla_name} - وقت الاستجابة: {response_time} ساعة - وقت الحل: {resolution_time} ساعة]"
-                if instance.description:
-                    instance.description += sla_info
-                else:
-                    instance.description = f"طلب صيانة {instance.get_request_type_display()}{sla_info}"
             else:
-                # حساب أوقات افتراضية بناءً على المعاملات المُصححة
-                # معاملات الخطورة (كلما ارتفعت الخطورة، قل الوقت المسموح)
-                severity_multipliers = {
-                    'low': 2.0,      # منخفض - وقت أكثر
-                    'medium': 1.0,   # متوسط - وقت عادي
-                    'high': 0.5,     # عالي - وقت أقل
-                    'critical': 0.25 # حرج - وقت أقل بكثير
-                }
-                
-                # معاملات التأثير (كلما ارتفع التأثير، قل الوقت المسموح)
-                impact_multipliers = {
-                    'minimal': 2.0,    # طفيف - وقت أكثر
-                    'moderate': 1.0,   # متوسط - وقت عادي
-                    'significant': 0.5, # كبير - وقت أقل
-                    'extensive': 0.25  # واسع - وقت أقل بكثير
-                }
-                
-                # معاملات الأولوية (كلما ارتفعت الأولوية، قل الوقت المسموح)
-                priority_multipliers = {
-                    'low': 2.0,      # منخفض - وقت أكثر
-                    'medium': 1.0,   # متوسط - وقت عادي
-                    'high': 0.5,     # عالي - وقت أقل
-                    'critical': 0.25 # حرج - وقت أقل بكثير
-                }
-                
-                severity_factor = severity_multipliers.get(instance.severity, 1.0)
-                impact_factor = impact_multipliers.get(instance.impact, 1.0)
-                priority_factor = priority_multipliers.get(instance.priority, 1.0)
-                
-                # أوقات افتراضية أساسية
-                base_response = 12  # 12 ساعة
-                base_resolution = 36  # 36 ساعة
-                
-                # المعامل النهائي (متوسط الثلاثة عوامل)
-                final_multiplier = (severity_factor + impact_factor + priority_factor) / 3
-                
-                response_time = max(1, int(base_response * final_multiplier))
-                resolution_time = max(2, int(base_resolution * final_multiplier))
-                instance.estimated_hours = resolution_time
-                
-                # إضافة معلومات الحساب الافتراضي
+                # حساب افتراضي بالمعاملات لما مفيش خلية في المصفوفة
                 sla_info = f"\n\n[حساب افتراضي - وقت الاستجابة: {response_time} ساعة - وقت الحل: {resolution_time} ساعة]"
-                if instance.description:
-                    instance.description += sla_info
-                else:
-                    instance.description = f"طلب صيانة {instance.get_request_type_display()}{sla_info}"
+            
+            # إضافة معلومات SLA للوصف
+            if instance.description:
+                instance.description += sla_info
+            else:
+                instance.description = f"طلب صيانة {instance.get_request_type_display()}{sla_info}"
                     
         except Exception as e:
             # في حالة عدم وجود SLA مناسب، استخدم Job Plan
@@ -0,0 +1,433 @@
+"""
+طابور المهام الدورية المخزن في قاعدة البيانات
+بدل خيط schedule في كل عملية ويب: عملية واحدة بس (صاحبة الـ lease) بتضيف تشغيلات المهام
+المستحقة في JobRun، وأي عدد من العمال في أي عملية بيسحبوا التشغيلات بتحديث شرطي
+فكل تشغيل بيتنفذ مرة واحدة في الكلاستر، والتشغيلات المعلقة بتفضل في الجدول لو العامل وقع
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from datetime import time as dt_time
+
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import Avg, Count, Max, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import JobRun, ScheduledJob, SchedulerLease
+from .scheduler_config import get_config
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'cmms-scheduler'
+CLAIM_BATCH = 10
+
+# سجل المهام: الاسم -> إعدادات التشغيل والدالة
+JOB_REGISTRY = {}
+
+
+def register_job(name, func, interval=None, run_at=None, max_retries=None, retry_backoff_seconds=None):
+    """
+    تسجيل مهمة دورية
+    interval للمهام اللي بتتكرر كل فترة، run_at (وقت محلي) للمهام اليومية
+    """
+    JOB_REGISTRY[name] = {
+        'func': func,
+        'interval': interval or timedelta(days=1),
+        'run_at': run_at,
+        'max_retries': max_retries if max_retries is not None else get_config('job_queue.max_retries', 3),
+        'retry_backoff_seconds': (
+            retry_backoff_seconds if retry_backoff_seconds is not None
+            else get_config('job_queue.retry_backoff_seconds', 60)
+        ),
+    }
+
+
+def _task_runner_job(method_name):
+    """مهمة بتستخدم نفس جسم الدالة في MaintenanceTaskRunner"""
+    def run():
+        from .tasks import MaintenanceTaskRunner
+        return getattr(MaintenanceTaskRunner(), method_name)()
+    run.__name__ = method_name
+    return run
+
+
+# نفس جدول MaintenanceTaskRunner القديم، ومعاه إرسال طابور الإشعارات
+register_job('pm_schedules', _task_runner_job('_check_pm_schedules'), interval=timedelta(hours=6))
+register_job('sla_violations', _task_runner_job('_check_sla_violations'), interval=timedelta(minutes=30))
+register_job('daily_maintenance_check', _task_runner_job('_daily_maintenance_check'), run_at=dt_time(8, 0))
+register_job('daily_reports', _task_runner_job('_send_daily_reports'), run_at=dt_time(21, 0))
+register_job(
+    'downtime_monitor', _task_runner_job('_monitor_downtime_schedules'),
+    interval=get_config('downtime.reconcile_interval', timedelta(minutes=15)),
+)
+register_job('calibration_check', _task_runner_job('_check_calibration_schedules'), run_at=dt_time(9, 0))
+register_job('kpi_snapshots', _task_runner_job('_rollup_kpi_snapshots'), interval=timedelta(hours=1))
+register_job('pm_forecast', _task_runner_job('_sync_pm_forecast'), run_at=dt_time(1, 0))
+register_job(
+    'notification_queue', _task_runner_job('_process_notification_queue'),
+    interval=get_config('notification_queue.interval', timedelta(minutes=1)),
+)
+register_job(
+    'qr_render', _task_runner_job('_render_qr_images'),
+    interval=get_config('qr_render.interval', timedelta(minutes=5)),
+)
+register_job(
+    'scan_audit_spool', _task_runner_job('_replay_scan_audit_spool'),
+    interval=get_config('scan_audit.replay_interval', timedelta(minutes=5)),
+)
+register_job(
+    'scan_sessions', _task_runner_job('_expire_scan_sessions'),
+    interval=get_config('scan_sessions.expire_interval', timedelta(minutes=5)),
+)
+register_job(
+    'scan_rollups', _task_runner_job('_rollup_qr_scans'),
+    interval=get_config('scan_rollups.interval', timedelta(minutes=15)),
+)
+
+register_job(
+    'zkteco_ingest', _task_runner_job('_ingest_zkteco_attendance'),
+    interval=get_config('zkteco_ingest.interval', timedelta(minutes=5)),
+)
+
+def worker_id(suffix=''):
+    base = f"{socket.gethostname()}:{os.getpid()}"
+    return f"{base}:{suffix}" if suffix else base
+
+
+def next_run_time(definition, after):
+    """موعد التشغيل التالي بعد after"""
+    run_at = definition['run_at']
+    if run_at is None:
+        return after + definition['interval']
+
+    local_after = timezone.localtime(after)
+    candidate = timezone.make_aware(datetime.combine(local_after.date(), run_at))
+    if candidate <= after:
+        candidate = timezone.make_aware(datetime.combine(local_after.date() + timedelta(days=1), run_at))
+    return candidate
+
+
+def sync_jobs(now=None):
+    """إنشاء صفوف ScheduledJob للمهام المسجلة (الإعدادات المعدلة من الأدمن بتفضل زي ما هي)"""
+    now = now or timezone.now()
+    existing = set(ScheduledJob.objects.values_list('name', flat=True))
+    for name, definition in JOB_REGISTRY.items():
+        fields = {
+            'interval_seconds': int(definition['interval'].total_seconds()),
+            'run_at': definition['run_at'],
+        }
+        if name in existing:
+            ScheduledJob.objects.filter(name=name).update(**fields)
+        else:
+            ScheduledJob.objects.get_or_create(name=name, defaults={
+                **fields,
+                'max_retries': definition['max_retries'],
+                'retry_backoff_seconds': definition['retry_backoff_seconds'],
+                'next_run_at': next_run_time(definition, now),
+            })
+
+
+# ────────────────────────────  Leader  ────────────────────────────
+
+def acquire_lease(holder, ttl=None, now=None):
+    """أخذ أو تجديد قفل القيادة، بيرجع True لو holder هو القائد"""
+    now = now or timezone.now()
+    ttl = ttl or timedelta(seconds=get_config('job_queue.lease_ttl_seconds', 30))
+    expires_at = now + ttl
+
+    updated = SchedulerLease.objects.filter(name=LEASE_NAME).filter(
+        Q(holder=holder) | Q(expires_at__lt=now)
+    ).update(holder=holder, expires_at=expires_at)
+    if updated:
+        return True
+    try:
+        with transaction.atomic():
+            SchedulerLease.objects.create(name=LEASE_NAME, holder=holder, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_lease(holder):
+    SchedulerLease.objects.filter(name=LEASE_NAME, holder=holder).update(expires_at=timezone.now())
+
+
+def queue_is_running(now=None):
+    """فيه عملية طابور شغالة لو قفل القيادة ساري (القائد بيجدده كل poll_interval)"""
+    now = now or timezone.now()
+    return SchedulerLease.objects.filter(name=LEASE_NAME, expires_at__gt=now).exists()
+
+
+def trigger_job(name, now=None):
+    """
+    تقديم موعد مهمة لدلوقتي عشان القائد يضيفها في الدورة الجاية
+    الفلتر بيخلي الطلبات المتكررة (مع كل حفظ) ما تكتبش غير أول مرة
+    """
+    now = now or timezone.now()
+    return ScheduledJob.objects.filter(name=name, enabled=True, next_run_at__gt=now).update(next_run_at=now)
+
+
+def enqueue_due_jobs(now=None):
+    """إضافة تشغيل لكل مهمة مستحقة، بيرجع أسماء المهام اللي اتضافت"""
+    now = now or timezone.now()
+    enqueued = []
+    busy = set(
+        JobRun.objects.filter(status__in=['queued', 'running']).values_list('job_id', flat=True)
+    )
+
+    for job in ScheduledJob.objects.filter(enabled=True, next_run_at__lte=now):
+        definition = JOB_REGISTRY.get(job.name)
+        if definition is None:
+            continue
+        with transaction.atomic():
+            # التحديث الشرطي بيمنع الإضافة مرتين لو قائدين اتداخلوا لحظة تسليم القفل
+            advanced = ScheduledJob.objects.filter(pk=job.pk, next_run_at=job.next_run_at).update(
+                next_run_at=next_run_time(definition, now)
+            )
+            # التشغيلات الفايتة بتتدمج في تشغيل واحد، ومفيش تشغيل جديد لو فيه واحد لسه في الطابور
+            if advanced and job.pk not in busy:
+                JobRun.objects.create(job=job, scheduled_for=now)
+                enqueued.append(job.name)
+    return enqueued
+
+
+def _schedule_retry(run, now):
+    if run.attempt > run.job.max_retries:
+        return None
+    delay = run.job.retry_backoff_seconds * (2 ** (run.attempt - 1))
+    return JobRun.objects.create(
+        job=run.job, attempt=run.attempt + 1, scheduled_for=now + timedelta(seconds=delay)
+    )
+
+
+def requeue_stale_runs(now=None, timeout=None):
+    """
+    التشغيلات اللي عاملها وقع في النص بتتسجل فاشلة وتتعاد
+    الحكم بآخر نبضة مش بوقت البدء، فالمهمة البطيئة اللي عاملها لسه عايش ما تتنفذش مرتين
+    """
+    now = now or timezone.now()
+    timeout = timeout or timedelta(seconds=get_config('job_queue.heartbeat_timeout_seconds', 120))
+    stale = JobRun.objects.filter(status='running').alias(
+        last_seen=Coalesce('heartbeat_at', 'started_at')
+    ).filter(last_seen__lt=now - timeout).select_related('job')
+    count = 0
+    for run in stale:
+        # الشرط على النبضة اللي اتقرت: لو العامل نبض بعد القراءة التشغيل بيفضل معاه
+        updated = JobRun.objects.filter(pk=run.pk, status='running', heartbeat_at=run.heartbeat_at).update(
+            status='failed', finished_at=now, error='انتهت المهلة أو توقف العامل'
+        )
+        if updated:
+            _schedule_retry(run, now)
+            count += 1
+    return count
+
+
+def scheduler_tick(holder, now=None):
+    """دورة واحدة للقائد: تجديد القفل ثم إضافة المهام المستحقة"""
+    now = now or timezone.now()
+    if not acquire_lease(holder, now=now):
+        return None
+    requeue_stale_runs(now)
+    return enqueue_due_jobs(now)
+
+
+# ────────────────────────────  Workers  ────────────────────────────
+
+def claim_next_run(worker, now=None):
+    """سحب أقدم تشغيل مستحق، التحديث الشرطي بيضمن إن عامل واحد بس ياخده"""
+    now = now or timezone.now()
+    candidates = JobRun.objects.filter(
+        status='queued', scheduled_for__lte=now
+    ).order_by('scheduled_for', 'id').values_list('id', flat=True)[:CLAIM_BATCH]
+
+    for run_id in candidates:
+        claimed = JobRun.objects.filter(pk=run_id, status='queued').update(
+            status='running', worker=worker, started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return JobRun.objects.select_related('job').get(pk=run_id)
+    return None
+
+
+def _heartbeat_loop(run_id, stop):
+    """نبضة دورية طول ما المهمة شغالة عشان القائد ما يعتبرش العامل واقع"""
+    interval = get_config('job_queue.heartbeat_seconds', 30)
+    try:
+        while not stop.wait(interval):
+            JobRun.objects.filter(pk=run_id, status='running').update(heartbeat_at=timezone.now())
+    except Exception as e:
+        logger.error(f"خطأ في نبضة التشغيل {run_id}: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def execute_run(run):
+    """تنفيذ تشغيل وتسجيل المدة والنتيجة، وجدولة إعادة المحاولة لو فشل"""
+    definition = JOB_REGISTRY.get(run.job.name)
+    started = time.perf_counter()
+    error = ''
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat_loop, args=(run.pk, stop_heartbeat), name=f'cmms-heartbeat-{run.pk}', daemon=True
+    )
+    heartbeat.start()
+    try:
+        if definition is None:
+            raise LookupError(f"مهمة غير مسجلة: {run.job.name}")
+        definition['func']()
+        status = 'succeeded'
+    except Exception:
+        status = 'failed'
+        error = traceback.format_exc()
+        logger.error(f"فشل تشغيل المهمة {run.job.name} (محاولة {run.attempt}): {error}")
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+    now = timezone.now()
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    # لو القائد اعتبر التشغيل واقع وأعاده، النتيجة المتأخرة ما تكتبش فوق الفشل ولا تعمل إعادة تانية
+    finished = JobRun.objects.filter(pk=run.pk, status='running').update(
+        status=status, finished_at=now, duration_ms=duration_ms, error=error
+    )
+    ScheduledJob.objects.filter(pk=run.job_id).update(
+        last_run_at=now, last_status=status, last_duration_ms=duration_ms
+    )
+    if status == 'failed' and finished:
+        _schedule_retry(run, now)
+    return status
+
+
+def work_once(worker):
+    """سحب وتنفيذ تشغيل واحد، بيرجع False لو الطابور فاضي"""
+    run = claim_next_run(worker)
+    if run is None:
+        return False
+    execute_run(run)
+    return True
+
+
+def drain_queue(worker):
+    """تنفيذ كل التشغيلات المستحقة دلوقتي (للتشغيل من cron أو الاختبارات)"""
+    count = 0
+    while work_once(worker):
+        count += 1
+    return count
+
+
+# ────────────────────────────  Metrics  ────────────────────────────
+
+def job_metrics(since=None):
+    """عدد التشغيلات والفشل ومتوسط وأقصى مدة لكل مهمة"""
+    runs = JobRun.objects.all()
+    if since:
+        runs = runs.filter(scheduled_for__gte=since)
+    totals = {
+        row['job__name']: row
+        for row in runs.values('job__name').annotate(
+            runs=Count('id'),
+            succeeded=Count('id', filter=Q(status='succeeded')),
+            failed=Count('id', filter=Q(status='failed')),
+            avg_ms=Avg('duration_ms'),
+            max_ms=Max('duration_ms'),
+        ).order_by()
+    }
+
+    metrics = []
+    for job in ScheduledJob.objects.all():
+        row = totals.get(job.name, {})
+        metrics.append({
+            'name': job.name,
+            'enabled': job.enabled,
+            'next_run_at': job.next_run_at,
+            'last_run_at': job.last_run_at,
+            'last_status': job.last_status,
+            'last_duration_ms': job.last_duration_ms,
+            'runs': row.get('runs', 0),
+            'succeeded': row.get('succeeded', 0),
+            'failed': row.get('failed', 0),
+            'avg_ms': round(row['avg_ms'], 1) if row.get('avg_ms') is not None else None,
+            'max_ms': row.get('max_ms'),
+        })
+    return metrics
+
+
+# ────────────────────────────  Service  ────────────────────────────
+
+class JobQueueService:
+    """
+    خيط جدولة (بيحاول ياخد القيادة) + مجموعة عمال بعدد concurrency
+    ممكن يشتغل في أي عدد من العمليات أو الأجهزة في نفس الوقت
+    """
+
+    def __init__(self, concurrency=None, poll_interval=None):
+        self.concurrency = concurrency or get_config('job_queue.concurrency', 2)
+        self.poll_interval = poll_interval or get_config('job_queue.poll_interval_seconds', 5)
+        self.holder = worker_id()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads.append(threading.Thread(target=self._scheduler_loop, name='cmms-scheduler', daemon=True))
+        for index in range(self.concurrency):
+            self._threads.append(threading.Thread(
+                target=self._worker_loop, args=(worker_id(f'w{index}'),), name=f'cmms-worker-{index}', daemon=True
+            ))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"تم بدء طابور المهام ({self.concurrency} عامل) - {self.holder}")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        try:
+            release_lease(self.holder)
+        finally:
+            close_old_connections()
+        logger.info("تم إيقاف طابور المهام")
+
+    def run_forever(self):
+        self.start()
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _scheduler_loop(self):
+        synced = False
+        while not self._stop.is_set():
+            try:
+                close_old_connections()
+                if not synced:
+                    sync_jobs()
+                    synced = True
+                enqueued = scheduler_tick(self.holder)
+                if enqueued:
+                    logger.info(f"تمت إضافة المهام: {', '.join(enqueued)}")
+            except Exception as e:
+                logger.error(f"خطأ في جدولة المهام: {str(e)}")
+            self._stop.wait(self.poll_interval)
+
+    def _worker_loop(self, worker):
+        while not self._stop.is_set():
+            try:
+                close_old_connections()
+                if work_once(worker):
+                    continue
+            except Exception as e:
+                logger.error(f"خطأ في عامل طابور المهام {worker}: {str(e)}")
+            self._stop.wait(self.poll_interval)
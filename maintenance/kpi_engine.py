@@ -0,0 +1,263 @@
+# محرك حساب MTBF / MTTR / التوفر لكل الأجهزة مرة واحدة
+# بدل ما نعمل استعلامات لكل جهاز، بنجيب الأجهزة وأوامر الشغل وجداول الصيانة الوقائية في عدد
+# ثابت من الاستعلامات، والـ SLA وخطط العمل من فهرس sla_resolver، ونحسب كل حاجة في الذاكرة
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Device, PreventiveMaintenanceSchedule, WorkOrder
+from .sla_resolver import resolver
+
+FAILURE_REQUEST_TYPES = ['corrective', 'breakdown']
+COMPLETED_STATUSES = ['closed', 'qa_verified', 'resolved']
+OPEN_STATUSES = ['new', 'assigned', 'in_progress', 'wait_parts']
+
+PRIORITY_REPAIR_HOURS = {'critical': 2, 'high': 4, 'medium': 8}
+DEFAULT_PRIORITY_REPAIR_HOURS = 24
+
+# تقدير MTBF للأجهزة اللي مالهاش أعطال في الفترة (ساعات لكل يوم)
+NO_FAILURE_MTBF_HOURS_PER_DAY = {'working': 24, 'needs_check': 20, 'needs_maintenance': 12}
+
+# تقدير MTTR بناءً على حالة الجهاز لما مفيش أوامر شغل ولا SLA ولا خطة عمل
+STATUS_MTTR_HOURS = {'working': 2.0, 'needs_check': 4.0, 'needs_maintenance': 8.0, 'out_of_order': 24.0}
+DEFAULT_STATUS_MTTR_HOURS = 6.0
+
+# الحد الأقصى للتوفر حسب حالة الجهاز: (مع SLA, بدون SLA)
+STATUS_AVAILABILITY_CAP = {
+    'needs_maintenance': (40, 30),
+    'needs_check': (80, 70),
+    'working': (98, 95),
+}
+
+DEFAULT_MTBF_HOURS = 720
+DEFAULT_MTTR_HOURS = 4.0
+
+
+def _priority_hours(priority):
+    return PRIORITY_REPAIR_HOURS.get(priority, DEFAULT_PRIORITY_REPAIR_HOURS)
+
+
+def _hours(delta):
+    return delta.total_seconds() / 3600
+
+
+class DeviceKPIEngine:
+    """
+    حساب مؤشرات الأجهزة لنطاق (جهاز / قسم / الكل) في عدد ثابت من الاستعلامات
+    نفس منطق calculate_mtbf و calculate_mttr و calculate_availability القديم بالظبط
+    """
+
+    def __init__(self, device_id=None, department_id=None, days=30, now=None):
+        self.device_id = device_id
+        self.department_id = department_id
+        self.days = days
+        self.end_date = now or timezone.now()
+        self.start_date = self.end_date - timedelta(days=days)
+
+        self._devices = None
+        self._work_orders = None
+        self._sla_hours = None
+        self._job_plan_hours = None
+        self._pm_downtime = None
+
+    # ────────────────────────────  Bulk loading  ────────────────────────────
+
+    def _device_queryset(self):
+        devices = Device.objects.all()
+        if self.device_id:
+            devices = devices.filter(id=self.device_id)
+        if self.department_id:
+            devices = devices.filter(department_id=self.department_id)
+        return devices
+
+    @property
+    def devices(self):
+        """[{id, status, category_id}] بترتيب الأجهزة الافتراضي"""
+        if self._devices is None:
+            self._devices = list(self._device_queryset().values('id', 'status', 'category_id'))
+        return self._devices
+
+    @property
+    def work_orders(self):
+        """أوامر شغل الأعطال في الفترة مجمعة حسب الجهاز ومرتبة بوقت الإنشاء"""
+        if self._work_orders is None:
+            rows = WorkOrder.objects.filter(
+                created_at__range=[self.start_date, self.end_date],
+                service_request__request_type__in=FAILURE_REQUEST_TYPES,
+            )
+            if self.device_id:
+                rows = rows.filter(service_request__device_id=self.device_id)
+            if self.department_id:
+                rows = rows.filter(service_request__device__department_id=self.department_id)
+            rows = rows.values(
+                'status', 'created_at', 'updated_at', 'actual_start', 'actual_end',
+                'actual_hours', 'estimated_hours',
+                device_id=F('service_request__device_id'),
+                request_type=F('service_request__request_type'),
+                sr_priority=F('service_request__priority'),
+            ).order_by('created_at', 'id')
+
+            grouped = defaultdict(list)
+            for row in rows:
+                grouped[row['device_id']].append(row)
+            self._work_orders = grouped
+        return self._work_orders
+
+    @property
+    def sla_hours(self):
+        """{category_id: resolution_time_hours} لأول SLA نشط في كل فئة"""
+        if self._sla_hours is None:
+            self._sla_hours = {
+                category_id: row.resolution_time_hours
+                for category_id, row in resolver.category_definitions().items()
+            }
+        return self._sla_hours
+
+    @property
+    def job_plan_hours(self):
+        """{category_id: estimated_hours} لأول خطة عمل نشطة في كل فئة"""
+        if self._job_plan_hours is None:
+            self._job_plan_hours = resolver.job_plan_hours
+        return self._job_plan_hours
+
+    @property
+    def pm_downtime(self):
+        """{device_id: [ساعات توقف كل صيانة وقائية مستحقة في الفترة]}"""
+        if self._pm_downtime is None:
+            schedules = PreventiveMaintenanceSchedule.objects.filter(
+                device_id__in=[device['id'] for device in self.devices],
+                next_due_date__range=[self.start_date.date(), self.end_date.date()],
+                job_plan__isnull=False,
+            ).order_by('next_due_date', 'pk').values_list('device_id', 'job_plan__estimated_hours')
+
+            grouped = defaultdict(list)
+            for device_id, estimated_hours in schedules:
+                # تقدير افتراضي للصيانة الوقائية (ساعتان)
+                grouped[device_id].append(float(estimated_hours) if estimated_hours else 2)
+            self._pm_downtime = grouped
+        return self._pm_downtime
+
+    # ────────────────────────────  Per-device KPIs  ────────────────────────────
+
+    def device_mtbf(self, device):
+        """MTBF للجهاز بالساعات، أو None لو الجهاز مش داخل في المتوسط"""
+        orders = self.work_orders.get(device['id'], [])
+
+        if len(orders) >= 2:
+            intervals = []
+            for prev_wo, curr_wo in zip(orders, orders[1:]):
+                prev_end = prev_wo['actual_end'] or prev_wo['created_at']
+                curr_start = curr_wo['actual_start'] or curr_wo['created_at']
+                interval_hours = _hours(curr_start - prev_end)
+                if interval_hours > 0:
+                    intervals.append(interval_hours)
+            return sum(intervals) / len(intervals) if intervals else None
+
+        if len(orders) == 1:
+            first_failure = orders[0]['actual_start'] or orders[0]['created_at']
+            hours_to_failure = _hours(first_failure - self.start_date)
+            return hours_to_failure if hours_to_failure > 0 else None
+
+        # لا توجد أعطال - نتجاهل الأجهزة المعطلة out_of_order
+        hours_per_day = NO_FAILURE_MTBF_HOURS_PER_DAY.get(device['status'])
+        return self.days * hours_per_day if hours_per_day else None
+
+    def work_order_repair_hours(self, wo):
+        if wo['actual_hours']:
+            return float(wo['actual_hours'])
+        if wo['actual_start'] and wo['actual_end']:
+            return _hours(wo['actual_end'] - wo['actual_start'])
+        if wo['estimated_hours']:
+            return float(wo['estimated_hours'])
+        if wo['status'] in COMPLETED_STATUSES and wo['updated_at'] and wo['created_at']:
+            return min(_hours(wo['updated_at'] - wo['created_at']), 72)  # حد أقصى 3 أيام
+        if wo['status'] in OPEN_STATUSES:
+            return min(_hours(self.end_date - wo['created_at']), 48)  # حد أقصى يومين
+        return _priority_hours(wo['sr_priority'])
+
+    def device_estimated_mttr(self, device):
+        """تقدير MTTR للجهاز من SLA أو خطة العمل أو حالته لما مفيش أوامر شغل"""
+        category_id = device['category_id']
+        if category_id in self.sla_hours:
+            return float(self.sla_hours[category_id])
+        if self.job_plan_hours.get(category_id):
+            return float(self.job_plan_hours[category_id])
+        return STATUS_MTTR_HOURS.get(device['status'], DEFAULT_STATUS_MTTR_HOURS)
+
+    def device_availability(self, device):
+        sla_hours = self.sla_hours.get(device['category_id'])
+        total_downtime_hours = 0
+
+        for wo in self.work_orders.get(device['id'], []):
+            if wo['request_type'] != 'corrective':
+                continue
+            if wo['status'] in ('closed', 'qa_verified'):
+                if wo['actual_start'] and wo['actual_end']:
+                    total_downtime_hours += _hours(wo['actual_end'] - wo['actual_start'])
+                elif sla_hours is not None:
+                    total_downtime_hours += sla_hours
+                else:
+                    total_downtime_hours += _priority_hours(wo['sr_priority'])
+            elif wo['status'] in OPEN_STATUSES:
+                elapsed_time = _hours(self.end_date - wo['created_at'])
+                # إذا تجاوز الوقت المحدد في SLA، نحسب كامل الوقت
+                total_downtime_hours += max(elapsed_time, sla_hours) if sla_hours is not None else elapsed_time
+
+        total_period_hours = self.days * 24
+        uptime_hours = max(0, total_period_hours - total_downtime_hours)
+        availability = (uptime_hours / total_period_hours) * 100
+
+        if device['status'] == 'out_of_order':
+            availability = 0
+        elif device['status'] in STATUS_AVAILABILITY_CAP:
+            with_sla, without_sla = STATUS_AVAILABILITY_CAP[device['status']]
+            availability = min(availability, with_sla if sla_hours is not None else without_sla)
+
+        # الصيانة الوقائية المجدولة بتعيد حساب التوفر من ساعات التوقف
+        for pm_hours in self.pm_downtime.get(device['id'], []):
+            total_downtime_hours += pm_hours
+            uptime_hours = max(0, total_period_hours - total_downtime_hours)
+            availability = (uptime_hours / total_period_hours) * 100
+
+        return max(0, availability)
+
+    # ────────────────────────────  Aggregates  ────────────────────────────
+
+    def mtbf(self):
+        values = [value for value in map(self.device_mtbf, self.devices) if value is not None]
+        return sum(values) / len(values) if values else DEFAULT_MTBF_HOURS
+
+    def mttr(self):
+        repair_times = []
+        for orders in self.work_orders.values():
+            for wo in orders:
+                repair_time = self.work_order_repair_hours(wo)
+                if repair_time > 0:
+                    repair_times.append(repair_time)
+        if repair_times:
+            return sum(repair_times) / len(repair_times)
+
+        if not self.devices:
+            return DEFAULT_MTTR_HOURS
+        estimates = [self.device_estimated_mttr(device) for device in self.devices]
+        return sum(estimates) / len(estimates)
+
+    def availability(self):
+        if not self.devices:
+            return 0
+        values = [self.device_availability(device) for device in self.devices]
+        return sum(values) / len(values)
+
+    def per_device(self):
+        """مؤشرات كل جهاز على حدة"""
+        return [
+            {
+                'device_id': device['id'],
+                'mtbf': self.device_mtbf(device),
+                'availability': self.device_availability(device),
+                'failures': len(self.work_orders.get(device['id'], [])),
+            }
+            for device in self.devices
+        ]
@@ -0,0 +1,313 @@
+# تجميع المؤشرات اليومية في جدول KPISnapshot
+# المهمة الدورية بتعيد حساب الأيام اللي اتغير فيها أمر شغل أو حدث توقف أو معايرة بس،
+# والاتجاهات الشهرية في الداشبورد بتقرأ الصفوف المجمعة بدل ما تلف على أوامر الشغل
+import calendar
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .dashboard_cache import invalidate_department
+from .kpi_engine import COMPLETED_STATUSES, FAILURE_REQUEST_TYPES
+from .models import CalibrationRecord, Device, DowntimeEvent, KPISnapshot, KPISnapshotCursor, WorkOrder
+
+DAYS_PER_CHUNK = 31
+DEVICES_PER_CHUNK = 500
+CURSOR_NAME = 'daily'
+
+COUNTER_FIELDS = [
+    'work_orders_created', 'work_orders_completed', 'work_orders_overdue', 'failures',
+    'preventive_work_orders', 'repair_count', 'repair_hours', 'downtime_hours',
+    'calibrations_completed',
+]
+
+
+def _hours(delta):
+    return delta.total_seconds() / 3600
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def days_between(start, end):
+    """كل الأيام (بالتوقيت المحلي) من start لحد end"""
+    day, last = timezone.localdate(start), timezone.localdate(end)
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def last_rollup_time():
+    """
+    وقت آخر تشغيل، أو None لو المهمة عمرها ما اشتغلت
+    لو مفيش مؤشر (قاعدة بيانات قبل المؤشر) بنرجع لآخر صف اتكتب
+    """
+    cursor = KPISnapshotCursor.objects.filter(name=CURSOR_NAME).first()
+    if cursor:
+        return cursor.last_run_at
+    return KPISnapshot.objects.aggregate(last=Max('computed_at'))['last']
+
+
+# ────────────────────────────  Dirty days  ────────────────────────────
+
+def collect_dirty_days(since, now):
+    """
+    {day: {device_id}} للأيام اللي محتاجة إعادة حساب
+    since=None معناها أول تشغيل، فبنحسب التاريخ كله
+    """
+    dirty = defaultdict(set)
+
+    work_orders = WorkOrder.objects.filter(service_request__isnull=False)
+    if since is not None:
+        work_orders = work_orders.filter(
+            Q(updated_at__gt=since)
+            # أوامر مفتوحة عدت موعد الحل من آخر تشغيل فبقت متأخرة من غير ما تتعدل
+            | Q(actual_end__isnull=True, service_request__resolution_due__gt=since,
+                service_request__resolution_due__lte=now)
+        )
+    for device_id, created_at in work_orders.values_list('service_request__device_id', 'created_at').iterator():
+        dirty[timezone.localdate(created_at)].add(device_id)
+
+    events = DowntimeEvent.objects.filter(start_time__isnull=False)
+    if since is not None:
+        events = events.filter(Q(updated_at__gt=since) | Q(end_time__isnull=True))
+    for device_id, start_time, end_time, updated_at in events.values_list(
+        'device_id', 'start_time', 'end_time', 'updated_at'
+    ).iterator():
+        if end_time is None and since is not None and updated_at <= since:
+            # توقف مستمر مااتعدلش: الأيام القديمة محسوبة، بس اللي بعد آخر تشغيل بتزيد ساعاتها
+            start_time = max(start_time, since)
+        for day in days_between(start_time, min(end_time or now, now)):
+            dirty[day].add(device_id)
+
+    calibrations = CalibrationRecord.objects.filter(calibration_date__isnull=False)
+    if since is not None:
+        calibrations = calibrations.filter(updated_at__gt=since)
+    for device_id, calibration_date in calibrations.values_list('device_id', 'calibration_date').iterator():
+        dirty[calibration_date].add(device_id)
+
+    for device_id, day in KPISnapshot.objects.filter(is_stale=True).values_list('device_id', 'date'):
+        dirty[day].add(device_id)
+
+    return dirty
+
+
+def mark_snapshots_stale(device_id, days):
+    """تعليم صفوف أيام معينة للجهاز عشان تتحسب تاني (بيتنادى عند الحذف)"""
+    days = list(days)
+    if device_id and days:
+        KPISnapshot.objects.filter(device_id=device_id, date__in=days).update(is_stale=True)
+
+
+# ────────────────────────────  Rebuild  ────────────────────────────
+
+def _daily_counters(days, now, device_ids=None, department_id=None):
+    """
+    {(device_id, day): العدادات} من أوامر الشغل والتوقف والمعايرات الخام
+    لأجهزة device_ids أو لأجهزة قسم department_id (أو كل الأجهزة)
+    """
+    day_set = set(days)
+    range_start = _day_start(min(days))
+    range_end = _day_start(max(days) + timedelta(days=1))
+    counters = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+
+    def scope(prefix):
+        if device_ids is not None:
+            return Q(**{f'{prefix}id__in': device_ids})
+        if department_id:
+            return Q(**{f'{prefix}department_id': department_id})
+        return Q()
+
+    work_orders = WorkOrder.objects.filter(
+        scope('service_request__device__'),
+        service_request__isnull=False,
+        created_at__gte=range_start,
+        created_at__lt=range_end,
+    ).values(
+        'status', 'created_at', 'actual_start', 'actual_end',
+        device_id=F('service_request__device_id'),
+        request_type=F('service_request__request_type'),
+        resolution_due=F('service_request__resolution_due'),
+    )
+    for wo in work_orders:
+        day = timezone.localdate(wo['created_at'])
+        if day not in day_set:
+            continue
+        row = counters[(wo['device_id'], day)]
+        row['work_orders_created'] += 1
+        if wo['status'] in COMPLETED_STATUSES:
+            row['work_orders_completed'] += 1
+            if wo['actual_start'] and wo['actual_end']:
+                row['repair_count'] += 1
+                row['repair_hours'] += _hours(wo['actual_end'] - wo['actual_start'])
+        if wo['actual_end'] is None and wo['resolution_due'] and wo['resolution_due'] < now:
+            row['work_orders_overdue'] += 1
+        if wo['request_type'] in FAILURE_REQUEST_TYPES:
+            row['failures'] += 1
+        elif wo['request_type'] == 'preventive':
+            row['preventive_work_orders'] += 1
+
+    events = DowntimeEvent.objects.filter(
+        scope('device__'),
+        start_time__lt=range_end,
+    ).filter(Q(end_time__isnull=True) | Q(end_time__gt=range_start))
+    for device_id, start_time, end_time in events.values_list('device_id', 'start_time', 'end_time'):
+        end_time = min(end_time or now, now)
+        for day in days_between(start_time, end_time):
+            if day not in day_set:
+                continue
+            overlap = min(end_time, _day_start(day + timedelta(days=1))) - max(start_time, _day_start(day))
+            if overlap > timedelta(0):
+                counters[(device_id, day)]['downtime_hours'] += _hours(overlap)
+
+    calibrations = CalibrationRecord.objects.filter(
+        scope('device__'), calibration_date__range=(min(days), max(days)), status='completed'
+    ).values_list('device_id', 'calibration_date')
+    for device_id, calibration_date in calibrations:
+        if calibration_date in day_set:
+            counters[(device_id, calibration_date)]['calibrations_completed'] += 1
+
+    return counters
+
+
+def _rebuild_chunk(days, device_ids, now):
+    """إعادة حساب كل (جهاز، يوم) في days × device_ids واستبدال صفوفهم"""
+    counters = _daily_counters(days, now, device_ids=device_ids)
+
+    departments = dict(Device.objects.filter(id__in=device_ids).values_list('id', 'department_id'))
+    rows = [
+        KPISnapshot(device_id=device_id, department_id=departments[device_id], date=day, computed_at=now, **values)
+        for (device_id, day), values in counters.items()
+        if device_id in departments and any(values.values())
+    ]
+
+    with transaction.atomic():
+        KPISnapshot.objects.filter(device_id__in=device_ids, date__in=days).delete()
+        KPISnapshot.objects.bulk_create(rows, batch_size=1000)
+    return len(rows), set(departments.values())
+
+
+def rebuild_snapshots(dirty, now=None):
+    """إعادة حساب الأيام المتعلمة على دفعات، بيرجع عدد الصفوف المكتوبة"""
+    now = now or timezone.now()
+    written = 0
+    departments = set()
+    for days in _chunks(sorted(dirty), DAYS_PER_CHUNK):
+        device_ids = sorted(device_id for device_id in set().union(*(dirty[day] for day in days)) if device_id)
+        for devices in _chunks(device_ids, DEVICES_PER_CHUNK):
+            rows, chunk_departments = _rebuild_chunk(days, devices, now)
+            written += rows
+            departments |= chunk_departments
+
+    # الاتجاهات المتخزنة في كاش الداشبورد للأقسام دي بقت قديمة
+    for department_id in departments:
+        invalidate_department(department_id)
+    return written
+
+
+def rollup_kpi_snapshots(now=None):
+    """
+    المهمة الدورية: تحديث اللقطات اليومية اللي اتغيرت مصادرها من آخر تشغيل بس
+    """
+    now = now or timezone.now()
+    dirty = collect_dirty_days(last_rollup_time(), now)
+    rows = rebuild_snapshots(dirty, now)
+    # المؤشر بيتقدم حتى لو مفيش صفوف اتكتبت، عشان التشغيل الجاي ميرجعش يلف على نفس الفترة
+    KPISnapshotCursor.objects.update_or_create(name=CURSOR_NAME, defaults={'last_run_at': now})
+    return {
+        'days': len(dirty),
+        'device_days': sum(len(devices) for devices in dirty.values()),
+        'rows': rows,
+    }
+
+
+# ────────────────────────────  Readers  ────────────────────────────
+
+def has_snapshots():
+    return KPISnapshot.objects.exists()
+
+
+def _month_starts(today, months):
+    """أول يوم في كل شهر من الأقدم للأحدث"""
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(months):
+        starts.append(today.replace(year=year, month=month, day=1))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return list(reversed(starts))
+
+
+def _trend_row(month_start, totals):
+    """صف شهر واحد من مجاميع العدادات (نفس التعريفات للقطات والحساب الخام)"""
+    total_wo = totals.get('work_orders_created') or 0
+    completed_wo = totals.get('work_orders_completed') or 0
+    overdue_wo = totals.get('work_orders_overdue') or 0
+    repair_count = totals.get('repair_count') or 0
+    failures = totals.get('failures') or 0
+    mttr = (totals.get('repair_hours') or 0) / repair_count if repair_count else 0
+
+    # معدل الأعطال من طلبات العطل الفعلية مش من كل أوامر الشغل
+    failure_rate = (failures / 30) if failures > 0 else 0
+    availability = max(0, 100 - (failure_rate * mttr / 24 * 100))
+
+    return {
+        'month': month_start.strftime('%Y-%m'),
+        'month_name': calendar.month_name[month_start.month],
+        'mtbf': 720 / failure_rate if failure_rate > 0 else 720,
+        'mttr': round(mttr, 1),
+        'availability': round(availability, 1),
+        'pm_compliance': round((totals.get('preventive_work_orders') or 0) / total_wo * 100, 1) if total_wo else 0,
+        'total_work_orders': total_wo,
+        'completion_rate': round(completed_wo / total_wo * 100, 1) if total_wo else 0,
+        'overdue_rate': round(overdue_wo / total_wo * 100, 1) if total_wo else 0,
+        'failures': failures,
+        'downtime_hours': round(totals.get('downtime_hours') or 0, 1),
+        'calibrations_completed': totals.get('calibrations_completed') or 0,
+    }
+
+
+def snapshot_monthly_trends(department_id=None, months=6, today=None):
+    """
+    نفس مخرجات get_monthly_trends بس من اللقطات اليومية، باستعلام واحد
+    الشهور هنا شهور تقويمية كاملة
+    """
+    today = today or timezone.localdate()
+    month_starts = _month_starts(today, months)
+
+    snapshots = KPISnapshot.objects.filter(date__gte=month_starts[0])
+    if department_id:
+        snapshots = snapshots.filter(department_id=department_id)
+    totals = {
+        row['month']: {name: row[f'total_{name}'] for name in COUNTER_FIELDS}
+        for row in snapshots.annotate(month=TruncMonth('date')).values('month').annotate(
+            **{f'total_{name}': Sum(name) for name in COUNTER_FIELDS}
+        ).order_by()
+    }
+    return [_trend_row(month_start, totals.get(month_start, {})) for month_start in month_starts]
+
+
+def raw_monthly_trends(department_id=None, months=6, today=None, now=None):
+    """
+    نفس الاتجاهات من أوامر الشغل الخام (قبل أول تشغيل للتجميع)
+    بنفس عدادات اللقطات، فالأرقام ما بتتغيرش لما اللقطات تبدأ
+    """
+    now = now or timezone.now()
+    today = today or timezone.localdate(now)
+    month_starts = _month_starts(today, months)
+    days = [month_starts[0] + timedelta(days=n) for n in range((today - month_starts[0]).days + 1)]
+
+    totals = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    for (_, day), values in _daily_counters(days, now, department_id=department_id).items():
+        month = totals[day.replace(day=1)]
+        for name, value in values.items():
+            month[name] += value
+    return [_trend_row(month_start, totals.get(month_start, {})) for month_start in month_starts]
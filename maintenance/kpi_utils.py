@@ -5,337 +5,39 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import Device, SLADefinition
 from .models import ServiceRequest, WorkOrder, PreventiveMaintenanceSchedule, SparePart
+from .dashboard_cache import cached_kpi
+from .kpi_engine import DeviceKPIEngine
+from .kpi_snapshots import has_snapshots, raw_monthly_trends, snapshot_monthly_trends
 import calendar
 
+@cached_kpi()
 def calculate_mtbf(device_id=None, department_id=None, days=30):
     """
     حساب متوسط الوقت بين الأعطال (MTBF) باستخدام الأوقات الفعلية من Work Orders
     """
-    # تحديد الفترة الزمنية
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=days)
-    
-    # جلب الأجهزة
-    devices = Device.objects.all()
-    if device_id:
-        devices = devices.filter(id=device_id)
-    if department_id:
-        devices = devices.filter(department_id=department_id)
-    
-    total_mtbf = 0
-    device_count = 0
-    
-    for device in devices:
-        # جلب أوامر الشغل للأعطال التصحيحية والطارئة
-        work_orders = WorkOrder.objects.filter(
-            service_request__device=device,
-            service_request__request_type__in=['corrective', 'breakdown'],
-            created_at__range=[start_date, end_date]
-        ).order_by('created_at')
-        
-        failure_count = work_orders.count()
-        
-        if failure_count >= 2:
-            # حساب الفترات بين الأعطال باستخدام الأوقات الفعلية
-            intervals = []
-            for i in range(1, failure_count):
-                prev_wo = work_orders[i-1]
-                curr_wo = work_orders[i]
-                
-                # استخدام actual_end إذا متوفر، وإلا استخدام created_at
-                prev_end = prev_wo.actual_end if prev_wo.actual_end else prev_wo.created_at
-                curr_start = curr_wo.actual_start if curr_wo.actual_start else curr_wo.created_at
-                
-                interval_hours = (curr_start - prev_end).total_seconds() / 3600
-                if interval_hours > 0:
-                    intervals.append(interval_hours)
-            
-            if intervals:
-                device_mtbf = sum(intervals) / len(intervals)
-                total_mtbf += device_mtbf
-                device_count += 1
-        elif failure_count == 1:
-            # عطل واحد فقط - نحسب من بداية الفترة
-            first_wo = work_orders.first()
-            first_failure = first_wo.actual_start if first_wo.actual_start else first_wo.created_at
-            hours_to_failure = (first_failure - start_date).total_seconds() / 3600
-            if hours_to_failure > 0:
-                total_mtbf += hours_to_failure
-                device_count += 1
-        else:
-            # لا توجد أعطال - الجهاز يعمل بدون مشاكل
-            if device.status == 'working':
-                # نعتبر أن الجهاز عمل طوال الفترة
-                estimated_mtbf = days * 24
-                total_mtbf += estimated_mtbf
-                device_count += 1
-            elif device.status == 'needs_check':
-                estimated_mtbf = days * 20  # 80% من الفترة
-                total_mtbf += estimated_mtbf
-                device_count += 1
-            elif device.status == 'needs_maintenance':
-                estimated_mtbf = days * 12  # 50% من الفترة
-                total_mtbf += estimated_mtbf
-                device_count += 1
-            # نتجاهل الأجهزة المعطلة out_of_order
-    
-    return total_mtbf / device_count if device_count > 0 else 720  # متوسط شهر إذا لم توجد بيانات
+    return DeviceKPIEngine(device_id=device_id, department_id=department_id, days=days).mtbf()
 
+@cached_kpi()
 def calculate_mttr(device_id=None, department_id=None, days=30):
     """
     حساب متوسط وقت الإصلاح (MTTR) باستخدام الأوقات الفعلية من Work Orders
     """
-    from .models import SLADefinition, JobPlan
-    
-    # تحديد الفترة الزمنية
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=days)
-    
-    # جلب أوامر الشغل للأعطال التصحيحية والطارئة
-    work_orders = WorkOrder.objects.filter(
-        created_at__range=[start_date, end_date],
-        service_request__request_type__in=['corrective', 'breakdown']
-    )
-    
-    if device_id:
-        work_orders = work_orders.filter(service_request__device_id=device_id)
-    if department_id:
-        work_orders = work_orders.filter(service_request__device__department_id=department_id)
-    
-    total_repair_time = 0
-    valid_orders = 0
-    
-    for wo in work_orders:
-        repair_time = 0
-        
-        # استخدام actual_hours إذا متوفرة
-        if hasattr(wo, 'actual_hours') and wo.actual_hours:
-            repair_time = float(wo.actual_hours)
-        # استخدام الفرق بين actual_start و actual_end
-        elif wo.actual_start and wo.actual_end:
-            repair_time = (wo.actual_end - wo.actual_start).total_seconds() / 3600
-        # استخدام estimated_hours إذا متوفرة
-        elif hasattr(wo, 'estimated_hours') and wo.estimated_hours:
-            repair_time = float(wo.estimated_hours)
-        # تقدير من الفرق بين created_at و updated_at للأوامر المكتملة
-        elif wo.status in ['closed', 'qa_verified','resolved'] and wo.updated_at and wo.created_at:
-            repair_time = (wo.updated_at - wo.created_at).total_seconds() / 3600
-            # تحديد حد أقصى معقول
-            repair_time = min(repair_time, 72)  # حد أقصى 3 أيام
-        # للأوامر المفتوحة، نحسب الوقت المنقضي حتى الآن
-        elif wo.status in ['new', 'assigned', 'in_progress', 'wait_parts']:
-            repair_time = (timezone.now() - wo.created_at).total_seconds() / 3600
-            # تحديد حد أقصى معقول
-            repair_time = min(repair_time, 48)  # حد أقصى يومين للأوامر المفتوحة
-        else:
-            # تقدير بناءً على الأولوية
-            if wo.service_request.priority == 'critical':
-                repair_time = 2
-            elif wo.service_request.priority == 'high':
-                repair_time = 4
-            elif wo.service_request.priority == 'medium':
-                repair_time = 8
-            else:
-                repair_time = 24
-        
-        if repair_time > 0:
-            total_repair_time += repair_time
-            valid_orders += 1
-    
-    # إذا لم توجد أوامر شغل، نستخدم تقديرات بناءً على الأجهزة
-    if valid_orders == 0:
-        devices = Device.objects.all()
-        if device_id:
-            devices = devices.filter(id=device_id)
-        if department_id:
-            devices = devices.filter(department_id=department_id)
-        
-        # إذا لم توجد أجهزة، نرجع قيمة افتراضية
-        if not devices.exists():
-            return 4.0
-        
-        total_estimated_mttr = 0
-        device_count = 0
-        
-        for device in devices:
-            # البحث عن SLA مناسب
-            applicable_sla = None
-            if device.category:
-                sla_definitions = SLADefinition.objects.filter(
-                    is_active=True,
-                    device_category=device.category
-                )
-                if sla_definitions.exists():
-                    applicable_sla = sla_definitions.first()
-            
-            # البحث عن خطة عمل مناسبة
-            job_plan_duration = None
-            if device.category:
-                job_plans = JobPlan.objects.filter(device_category=device.category, is_active=True)
-                if job_plans.exists():
-                    job_plan = job_plans.first()
-                    if hasattr(job_plan, 'estimated_hours') and job_plan.estimated_hours:
-                        job_plan_duration = float(job_plan.estimated_hours)
-            
-            # تحديد MTTR بناءً على المصادر المتاحة
-            if applicable_sla:
-                estimated_mttr = float(applicable_sla.resolution_time_hours)
-            elif job_plan_duration:
-                estimated_mttr = job_plan_duration
-            else:
-                # تقدير بناءً على حالة الجهاز
-                if device.status == 'working':
-                    estimated_mttr = 2.0
-                elif device.status == 'needs_check':
-                    estimated_mttr = 4.0
-                elif device.status == 'needs_maintenance':
-                    estimated_mttr = 8.0
-                elif device.status == 'out_of_order':
-                    estimated_mttr = 24.0
-                else:
-                    estimated_mttr = 6.0
-            
-            total_estimated_mttr += estimated_mttr
-            device_count += 1
-        
-        return total_estimated_mttr / device_count if device_count > 0 else 4.0
-    
-    return total_repair_time / valid_orders if valid_orders > 0 else 4.0
+    return DeviceKPIEngine(device_id=device_id, department_id=department_id, days=days).mttr()
 
+@cached_kpi()
 def calculate_availability(device_id=None, department_id=None, days=30):
     """
     حساب نسبة التوفر (Availability) بناءً على SLA وخطط العمل والبيانات الفعلية
     """
-    from .models import SLADefinition, JobPlan
-    
-    # تحديد الفترة الزمنية
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=days)
-    
-    # جلب الأجهزة
-    devices = Device.objects.all()
-    if device_id:
-        devices = devices.filter(id=device_id)
-    if department_id:
-        devices = devices.filter(department_id=department_id)
-    
-    total_availability = 0
-    device_count = 0
-    
-    for device in devices:
-        # البحث عن SLA مناسب للجهاز
-        applicable_sla = None
-        if device.category:
-            sla_definitions = SLADefinition.objects.filter(
-                is_active=True,
-                device_category=device.category
-            )
-            if sla_definitions.exists():
-                applicable_sla = sla_definitions.first()
-        
-        # حساب التوفر بناءً على أوامر الشغل الفعلية
-        corrective_work_orders = WorkOrder.objects.filter(
-            service_request__device=device,
-            service_request__request_type='corrective',
-            created_at__range=[start_date, end_date]
-        )
-        
-        total_downtime_hours = 0
-        
-        # حساب الـ downtime من أوامر الشغل المكتملة
-        completed_orders = corrective_work_orders.filter(status__in=['closed', 'qa_verified'])
-        for wo in completed_orders:
-            if wo.actual_start and wo.actual_end:
-                downtime = (wo.actual_end - wo.actual_start).total_seconds() / 3600
-            elif applicable_sla:
-                downtime = applicable_sla.resolution_time_hours
-            else:
-                # تقدير بناءً على الأولوية
-                if wo.service_request.priority == 'critical':
-                    downtime = 2
-                elif wo.service_request.priority == 'high':
-                    downtime = 4
-                elif wo.service_request.priority == 'medium':
-                    downtime = 8
-                else:
-                    downtime = 24
-            
-            total_downtime_hours += downtime
-        
-        # حساب الـ downtime من أوامر الشغل المفتوحة
-        open_orders = corrective_work_orders.filter(
-            status__in=['new', 'assigned', 'in_progress', 'wait_parts']
-        )
-        
-        for wo in open_orders:
-            # حساب الوقت المنقضي منذ بداية العطل
-            elapsed_time = (timezone.now() - wo.created_at).total_seconds() / 3600
-            
-            if applicable_sla:
-                # إذا تجاوز الوقت المحدد في SLA، نحسب كامل الوقت
-                expected_resolution = applicable_sla.resolution_time_hours
-                downtime = max(elapsed_time, expected_resolution)
-            else:
-                downtime = elapsed_time
-            
-            total_downtime_hours += downtime
-        
-        # حساب نسبة التوفر الأساسية
-        total_period_hours = days * 24
-        uptime_hours = max(0, total_period_hours - total_downtime_hours)
-        device_availability = (uptime_hours / total_period_hours) * 100
-        
-        # تطبيق تأثير حالة الجهاز على التوفر
-        if device.status == 'out_of_order':
-            device_availability = 0
-        elif device.status == 'needs_maintenance':
-            # إذا كان هناك SLA، نستخدم نسبة مبنية على مدى تجاوز SLA
-            if applicable_sla:
-                device_availability = min(device_availability, 40)
-            else:
-                device_availability = min(device_availability, 30)
-        elif device.status == 'needs_check':
-            if applicable_sla:
-                device_availability = min(device_availability, 80)
-            else:
-                device_availability = min(device_availability, 70)
-        elif device.status == 'working':
-            if applicable_sla:
-                device_availability = min(device_availability, 98)  # SLA عادة يستهدف 98%+
-            else:
-                device_availability = min(device_availability, 95)
-        
-        # تطبيق تأثير الصيانة الوقائية المجدولة
-        try:
-            pm_schedules = PreventiveMaintenanceSchedule.objects.filter(
-                device=device,
-                next_due_date__range=[start_date.date(), end_date.date()]
-            )
-            
-            for pm in pm_schedules:
-                if pm.job_plan:
-                    # محاولة الحصول على الوقت المقدر من خطة العمل
-                    pm_downtime = 0
-                    if hasattr(pm.job_plan, 'estimated_hours') and pm.job_plan.estimated_hours:
-                        pm_downtime = float(pm.job_plan.estimated_hours)
-                    elif hasattr(pm.job_plan, 'estimated_duration') and pm.job_plan.estimated_duration:
-                        pm_downtime = pm.job_plan.estimated_duration.total_seconds() / 3600
-                    else:
-                        # تقدير افتراضي للصيانة الوقائية (ساعتان)
-                        pm_downtime = 2
-                    
-                    total_downtime_hours += pm_downtime
-                    # إعادة حساب التوفر
-                    uptime_hours = max(0, total_period_hours - total_downtime_hours)
-                    device_availability = (uptime_hours / total_period_hours) * 100
-        except Exception as e:
-            # في حالة وجود خطأ، نتجاهل تأثير الصيانة الوقائية
-            pass
-        
-        total_availability += max(0, device_availability)
-        device_count += 1
-    
-    return total_availability / device_count if device_count > 0 else 0
+    return DeviceKPIEngine(device_id=device_id, department_id=department_id, days=days).availability()
+
+@cached_kpi()
+def calculate_reliability_kpis(department_id=None, days=30):
+    """
+    MTBF و MTTR والتوفر مع بعض بمحرك واحد بيحمّل بيانات القسم مرة واحدة
+    """
+    engine = DeviceKPIEngine(department_id=department_id, days=days)
+    return {'mtbf': engine.mtbf(), 'mttr': engine.mttr(), 'availability': engine.availability()}
 
 def calculate_pm_compliance(department_id=None, device_id=None, days=30):
     """
@@ -377,6 +79,7 @@ def calculate_pm_compliance(department_id=None, device_id=None, days=30):
     compliance_rate = (completed_schedules / pm_schedules.count()) * 100
     return compliance_rate
 
+@cached_kpi()
 def calculate_work_order_stats(department_id=None, days=30):
     """
     حساب إحصائيات أوامر الشغل
@@ -447,6 +150,7 @@ def calculate_overdue_work_orders_rate(department_id=None, days=30):
     
     return (overdue_count / work_orders.count()) * 100
 
+@cached_kpi(department_scoped=False)
 def calculate_spare_parts_stats(department_id=None):
     """
     حساب إحصائيات قطع الغيار
@@ -522,100 +226,19 @@ def calculate_calibration_compliance(department_id=None, days=30):
     compliance_rate = (compliant_devices / total_devices) * 100
     return compliance_rate
 
+@cached_kpi()
 def get_monthly_trends(department_id=None, months=6):
     """
     جلب الاتجاهات الشهرية للمؤشرات
     هنا بنشوف إزاي الأداء بيتغير على مدار الشهور
     """
-    import calendar
-    from django.db.models import Count, Avg, Q
-    from .models import ServiceRequest, WorkOrder, Device
-    
-    trends = []
-    
-    for i in range(months):
-        # حساب تاريخ بداية ونهاية الشهر
-        current_date = timezone.now().replace(day=1) - timedelta(days=i*30)
-        month_start = current_date.replace(day=1)
-        
-        # حساب نهاية الشهر بدقة
-        if month_start.month == 12:
-            month_end = month_start.replace(year=month_start.year + 1, month=1) - timedelta(days=1)
-        else:
-            month_end = month_start.replace(month=month_start.month + 1) - timedelta(days=1)
-        
-        # فلتر الأجهزة حسب القسم إن وجد
-        devices_filter = Q()
-        if department_id:
-            devices_filter = Q(department_id=department_id)
-        
-        # حساب إحصائيات أوامر الشغل للشهر المحدد
-        work_orders_month = WorkOrder.objects.filter(
-            created_at__range=[month_start, month_end]
-        )
-        if department_id:
-            work_orders_month = work_orders_month.filter(
-                service_request__device__department_id=department_id
-            )
-        
-        total_wo = work_orders_month.count()
-        completed_wo = work_orders_month.filter(status__in=['closed', 'qa_verified', 'resolved']).count()
-        overdue_wo = work_orders_month.filter(
-            actual_end__isnull=True,
-            service_request__resolution_due__lt=timezone.now()
-        ).count()
-        
-        # حساب نسب الأداء للشهر
-        completion_rate = (completed_wo / total_wo * 100) if total_wo > 0 else 0
-        overdue_rate = (overdue_wo / total_wo * 100) if total_wo > 0 else 0
-        
-        # حساب متوسط وقت الإصلاح للشهر
-        completed_orders = work_orders_month.filter(
-            status__in=['closed', 'qa_verified', 'resolved'],
-            actual_end__isnull=False,
-            actual_start__isnull=False
-        )
-        
-        if completed_orders.exists():
-            total_repair_time = 0
-            count = 0
-            for wo in completed_orders:
-                repair_time = (wo.actual_end - wo.actual_start).total_seconds() / 3600
-                total_repair_time += repair_time
-                count += 1
-            mttr = total_repair_time / count if count > 0 else 0
-        else:
-            mttr = 0
-        
-        # حساب نسبة التوفر (تقدير بناءً على أوامر الشغل)
-        # نسبة التوفر = 100 - (نسبة الأعطال * متوسط وقت الإصلاح / 24)
-        failure_rate = (total_wo / 30) if total_wo > 0 else 0  # معدل الأعطال في اليوم
-        availability = max(0, 100 - (failure_rate * mttr / 24 * 100))
-        
-        # حساب الالتزام بالصيانة الوقائية للشهر
-        preventive_orders = work_orders_month.filter(
-            service_request__request_type='preventive'
-        ).count()
-        pm_compliance = (preventive_orders / total_wo * 100) if total_wo > 0 else 0
-        
-        month_data = {
-            'month': month_start.strftime('%Y-%m'),
-            'month_name': calendar.month_name[month_start.month],
-            'mtbf': 720 / failure_rate if failure_rate > 0 else 720,  # تقدير MTBF بالساعات
-            'mttr': round(mttr, 1),
-            'availability': round(availability, 1),
-            'pm_compliance': round(pm_compliance, 1),
-            'total_work_orders': total_wo,
-            'completion_rate': round(completion_rate, 1),
-            'overdue_rate': round(overdue_rate, 1),
-        }
-        
-        trends.append(month_data)
-    
-    # ترتيب البيانات من الأقدم للأحدث
-    trends.reverse()
-    return trends
+    # بعد أول تشغيل لمهمة التجميع بنقرأ من اللقطات اليومية بدل أوامر الشغل،
+    # والحساب الخام بيستخدم نفس الشهور التقويمية ونفس تعريف الأعطال
+    if has_snapshots():
+        return snapshot_monthly_trends(department_id=department_id, months=months)
+    return raw_monthly_trends(department_id=department_id, months=months)
 
+@cached_kpi()
 def get_dashboard_summary(department_id=None):
     """
     جلب ملخص شامل للداشبورد
@@ -623,9 +246,7 @@ def get_dashboard_summary(department_id=None):
     """
     summary = {
         # المؤشرات الأساسية
-        'mtbf': calculate_mtbf(department_id=department_id),
-        'mttr': calculate_mttr(department_id=department_id),
-        'availability': calculate_availability(department_id=department_id),
+        **calculate_reliability_kpis(department_id=department_id),
         'pm_compliance': calculate_pm_compliance(department_id=department_id),
         'calibration_compliance': calculate_calibration_compliance(department_id=department_id),
         
@@ -652,9 +273,10 @@ def get_device_performance_score(device_id):
     device = Device.objects.get(id=device_id)
     
     # المؤشرات الأساسية للجهاز
-    mtbf = calculate_mtbf(device_id=device_id)
-    mttr = calculate_mttr(device_id=device_id)
-    availability = calculate_availability(device_id=device_id)
+    engine = DeviceKPIEngine(device_id=device_id)
+    mtbf = engine.mtbf()
+    mttr = engine.mttr()
+    availability = engine.availability()
     
     # حساب النقاط (من 100)
     score = 0
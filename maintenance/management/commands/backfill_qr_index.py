@@ -0,0 +1,47 @@
+"""
+Django management command to backfill missing QR tokens and the QR hash index
+Usage: python manage.py backfill_qr_index [--entity device] [--batch-size 1000]
+"""
+
+from django.core.management.base import BaseCommand
+
+from maintenance.qr_resolver import (
+    BACKFILL_BATCH_SIZE, HASH_ENTITY_MODELS, backfill_qr_index, backfill_qr_tokens
+)
+
+
+class Command(BaseCommand):
+    help = 'Fill missing qr_token values and index QR hashes in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--entity',
+            type=str,
+            choices=list(HASH_ENTITY_MODELS) + ['all'],
+            default='all',
+            help='Specify which entity type to process',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BACKFILL_BATCH_SIZE,
+            help='Rows written per bulk statement',
+        )
+
+    def handle(self, *args, **options):
+        entity_types = None if options['entity'] == 'all' else [options['entity']]
+        batch_size = options['batch_size']
+
+        tokens = backfill_qr_tokens(entity_types, batch_size=batch_size)
+        for entity_type, count in tokens.items():
+            self.stdout.write(f"  qr_token {entity_type}: {count}")
+
+        indexed = backfill_qr_index(entity_types, batch_size=batch_size)
+        for entity_type, count in indexed.items():
+            self.stdout.write(f"  index {entity_type}: {count}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backfill complete: {sum(tokens.values())} tokens, {sum(indexed.values())} index rows"
+            )
+        )
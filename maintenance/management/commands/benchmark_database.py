@@ -0,0 +1,177 @@
+"""
+Django management command to load-test the database configurations
+Usage: python manage.py benchmark_database [--modes sqlite-legacy,sqlite-tuned] [--threads 8] [--seconds 10]
+
+Each thread plays a mix of scan writes (a QRScanLog insert plus a counter
+increment on a shared QRScanRollup row, in one transaction, like the scan
+endpoint and the rollup job) and dashboard reads (grouped counts over the scan
+log and the devices). Modes:
+
+  sqlite-legacy   the old settings: rollback journal, 5s timeout, deferred transactions
+  sqlite-tuned    WAL, busy timeout and pragmas from core.database
+  configured      settings.DATABASES as deployed (reads go to the replica when there is one)
+
+SQLite modes run on a throwaway copy of the SQLite file (--source, default the
+configured SQLite database). The configured mode writes to the real database;
+its rows are tagged and deleted at the end.
+"""
+
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from core.database import REPLICA_ALIAS, sqlite_options
+from maintenance.models import Device, QRScanLog, QRScanRollup
+
+MODES = ('sqlite-legacy', 'sqlite-tuned', 'configured')
+BENCHMARK_TYPE = 'benchmark'
+LEGACY_OPTIONS = {'timeout': 5}
+
+
+class Command(BaseCommand):
+    help = 'Compare scan-write and dashboard-read throughput across database configurations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', type=str, default='sqlite-legacy,sqlite-tuned', help=f"Comma-separated: {', '.join(MODES)}")
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--write-ratio', type=float, default=0.5, help='Share of operations that are scan writes')
+        parser.add_argument('--source', type=str, default=None, help='SQLite file copied for the sqlite-* modes')
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+
+        self.stdout.write(
+            f"{options['threads']} threads, {options['seconds']:g}s per mode, "
+            f"{options['write_ratio']:.0%} writes"
+        )
+        for mode in modes:
+            if mode == 'configured':
+                read_alias = REPLICA_ALIAS if REPLICA_ALIAS in settings.DATABASES else 'default'
+                self._report(mode, self._run('default', read_alias, options))
+                continue
+            with tempfile.TemporaryDirectory() as directory:
+                alias = self._sqlite_alias(mode, options['source'], Path(directory))
+                try:
+                    self._report(mode, self._run(alias, alias, options))
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+
+    def _sqlite_alias(self, mode, source, directory):
+        """Register a connection to a copy of the SQLite file with the mode's options"""
+        default = settings.DATABASES['default']
+        if source is None:
+            if default['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError('--source is required for sqlite-* modes when the default database is not SQLite')
+            source = default['NAME']
+        path = directory / 'benchmark.sqlite3'
+        shutil.copyfile(source, path)
+
+        if mode == 'sqlite-legacy':
+            # journal_mode lives in the file, so switch the copy back explicitly
+            options = dict(LEGACY_OPTIONS, init_command='PRAGMA journal_mode=DELETE')
+        else:
+            options = sqlite_options()
+        alias = f'benchmark_{mode.replace("-", "_")}'
+        config = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path), 'OPTIONS': options}
+        connections.settings[alias] = connections.configure_settings({'default': dict(default), alias: config})[alias]
+        # the copy may be behind the code (and needs the rollup table)
+        call_command('migrate', database=alias, verbosity=0)
+        return alias
+
+    def _run(self, write_alias, read_alias, options):
+        now = timezone.now()
+        QRScanRollup.objects.using(write_alias).get_or_create(
+            granularity='hour', bucket=now.replace(minute=0, second=0, microsecond=0),
+            entity_type=BENCHMARK_TYPE, department=None, scanner_id='', flow_name='',
+        )
+        device_ids = list(Device.objects.using(read_alias).values_list('pk', flat=True)[:1000]) or [0]
+        results = []
+        deadline = time.monotonic() + options['seconds']
+        threads = [
+            threading.Thread(
+                target=self._worker,
+                args=(write_alias, read_alias, options['write_ratio'], deadline, device_ids, random.Random(n), results),
+            )
+            for n in range(options['threads'])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        QRScanLog.objects.using(write_alias).filter(entity_type=BENCHMARK_TYPE).delete()
+        QRScanRollup.objects.using(write_alias).filter(entity_type=BENCHMARK_TYPE).delete()
+        return results, elapsed
+
+    def _worker(self, write_alias, read_alias, write_ratio, deadline, device_ids, rng, results):
+        timings = {'write': [], 'read': []}
+        errors = 0
+        since = timezone.now() - timedelta(days=1)
+        try:
+            while time.monotonic() < deadline:
+                kind = 'write' if rng.random() < write_ratio else 'read'
+                started = time.perf_counter()
+                try:
+                    if kind == 'write':
+                        self._write(write_alias, rng.choice(device_ids))
+                    else:
+                        self._read(read_alias, since)
+                except OperationalError:
+                    # "database is locked" after the busy timeout
+                    errors += 1
+                    continue
+                timings[kind].append((time.perf_counter() - started) * 1000)
+        finally:
+            for alias in {write_alias, read_alias}:
+                connections[alias].close()
+        results.append((timings, errors))
+
+    @staticmethod
+    def _write(alias, device_id):
+        with transaction.atomic(using=alias):
+            QRScanLog.objects.using(alias).create(
+                qr_code=f'{BENCHMARK_TYPE}:{device_id}', entity_type=BENCHMARK_TYPE, entity_id=str(device_id),
+                device_type='benchmark',
+            )
+            QRScanRollup.objects.using(alias).filter(entity_type=BENCHMARK_TYPE).update(scans=F('scans') + 1)
+
+    @staticmethod
+    def _read(alias, since):
+        list(QRScanLog.objects.using(alias).filter(scanned_at__gte=since).values('entity_type').annotate(n=Count('id')))
+        list(Device.objects.using(alias).values('status').annotate(n=Count('id')))
+
+    def _report(self, mode, run):
+        results, elapsed = run
+        writes = sorted(t for timings, _ in results for t in timings['write'])
+        reads = sorted(t for timings, _ in results for t in timings['read'])
+        errors = sum(count for _, count in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"{mode:<14} {(len(writes) + len(reads)) / elapsed:8.1f} ops/s   "
+            f"writes {len(writes) / elapsed:7.1f}/s {self._percentiles(writes)}   "
+            f"reads {len(reads) / elapsed:7.1f}/s {self._percentiles(reads)}   "
+            f"lock errors {errors}"
+        ))
+
+    @staticmethod
+    def _percentiles(timings):
+        if not timings:
+            return '(none)'
+        return f"p50 {timings[len(timings) // 2]:.1f} ms p95 {timings[int(len(timings) * 0.95)]:.1f} ms"
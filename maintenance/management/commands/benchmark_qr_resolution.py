@@ -0,0 +1,70 @@
+"""
+Django management command to benchmark QR hash resolution against table size
+Usage: python manage.py benchmark_qr_resolution [--sizes 1000,10000,40000] [--scans 200]
+
+Synthetic index rows are written inside a transaction that is rolled back.
+"""
+
+import hashlib
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from maintenance.models import QRTokenIndex
+from maintenance.qr_resolver import compute_entity_hash, resolve_entity_hash
+
+
+class Command(BaseCommand):
+    help = 'Compare indexed QR hash resolution with the legacy full-table hash scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='1000,10000,40000')
+        parser.add_argument('--scans', type=int, default=200)
+        parser.add_argument('--entity', type=str, default='patient')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        scans = options['scans']
+        entity_type = options['entity']
+
+        self.stdout.write(f"{'rows':>10} {'indexed µs/scan':>18} {'legacy ms/scan':>16}")
+
+        with transaction.atomic():
+            base = 10 ** 9  # keep synthetic ids clear of real rows
+            populated = 0
+            for size in sizes:
+                rows = [
+                    QRTokenIndex(
+                        entity_type=entity_type,
+                        token_hash=compute_entity_hash(entity_type, base + pk),
+                        object_id=base + pk,
+                    )
+                    for pk in range(populated, size)
+                ]
+                QRTokenIndex.objects.bulk_create(rows, batch_size=2000)
+                populated = size
+
+                sample = [base + random.randrange(size) for _ in range(scans)]
+                hashes = [compute_entity_hash(entity_type, pk) for pk in sample]
+
+                started = time.perf_counter()
+                for hash_value in hashes:
+                    resolve_entity_hash(entity_type, hash_value)
+                indexed_us = (time.perf_counter() - started) / scans * 1e6
+
+                legacy_ms = self._legacy_scan_ms(entity_type, base, size, hashes[0])
+                self.stdout.write(f"{size:>10} {indexed_us:>18.1f} {legacy_ms:>16.1f}")
+
+            transaction.set_rollback(True)
+
+    def _legacy_scan_ms(self, entity_type, base, size, hash_value):
+        """Hashing cost of the old per-row loop, without the ORM overhead it also paid"""
+        started = time.perf_counter()
+        for pk in range(base, base + size):
+            hash_input = f"{entity_type}_{pk}_{settings.SECRET_KEY}"
+            if hashlib.sha256(hash_input.encode()).hexdigest()[:12] == hash_value:
+                break
+        return (time.perf_counter() - started) * 1000
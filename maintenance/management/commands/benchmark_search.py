@@ -0,0 +1,95 @@
+"""
+Django management command to benchmark the unified search index
+Usage: python manage.py benchmark_search [--rows 100000] [--queries 200]
+
+Synthetic SearchDocument rows are written inside a transaction that is rolled
+back, then the same queries are timed through search_index.search (FTS5 on
+SQLite) and through the legacy-style icontains OR-filter with a count.
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from maintenance import search_index
+from maintenance.models import SearchDocument
+
+COMMON_WORDS = (
+    'ventilator monitor infusion pump defibrillator ultrasound xray analyzer centrifuge incubator '
+    'جهاز تنفس صناعي مضخة محاليل شاشة مراقبة أشعة سونار حضانة مختبر'
+).split()
+SYLLABLES = 'ka ri to mel san dor vi lu pe ra no gi sha ba te mo zu'.split()
+
+
+def vocabulary(rng, size=20000):
+    """Distinct name-like words, so term frequencies look like real names and models"""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+class Command(BaseCommand):
+    help = 'Compare ranked FTS search with icontains scans on synthetic 100k-row tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Documents per entity type')
+        parser.add_argument('--entities', type=str, default='device,patient,service_request')
+        parser.add_argument('--queries', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        entities = options['entities'].split(',')
+        rows = options['rows']
+
+        words = vocabulary(rng)
+        with transaction.atomic():
+            search_index.ensure_fts()
+            started = time.perf_counter()
+            base = 10 ** 9  # keep synthetic ids clear of real rows
+            for entity in entities:
+                documents = (
+                    SearchDocument(
+                        entity=entity, object_id=base + pk, hospital_id=1,
+                        title=f"{rng.choice(COMMON_WORDS)} {' '.join(rng.choices(words, k=2))}",
+                        body=f"SN-{rng.randrange(10 ** 8):08d} " + ' '.join(rng.choices(words, k=6)),
+                    )
+                    for pk in range(rows)
+                )
+                SearchDocument.objects.bulk_create(documents, batch_size=5000)
+            self.stdout.write(
+                f"Loaded {rows * len(entities)} documents in {time.perf_counter() - started:.1f}s "
+                f"(FTS5: {'yes' if search_index.fts_available() else 'no'})"
+            )
+
+            queries = [self._query(rng, words) for _ in range(options['queries'])]
+            self._report('index', [self._time(search_index.search, query) for query in queries])
+            self._report('icontains', [self._time(self._legacy, query) for query in queries])
+
+            transaction.set_rollback(True)
+
+    def _query(self, rng, words):
+        word = rng.choice(words)
+        return rng.choice([word, word[:4], f"{rng.choice(COMMON_WORDS)} {word}", f"SN-{rng.randrange(10 ** 8):08d}"])
+
+    @staticmethod
+    def _legacy(query):
+        # the old per-table filters, plus the count a paginated result needs
+        documents = SearchDocument.objects.filter(Q(title__icontains=query) | Q(body__icontains=query))
+        return documents.count(), list(documents[:20])
+
+    @staticmethod
+    def _time(func, query):
+        started = time.perf_counter()
+        func(query)
+        return (time.perf_counter() - started) * 1000
+
+    def _report(self, label, timings):
+        timings.sort()
+        self.stdout.write(
+            f"{label:<10} median {timings[len(timings) // 2]:8.2f} ms   "
+            f"p95 {timings[int(len(timings) * 0.95)]:8.2f} ms   max {timings[-1]:8.2f} ms"
+        )
@@ -0,0 +1,43 @@
+"""
+Django management command to show CMMS dashboard cache hit/miss counters
+Usage: python manage.py dashboard_cache_stats [--reset]
+
+Counters live in the configured cache, so they cover every worker only when
+CACHES points at a shared backend (the default local-memory cache is per process).
+Invalidation does not depend on this: the generations are kept in the database.
+"""
+
+from django.core.management.base import BaseCommand
+
+from maintenance.dashboard_cache import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the per-department dashboard cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+
+        self.stdout.write(f"{'function':<30} {'hits':>8} {'misses':>8} {'hit %':>7}")
+        for name, counters in stats['functions'].items():
+            self.stdout.write(
+                f"{name:<30} {counters['hits']:>8} {counters['misses']:>8} {counters['hit_rate']:>7}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Total: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']}%), "
+                f"{stats['invalidations']} invalidations"
+            )
+        )
+
+        if not stats['shared_cache']:
+            self.stdout.write(self.style.WARNING(
+                'The cache is local to each process: these counters cover this process only'
+            ))
+
+        if options['reset']:
+            reset_cache_stats()
+            self.stdout.write('Counters reset')
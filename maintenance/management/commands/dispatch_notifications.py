@@ -0,0 +1,33 @@
+"""
+Django management command to drain the notification queue in claimed batches
+Usage: python manage.py dispatch_notifications [--batch-size 200] [--max-batches 10]
+
+Several copies can run side by side; each batch is claimed by exactly one process
+and its emails are sent over a single SMTP connection.
+"""
+
+from django.core.management.base import BaseCommand
+
+from maintenance.notification_dispatch import dispatch_pending
+
+
+class Command(BaseCommand):
+    help = 'Send pending NotificationQueue entries in batches and report throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Entries claimed per batch')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        result = dispatch_pending(batch_size=options['batch_size'], max_batches=options['max_batches'])
+
+        if result['requeued']:
+            self.stdout.write(f"Requeued {result['requeued']} stale claim(s)")
+        self.stdout.write(
+            f"Batches: {result['batches']}  claimed: {result['claimed']}  emailed: {result['sent']}  "
+            f"in-app only: {result['app_only']}  retrying: {result['retried']}  failed: {result['failed']}  "
+            f"lost claims: {result['lost']}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['claimed']} notification(s) in {result['seconds']}s ({result['per_second']}/s)"
+        ))
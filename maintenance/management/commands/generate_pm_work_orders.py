@@ -1,7 +1,5 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import date
-from maintenance.models import PreventiveMaintenanceSchedule
+from maintenance.pm_generation import generate_due_pm_work_orders
 
 
 class Command(BaseCommand):
@@ -13,45 +11,43 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be generated without actually creating work orders',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Schedules written per transaction (default: pm_generation.chunk_size)',
+        )
+        parser.add_argument(
+            '--no-notify',
+            action='store_true',
+            help='Do not send the per-technician digest notifications',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
-        
-        # العثور على جداول الصيانة المستحقة
-        due_schedules = PreventiveMaintenanceSchedule.objects.filter(
-            is_active=True,
-            next_due_date__lte=date.today()
+
+        # الجداول المستحقة بتتقرا وتتفلتر في استعلامات ثابتة وبتتكتب على دفعات
+        result = generate_due_pm_work_orders(
+            chunk_size=options['chunk_size'],
+            dry_run=dry_run,
+            notify=not options['no_notify'],
         )
-        
-        self.stdout.write(f'Found {due_schedules.count()} due PM schedules')
-        
-        generated_count = 0
-        
-        for schedule in due_schedules:
-            try:
-                if dry_run:
-                    self.stdout.write(
-                        f'Would generate work order for: {schedule.name} - {schedule.device.name}'
-                    )
-                else:
-                    work_order = schedule.generate_work_order()
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'Generated work order {work_order.id} for: {schedule.name} - {schedule.device.name}'
-                        )
-                    )
-                generated_count += 1
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f'Error generating work order for {schedule.name}: {str(e)}'
-                    )
-                )
-        
+
+        self.stdout.write(f"Found {result['due']} due PM schedules ({result['skipped']} skipped)")
+
         if dry_run:
-            self.stdout.write(f'Dry run complete. Would generate {generated_count} work orders.')
-        else:
-            self.stdout.write(
-                self.style.SUCCESS(f'Successfully generated {generated_count} work orders.')
+            for schedule in result['selected']:
+                self.stdout.write(f'Would generate work order for: {schedule.name} - {schedule.device.name}')
+            self.stdout.write(f"Dry run complete. Would generate {len(result['selected'])} work orders.")
+            return
+
+        for work_order in result['work_orders']:
+            self.stdout.write(f'Generated work order {work_order.wo_number} for: {work_order.title}')
+        if result['failed']:
+            self.stdout.write(self.style.ERROR(f"Failed to generate {result['failed']} work orders (see log)"))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully generated {result['created']} work orders "
+                f"({result['notifications']} digest notifications) in {result['seconds']:.2f}s."
             )
+        )
@@ -8,6 +8,7 @@ from maintenance.models import (
     Device, DeviceCategory, SLADefinition, SLAMatrix,
     SEVERITY_CHOICES, IMPACT_CHOICES, PRIORITY_CHOICES
 )
+from maintenance.sla_matrix import sync_sla_matrix
 
 logger = logging.getLogger(__name__)
 
@@ -130,9 +131,9 @@ class Command(BaseCommand):
                     name=config['name'],
                     defaults={
                         'description': config['description'],
-                        'response_time_hours': config['response_time_hours'],
+                        # الحقل بالساعات الصحيحة فأقل من ساعة بيتقرب لساعة
+                        'response_time_hours': max(1, round(config['response_time_hours'])),
                         'resolution_time_hours': config['resolution_time_hours'],
-                        'escalation_time_hours': config['escalation_time_minutes'] / 60,
                         'is_active': True,
                         'device_category': None,  # SLA عام لجميع الفئات
                     }
@@ -144,8 +145,10 @@ class Command(BaseCommand):
                 else:
                     self.stdout.write(f'تعريف SLA موجود: {config["name"]}')
             else:
-                self.stdout.write(f'[تجريبي] سيتم إنشاء تعريف SLA: {config["name"]}')
-                sla_definitions[config['name']] = None
+                sla_def = SLADefinition.objects.filter(name=config['name']).first()
+                if sla_def is None:
+                    self.stdout.write(f'[تجريبي] سيتم إنشاء تعريف SLA: {config["name"]}')
+                sla_definitions[config['name']] = sla_def
         
         return sla_definitions
     
@@ -184,33 +187,25 @@ class Command(BaseCommand):
                 
                 sla_rules.append((severity, impact, priority, sla_name))
         
-        created_count = 0
-        
-        for category in device_categories:
-            for severity, impact, priority, sla_name in sla_rules:
-                if not dry_run:
-                    sla_def = sla_definitions.get(sla_name)
-                    if sla_def:
-                        matrix_entry, created = SLAMatrix.objects.get_or_create(
-                            device_category=category,
-                            severity=severity,
-                            impact=impact,
-                            priority=priority,
-                            defaults={'sla_definition': sla_def}
-                        )
-                        
-                        if created:
-                            created_count += 1
-                            self.stdout.write(
-                                f'تم إنشاء مصفوفة SLA: {category.name} - '
-                                f'{severity}/{impact}/{priority} -> {sla_name}'
-                            )
-                else:
-                    self.stdout.write(
-                        f'[تجريبي] سيتم إنشاء مصفوفة SLA: {category.name} - '
-                        f'{severity}/{impact}/{priority} -> {sla_name}'
-                    )
-                    created_count += 1
+        # ربط كل قاعدة بتعريفها، والمقارنة مع الموجود والإنشاء المجمع في sync_sla_matrix
+        rules = []
+        pending_rules = 0
+        for severity, impact, priority, sla_name in sla_rules:
+            sla_def = sla_definitions.get(sla_name)
+            if sla_def:
+                rules.append((severity, impact, priority, sla_def))
+            else:
+                # تعريف لسه هيتعمل (تشغيل تجريبي) فكل خلاياه جديدة
+                pending_rules += 1
+        
+        category_ids = list(device_categories.values_list('pk', flat=True))
+        result = sync_sla_matrix(
+            categories=category_ids,
+            definitions=[sla_def for sla_def in sla_definitions.values() if sla_def],
+            rules=rules,
+            dry_run=dry_run,
+        )
+        created_count = result['created'] + pending_rules * len(category_ids)
         
         self.stdout.write(
             self.style.SUCCESS(f'تم إنشاء {created_count} مدخل في مصفوفة SLA')
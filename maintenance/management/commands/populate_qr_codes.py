@@ -1,8 +1,24 @@
+"""
+Django management command to assign QR tokens to records that have none
+Usage: python manage.py populate_qr_codes [--entity patient] [--dry-run]
+
+Tokens are assigned with bulk updates; images are rendered from the token on
+request by core.qr_cache.
+"""
+
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from manager.models import Patient, Bed
-from hr.models import CustomUser
-from maintenance.models import Device, DeviceAccessory
+from django.db.models import Q
+
+from core.qr_render import assign_missing_tokens
+
+ENTITY_LABELS = {
+    'patient': 'manager.patient',
+    'bed': 'manager.bed',
+    'user': 'hr.customuser',
+    'device': 'maintenance.device',
+    'accessory': 'maintenance.deviceaccessory',
+}
 
 
 class Command(BaseCommand):
@@ -17,7 +33,7 @@ class Command(BaseCommand):
         parser.add_argument(
             '--entity',
             type=str,
-            choices=['patient', 'bed', 'user', 'device', 'accessory', 'all'],
+            choices=[*ENTITY_LABELS, 'all'],
             default='all',
             help='Specify which entity type to process',
         )
@@ -25,147 +41,20 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         entity_type = options['entity']
-        
-        if dry_run:
-            self.stdout.write(
-                self.style.WARNING('🔍 DRY RUN MODE - No changes will be made')
-            )
-        
-        self.stdout.write('🔄 Starting QR code population for existing records...')
-        
-        total_processed = 0
-        
-        with transaction.atomic():
-            if entity_type in ['patient', 'all']:
-                total_processed += self.process_patients(dry_run)
-            
-            if entity_type in ['bed', 'all']:
-                total_processed += self.process_beds(dry_run)
-            
-            if entity_type in ['user', 'all']:
-                total_processed += self.process_users(dry_run)
-            
-            if entity_type in ['device', 'all']:
-                total_processed += self.process_devices(dry_run)
-            
-            if entity_type in ['accessory', 'all']:
-                total_processed += self.process_accessories(dry_run)
-        
-        self.stdout.write(
-            self.style.SUCCESS(f'🎉 QR Code Population Complete! Total: {total_processed}')
-        )
-
-    def process_patients(self, dry_run=False):
-        self.stdout.write('\n📋 Processing Patients...')
-        patients = Patient.objects.filter(qr_token__isnull=True)
-        count = 0
-        
-        for patient in patients:
-            try:
-                if not dry_run:
-                    patient.qr_token = patient.generate_qr_token()
-                    patient.generate_qr_code()
-                    patient.save(update_fields=['qr_token', 'qr_code'])
-                
-                count += 1
-                self.stdout.write(f"  ✅ Patient {patient.id}: {patient.first_name} {patient.last_name}")
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"  ❌ Error with Patient {patient.id}: {e}")
-                )
-        
-        self.stdout.write(f"📋 Processed {count} patients")
-        return count
-
-    def process_beds(self, dry_run=False):
-        self.stdout.write('\n🛏️ Processing Beds...')
-        beds = Bed.objects.filter(qr_token__isnull=True)
-        count = 0
-        
-        for bed in beds:
-            try:
-                if not dry_run:
-                    bed.qr_token = bed.generate_qr_token()
-                    bed.generate_qr_code()
-                    bed.save(update_fields=['qr_token', 'qr_code'])
-                
-                count += 1
-                self.stdout.write(f"  ✅ Bed {bed.id}: {bed}")
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"  ❌ Error with Bed {bed.id}: {e}")
-                )
-        
-        self.stdout.write(f"🛏️ Processed {count} beds")
-        return count
+        labels = list(ENTITY_LABELS.values()) if entity_type == 'all' else [ENTITY_LABELS[entity_type]]
 
-    def process_users(self, dry_run=False):
-        self.stdout.write('\n👥 Processing Users...')
-        users = CustomUser.objects.filter(qr_token__isnull=True)
-        count = 0
-        
-        for user in users:
-            try:
-                if not dry_run:
-                    user.qr_token = user.generate_qr_token()
-                    user.generate_qr_code()
-                    user.save(update_fields=['qr_token', 'qr_code'])
-                
-                count += 1
-                self.stdout.write(f"  ✅ User {user.id}: {user.get_full_name()} ({user.role})")
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"  ❌ Error with User {user.id}: {e}")
-                )
-        
-        self.stdout.write(f"👥 Processed {count} users")
-        return count
+        if dry_run:
+            from django.apps import apps
 
-    def process_devices(self, dry_run=False):
-        self.stdout.write('\n🔧 Processing Devices...')
-        devices = Device.objects.filter(qr_token__isnull=True)
-        count = 0
-        
-        for device in devices:
-            try:
-                if not dry_run:
-                    device.qr_token = device.generate_qr_token()
-                    device.generate_qr_code()
-                    device.save(update_fields=['qr_token', 'qr_code'])
-                
-                count += 1
-                self.stdout.write(f"  ✅ Device {device.id}: {device.name}")
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"  ❌ Error with Device {device.id}: {e}")
-                )
-        
-        self.stdout.write(f"🔧 Processed {count} devices")
-        return count
+            self.stdout.write(self.style.WARNING('🔍 DRY RUN MODE - No changes will be made'))
+            missing = Q(qr_token__isnull=True) | Q(qr_token='')
+            counts = {label: apps.get_model(label).objects.filter(missing).count() for label in labels}
+        else:
+            with transaction.atomic():
+                counts = assign_missing_tokens(labels)
 
-    def process_accessories(self, dry_run=False):
-        self.stdout.write('\n🔩 Processing Device Accessories...')
-        accessories = DeviceAccessory.objects.filter(qr_token__isnull=True)
-        count = 0
-        
-        for accessory in accessories:
-            try:
-                if not dry_run:
-                    accessory.qr_token = accessory.generate_qr_token()
-                    accessory.generate_qr_code()
-                    accessory.save(update_fields=['qr_token', 'qr_code'])
-                
-                count += 1
-                self.stdout.write(f"  ✅ Accessory {accessory.id}: {accessory.name}")
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"  ❌ Error with Accessory {accessory.id}: {e}")
-                )
-        
-        self.stdout.write(f"🔩 Processed {count} accessories")
-        return count
+        for label in labels:
+            self.stdout.write(f"  {label:<28} {counts.get(label, 0):>8}")
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 QR Code Population Complete! Total: {sum(counts.values())}')
+        )
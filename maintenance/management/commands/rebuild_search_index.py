@@ -0,0 +1,33 @@
+"""
+Django management command to rebuild the unified search index
+Usage: python manage.py rebuild_search_index [--entity device --entity patient]
+
+Signals keep the index current; run this after bulk imports or raw SQL updates.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from maintenance.search_index import SEARCH_ENTITIES, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild SearchDocument rows (and the SQLite FTS5 table) from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entity', action='append', default=None, help=f"One of: {', '.join(SEARCH_ENTITIES)}")
+
+    def handle(self, *args, **options):
+        entities = options['entity']
+        unknown = set(entities or ()) - set(SEARCH_ENTITIES)
+        if unknown:
+            raise CommandError(f"Unknown entity: {', '.join(sorted(unknown))}")
+
+        started = time.perf_counter()
+        counts = rebuild_index(entities)
+        for entity, count in counts.items():
+            self.stdout.write(f"{entity:<16} {count:>8}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {sum(counts.values())} objects in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,32 @@
+"""
+Django management command to aggregate QR scan logs into hourly rollups
+Usage: python manage.py rollup_qr_scans [--batch-size 5000] [--compact]
+
+The scan_rollups job keeps the rollups current every few minutes. Run this to
+backfill after importing old scan logs, or with --compact to apply retention now.
+"""
+
+from django.core.management.base import BaseCommand
+
+from maintenance.scan_rollups import compact, rollup_scans
+
+
+class Command(BaseCommand):
+    help = 'Aggregate new QRScanLog rows into QRScanRollup buckets and optionally apply retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Log rows per transaction (default: scan_rollups.batch_size)')
+        parser.add_argument('--compact', action='store_true', help='Also delete rolled-up raw logs and downsample old buckets')
+
+    def handle(self, *args, **options):
+        result = rollup_scans(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {result['scans']} scans into {result['buckets']} bucket updates "
+            f"(last log #{result['last_log_id']}) in {result['seconds']:.2f}s"
+        ))
+        if options['compact']:
+            cleanup = compact()
+            self.stdout.write(self.style.SUCCESS(
+                f"Deleted {cleanup['raw_logs']} raw logs and {cleanup['history_rows']} history rows, "
+                f"merged {cleanup['hourly_rows']} hourly buckets into days in {cleanup['seconds']:.2f}s"
+            ))
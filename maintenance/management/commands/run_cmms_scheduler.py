@@ -19,6 +19,7 @@ class Command(BaseCommand):
     python manage.py run_cmms_scheduler --task calibration # فحص المعايرة فقط
     python manage.py run_cmms_scheduler --task spare_parts # فحص قطع الغيار فقط
     python manage.py run_cmms_scheduler --task cleanup     # تنظيف البيانات فقط
+    python manage.py run_cmms_scheduler --task kpi         # تحديث لقطات المؤشرات اليومية فقط
     python manage.py run_cmms_scheduler --verbose          # مع تفاصيل أكثر
     """
     
@@ -28,7 +29,7 @@ class Command(BaseCommand):
         parser.add_argument(
             '--task',
             type=str,
-            choices=['pm', 'sla', 'calibration', 'spare_parts', 'notifications', 'cleanup', 'all'],
+            choices=['pm', 'sla', 'calibration', 'spare_parts', 'notifications', 'cleanup', 'kpi', 'all'],
             default='all',
             help='نوع المهمة المراد تشغيلها (افتراضي: all)',
         )
@@ -96,6 +97,14 @@ class Command(BaseCommand):
                 if not dry_run:
                     scheduler.cleanup_old_data()
                     
+            elif task == 'kpi':
+                self.stdout.write('تشغيل مهمة تحديث لقطات المؤشرات اليومية...')
+                if not dry_run:
+                    result = scheduler.rollup_kpi_snapshots()
+                    self.stdout.write(
+                        f"الأيام: {result['days']} - جهاز/يوم: {result['device_days']} - الصفوف: {result['rows']}"
+                    )
+                    
             else:  # all
                 self.stdout.write('تشغيل جميع المهام المجدولة...')
                 if not dry_run:
@@ -0,0 +1,59 @@
+"""
+Django management command to run the CMMS job queue (leader election + worker pool)
+Usage: python manage.py run_job_queue [--concurrency 4] [--once] [--status]
+
+Any number of these processes can run at once; only the lease holder enqueues
+periodic jobs and each queued run is claimed by exactly one worker.
+"""
+
+from django.core.management.base import BaseCommand
+
+from maintenance.job_queue import (
+    JobQueueService, drain_queue, job_metrics, release_lease, scheduler_tick, sync_jobs, worker_id
+)
+
+
+class Command(BaseCommand):
+    help = 'Run periodic CMMS jobs from the database-backed job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None, help='Worker threads in this process')
+        parser.add_argument('--once', action='store_true', help='Enqueue due jobs, run everything queued, then exit')
+        parser.add_argument('--status', action='store_true', help='Print per-job run history metrics and exit')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self._print_status()
+            return
+
+        sync_jobs()
+
+        if options['once']:
+            holder = worker_id()
+            enqueued = scheduler_tick(holder)
+            if enqueued is None:
+                self.stdout.write('Another process holds the scheduler lease; only running queued jobs')
+            else:
+                self.stdout.write(f"Enqueued: {', '.join(enqueued) or '-'}")
+            release_lease(holder)
+            count = drain_queue(holder)
+            self.stdout.write(self.style.SUCCESS(f'Ran {count} job(s)'))
+            return
+
+        service = JobQueueService(concurrency=options['concurrency'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Job queue running with {service.concurrency} worker(s) as {service.holder} (Ctrl+C to stop)'
+        ))
+        service.run_forever()
+
+    def _print_status(self):
+        self.stdout.write(
+            f"{'job':<26} {'runs':>6} {'ok':>6} {'failed':>7} {'avg ms':>9} {'max ms':>8}  {'last':<10} next run"
+        )
+        for row in job_metrics():
+            avg_ms = '-' if row['avg_ms'] is None else row['avg_ms']
+            max_ms = '-' if row['max_ms'] is None else row['max_ms']
+            self.stdout.write(
+                f"{row['name']:<26} {row['runs']:>6} {row['succeeded']:>6} {row['failed']:>7} "
+                f"{avg_ms:>9} {max_ms:>8}  {row['last_status'] or '-':<10} {row['next_run_at']:%Y-%m-%d %H:%M}"
+            )
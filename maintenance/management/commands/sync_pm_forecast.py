@@ -0,0 +1,30 @@
+"""
+Django management command to (re)build the PM forecast calendar
+Usage: python manage.py sync_pm_forecast [--horizon-days 180] [--dry-run]
+
+Schedule saves keep the calendar current; the daily pm_forecast job extends it
+with the horizon. Run this after bulk imports or after changing the horizon.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from maintenance.pm_forecast import sync_forecast
+
+
+class Command(BaseCommand):
+    help = 'Expand active PM schedules into PMForecastOccurrence rows up to the forecast horizon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon-days', type=int, default=None, help='Days ahead (default: pm_forecast.horizon_days)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would change')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = sync_forecast(horizon_days=options['horizon_days'], dry_run=options['dry_run'])
+        prefix = 'Would write' if options['dry_run'] else 'Wrote'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {result['created']} new, {result['updated']} updated, {result['deleted']} removed "
+            f"occurrences ({result['unchanged']} unchanged) in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0042_device_current_responsible_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QRTokenIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(max_length=30, verbose_name='نوع الكيان')),
+                ('token_hash', models.CharField(max_length=12, verbose_name='بصمة الرمز')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='معرف الكيان')),
+            ],
+            options={
+                'verbose_name': 'فهرس رموز QR',
+                'verbose_name_plural': 'فهرس رموز QR',
+                'indexes': [models.Index(fields=['token_hash'], name='maintenance_token_h_a223f3_idx')],
+                'unique_together': {('entity_type', 'object_id'), ('entity_type', 'token_hash')},
+            },
+        ),
+    ]
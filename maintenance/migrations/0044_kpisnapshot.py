@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0043_qrtokenindex'),
+        ('manager', '0025_department_qr_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KPISnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='اليوم')),
+                ('work_orders_created', models.PositiveIntegerField(default=0, verbose_name='أوامر الشغل المنشأة')),
+                ('work_orders_completed', models.PositiveIntegerField(default=0, verbose_name='أوامر الشغل المكتملة')),
+                ('work_orders_overdue', models.PositiveIntegerField(default=0, verbose_name='أوامر الشغل المتأخرة')),
+                ('failures', models.PositiveIntegerField(default=0, verbose_name='الأعطال')),
+                ('preventive_work_orders', models.PositiveIntegerField(default=0, verbose_name='أوامر الصيانة الوقائية')),
+                ('repair_count', models.PositiveIntegerField(default=0, verbose_name='عدد الإصلاحات المقاسة')),
+                ('repair_hours', models.FloatField(default=0, verbose_name='ساعات الإصلاح')),
+                ('downtime_hours', models.FloatField(default=0, verbose_name='ساعات التوقف')),
+                ('calibrations_completed', models.PositiveIntegerField(default=0, verbose_name='المعايرات المكتملة')),
+                ('is_stale', models.BooleanField(default=False, verbose_name='يحتاج إعادة حساب')),
+                ('computed_at', models.DateTimeField(verbose_name='وقت الحساب')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kpi_snapshots', to='manager.department', verbose_name='القسم')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kpi_snapshots', to='maintenance.device', verbose_name='الجهاز')),
+            ],
+            options={
+                'verbose_name': 'لقطة مؤشرات يومية',
+                'verbose_name_plural': 'لقطات المؤشرات اليومية',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['department', 'date'], name='maintenance_departm_2ed7cc_idx'), models.Index(fields=['date'], name='maintenance_date_f9538e_idx')],
+                'unique_together': {('device', 'date')},
+            },
+        ),
+    ]
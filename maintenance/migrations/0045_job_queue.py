@@ -0,0 +1,70 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0044_kpisnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='اسم المهمة')),
+                ('interval_seconds', models.PositiveIntegerField(default=3600, verbose_name='الفترة بالثواني')),
+                ('run_at', models.TimeField(blank=True, null=True, verbose_name='وقت التشغيل اليومي')),
+                ('enabled', models.BooleanField(default=True, verbose_name='مفعلة')),
+                ('max_retries', models.PositiveIntegerField(default=3, verbose_name='أقصى عدد محاولات إعادة')),
+                ('retry_backoff_seconds', models.PositiveIntegerField(default=60, verbose_name='مهلة إعادة المحاولة بالثواني')),
+                ('next_run_at', models.DateTimeField(verbose_name='التشغيل القادم')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True, verbose_name='آخر تشغيل')),
+                ('last_status', models.CharField(blank=True, max_length=20, verbose_name='حالة آخر تشغيل')),
+                ('last_duration_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='مدة آخر تشغيل (ms)')),
+            ],
+            options={
+                'verbose_name': 'مهمة مجدولة',
+                'verbose_name_plural': 'المهام المجدولة',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='الاسم')),
+                ('holder', models.CharField(blank=True, max_length=200, verbose_name='المالك')),
+                ('expires_at', models.DateTimeField(verbose_name='ينتهي في')),
+            ],
+            options={
+                'verbose_name': 'قفل الجدولة',
+                'verbose_name_plural': 'أقفال الجدولة',
+            },
+        ),
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'في الطابور'), ('running', 'قيد التشغيل'), ('succeeded', 'نجحت'), ('failed', 'فشلت')], default='queued', max_length=20, verbose_name='الحالة')),
+                ('attempt', models.PositiveIntegerField(default=1, verbose_name='رقم المحاولة')),
+                ('scheduled_for', models.DateTimeField(verbose_name='موعد التشغيل')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='وقت البدء')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='وقت الانتهاء')),
+                ('duration_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='المدة (ms)')),
+                ('worker', models.CharField(blank=True, max_length=200, verbose_name='العامل')),
+                ('error', models.TextField(blank=True, verbose_name='الخطأ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='maintenance.scheduledjob', verbose_name='المهمة')),
+            ],
+            options={
+                'verbose_name': 'تشغيل مهمة',
+                'verbose_name_plural': 'سجل تشغيل المهام',
+                'ordering': ['-scheduled_for'],
+                'indexes': [models.Index(fields=['status', 'scheduled_for'], name='maintenance_status_b2caf3_idx'), models.Index(fields=['job', 'scheduled_for'], name='maintenance_job_id_dc6d34_idx')],
+            },
+        ),
+    ]
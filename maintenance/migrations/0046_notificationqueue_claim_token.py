@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0045_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationqueue',
+            name='claim_token',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='رمز الحجز'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:36
+
+from django.db import migrations, models
+
+FTS_TABLE = 'maintenance_searchdocument_fts'
+DOCS_TABLE = 'maintenance_searchdocument'
+
+FTS_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"title, body, content='{DOCS_TABLE}', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS {DOCS_TABLE}_ai AFTER INSERT ON {DOCS_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    f"CREATE TRIGGER IF NOT EXISTS {DOCS_TABLE}_ad AFTER DELETE ON {DOCS_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+    f"CREATE TRIGGER IF NOT EXISTS {DOCS_TABLE}_au AFTER UPDATE ON {DOCS_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 على SQLite بس، القواعد التانية بتستخدم البحث العادي على SearchDocument
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in FTS_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {DOCS_TABLE}_{suffix}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0046_notificationqueue_claim_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=30, verbose_name='النوع')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='رقم الكائن')),
+                ('hospital_id', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='المستشفى')),
+                ('title', models.CharField(max_length=500, verbose_name='العنوان')),
+                ('body', models.TextField(blank=True, verbose_name='النص')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')),
+            ],
+            options={
+                'verbose_name': 'مستند بحث',
+                'verbose_name_plural': 'فهرس البحث',
+                'indexes': [models.Index(fields=['entity', 'hospital_id'], name='maintenance_entity_bfa1a5_idx')],
+                'constraints': [models.UniqueConstraint(fields=('entity', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
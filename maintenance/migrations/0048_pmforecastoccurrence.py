@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0047_search_index'),
+        ('manager', '0025_department_qr_code'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PMForecastOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_date', models.DateField(verbose_name='تاريخ الاستحقاق')),
+                ('week_start', models.DateField(verbose_name='بداية الأسبوع')),
+                ('estimated_hours', models.DecimalField(decimal_places=2, default=0, max_digits=5, verbose_name='الساعات المقدرة')),
+                ('assignee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pm_forecast', to=settings.AUTH_USER_MODEL, verbose_name='الفني المسؤول')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pm_forecast', to='manager.department', verbose_name='القسم')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pm_forecast', to='maintenance.device', verbose_name='الجهاز')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forecast_occurrences', to='maintenance.preventivemaintenanceschedule', verbose_name='جدولة الصيانة الوقائية')),
+            ],
+            options={
+                'verbose_name': 'موعد صيانة وقائية متوقع',
+                'verbose_name_plural': 'مواعيد الصيانة الوقائية المتوقعة',
+                'ordering': ['due_date'],
+                'indexes': [models.Index(fields=['department', 'due_date'], name='maintenance_departm_638ce0_idx'), models.Index(fields=['assignee', 'due_date'], name='maintenance_assigne_d691a2_idx'), models.Index(fields=['due_date'], name='maintenance_due_dat_8718dd_idx')],
+                'unique_together': {('schedule', 'due_date')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0048_pmforecastoccurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DowntimeTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('work_order', 'أمر شغل'), ('service_request', 'طلب خدمة'), ('reconcile', 'مطابقة دورية')], max_length=20, verbose_name='المصدر')),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='رقم المصدر')),
+                ('from_status', models.CharField(blank=True, default='', max_length=20, verbose_name='الحالة السابقة')),
+                ('to_status', models.CharField(blank=True, default='', max_length=20, verbose_name='الحالة الجديدة')),
+                ('action', models.CharField(choices=[('opened', 'بداية توقف'), ('linked', 'ربط بتوقف مفتوح'), ('closed', 'نهاية توقف'), ('none', 'بدون تأثير')], default='none', max_length=10, verbose_name='الإجراء')),
+                ('occurred_at', models.DateTimeField(verbose_name='وقت التغيير')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='downtime_transitions', to='maintenance.device', verbose_name='الجهاز')),
+                ('downtime', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transitions', to='maintenance.devicedowntime', verbose_name='التوقف')),
+            ],
+            options={
+                'verbose_name': 'تغيير حالة مؤثر على التوقف',
+                'verbose_name_plural': 'تغييرات الحالة المؤثرة على التوقف',
+                'ordering': ['-occurred_at'],
+                'indexes': [models.Index(fields=['device', 'occurred_at'], name='maintenance_device__511dbe_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0049_downtimetransition'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='qrscanlog',
+            name='scanned_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='وقت المسح'),
+        ),
+    ]
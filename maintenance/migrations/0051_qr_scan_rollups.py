@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0050_qrscanlog_scanned_at_default'),
+        ('manager', '0025_department_qr_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QRScanRollupCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='الاسم')),
+                ('last_log_id', models.PositiveBigIntegerField(default=0, verbose_name='آخر سجل')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')),
+            ],
+            options={
+                'verbose_name': 'مؤشر تجميع المسحات',
+                'verbose_name_plural': 'مؤشرات تجميع المسحات',
+            },
+        ),
+        migrations.CreateModel(
+            name='QRScanLastSeen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(max_length=50, verbose_name='نوع الكيان')),
+                ('entity_id', models.CharField(max_length=100, verbose_name='معرف الكيان')),
+                ('last_scanned_at', models.DateTimeField(verbose_name='آخر مسحة')),
+                ('scans', models.PositiveIntegerField(default=0, verbose_name='عدد المسحات')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='qr_last_seen', to='manager.department', verbose_name='القسم')),
+            ],
+            options={
+                'verbose_name': 'آخر مسحة للكيان',
+                'verbose_name_plural': 'آخر مسحات الكيانات',
+                'indexes': [models.Index(fields=['entity_type', 'last_scanned_at'], name='maintenance_entity__eceeef_idx')],
+                'unique_together': {('entity_type', 'entity_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='QRScanRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'ساعة'), ('day', 'يوم')], default='hour', max_length=10, verbose_name='الدقة')),
+                ('bucket', models.DateTimeField(verbose_name='بداية الفترة')),
+                ('entity_type', models.CharField(max_length=50, verbose_name='نوع الكيان')),
+                ('scanner_id', models.CharField(blank=True, default='', max_length=100, verbose_name='معرف الماسح')),
+                ('flow_name', models.CharField(blank=True, default='', max_length=100, verbose_name='اسم الـ Flow')),
+                ('scans', models.PositiveIntegerField(default=0, verbose_name='عدد المسحات')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='qr_scan_rollups', to='manager.department', verbose_name='القسم')),
+            ],
+            options={
+                'verbose_name': 'تجميع مسحات QR',
+                'verbose_name_plural': 'تجميعات مسحات QR',
+                'ordering': ['-bucket'],
+                'indexes': [models.Index(fields=['granularity', 'bucket'], name='maintenance_granula_1bba1a_idx'), models.Index(fields=['department', 'bucket'], name='maintenance_departm_bd00b3_idx')],
+                'unique_together': {('granularity', 'bucket', 'entity_type', 'department', 'scanner_id', 'flow_name')},
+            },
+        ),
+    ]
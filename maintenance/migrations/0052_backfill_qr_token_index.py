@@ -0,0 +1,36 @@
+# فهرسة الكيانات اللي اتعملت قبل QRTokenIndex (المسح مبقاش بيفهرس وقت الـ miss)
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    from maintenance.qr_resolver import HASH_ENTITY_MODELS, compute_entity_hash
+
+    QRTokenIndex = apps.get_model('maintenance', 'QRTokenIndex')
+    for entity_type, model_key in HASH_ENTITY_MODELS.items():
+        model = apps.get_model(*model_key)
+        indexed = QRTokenIndex.objects.filter(entity_type=entity_type).values('object_id')
+        pending = list(model.objects.exclude(pk__in=indexed).order_by('pk').values_list('pk', flat=True))
+        QRTokenIndex.objects.bulk_create(
+            [
+                QRTokenIndex(entity_type=entity_type, token_hash=compute_entity_hash(entity_type, pk), object_id=pk)
+                for pk in pending
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0051_qr_scan_rollups'),
+        ('manager', '0025_department_qr_code'),
+        ('hr', '0011_attendancedevice'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0052_backfill_qr_token_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KPISnapshotCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='الاسم')),
+                ('last_run_at', models.DateTimeField(verbose_name='آخر تشغيل')),
+            ],
+            options={
+                'verbose_name': 'مؤشر تجميع اللقطات',
+                'verbose_name_plural': 'مؤشرات تجميع اللقطات',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0053_kpi_snapshot_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCacheGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=50, unique=True, verbose_name='النطاق')),
+                ('generation', models.PositiveBigIntegerField(default=0, verbose_name='الجيل')),
+            ],
+            options={
+                'verbose_name': 'جيل كاش الداشبورد',
+                'verbose_name_plural': 'أجيال كاش الداشبورد',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0054_dashboard_cache_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchdocument',
+            name='display_body',
+            field=models.TextField(blank=True, default='', verbose_name='النص الأصلي'),
+        ),
+        migrations.AddField(
+            model_name='searchdocument',
+            name='display_title',
+            field=models.CharField(blank=True, default='', max_length=500, verbose_name='العنوان الأصلي'),
+        ),
+    ]
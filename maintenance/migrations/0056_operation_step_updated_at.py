@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0055_search_document_display_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operationstep',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0056_operation_step_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qrscanlog',
+            name='reference',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, null=True, verbose_name='مرجع المسح'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0057_qr_scan_log_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qrscanrollupcursor',
+            name='gaps',
+            field=models.JSONField(blank=True, default=dict, verbose_name='سجلات ناقصة'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0058_qr_scan_rollup_cursor_gaps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobrun',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='آخر نبضة من العامل'),
+        ),
+    ]
@@ -105,7 +105,11 @@ class QRScanLog(models.Model):
         verbose_name="تم تنفيذ التدفق"
     )
     
-    scanned_at = models.DateTimeField(auto_now_add=True, verbose_name="وقت المسح")
+    # وقت المسح نفسه (السجل بيتكتب متأخر من maintenance.scan_audit)
+    scanned_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="وقت المسح")
+    
+    # معرف السجل من لحظة المسح، قبل ما الطابور يتكتب ويبقى ليه id
+    reference = models.UUIDField(null=True, blank=True, editable=False, db_index=True, verbose_name="مرجع المسح")
     
     class Meta:
         verbose_name = "سجل مسح QR"
@@ -122,6 +126,25 @@ class QRScanLog(models.Model):
         return f"{self.qr_code} - {self.scanned_at}"
 
 
+class QRTokenIndex(models.Model):
+    """Lookup table mapping printed `entity_type:hash` labels to primary keys
+    (see maintenance.qr_resolver)"""
+    entity_type = models.CharField(max_length=30, verbose_name="نوع الكيان")
+    token_hash = models.CharField(max_length=12, verbose_name="بصمة الرمز")
+    object_id = models.PositiveBigIntegerField(verbose_name="معرف الكيان")
+
+    class Meta:
+        verbose_name = "فهرس رموز QR"
+        verbose_name_plural = "فهرس رموز QR"
+        unique_together = [('entity_type', 'token_hash'), ('entity_type', 'object_id')]
+        indexes = [
+            models.Index(fields=['token_hash']),
+        ]
+
+    def __str__(self):
+        return f"{self.entity_type}:{self.token_hash} -> {self.object_id}"
+
+
 # ════════════ ═══════════════════════════════════════════════════════════════
 # EXISTING MODELS
 # ═══════════════════════════════════════════════════════════════════════════
@@ -420,6 +443,52 @@ class DeviceDowntime(models.Model):
             return (timezone.now() - self.start_time).total_seconds() / 3600
         return 0
 
+
+class DowntimeTransition(models.Model):
+    """
+    سجل مختصر لتغييرات حالة أوامر الشغل والبلاغات اللي بتفتح أو تقفل توقف الجهاز
+    بيتكتب من maintenance.downtime_tracker مع كل تغيير حالة، والمطابقة الدورية بتستخدمه لوقت الإقفال
+    """
+    SOURCE_CHOICES = [
+        ('work_order', 'أمر شغل'),
+        ('service_request', 'طلب خدمة'),
+        ('reconcile', 'مطابقة دورية'),
+    ]
+
+    ACTION_CHOICES = [
+        ('opened', 'بداية توقف'),
+        ('linked', 'ربط بتوقف مفتوح'),
+        ('closed', 'نهاية توقف'),
+        ('none', 'بدون تأثير'),
+    ]
+
+    device = models.ForeignKey('Device', on_delete=models.CASCADE, related_name='downtime_transitions', verbose_name="الجهاز")
+    downtime = models.ForeignKey(
+        DeviceDowntime,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='transitions',
+        verbose_name="التوقف"
+    )
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, verbose_name="المصدر")
+    object_id = models.PositiveIntegerField(null=True, blank=True, verbose_name="رقم المصدر")
+    from_status = models.CharField(max_length=20, blank=True, default='', verbose_name="الحالة السابقة")
+    to_status = models.CharField(max_length=20, blank=True, default='', verbose_name="الحالة الجديدة")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default='none', verbose_name="الإجراء")
+    occurred_at = models.DateTimeField(verbose_name="وقت التغيير")
+
+    class Meta:
+        verbose_name = "تغيير حالة مؤثر على التوقف"
+        verbose_name_plural = "تغييرات الحالة المؤثرة على التوقف"
+        ordering = ['-occurred_at']
+        indexes = [
+            models.Index(fields=['device', 'occurred_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} {self.from_status} → {self.to_status} ({self.action})"
+
 # نموذج تقرير تحليل الأعطال
 class FailureAnalysisReport(models.Model):
     device = models.ForeignKey('Device', on_delete=models.CASCADE, related_name='failure_reports')
@@ -953,15 +1022,12 @@ class Device(QRCodeMixin, models.Model):
         if open_work_orders and open_work_orders.service_request:
             service_request = open_work_orders.service_request
             
-            # البحث عن SLA Matrix مناسب
+            # البحث عن SLA Matrix مناسب (من الفهرس اللي في الذاكرة)
             try:
-                sla_matrix = SLAMatrix.objects.filter(
-                    device_category=service_request.device.category,
-                    severity=service_request.severity,
-                    impact=service_request.impact,
-                    priority=service_request.priority,
-                    is_active=True
-                ).first()
+                from .sla_resolver import resolver
+                sla_matrix = resolver.lookup(
+                    self.category_id, service_request.severity, service_request.impact, service_request.priority
+                )
                 
                 if sla_matrix and sla_matrix.resolution_time_hours:
                     return timezone.now() + timezone.timedelta(hours=sla_matrix.resolution_time_hours)
@@ -976,13 +1042,10 @@ class Device(QRCodeMixin, models.Model):
         
         if service_requests:
             try:
-                sla_matrix = SLAMatrix.objects.filter(
-                    device_category=service_requests.device.category,
-                    severity=service_requests.severity,
-                    impact=service_requests.impact,
-                    priority=service_requests.priority,
-                    is_active=True
-                ).first()
+                from .sla_resolver import resolver
+                sla_matrix = resolver.lookup(
+                    self.category_id, service_requests.severity, service_requests.impact, service_requests.priority
+                )
                 
                 if sla_matrix and sla_matrix.resolution_time_hours:
                     return timezone.now() + timezone.timedelta(hours=sla_matrix.resolution_time_hours)
@@ -2202,67 +2265,17 @@ class ServiceRequest(models.Model):
         from datetime import timedelta
         
         try:
-            # البحث عن SLA Matrix مناسب أولاً
-            sla_matrix = SLAMatrix.objects.filter(
-                device_category=self.device.category,
-                severity=self.severity,
-                impact=self.impact,
-                priority=self.priority,
-                is_active=True
-            ).first()
+            # البحث عن SLA Matrix مناسب أولاً، وإلا حساب أوقات افتراضية بنفس المعاملات
+            from .sla_resolver import resolver
+            response_hours, resolution_hours, _ = resolver.resolve_times(
+                self.device.category_id, self.severity, self.impact, self.priority
+            )
             
             now = timezone.now()
+            self.response_due = now + timedelta(hours=response_hours)
+            self.resolution_due = now + timedelta(hours=resolution_hours)
+            self.estimated_hours = resolution_hours
             
-            if sla_matrix:
-                # استخدام الأوقات المحسوبة من SLA Matrix
-                self.response_due = now + timedelta(hours=sla_matrix.response_time_hours)
-                self.resolution_due = now + timedelta(hours=sla_matrix.resolution_time_hours)
-                self.estimated_hours = sla_matrix.resolution_time_hours
-            else:
-                # حساب أوقات افتراضية بناءً على المعاملات المُصححة
-                # معاملات الخطورة (كلما ارتفعت الخطورة، قل الوقت المسموح)
-                severity_multipliers = {
-                    'low': 2.0,      # منخفض - وقت أكثر
-                    'medium': 1.0,   # متوسط - وقت عادي
-                    'high': 0.5,     # عالي - وقت أقل
-                    'critical': 0.25 # حرج - وقت أقل بكثير
-                }
-                
-                # معاملات التأثير (كلما ارتفع التأثير، قل الوقت المسموح)
-                impact_multipliers = {
-                    'minimal': 2.0,    # طفيف - وقت أكثر
-                    'moderate': 1.0,   # متوسط - وقت عادي
-                    'significant': 0.5, # كبير - وقت أقل
-                    'extensive': 0.25  # واسع - وقت أقل بكثير
-                }
-                
-                # معاملات الأولوية (كلما ارتفعت الأولوية، قل الوقت المسموح)
-                priority_multipliers = {
-                    'low': 2.0,      # منخفض - وقت أكثر
-                    'medium': 1.0,   # متوسط - وقت عادي
-                    'high': 0.5,     # عالي - وقت أقل
-                    'critical': 0.25 # حرج - وقت أقل بكثير
-                }
-                
-                # حساب المعاملات
-                severity_factor = severity_multipliers.get(self.severity, 1.0)
-                impact_factor = impact_multipliers.get(self.impact, 1.0)
-                priority_factor = priority_multipliers.get(self.priority, 1.0)
-                
-                # أوقات افتراضية أساسية
-                base_response = 12  # 12 ساعة
-                base_resolution = 36  # 36 ساعة
-                
-                # المعامل النهائي (متوسط الثلاثة عوامل)
-                final_multiplier = (severity_factor + impact_factor + priority_factor) / 3
-                
-                response_hours = max(1, int(base_response * final_multiplier))
-                resolution_hours = max(2, int(base_resolution * final_multiplier))
-                
-                self.response_due = now + timedelta(hours=response_hours)
-                self.resolution_due = now + timedelta(hours=resolution_hours)
-                self.estimated_hours = resolution_hours
-                    
         except Exception as e:
             # في حالة الخطأ، استخدم قيم افتراضية
             from django.utils import timezone
@@ -2541,6 +2554,79 @@ class DowntimeEvent(models.Model):
         return self.end_time is None
 
 
+class KPISnapshot(models.Model):
+    """
+    لقطة يومية مجمعة لمؤشرات الجهاز
+    صف واحد لكل جهاز في كل يوم فيه نشاط، بيتملى بالتدريج من maintenance.kpi_snapshots
+    والداشبورد والاتجاهات الشهرية بتقرأ منه بدل أوامر الشغل الخام
+    """
+    device = models.ForeignKey('Device', on_delete=models.CASCADE, related_name='kpi_snapshots', verbose_name="الجهاز")
+    department = models.ForeignKey(
+        'manager.Department',
+        on_delete=models.CASCADE,
+        related_name='kpi_snapshots',
+        verbose_name="القسم"
+    )
+    date = models.DateField(verbose_name="اليوم")
+
+    # أوامر الشغل المنشأة في اليوم
+    work_orders_created = models.PositiveIntegerField(default=0, verbose_name="أوامر الشغل المنشأة")
+    work_orders_completed = models.PositiveIntegerField(default=0, verbose_name="أوامر الشغل المكتملة")
+    work_orders_overdue = models.PositiveIntegerField(default=0, verbose_name="أوامر الشغل المتأخرة")
+    failures = models.PositiveIntegerField(default=0, verbose_name="الأعطال")
+    preventive_work_orders = models.PositiveIntegerField(default=0, verbose_name="أوامر الصيانة الوقائية")
+    repair_count = models.PositiveIntegerField(default=0, verbose_name="عدد الإصلاحات المقاسة")
+    repair_hours = models.FloatField(default=0, verbose_name="ساعات الإصلاح")
+
+    downtime_hours = models.FloatField(default=0, verbose_name="ساعات التوقف")
+    calibrations_completed = models.PositiveIntegerField(default=0, verbose_name="المعايرات المكتملة")
+
+    is_stale = models.BooleanField(default=False, verbose_name="يحتاج إعادة حساب")
+    computed_at = models.DateTimeField(verbose_name="وقت الحساب")
+
+    class Meta:
+        verbose_name = "لقطة مؤشرات يومية"
+        verbose_name_plural = "لقطات المؤشرات اليومية"
+        unique_together = ['device', 'date']
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['department', 'date']),
+            models.Index(fields=['date']),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} - {self.date}"
+
+
+class KPISnapshotCursor(models.Model):
+    """وقت آخر تشغيل لتجميع اللقطات (بيتقدم حتى لو التشغيل مكتبش ولا صف)"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="الاسم")
+    last_run_at = models.DateTimeField(verbose_name="آخر تشغيل")
+
+    class Meta:
+        verbose_name = "مؤشر تجميع اللقطات"
+        verbose_name_plural = "مؤشرات تجميع اللقطات"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_run_at}"
+
+
+class DashboardCacheGeneration(models.Model):
+    """
+    رقم جيل كاش الداشبورد لكل قسم (أو للكل)
+    متخزن في قاعدة البيانات عشان الإبطال يوصل لكل العمليات حتى لو الكاش محلي لكل عملية
+    """
+    scope = models.CharField(max_length=50, unique=True, verbose_name="النطاق")
+    generation = models.PositiveBigIntegerField(default=0, verbose_name="الجيل")
+
+    class Meta:
+        verbose_name = "جيل كاش الداشبورد"
+        verbose_name_plural = "أجيال كاش الداشبورد"
+
+    def __str__(self):
+        return f"{self.scope}: {self.generation}"
+
+
 # تم نقل هذا النموذج إلى تعريف آخر في الملف
 class DeviceUsageLogDaily(models.Model):
     """
@@ -3001,12 +3087,17 @@ class PreventiveMaintenanceSchedule(models.Model):
     
     def calculate_next_due_date(self):
         """حساب تاريخ الاستحقاق التالي بناءً على التاريخ الحالي وليس التاريخ السابق"""
-        from datetime import timedelta, date
-        import calendar
+        from datetime import date
         
         # استخدم التاريخ الحالي كنقطة بداية لحساب التاريخ التالي
         today = date.today()
         base_date = self.last_completed_date or self.start_date or today
+        return self.next_due_after(base_date)
+    
+    def next_due_after(self, base_date):
+        """الموعد اللي بعد base_date بفترة واحدة حسب التكرار (None للتكرار بعد الاستخدام/الوردية)"""
+        from datetime import timedelta, date
+        import calendar
         
         if self.frequency == 'daily':
             return base_date + timedelta(days=1)
@@ -3199,28 +3290,59 @@ class PreventiveMaintenanceSchedule(models.Model):
     
     @classmethod
     def check_and_generate_work_orders(cls):
-        """فحص الجدولات وإنشاء أوامر العمل المستحقة"""
-        active_schedules = cls.objects.filter(is_active=True)
-        generated_count = 0
-        
-        print(f"DEBUG: Checking {active_schedules.count()} active PM schedules")
-        
-        for schedule in active_schedules:
-            print(f"DEBUG: Checking schedule {schedule.id} - {schedule.name}")
-            print(f"DEBUG: Next due date: {schedule.next_due_date}")
-            print(f"DEBUG: Is due: {schedule.is_due()}")
-            
-            if schedule.is_due():
-                print(f"DEBUG: Schedule {schedule.id} is due, generating work order")
-                work_order = schedule.generate_work_order()
-                if work_order:
-                    generated_count += 1
-                    print(f"DEBUG: Work order {work_order.id} generated for schedule {schedule.id}")
-                else:
-                    print(f"DEBUG: No work order generated for schedule {schedule.id} (already exists or completed today)")
-        
-        print(f"DEBUG: Generated {generated_count} work orders from PM schedules")
-        return generated_count
+        """فحص الجدولات وإنشاء أوامر العمل المستحقة (على دفعات من maintenance.pm_generation)"""
+        from .pm_generation import generate_due_pm_work_orders
+
+        return generate_due_pm_work_orders()['created']
+
+
+class PMForecastOccurrence(models.Model):
+    """
+    موعد متوقع لصيانة وقائية داخل أفق التوقع
+    كل جدول نشط بيتفرد لمواعيده الجاية هنا (maintenance.pm_forecast) عشان أسئلة زي
+    "المستحق في الـ 90 يوم الجايين لكل قسم" أو "حمل كل فني في الأسبوع" تبقى استعلام واحد
+    """
+    schedule = models.ForeignKey(
+        PreventiveMaintenanceSchedule,
+        on_delete=models.CASCADE,
+        related_name='forecast_occurrences',
+        verbose_name="جدولة الصيانة الوقائية"
+    )
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='pm_forecast', verbose_name="الجهاز")
+    department = models.ForeignKey(
+        'manager.Department',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pm_forecast',
+        verbose_name="القسم"
+    )
+    assignee = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pm_forecast',
+        verbose_name="الفني المسؤول"
+    )
+    due_date = models.DateField(verbose_name="تاريخ الاستحقاق")
+    # أول يوم (الاثنين) في أسبوع الاستحقاق عشان التجميع بالأسبوع يبقى على عمود متفهرس
+    week_start = models.DateField(verbose_name="بداية الأسبوع")
+    estimated_hours = models.DecimalField(max_digits=5, decimal_places=2, default=0, verbose_name="الساعات المقدرة")
+
+    class Meta:
+        verbose_name = "موعد صيانة وقائية متوقع"
+        verbose_name_plural = "مواعيد الصيانة الوقائية المتوقعة"
+        unique_together = ['schedule', 'due_date']
+        ordering = ['due_date']
+        indexes = [
+            models.Index(fields=['department', 'due_date']),
+            models.Index(fields=['assignee', 'due_date']),
+            models.Index(fields=['due_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.schedule.name} - {self.due_date}"
 
 
 # ===== SLA Models =====
@@ -3518,6 +3640,9 @@ class NotificationQueue(models.Model):
     # Error tracking
     last_error = models.TextField(blank=True, verbose_name="آخر خطأ")
     
+    # العامل اللي حجز الدفعة (notification_dispatch)
+    claim_token = models.CharField(max_length=64, blank=True, db_index=True, verbose_name="رمز الحجز")
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإنشاء")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="تاريخ التحديث")
@@ -4139,6 +4264,8 @@ class OperationStep(models.Model):
     )
     
     description = models.CharField(max_length=255, blank=True, verbose_name="وصف الخطوة")
+    # جزء من بصمة شجرة المطابقة (OperationMatcher.current_version)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = "خطوة العملية"
@@ -4448,3 +4575,201 @@ class CleaningCycle(models.Model):
         if self.end_time:
             return self.end_time - self.start_time
         return None
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# JOB QUEUE - طابور المهام الدورية (maintenance.job_queue)
+# ═══════════════════════════════════════════════════════════════════════════
+
+class ScheduledJob(models.Model):
+    """
+    مهمة دورية مسجلة في طابور المهام
+    القائد (صاحب الـ lease) بس هو اللي بيضيف تشغيلات جديدة لما next_run_at ييجي
+    """
+    name = models.CharField(max_length=100, unique=True, verbose_name="اسم المهمة")
+    interval_seconds = models.PositiveIntegerField(default=3600, verbose_name="الفترة بالثواني")
+    run_at = models.TimeField(null=True, blank=True, verbose_name="وقت التشغيل اليومي")
+    enabled = models.BooleanField(default=True, verbose_name="مفعلة")
+    max_retries = models.PositiveIntegerField(default=3, verbose_name="أقصى عدد محاولات إعادة")
+    retry_backoff_seconds = models.PositiveIntegerField(default=60, verbose_name="مهلة إعادة المحاولة بالثواني")
+    next_run_at = models.DateTimeField(verbose_name="التشغيل القادم")
+    last_run_at = models.DateTimeField(null=True, blank=True, verbose_name="آخر تشغيل")
+    last_status = models.CharField(max_length=20, blank=True, verbose_name="حالة آخر تشغيل")
+    last_duration_ms = models.PositiveIntegerField(null=True, blank=True, verbose_name="مدة آخر تشغيل (ms)")
+
+    class Meta:
+        verbose_name = "مهمة مجدولة"
+        verbose_name_plural = "المهام المجدولة"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class JobRun(models.Model):
+    """سجل تشغيل واحد لمهمة (وكل إعادة محاولة بتبقى صف جديد)"""
+    STATUS_CHOICES = [
+        ('queued', 'في الطابور'),
+        ('running', 'قيد التشغيل'),
+        ('succeeded', 'نجحت'),
+        ('failed', 'فشلت'),
+    ]
+
+    job = models.ForeignKey(ScheduledJob, on_delete=models.CASCADE, related_name='runs', verbose_name="المهمة")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name="الحالة")
+    attempt = models.PositiveIntegerField(default=1, verbose_name="رقم المحاولة")
+    scheduled_for = models.DateTimeField(verbose_name="موعد التشغيل")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="وقت البدء")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="وقت الانتهاء")
+    duration_ms = models.PositiveIntegerField(null=True, blank=True, verbose_name="المدة (ms)")
+    worker = models.CharField(max_length=200, blank=True, verbose_name="العامل")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="آخر نبضة من العامل")
+    error = models.TextField(blank=True, verbose_name="الخطأ")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإنشاء")
+
+    class Meta:
+        verbose_name = "تشغيل مهمة"
+        verbose_name_plural = "سجل تشغيل المهام"
+        ordering = ['-scheduled_for']
+        indexes = [
+            models.Index(fields=['status', 'scheduled_for']),
+            models.Index(fields=['job', 'scheduled_for']),
+        ]
+
+    def __str__(self):
+        return f"{self.job.name} #{self.attempt} - {self.status}"
+
+
+class SchedulerLease(models.Model):
+    """قفل القيادة: عملية واحدة بس في الكلاستر بتجدول المهام طول ما الـ lease بتاعها سارية"""
+    name = models.CharField(max_length=100, unique=True, verbose_name="الاسم")
+    holder = models.CharField(max_length=200, blank=True, verbose_name="المالك")
+    expires_at = models.DateTimeField(verbose_name="ينتهي في")
+
+    class Meta:
+        verbose_name = "قفل الجدولة"
+        verbose_name_plural = "أقفال الجدولة"
+
+    def __str__(self):
+        return f"{self.name} -> {self.holder}"
+
+
+# ═══════════════════════════════════════════════════════════════
+# SEARCH INDEX - فهرس البحث الموحد (maintenance.search_index)
+# ═══════════════════════════════════════════════════════════════
+
+class SearchDocument(models.Model):
+    """
+    صف واحد لكل كائن قابل للبحث (جهاز، مريض، بلاغ، قطعة غيار، مورد)
+    النص متخزن بعد توحيد الحروف العربية، وعلى SQLite جدول FTS5 بيتحدث منه بـ triggers
+    والنص الأصلي متخزن جنبه للعرض والتظليل
+    """
+    entity = models.CharField(max_length=30, verbose_name="النوع")
+    object_id = models.PositiveBigIntegerField(verbose_name="رقم الكائن")
+    hospital_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="المستشفى")
+    title = models.CharField(max_length=500, verbose_name="العنوان")
+    body = models.TextField(blank=True, verbose_name="النص")
+    display_title = models.CharField(max_length=500, blank=True, default='', verbose_name="العنوان الأصلي")
+    display_body = models.TextField(blank=True, default='', verbose_name="النص الأصلي")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="تاريخ التحديث")
+
+    class Meta:
+        verbose_name = "مستند بحث"
+        verbose_name_plural = "فهرس البحث"
+        constraints = [
+            models.UniqueConstraint(fields=['entity', 'object_id'], name='unique_search_document'),
+        ]
+        indexes = [
+            models.Index(fields=['entity', 'hospital_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.entity}:{self.object_id} {self.title}"
+
+
+# ═══════════════════════════════════════════════════════════════
+# QR SCAN ROLLUPS - تجميع مسحات QR (maintenance.scan_rollups)
+# ═══════════════════════════════════════════════════════════════
+
+class QRScanRollup(models.Model):
+    """
+    عدد مسحات QR في كل ساعة لكل (نوع كيان، قسم، ماسح، flow)
+    بيتملى بالتدريج من QRScanLog، والساعات القديمة بتتدمج في صف يومي واحد
+    والخريطة الحرارية بتقرأ منه بدل السجلات الخام
+    """
+    GRANULARITY_CHOICES = [
+        ('hour', 'ساعة'),
+        ('day', 'يوم'),
+    ]
+
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES, default='hour', verbose_name="الدقة")
+    bucket = models.DateTimeField(verbose_name="بداية الفترة")
+    entity_type = models.CharField(max_length=50, verbose_name="نوع الكيان")
+    department = models.ForeignKey(
+        'manager.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='qr_scan_rollups',
+        verbose_name="القسم"
+    )
+    scanner_id = models.CharField(max_length=100, blank=True, default='', verbose_name="معرف الماسح")
+    flow_name = models.CharField(max_length=100, blank=True, default='', verbose_name="اسم الـ Flow")
+    scans = models.PositiveIntegerField(default=0, verbose_name="عدد المسحات")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="تاريخ التحديث")
+
+    class Meta:
+        verbose_name = "تجميع مسحات QR"
+        verbose_name_plural = "تجميعات مسحات QR"
+        unique_together = ['granularity', 'bucket', 'entity_type', 'department', 'scanner_id', 'flow_name']
+        ordering = ['-bucket']
+        indexes = [
+            models.Index(fields=['granularity', 'bucket']),
+            models.Index(fields=['department', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket} {self.entity_type}: {self.scans}"
+
+
+class QRScanLastSeen(models.Model):
+    """آخر مسحة لكل كيان، بتفضل بعد ما السجلات الخام تتمسح (للأجهزة اللي محدش بيمسحها)"""
+    entity_type = models.CharField(max_length=50, verbose_name="نوع الكيان")
+    entity_id = models.CharField(max_length=100, verbose_name="معرف الكيان")
+    department = models.ForeignKey(
+        'manager.Department',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='qr_last_seen',
+        verbose_name="القسم"
+    )
+    last_scanned_at = models.DateTimeField(verbose_name="آخر مسحة")
+    scans = models.PositiveIntegerField(default=0, verbose_name="عدد المسحات")
+
+    class Meta:
+        verbose_name = "آخر مسحة للكيان"
+        verbose_name_plural = "آخر مسحات الكيانات"
+        unique_together = ['entity_type', 'entity_id']
+        indexes = [
+            models.Index(fields=['entity_type', 'last_scanned_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.entity_type}:{self.entity_id} - {self.last_scanned_at}"
+
+
+class QRScanRollupCursor(models.Model):
+    """آخر سجل QRScanLog اتجمع (بالـ id، عشان السجلات المؤجلة اللي بتتكتب متأخر تتحسب برضه)"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="الاسم")
+    last_log_id = models.PositiveBigIntegerField(default=0, verbose_name="آخر سجل")
+    # ids ناقصة تحت last_log_id لسه ممكن تتكتب (transaction ما خلصتش): {id: أول مرة اتلاحظ}
+    gaps = models.JSONField(default=dict, blank=True, verbose_name="سجلات ناقصة")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="تاريخ التحديث")
+
+    class Meta:
+        verbose_name = "مؤشر تجميع المسحات"
+        verbose_name_plural = "مؤشرات تجميع المسحات"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_log_id}"
@@ -0,0 +1,299 @@
+"""
+إرسال طابور الإشعارات على دفعات
+كل عامل بيحجز دفعة من NotificationQueue بتحديث شرطي واحد (رمز حجز خاص بيه) فعمال كتير
+يقدروا يشتغلوا مع بعض من غير ما إشعار يتبعت مرتين، والإيميلات بتتبعت على اتصال SMTP واحد
+للدفعة كلها، والنتايج بتتكتب بـ bulk_update / bulk_create بدل حفظ كل صف لوحده
+لو الحجز رجع للطابور (requeue_stale_claims) وعامل تاني خده، العامل الأولاني مبيبعتش الإشعار
+ومبيكتبش نتيجته، فكل صف بيتكتب من صاحب الحجز الحالي بس
+"""
+
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EmailLog, NotificationPreference, NotificationQueue, SystemNotification
+from .scheduler_config import get_config
+
+logger = logging.getLogger(__name__)
+
+CREATE_CHUNK_SIZE = 500
+
+# نوع الإشعار -> حقل تفضيل الإيميل الخاص بيه في NotificationPreference
+EMAIL_PREFERENCE_FIELDS = {
+    'service_request': 'email_service_requests',
+    'work_order': 'email_work_orders',
+    'preventive_maintenance': 'email_preventive_maintenance',
+    'sla_breach': 'email_sla_breaches',
+}
+
+QUEUE_UPDATE_FIELDS = ['status', 'attempts', 'scheduled_for', 'last_error', 'claim_token', 'processed_at', 'updated_at']
+
+
+def _batch_size():
+    return get_config('notification_queue.batch_size', 50)
+
+
+def _retry_delay():
+    return timedelta(minutes=get_config('notification_queue.retry_delay_minutes', 30))
+
+
+def _claim_timeout():
+    return timedelta(minutes=get_config('notification_queue.claim_timeout_minutes', 10))
+
+
+def enqueue_notifications(notifications, scheduled_for=None, max_attempts=None):
+    """
+    إضافة إشعارات للطابور مرة واحدة
+    notifications: كائنات SystemNotification مش محفوظة (أو dicts بنفس الحقول)
+    بيعمل bulk_create للإشعارات ولعناصر الطابور، ويرجع عناصر الطابور
+    """
+    notifications = [
+        item if isinstance(item, SystemNotification) else SystemNotification(**item)
+        for item in notifications
+    ]
+    if max_attempts is None:
+        max_attempts = get_config('notification_queue.max_attempts', 3)
+
+    with transaction.atomic():
+        created = SystemNotification.objects.bulk_create(notifications, batch_size=CREATE_CHUNK_SIZE)
+        entries = [
+            NotificationQueue(notification=notification, scheduled_for=scheduled_for, max_attempts=max_attempts)
+            for notification in created
+        ]
+        return NotificationQueue.objects.bulk_create(entries, batch_size=CREATE_CHUNK_SIZE)
+
+
+def requeue_stale_claims(now=None):
+    """إرجاع الدفعات المحجوزة من عامل وقع قبل ما يكمل"""
+    now = now or timezone.now()
+    return NotificationQueue.objects.filter(
+        status='processing', updated_at__lt=now - _claim_timeout()
+    ).update(status='pending', claim_token='', updated_at=now)
+
+
+def claim_batch(batch_size=None, now=None, token=None):
+    """
+    حجز دفعة من الإشعارات المستحقة
+    التحديث شرطي على status='pending' فلو عاملين اختاروا نفس الصفوف كل صف بيروح لواحد بس
+    """
+    now = now or timezone.now()
+    token = token or uuid.uuid4().hex
+    candidates = NotificationQueue.objects.filter(
+        Q(scheduled_for__isnull=True) | Q(scheduled_for__lte=now), status='pending'
+    ).order_by('scheduled_for', 'pk').values_list('pk', flat=True)[:batch_size or _batch_size()]
+
+    claimed = NotificationQueue.objects.filter(pk__in=list(candidates), status='pending').update(
+        status='processing', claim_token=token, updated_at=now
+    )
+    if not claimed:
+        return []
+    return list(
+        NotificationQueue.objects.filter(claim_token=token, status='processing')
+        .select_related('notification__recipient')
+        .order_by('pk')
+    )
+
+
+def _still_claimed(entries, token):
+    """أرقام العناصر اللي لسه محجوزة بالرمز ده (مرجعتش للطابور ولا عامل تاني خدها)"""
+    return set(
+        NotificationQueue.objects.filter(
+            pk__in=[entry.pk for entry in entries], claim_token=token, status='processing'
+        ).values_list('pk', flat=True)
+    )
+
+
+def _release_claim(entries, token, now):
+    """
+    تحويل الحجز لرمز تاني في تحديث شرطي واحد، فالعناصر اللي بترجع هي اللي العامل ده
+    لسه صاحبها، ومحدش تاني يقدر يحجزها لحد ما النتايج تتكتب في نفس المعاملة
+    """
+    finished = uuid.uuid4().hex
+    NotificationQueue.objects.filter(
+        pk__in=[entry.pk for entry in entries], claim_token=token, status='processing'
+    ).update(claim_token=finished, updated_at=now)
+    return set(NotificationQueue.objects.filter(claim_token=finished).values_list('pk', flat=True))
+
+
+def _email_allowed(notification, preferences):
+    preference = preferences.get(notification.recipient_id)
+    if preference is None:
+        return True
+    if not preference.email_enabled:
+        return False
+    field = EMAIL_PREFERENCE_FIELDS.get(notification.notification_type)
+    return getattr(preference, field) if field else True
+
+
+def _build_message(notification, connection):
+    return EmailMessage(
+        subject=notification.title,
+        body=notification.message or '',
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[notification.recipient.email],
+        connection=connection,
+    )
+
+
+def _send_emails(entries):
+    """
+    إرسال إيميلات الدفعة على اتصال واحد
+    بيرجع dict: رقم عنصر الطابور -> رسالة الخطأ (أو None لو اتبعت)
+    """
+    results = {}
+    if not entries:
+        return results
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        logger.error(f"فشل الاتصال بخادم البريد: {str(e)}")
+        return {entry.pk: str(e) for entry in entries}
+
+    try:
+        for entry in entries:
+            try:
+                connection.send_messages([_build_message(entry.notification, connection)])
+                results[entry.pk] = None
+            except Exception as e:
+                results[entry.pk] = str(e) or e.__class__.__name__
+                # لو الاتصال نفسه اتقطع نفتح واحد جديد لباقي الدفعة
+                if not _connection_alive(connection):
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        pass
+    finally:
+        connection.close()
+    return results
+
+
+def _connection_alive(connection):
+    try:
+        return connection.connection.noop()[0] == 250
+    except Exception:
+        return False
+
+
+def dispatch_batch(batch_size=None, now=None):
+    """حجز دفعة وإرسالها وتسجيل النتايج، بيرجع عدادات الدفعة"""
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    entries = claim_batch(batch_size=batch_size, now=now, token=token)
+    counts = {'claimed': len(entries), 'sent': 0, 'app_only': 0, 'retried': 0, 'failed': 0, 'lost': 0}
+    if not entries:
+        return counts
+
+    recipient_ids = {entry.notification.recipient_id for entry in entries}
+    preferences = {
+        preference.user_id: preference
+        for preference in NotificationPreference.objects.filter(user_id__in=recipient_ids)
+    }
+
+    email_entries = [
+        entry for entry in entries
+        if entry.notification.recipient.email and _email_allowed(entry.notification, preferences)
+    ]
+    # لو الحجز ضاع قبل الإرسال (الدفعة اتأخرت ورجعت للطابور) منبعتش، صاحب الحجز الجديد هيبعت
+    if email_entries:
+        owned = _still_claimed(email_entries, token)
+        email_entries = [entry for entry in email_entries if entry.pk in owned]
+    results = _send_emails(email_entries)
+
+    finished_at = timezone.now()
+    notifications, email_logs, updated = [], [], []
+    with transaction.atomic():
+        owned = _release_claim(entries, token, finished_at)
+        for entry in entries:
+            if entry.pk not in owned:
+                counts['lost'] += 1
+                continue
+            updated.append(entry)
+            notification = entry.notification
+            entry.attempts += 1
+            entry.claim_token = ''
+            entry.updated_at = finished_at
+
+            if entry.pk not in results:
+                # إشعار داخل النظام بس (مفيش إيميل أو المستخدم قافل الإيميل)
+                error = None
+                counts['app_only'] += 1
+            else:
+                error = results[entry.pk]
+                email_logs.append(EmailLog(
+                    recipient_email=notification.recipient.email,
+                    recipient_name=notification.recipient.get_full_name(),
+                    subject=notification.title,
+                    body=notification.message,
+                    notification=notification,
+                    status='failed' if error else 'sent',
+                    sent_at=None if error else finished_at,
+                    error_message=error or '',
+                ))
+
+            if error is None:
+                if entry.pk in results:
+                    counts['sent'] += 1
+                entry.status = 'completed'
+                entry.processed_at = finished_at
+                entry.last_error = ''
+                notification.status = 'sent'
+                notification.sent_at = finished_at
+                notifications.append(notification)
+            elif entry.attempts < entry.max_attempts:
+                counts['retried'] += 1
+                entry.status = 'pending'
+                entry.scheduled_for = finished_at + _retry_delay()
+                entry.last_error = error
+            else:
+                counts['failed'] += 1
+                entry.status = 'failed'
+                entry.processed_at = finished_at
+                entry.last_error = error
+                notification.status = 'failed'
+                notifications.append(notification)
+
+        if updated:
+            NotificationQueue.objects.bulk_update(updated, QUEUE_UPDATE_FIELDS)
+        if notifications:
+            SystemNotification.objects.bulk_update(notifications, ['status', 'sent_at'])
+        if email_logs:
+            EmailLog.objects.bulk_create(email_logs)
+
+    return counts
+
+
+def dispatch_pending(batch_size=None, max_batches=None, now=None):
+    """
+    تفريغ الطابور دفعة ورا دفعة لحد ما يخلص (أو max_batches)
+    بيرجع إجمالي العدادات والوقت ومعدل الإرسال (إشعار/ثانية)
+    """
+    started = time.perf_counter()
+    totals = {'batches': 0, 'claimed': 0, 'sent': 0, 'app_only': 0, 'retried': 0, 'failed': 0, 'lost': 0}
+    totals['requeued'] = requeue_stale_claims(now=now)
+
+    while max_batches is None or totals['batches'] < max_batches:
+        counts = dispatch_batch(batch_size=batch_size, now=now)
+        if not counts['claimed']:
+            break
+        totals['batches'] += 1
+        for key, value in counts.items():
+            totals[key] += value
+
+    seconds = time.perf_counter() - started
+    totals['seconds'] = round(seconds, 3)
+    totals['per_second'] = round(totals['claimed'] / seconds, 1) if seconds and totals['claimed'] else 0
+    logger.info(
+        f"تم معالجة {totals['claimed']} إشعار في {totals['batches']} دفعة "
+        f"({totals['per_second']} إشعار/ثانية)"
+    )
+    return totals
@@ -1,10 +1,14 @@
 # هنا بنعمل نظام الصلاحيات للـ CMMS عشان نتحكم في مين يقدر يعمل إيه
+from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.models import Group, Permission
 from django.core.exceptions import PermissionDenied
+from django.db.models import Q
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.core.cache import cache
 from functools import wraps
+from core.shared_cache import is_shared_cache
 
 # تعريف الأدوار الأساسية في النظام
 ROLES = {
@@ -50,13 +54,122 @@ ROLES = {
     }
 }
 
+# لقطة أدوار وصلاحيات المستخدم
+# بتتحمل مرة واحدة وبتتعلق على كائن المستخدم طول الطلب، ولو الكاش مشترك بين العمليات بتتخزن فيه
+# بين الطلبات بمفتاح فيه رقم جيل للمستخدم ورقم جيل عام؛ تغيير مجموعات المستخدم بيزود جيله، وتغيير
+# صلاحيات أي مجموعة بيزود الجيل العام (الإشارات في signals.py)
+# الكاش المحلي لكل عملية (الافتراضي) مش بيشوف إبطال العمليات التانية، فمعاه اللقطة للطلب بس
+SNAPSHOT_KEY_PREFIX = 'cmms_permissions'
+SNAPSHOT_ATTR = '_cmms_role_snapshot'
+
+# حد أقصى لعمر اللقطة في الكاش المشترك حتى لو إبطال ما وصلش (تعديل من غير إشارات)
+DEFAULT_SNAPSHOT_TIMEOUT = 300
+
+
+class RoleSnapshot:
+    """
+    أدوار وصلاحيات مستخدم واحد في الذاكرة، كل الأسئلة بتتجاوب من غير استعلامات
+    """
+    __slots__ = ('user_id', 'is_superuser', 'is_active', 'roles', 'permissions')
+
+    def __init__(self, user_id, is_superuser, is_active, roles, permissions):
+        self.user_id = user_id
+        self.is_superuser = is_superuser
+        self.is_active = is_active
+        self.roles = frozenset(roles)
+        self.permissions = frozenset(permissions)
+
+    def has_role(self, role_name):
+        return self.is_superuser or role_name in self.roles
+
+    def has_any_role(self, role_names):
+        return self.is_superuser or not self.roles.isdisjoint(role_names)
+
+    def has_perm(self, perm):
+        # نفس قاعدة ModelBackend: المستخدم الموقوف ملوش صلاحيات
+        if self.is_active and self.is_superuser:
+            return True
+        return self.is_active and perm in self.permissions
+
+
+def _snapshot_timeout():
+    return getattr(settings, 'CMMS_PERMISSION_CACHE_TIMEOUT', DEFAULT_SNAPSHOT_TIMEOUT)
+
+
+def _generation_key(scope):
+    return f'{SNAPSHOT_KEY_PREFIX}:gen:{scope}'
+
+
+def _incr(key):
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def _snapshot_key(user_id):
+    keys = [_generation_key('global'), _generation_key(f'user:{user_id}')]
+    values = cache.get_many(keys)
+    return f'{SNAPSHOT_KEY_PREFIX}:snapshot:{user_id}:{values.get(keys[0], 0)}.{values.get(keys[1], 0)}'
+
+
+def _load_snapshot(user):
+    roles = list(user.groups.values_list('name', flat=True))
+    permissions = [
+        f'{app_label}.{codename}'
+        for app_label, codename in Permission.objects.filter(
+            Q(group__user=user) | Q(user=user)
+        ).values_list('content_type__app_label', 'codename').distinct()
+    ]
+    return RoleSnapshot(user.pk, user.is_superuser, user.is_active, roles, permissions)
+
+
+def get_role_snapshot(user):
+    """
+    لقطة أدوار المستخدم: من كائن المستخدم لو اتحملت في نفس الطلب، وإلا من الكاش المشترك، وإلا من القاعدة
+    """
+    snapshot = getattr(user, SNAPSHOT_ATTR, None)
+    if snapshot is not None:
+        return snapshot
+
+    if not getattr(user, 'is_authenticated', False) or user.pk is None:
+        snapshot = RoleSnapshot(None, False, False, (), ())
+    elif not is_shared_cache():
+        snapshot = _load_snapshot(user)
+    else:
+        key = _snapshot_key(user.pk)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = _load_snapshot(user)
+            cache.set(key, snapshot, timeout=_snapshot_timeout())
+
+    setattr(user, SNAPSHOT_ATTR, snapshot)
+    return snapshot
+
+
+def invalidate_user_roles(user_ids):
+    """
+    إبطال لقطات مستخدمين معينين (إضافة أو إزالة مجموعات أو صلاحيات مباشرة)
+    """
+    for user_id in user_ids:
+        _incr(_generation_key(f'user:{user_id}'))
+
+
+def invalidate_all_roles():
+    """
+    إبطال كل اللقطات (تغيير صلاحيات مجموعة أو حذفها أو تغيير اسمها)
+    """
+    _incr(_generation_key('global'))
+
+
 def has_role(user, role_name):
     """
     التحقق من أن المستخدم له دور معين
     """
     if user.is_superuser:
         return True
-    return user.groups.filter(name=role_name).exists()
+    return get_role_snapshot(user).has_role(role_name)
 
 def has_any_role(user, role_names):
     """
@@ -64,7 +177,7 @@ def has_any_role(user, role_names):
     """
     if user.is_superuser:
         return True
-    return user.groups.filter(name__in=role_names).exists()
+    return get_role_snapshot(user).has_any_role(role_names)
 
 def has_permission(user, permission_name):
     """
@@ -72,7 +185,7 @@ def has_permission(user, permission_name):
     """
     if user.is_superuser:
         return True
-    return user.has_perm(f'maintenance.{permission_name}')
+    return get_role_snapshot(user).has_perm(f'maintenance.{permission_name}')
 
 def can_view_device(user, device=None):
     """
@@ -126,8 +239,9 @@ def can_view_work_order(user, work_order=None):
     
     # إذا كان المستخدم هو الفني المعين أو طالب الخدمة
     if work_order:
-        if (work_order.assigned_technician == user or 
-            work_order.service_request.requested_by == user):
+        if work_order.assignee_id == user.pk:
+            return True
+        if work_order.service_request_id and work_order.service_request.reporter_id == user.pk:
             return True
     
     # المديرين والمشرفين يمكنهم عرض جميع أوامر الشغل
@@ -141,7 +255,7 @@ def can_edit_work_order(user, work_order=None):
         return True
     
     # إذا كان المستخدم هو الفني المعين
-    if work_order and work_order.assigned_technician == user:
+    if work_order and work_order.assignee_id == user.pk:
         return True
     
     # المديرين والمشرفين يمكنهم تعديل جميع أوامر الشغل
@@ -346,7 +460,7 @@ def get_user_roles(user):
     if user.is_superuser:
         return ['SuperUser']
     
-    return list(user.groups.values_list('name', flat=True))
+    return sorted(get_role_snapshot(user).roles)
 
 def get_role_permissions(role_name):
     """
@@ -363,12 +477,21 @@ class PermissionChecker:
     """
     def __init__(self, user):
         self.user = user
+        # اللقطة بتتحمل مرة واحدة وكل الدوال تحت بتقرا منها
+        self.snapshot = get_role_snapshot(user)
+    
+    @property
+    def user_roles(self):
+        return sorted(self.snapshot.roles)
     
     def has_role(self, role_name):
-        return has_role(self.user, role_name)
+        return self.snapshot.has_role(role_name)
     
     def has_any_role(self, role_names):
-        return has_any_role(self.user, role_names)
+        return self.snapshot.has_any_role(role_names)
+    
+    def has_permission(self, permission_name):
+        return self.snapshot.has_perm(f'maintenance.{permission_name}')
     
     def can_view_device(self, device=None):
         return can_view_device(self.user, device)
@@ -0,0 +1,205 @@
+# تقويم توقعات الصيانة الوقائية
+# كل جدول نشط بيتفرد لمواعيده الجاية لحد أفق التوقع في PMForecastOccurrence، والتحديث تدريجي:
+# لما جدول يتغير بنحسب مواعيده في الذاكرة ونقارنها بالصفوف الموجودة ونكتب الفرق بس.
+# أسئلة الأقسام والفنيين والأسابيع بتبقى استعلامات تجميع على الجدول ده بدل لف على الجداول
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import PMForecastOccurrence, PreventiveMaintenanceSchedule
+from .scheduler_config import get_config
+
+BATCH_SIZE = 500
+
+# حماية من تكرار غلط (تكرار يومي على أفق طويل جداً مثلاً)
+MAX_OCCURRENCES_PER_SCHEDULE = 400
+
+DEFAULT_ESTIMATED_HOURS = 2
+
+OCCURRENCE_FIELDS = ['device_id', 'department_id', 'assignee_id', 'week_start', 'estimated_hours']
+
+
+def _horizon_days():
+    return get_config('pm_forecast.horizon_days', 90)
+
+
+def _chunk_size():
+    return get_config('pm_forecast.chunk_size', 500)
+
+
+def week_start(day):
+    """الاثنين اللي بيبدأ بيه أسبوع اليوم"""
+    return day - timedelta(days=day.weekday())
+
+
+def expand_schedule(schedule, horizon_end):
+    """
+    مواعيد الجدول من next_due_date لحد horizon_end (أو end_date لو أقرب)
+    نفس خطوات next_due_after اللي بيستخدمها توليد أوامر الشغل، فالتوقع بيطابق اللي هيحصل فعلاً
+    """
+    if not schedule.is_active or schedule.next_due_date is None:
+        return []
+    last = horizon_end
+    if schedule.end_date and schedule.end_date < last:
+        last = schedule.end_date
+
+    dates = []
+    current = schedule.next_due_date
+    while current is not None and current <= last and len(dates) < MAX_OCCURRENCES_PER_SCHEDULE:
+        dates.append(current)
+        following = schedule.next_due_after(current)
+        if following is None or following <= current:
+            break
+        current = following
+    return dates
+
+
+def _desired_rows(schedule, horizon_end):
+    values = {
+        'device_id': schedule.device_id,
+        'department_id': schedule.device.department_id,
+        'assignee_id': schedule.assigned_to_id,
+        'estimated_hours': schedule.job_plan.estimated_hours or DEFAULT_ESTIMATED_HOURS,
+    }
+    return {
+        due_date: dict(values, week_start=week_start(due_date))
+        for due_date in expand_schedule(schedule, horizon_end)
+    }
+
+
+def _sync_chunk(schedules, schedule_ids, horizon_end, dry_run):
+    result = {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+
+    existing = {}
+    for occurrence in PMForecastOccurrence.objects.filter(schedule_id__in=schedule_ids).only(
+        'id', 'schedule_id', 'due_date', *OCCURRENCE_FIELDS
+    ):
+        existing[(occurrence.schedule_id, occurrence.due_date)] = occurrence
+
+    to_create, to_update = [], []
+    for schedule in schedules:
+        for due_date, values in _desired_rows(schedule, horizon_end).items():
+            occurrence = existing.pop((schedule.pk, due_date), None)
+            if occurrence is None:
+                to_create.append(PMForecastOccurrence(schedule_id=schedule.pk, due_date=due_date, **values))
+                continue
+            changed = False
+            for field, value in values.items():
+                if getattr(occurrence, field) != value:
+                    setattr(occurrence, field, value)
+                    changed = True
+            if changed:
+                to_update.append(occurrence)
+            else:
+                result['unchanged'] += 1
+
+    # اللي فاضل في existing مبقاش من مواعيد الجدول (اتنفذ، أو التكرار اتغير، أو الجدول اتوقف)
+    to_delete = [occurrence.pk for occurrence in existing.values()]
+    result.update(created=len(to_create), updated=len(to_update), deleted=len(to_delete))
+    if dry_run or not (to_create or to_update or to_delete):
+        return result
+
+    with transaction.atomic():
+        for start in range(0, len(to_delete), BATCH_SIZE):
+            PMForecastOccurrence.objects.filter(pk__in=to_delete[start:start + BATCH_SIZE]).delete()
+        if to_create:
+            PMForecastOccurrence.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        if to_update:
+            PMForecastOccurrence.objects.bulk_update(to_update, OCCURRENCE_FIELDS, batch_size=BATCH_SIZE)
+    return result
+
+
+def _schedule_chunks(schedules, chunk_size):
+    """
+    دفعات الجداول: الكائنات اللي جاية جاهزة (من الحفظ أو من توليد أوامر الشغل) بتتستخدم زي ما هي،
+    والأرقام أو "كل الجداول" بتتقرا بالترتيب على دفعات
+    """
+    if schedules is not None:
+        schedules = list(schedules)
+        instances = [schedule for schedule in schedules if isinstance(schedule, PreventiveMaintenanceSchedule)]
+        for start in range(0, len(instances), chunk_size):
+            yield instances[start:start + chunk_size]
+        ids = [schedule for schedule in schedules if not isinstance(schedule, PreventiveMaintenanceSchedule)]
+        if not ids:
+            return
+
+    queryset = PreventiveMaintenanceSchedule.objects.select_related('device', 'job_plan').order_by('pk')
+    if schedules is not None:
+        queryset = queryset.filter(pk__in=ids)
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        yield chunk
+
+
+def sync_forecast(schedules=None, today=None, horizon_days=None, dry_run=False):
+    """
+    مزامنة تقويم التوقعات مع الجداول
+
+    schedules: جداول بعينها (كائنات أو أرقام) للتحديث التدريجي، والافتراضي كل الجداول
+    horizon_days: طول الأفق من النهارده (الافتراضي pm_forecast.horizon_days)
+    dry_run: حساب الفرق بس من غير كتابة
+
+    بترجع عدد الصفوف: created / updated / deleted / unchanged
+    """
+    today = today or timezone.localdate()
+    horizon_end = today + timedelta(days=horizon_days or _horizon_days())
+
+    totals = {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    for chunk in _schedule_chunks(schedules, _chunk_size()):
+        result = _sync_chunk(chunk, [schedule.pk for schedule in chunk], horizon_end, dry_run)
+        for key, value in result.items():
+            totals[key] += value
+
+    if schedules is None and not dry_run:
+        # صفوف لجداول اتمسحت من غير post_delete (مثلاً raw SQL) مبتتشافش في اللفة فوق
+        totals['deleted'] += PMForecastOccurrence.objects.exclude(
+            schedule_id__in=PreventiveMaintenanceSchedule.objects.values('pk')
+        ).delete()[0]
+    return totals
+
+
+# ────────────────────────────  الاستعلامات  ────────────────────────────
+
+def forecast(start=None, end=None, department=None, assignee=None, hospital=None):
+    """المواعيد المتوقعة في فترة، مع فلترة اختيارية بالقسم أو الفني أو المستشفى"""
+    queryset = PMForecastOccurrence.objects.all()
+    if hospital:
+        queryset = queryset.filter(device__department__hospital_id=getattr(hospital, 'pk', hospital))
+    if start:
+        queryset = queryset.filter(due_date__gte=start)
+    if end:
+        queryset = queryset.filter(due_date__lte=end)
+    if department:
+        queryset = queryset.filter(department_id=getattr(department, 'pk', department))
+    if assignee:
+        queryset = queryset.filter(assignee_id=getattr(assignee, 'pk', assignee))
+    return queryset
+
+
+def due_by_department(start=None, end=None, hospital=None):
+    """عدد المواعيد والساعات لكل قسم في الفترة"""
+    return forecast(start, end, hospital=hospital).values('department_id', 'department__name').annotate(
+        occurrences=Count('id'), hours=Sum('estimated_hours'),
+    ).order_by('department__name')
+
+
+def due_by_week(start=None, end=None, department=None, assignee=None, hospital=None):
+    """عدد المواعيد والساعات لكل أسبوع في الفترة"""
+    return forecast(start, end, department, assignee, hospital).values('week_start').annotate(
+        occurrences=Count('id'), hours=Sum('estimated_hours'),
+    ).order_by('week_start')
+
+
+def workload_histogram(start=None, end=None, department=None, assignee=None, hospital=None):
+    """حمل كل فني في كل أسبوع: صف لكل (فني، أسبوع) فيه عدد المواعيد والساعات"""
+    return forecast(start, end, department, assignee, hospital).values(
+        'assignee_id', 'assignee__username', 'week_start',
+    ).annotate(
+        occurrences=Count('id'), hours=Sum('estimated_hours'),
+    ).order_by('assignee__username', 'week_start')
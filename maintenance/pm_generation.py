@@ -0,0 +1,296 @@
+# توليد أوامر الصيانة الوقائية المستحقة على دفعات
+# بدل ما كل جدول يعمل is_due() و generate_work_order() لوحده (كذا استعلام لكل جدول):
+# بنجيب الجداول المستحقة وأوامر الشغل والبلاغات المفتوحة في استعلامات ثابتة، ونحسب المواعيد
+# في الذاكرة، وبعدين bulk_create للبلاغات وأوامر الشغل بأرقام محجوزة مسبقاً، جوه transaction
+# لكل دفعة، ونبعت إشعار ملخص واحد لكل فني بدل إشعار لكل أمر
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import PreventiveMaintenanceSchedule, ServiceRequest, SystemNotification, WorkOrder
+from .scheduler_config import get_config
+from .sla_resolver import resolver
+
+logger = logging.getLogger(__name__)
+
+OPEN_WO_STATUSES = ['new', 'assigned', 'in_progress', 'wait_parts', 'on_hold']
+COMPLETED_WO_STATUSES = ['resolved', 'qa_verified', 'closed']
+OPEN_SR_STATUSES = ['new', 'assigned', 'in_progress']
+
+# نفس قيم generate_work_order: البلاغ بأولوية عاجلة، وموعد الانتهاء من خلية "خطورة عالية/تأثير كبير"
+PM_PRIORITY = 'urgent'
+PM_SEVERITY = 'medium'
+PM_IMPACT = 'moderate'
+PM_SCHEDULE_SEVERITY = 'high'
+PM_SCHEDULE_IMPACT = 'significant'
+DEFAULT_ESTIMATED_HOURS = 2
+
+
+def _chunk_size():
+    return get_config('pm_generation.chunk_size', 200)
+
+
+def _digest_limit():
+    return get_config('pm_generation.digest_max_items', 20)
+
+
+def due_schedules(today=None):
+    """الجداول النشطة اللي ميعادها النهارده أو قبله، مع كل اللي محتاجينه في نفس الاستعلام"""
+    today = today or timezone.localdate()
+    return PreventiveMaintenanceSchedule.objects.filter(
+        is_active=True, next_due_date__lte=today,
+    ).select_related(
+        'device', 'device__category', 'job_plan', 'assigned_to', 'created_by',
+    ).order_by('pk')
+
+
+def _blocked_schedule_ids(schedule_ids, today):
+    """الجداول اللي ليها أمر شغل مفتوح أو أمر اتقفل النهارده (نفس شروط is_due)"""
+    return set(
+        WorkOrder.objects.filter(pm_schedule_id__in=schedule_ids, status__in=OPEN_WO_STATUSES)
+        .values_list('pm_schedule_id', flat=True)
+    ) | set(
+        WorkOrder.objects.filter(
+            pm_schedule_id__in=schedule_ids, status__in=COMPLETED_WO_STATUSES, completed_at__date=today,
+        ).values_list('pm_schedule_id', flat=True)
+    )
+
+
+def _devices_with_open_requests(device_ids):
+    """الأجهزة اللي عليها بلاغ صيانة وقائية مفتوح"""
+    return set(
+        ServiceRequest.objects.filter(
+            device_id__in=device_ids, request_type='preventive', status__in=OPEN_SR_STATUSES,
+        ).values_list('device_id', flat=True)
+    )
+
+
+def select_due(schedules, today):
+    """
+    تقسيم الجداول المستحقة لـ (اللي هيتولد لها أمر، اللي اتجاهلت)
+    استعلامين بس مهما كان عدد الجداول، والجهاز الواحد مياخدش أكتر من أمر في نفس التشغيل
+    """
+    schedules = list(schedules)
+    if not schedules:
+        return [], []
+    blocked = _blocked_schedule_ids([s.pk for s in schedules], today)
+    busy_devices = _devices_with_open_requests({s.device_id for s in schedules})
+
+    selected, skipped = [], []
+    for schedule in schedules:
+        if schedule.pk in blocked or schedule.device_id in busy_devices or schedule.created_by_id is None:
+            skipped.append(schedule)
+            continue
+        busy_devices.add(schedule.device_id)
+        selected.append(schedule)
+    return selected, skipped
+
+
+def advance_due_date(schedule, today):
+    """أول ميعاد بعد النهارده حسب التكرار (أو نفس الميعاد لو التكرار بالاستخدام)"""
+    next_due = schedule.next_due_date
+    while next_due is not None and next_due <= today:
+        following = schedule.next_due_after(next_due)
+        if following is None or following <= next_due:
+            return schedule.next_due_date
+        next_due = following
+    return next_due
+
+
+class WorkOrderNumbers:
+    """
+    أرقام أوامر الشغل بنفس صيغة WorkOrder.save (WO-YYYYMM-NNNN)
+    آخر رقم في الشهر بيتقرا مرة واحدة وبعدين بنكمل العد في الذاكرة
+    """
+
+    def __init__(self, now=None):
+        now = timezone.localtime(now) if now else datetime.now()
+        self.prefix = f"WO-{now.year}{now.month:02d}-"
+        self._last = None
+
+    def _load(self):
+        last = 0
+        for number in WorkOrder.objects.filter(wo_number__startswith=self.prefix).values_list('wo_number', flat=True):
+            try:
+                last = max(last, int(number[len(self.prefix):]))
+            except ValueError:
+                continue
+        return last
+
+    def reset(self):
+        self._last = None
+
+    def take(self, count):
+        if self._last is None:
+            self._last = self._load()
+        numbers = [f"{self.prefix}{n:04d}" for n in range(self._last + 1, self._last + count + 1)]
+        self._last += count
+        return numbers
+
+
+def _build_rows(schedule, wo_number, now):
+    category_id = schedule.device.category_id
+    response_hours, resolution_hours, _ = resolver.resolve_times(category_id, PM_SEVERITY, PM_IMPACT, PM_PRIORITY)
+    service_request = ServiceRequest(
+        device=schedule.device,
+        reporter=schedule.created_by,
+        title=f"صيانة وقائية - {schedule.name}",
+        description=f"صيانة وقائية مجدولة للجهاز: {schedule.device.name}",
+        request_type='preventive',
+        priority=PM_PRIORITY,
+        status='assigned',
+        assigned_to=schedule.assigned_to,
+        # bulk_create مش بيعدي على save() فبنحسب SLA هنا
+        response_due=now + timedelta(hours=response_hours),
+        resolution_due=now + timedelta(hours=resolution_hours),
+        estimated_hours=resolution_hours,
+    )
+
+    match = resolver.lookup(category_id, PM_SCHEDULE_SEVERITY, PM_SCHEDULE_IMPACT, PM_PRIORITY)
+    if match is not None:
+        scheduled_end = now + timedelta(hours=match.resolution_time_hours)
+    else:
+        scheduled_end = timezone.make_aware(datetime.combine(schedule.next_due_date, datetime.min.time()))
+
+    work_order = WorkOrder(
+        wo_number=wo_number,
+        title=f"صيانة وقائية - {schedule.name}",
+        description=f"صيانة وقائية مجدولة للجهاز: {schedule.device.name}\nخطة العمل: {schedule.job_plan.name}",
+        priority=PM_PRIORITY,
+        wo_type='preventive',
+        assignee=schedule.assigned_to,
+        created_by=schedule.created_by,
+        pm_schedule=schedule,
+        scheduled_start=now,
+        scheduled_end=scheduled_end,
+        estimated_hours=schedule.job_plan.estimated_hours or DEFAULT_ESTIMATED_HOURS,
+    )
+    return service_request, work_order
+
+
+def _write_chunk(schedules, numbers, today):
+    """كتابة دفعة واحدة: بلاغات، أوامر شغل، ومواعيد الجداول الجديدة"""
+    now = timezone.now()
+    wo_numbers = numbers.take(len(schedules))
+    rows = [_build_rows(schedule, wo_number, now) for schedule, wo_number in zip(schedules, wo_numbers)]
+
+    for schedule in schedules:
+        schedule.next_due_date = advance_due_date(schedule, today)
+        schedule.updated_at = now
+
+    with transaction.atomic():
+        requests = ServiceRequest.objects.bulk_create([service_request for service_request, _ in rows])
+        work_orders = []
+        for service_request, work_order in rows:
+            work_order.service_request = service_request
+            work_orders.append(work_order)
+        WorkOrder.objects.bulk_create(work_orders)
+        PreventiveMaintenanceSchedule.objects.bulk_update(schedules, ['next_due_date', 'updated_at'])
+    return requests, work_orders
+
+
+def _after_write(requests, work_orders, schedules):
+    # bulk_create و bulk_update مش بيبعتوا post_save: فهرس البحث وكاش لوحة التحكم
+    # وتقويم التوقعات وتوقف الأجهزة بنحدثهم هنا مرة للدفعة
+    from .dashboard_cache import invalidate_department
+    from .downtime_tracker import record_bulk_open
+    from .pm_forecast import sync_forecast
+    from .search_index import index_objects
+
+    index_objects(ServiceRequest, [service_request.pk for service_request in requests])
+    sync_forecast(schedules)
+    record_bulk_open(work_orders)
+    for department_id in {service_request.device.department_id for service_request in requests}:
+        invalidate_department(department_id)
+
+
+def build_digests(work_orders):
+    """إشعار واحد لكل فني فيه ملخص أوامر الصيانة الوقائية الجديدة بتاعته"""
+    by_recipient = OrderedDict()
+    for work_order in work_orders:
+        recipient = work_order.assignee or work_order.created_by
+        by_recipient.setdefault(recipient.pk, (recipient, []))[1].append(work_order)
+
+    limit = _digest_limit()
+    notifications = []
+    for recipient, items in by_recipient.values():
+        lines = [f"- {wo.wo_number}: {wo.pm_schedule.device.name}" for wo in items[:limit]]
+        if len(items) > limit:
+            lines.append(f"... و {len(items) - limit} أمر تاني")
+        notifications.append(SystemNotification(
+            recipient=recipient,
+            notification_type='preventive_maintenance',
+            title=f"{len(items)} أمر صيانة وقائية جديد",
+            message="\n".join(lines),
+            # لو أمر واحد بس نربطه بالإشعار عشان الرابط يفتحه مباشرة
+            work_order=items[0] if len(items) == 1 else None,
+            pm_schedule=items[0].pm_schedule if len(items) == 1 else None,
+        ))
+    return notifications
+
+
+def generate_due_pm_work_orders(today=None, schedules=None, chunk_size=None, dry_run=False, notify=True):
+    """
+    توليد أوامر الصيانة الوقائية لكل الجداول المستحقة
+
+    schedules: queryset بديل للجداول المستحقة (الافتراضي due_schedules)
+    chunk_size: عدد الجداول في كل transaction (الافتراضي pm_generation.chunk_size)
+    dry_run: تحديد الجداول اللي هيتولد لها أوامر من غير كتابة
+
+    بترجع dict فيه due / created / skipped / failed / notifications / seconds / work_orders
+    """
+    started = time.monotonic()
+    today = today or timezone.localdate()
+    chunk_size = chunk_size or _chunk_size()
+    if schedules is None:
+        schedules = due_schedules(today)
+
+    selected, skipped = select_due(schedules, today)
+    result = {
+        'due': len(selected) + len(skipped),
+        'created': 0,
+        'skipped': len(skipped),
+        'failed': 0,
+        'notifications': 0,
+        'work_orders': [],
+        'selected': selected,
+    }
+    if dry_run or not selected:
+        result['seconds'] = time.monotonic() - started
+        return result
+
+    numbers = WorkOrderNumbers()
+    for start in range(0, len(selected), chunk_size):
+        chunk = selected[start:start + chunk_size]
+        try:
+            try:
+                requests, work_orders = _write_chunk(chunk, numbers, today)
+            except IntegrityError:
+                # حد تاني أخد رقم أمر شغل في نفس اللحظة: نقرا آخر رقم تاني ونجرب مرة كمان
+                numbers.reset()
+                requests, work_orders = _write_chunk(chunk, numbers, today)
+        except Exception as e:
+            logger.error(f"خطأ في توليد دفعة صيانة وقائية ({len(chunk)} جدول): {str(e)}")
+            for schedule in chunk:
+                schedule.refresh_from_db(fields=['next_due_date'])
+            result['failed'] += len(chunk)
+            continue
+        _after_write(requests, work_orders, chunk)
+        result['created'] += len(work_orders)
+        result['work_orders'].extend(work_orders)
+
+    if notify and result['work_orders']:
+        from .notification_dispatch import enqueue_notifications
+
+        result['notifications'] = len(enqueue_notifications(build_digests(result['work_orders'])))
+
+    result['seconds'] = time.monotonic() - started
+    logger.info(
+        f"الصيانة الوقائية: {result['created']} أمر جديد من {result['due']} جدول مستحق "
+        f"({result['skipped']} اتجاهل) في {result['seconds']:.2f} ثانية"
+    )
+    return result
@@ -0,0 +1,181 @@
+# مطابقة تسلسل المسح مع تعريفات العمليات من شجرة في الذاكرة
+# بدل ما كل مسحة تحمل كل OperationDefinition النشطة وتسأل عن خطوات كل واحدة وتفك JSON
+# القواعد في كل مرة: التعريفات النشطة بتتجمع مرة واحدة في شجرة بادئات (trie) مفتاحها نوع
+# الكيان في كل خطوة مطلوبة، وقواعد التحقق والمعرفات المسموحة بتتفك مرة واحدة لدوال جاهزة.
+# الإصدار بصمة من قاعدة البيانات للتعريفات والخطوات (maintenance.fingerprint_cache) فكل عملية
+# بتلاحظ التعديل خلال فترة الفحص حتى لو الكاش محلي، والعملية اللي عدلت بتعيد البناء بعد الـ commit
+import json
+
+from .fingerprint_cache import FingerprintedCache
+
+
+def _parse(value):
+    """قيمة JSONField أو نص JSON قديم"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def compile_validator(validation_rule, allowed_entity_ids):
+    """
+    دالة (entity) -> bool للخطوة، أو None لو مفيش قيود
+    نفس منطق _validate_entity القديم: dict يعني كل الحقول لازم تساوي القيم في بيانات الكيان،
+    ونص عادي يعني لازم يكون موجود في نص البيانات
+    """
+    checks = []
+
+    rule = _parse(validation_rule) if validation_rule else None
+    if isinstance(rule, dict):
+        if rule:
+            expected = tuple(rule.items())
+
+            def matches_fields(entity):
+                data = entity.get('data') or {}
+                return all(key in data and data[key] == value for key, value in expected)
+            checks.append(matches_fields)
+    elif validation_rule:
+        # نص عادي، أو JSON مش dict (رقم أو ليستة زي '123') كان بيقع في فحص النص برضه
+        if isinstance(rule, str):
+            text = rule
+        elif isinstance(validation_rule, str):
+            text = validation_rule
+        else:
+            text = json.dumps(validation_rule)
+
+        def contains_text(entity):
+            return text in str(entity.get('data', {}))
+        checks.append(contains_text)
+
+    allowed = _parse(allowed_entity_ids) if allowed_entity_ids else None
+    if allowed:
+        allowed = frozenset(str(value) for value in (allowed if isinstance(allowed, (list, tuple)) else [allowed]))
+
+        def allowed_id(entity):
+            return str(entity.get('id')) in allowed
+        checks.append(allowed_id)
+
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    return lambda entity: all(check(entity) for check in checks)
+
+
+class _Node:
+    __slots__ = ('children', 'operations')
+
+    def __init__(self):
+        self.children = {}
+        # [(operation_id, validators)] بترتيب الـ id (أول تعريف يتطابق هو اللي بيكسب زي زمان)
+        self.operations = []
+
+
+class OperationMatcher(FingerprintedCache):
+    """
+    شجرة العمليات النشطة في الذاكرة
+    كل مسحة خطوة واحدة في الشجرة (dict lookup)، والتحقق بيحصل بس على العمليات اللي
+    تسلسل أنواعها طابق بالظبط
+    """
+
+    models = ('maintenance.OperationDefinition', 'maintenance.OperationStep')
+    check_interval_setting = 'CMMS_QR_OPERATIONS_CHECK_INTERVAL'
+
+    def _build(self):
+        from .models import OperationDefinition, OperationStep
+
+        # الترتيب بالـ id عشان DEVICE_USAGE تيجي قبل END_DEVICE_USAGE (نفس الترتيب القديم)
+        operations = OperationDefinition.objects.filter(is_active=True).in_bulk()
+        steps = {}
+        for step in OperationStep.objects.filter(
+            operation__is_active=True, is_required=True,
+        ).order_by('operation_id', 'order').only(
+            'operation_id', 'entity_type', 'validation_rule', 'allowed_entity_ids',
+        ):
+            steps.setdefault(step.operation_id, []).append(step)
+
+        root = _Node()
+        for operation_id in sorted(operations):
+            # عملية من غير خطوات مطلوبة عمرها ما كانت بتتطابق (التسلسل الفاضي مش بيتفحص)
+            required = steps.get(operation_id)
+            if not required:
+                continue
+            node = root
+            for step in required:
+                node = node.children.setdefault(step.entity_type, _Node())
+            validators = tuple(compile_validator(s.validation_rule, s.allowed_entity_ids) for s in required)
+            node.operations.append((operation_id, validators))
+        return root, operations
+
+    def _tree(self):
+        return self.section('tree', self._build)
+
+    # ────────────────────────────  الأسئلة  ────────────────────────────
+
+    def walk(self, entity_types, node=None):
+        """العقدة بعد تسلسل الأنواع (أو بعد عقدة سابقة لمسحة جديدة)، أو None لو مفيش عملية بتبدأ كده"""
+        if node is None:
+            node = self._tree()[0]
+        for entity_type in entity_types:
+            node = node.children.get(entity_type)
+            if node is None:
+                return None
+        return node
+
+    def match(self, scanned_entities):
+        """أول OperationDefinition نشطة تسلسلها وقواعدها بيطابقوا الكيانات، أو None"""
+        if not scanned_entities:
+            return None
+        root, operations = self._tree()
+        node = self.walk([entity['type'] for entity in scanned_entities], root)
+        if node is None:
+            return None
+        for operation_id, validators in node.operations:
+            if all(
+                validator is None or validator(entity)
+                for validator, entity in zip(validators, scanned_entities)
+            ):
+                return operations[operation_id]
+        return None
+
+    def next_entity_types(self, entity_types):
+        """
+        أنواع الكيانات اللي ممكن تيجي بعد التسلسل ده في عملية واحدة على الأقل
+        {entity_type: [أكواد العمليات اللي لسه ممكنة عن طريقه]}
+        """
+        root, operations = self._tree()
+        node = self.walk(entity_types, root)
+        if node is None:
+            return {}
+        result = {}
+        for entity_type, child in node.children.items():
+            codes = []
+            stack = [child]
+            while stack:
+                current = stack.pop()
+                codes.extend(operations[operation_id].code for operation_id, _ in current.operations)
+                stack.extend(current.children.values())
+            result[entity_type] = sorted(set(codes))
+        return result
+
+    def stats(self):
+        tree = self.cached('tree')
+        return {
+            'version': self._version,
+            'loads': self.loads,
+            'operations': len(tree[1]) if tree is not None else None,
+        }
+
+
+matcher = OperationMatcher()
+
+
+def invalidate():
+    """
+    أي تعديل في تعريف عملية أو خطوة: العملية دي بتعيد البناء فوراً
+    والعمليات التانية بتلاحظ البصمة الجديدة خلال CMMS_QR_OPERATIONS_CHECK_INTERVAL
+    بيتنادى بعد الـ commit عشان البناء الجاي يشوف التعديل
+    """
+    matcher.clear()
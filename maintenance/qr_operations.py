@@ -55,110 +55,19 @@ class QROperationsManager:
         return timezone.now() > last_activity + timeout_delta
     
     def get_scanned_entities(self, session: 'ScanSession') -> List[Dict]:
-        """Get all scanned entities in current session"""
-        scans = self.ScanHistory.objects.filter(
-            session=session,
-            is_valid=True
-        ).order_by('scanned_at')
-        
-        entities = []
-        for scan in scans:
-            # entity_data might already be a dict or a string
-            if scan.entity_data:
-                if isinstance(scan.entity_data, dict):
-                    data = scan.entity_data
-                else:
-                    data = json.loads(scan.entity_data)
-            else:
-                data = {}
-                
-            entities.append({
-                'type': scan.entity_type,
-                'id': scan.entity_id,
-                'data': data,
-                'scanned_at': scan.scanned_at.isoformat() if scan.scanned_at else None
-            })
-        return entities
+        """Get all scanned entities in current session (cached session state, see scan_session_state)"""
+        from . import scan_session_state
+        return scan_session_state.load(session).entities
     
     def match_operation(self, scanned_entities: List[Dict]) -> Optional['OperationDefinition']:
-        """Match scanned sequence to an operation definition"""
-        print(f"[DEBUG match_operation] Checking {len(scanned_entities)} entities")
-        print(f"[DEBUG match_operation] Entity types: {[e['type'] for e in scanned_entities]}")
-        
-        if not scanned_entities:
-            return None
-        
-        # Get active operations - ORDER BY ID to ensure DEVICE_USAGE comes before END_DEVICE_USAGE
-        active_operations = self.OperationDefinition.objects.filter(is_active=True).order_by('id')
-        print(f"[DEBUG match_operation] Found {active_operations.count()} active operations")
-        
-        for operation in active_operations:
-            steps = operation.steps.order_by('order')
-            print(f"[DEBUG match_operation] Checking {operation.code} with {steps.count()} steps")
-            if self._sequence_matches_steps(scanned_entities, steps):
-                print(f"[DEBUG match_operation] MATCHED: {operation.code}")
-                return operation
-        
-        print("[DEBUG match_operation] No operation matched")
-        return None
-    
-    def _sequence_matches_steps(self, entities: List[Dict], steps) -> bool:
-        """Check if scanned entities match operation steps"""
-        required_steps = [s for s in steps if s.is_required]
-        print(f"[DEBUG _sequence_matches_steps] Required steps: {len(required_steps)}")
-        print(f"[DEBUG _sequence_matches_steps] Step types: {[s.entity_type for s in required_steps]}")
-        print(f"[DEBUG _sequence_matches_steps] Entity types: {[e['type'] for e in entities]}")
-        
-        # EXACT MATCH: Must have exactly the same number of entities as required steps
-        if len(entities) != len(required_steps):
-            print(f"[DEBUG] Entity count mismatch: {len(entities)} != {len(required_steps)}")
-            return False
-        
-        # Check each required step
-        for i, step in enumerate(required_steps):
-            if i >= len(entities):
-                print(f"[DEBUG] Step {i} - no entity at this position")
-                return False
-                
-            entity = entities[i]
-            
-            # Check entity type
-            if entity['type'] != step.entity_type:
-                print(f"[DEBUG] Step {i} - type mismatch: {entity['type']} != {step.entity_type}")
-                return False
-            
-            # Check validation rule if exists
-            if step.validation_rule:
-                if not self._validate_entity(entity, step.validation_rule):
-                    print(f"[DEBUG] Step {i} - validation rule failed")
-                    return False
-            
-            # Check allowed entity IDs if specified
-            if step.allowed_entity_ids:
-                allowed_ids = json.loads(step.allowed_entity_ids)
-                if str(entity['id']) not in allowed_ids:
-                    print(f"[DEBUG] Step {i} - entity ID not in allowed list")
-                    return False
-        
-        print(f"[DEBUG] All steps matched exactly!")
-        return True
-    
-    def _validate_entity(self, entity: Dict, rule: str) -> bool:
-        """Validate entity against custom rule"""
-        try:
-            # Parse rule as JSON for complex validations
-            rule_dict = json.loads(rule)
-            
-            # Example: {"status": "available", "department": "ICU"}
-            for key, expected_value in rule_dict.items():
-                if key not in entity.get('data', {}):
-                    return False
-                if entity['data'][key] != expected_value:
-                    return False
-            return True
-        except:
-            # If not JSON, treat as simple field check
-            return rule in str(entity.get('data', {}))
+        """Match scanned sequence to an operation definition (compiled trie, see qr_operation_matcher)"""
+        from .qr_operation_matcher import matcher
+        return matcher.match(scanned_entities)
+    
+    def next_entity_types(self, scanned_entities: List[Dict]) -> Dict[str, List[str]]:
+        """Entity types that can follow the scanned sequence, with the operation codes still reachable"""
+        from .qr_operation_matcher import matcher
+        return matcher.next_entity_types([e['type'] for e in scanned_entities])
     
     def execute_operation(
         self,
@@ -0,0 +1,176 @@
+"""
+QR token resolution
+Maps printed `entity_type:hash` labels back to primary keys through the
+indexed QRTokenIndex table instead of re-hashing every row on each scan.
+"""
+
+import hashlib
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+
+
+# Entity types whose labels use the `entity_type:sha256(type_pk_SECRET)[:12]` format
+HASH_ENTITY_MODELS = {
+    'device': ('maintenance', 'Device'),
+    'patient': ('manager', 'Patient'),
+    'bed': ('manager', 'Bed'),
+    'room': ('manager', 'Room'),
+    'user': ('hr', 'CustomUser'),
+    'accessory': ('maintenance', 'DeviceAccessory'),
+    'department': ('manager', 'Department'),
+    'doctor': ('manager', 'Doctor'),
+}
+
+ENTITY_TYPE_ALIASES = {
+    'customuser': 'user',
+    'deviceaccessory': 'accessory',
+}
+
+# Order used when a bare hash (no type prefix) is scanned
+BARE_HASH_SEARCH_ORDER = ['device', 'patient', 'user', 'bed', 'accessory', 'room', 'department', 'doctor']
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def canonical_entity_type(entity_type: str) -> str:
+    """Normalize model-name style entity types (customuser, deviceaccessory)"""
+    entity_type = (entity_type or '').lower()
+    return ENTITY_TYPE_ALIASES.get(entity_type, entity_type)
+
+
+def compute_entity_hash(entity_type: str, pk) -> str:
+    """Same hash used by QRCodeMixin.generate_qr_token and the QR download views"""
+    hash_input = f"{entity_type}_{pk}_{settings.SECRET_KEY}"
+    return hashlib.sha256(hash_input.encode()).hexdigest()[:12]
+
+
+def get_entity_model(entity_type: str):
+    entity_type = canonical_entity_type(entity_type)
+    if entity_type not in HASH_ENTITY_MODELS:
+        return None
+    return apps.get_model(*HASH_ENTITY_MODELS[entity_type])
+
+
+def entity_type_for_model(model) -> Optional[str]:
+    """Reverse lookup of HASH_ENTITY_MODELS for a model class"""
+    key = (model._meta.app_label, model.__name__)
+    for entity_type, model_key in HASH_ENTITY_MODELS.items():
+        if model_key == key:
+            return entity_type
+    return None
+
+
+def _index_rows(entity_type: str, pks: Iterable) -> Dict[str, int]:
+    """Bulk insert index rows for the given pks, returns {hash: pk}"""
+    from .models import QRTokenIndex
+
+    hashes = {compute_entity_hash(entity_type, pk): pk for pk in pks}
+    rows = [
+        QRTokenIndex(entity_type=entity_type, token_hash=token_hash, object_id=pk)
+        for token_hash, pk in hashes.items()
+    ]
+    QRTokenIndex.objects.bulk_create(rows, batch_size=BACKFILL_BATCH_SIZE, ignore_conflicts=True)
+    return hashes
+
+
+def _unindexed_pks(entity_type: str):
+    from .models import QRTokenIndex
+
+    model = get_entity_model(entity_type)
+    indexed = QRTokenIndex.objects.filter(entity_type=entity_type).values('object_id')
+    return model.objects.exclude(pk__in=indexed).values_list('pk', flat=True)
+
+
+def index_entity(entity_type: str, pk) -> None:
+    """Register a single entity (called from post_save)"""
+    from .models import QRTokenIndex
+
+    QRTokenIndex.objects.get_or_create(
+        entity_type=entity_type,
+        object_id=pk,
+        defaults={'token_hash': compute_entity_hash(entity_type, pk)},
+    )
+
+
+def unindex_entity(entity_type: str, pk) -> None:
+    from .models import QRTokenIndex
+
+    QRTokenIndex.objects.filter(entity_type=entity_type, object_id=pk).delete()
+
+
+def resolve_entity_hash(entity_type: str, hash_value: str) -> Optional[int]:
+    """
+    Return the pk of the entity whose label is `entity_type:hash_value`, or None.
+    One indexed query; the index is kept current by the post_save/post_delete
+    signals, and rows that bypass them (bulk_create, raw imports) are picked up
+    by the backfill migration and `manage.py backfill_qr_index`.
+    """
+    from .models import QRTokenIndex
+
+    entity_type = canonical_entity_type(entity_type)
+    if entity_type not in HASH_ENTITY_MODELS or not hash_value:
+        return None
+
+    return QRTokenIndex.objects.filter(
+        entity_type=entity_type, token_hash=hash_value
+    ).values_list('object_id', flat=True).first()
+
+
+def resolve_bare_hash(hash_value: str) -> Tuple[Optional[str], Optional[int]]:
+    """Resolve a 12-char hash scanned without its `entity_type:` prefix (one indexed query)"""
+    from .models import QRTokenIndex
+
+    matches = dict(
+        QRTokenIndex.objects.filter(token_hash=hash_value).values_list('entity_type', 'object_id')
+    )
+    for entity_type in BARE_HASH_SEARCH_ORDER:
+        if entity_type in matches:
+            return entity_type, matches[entity_type]
+    return None, None
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def backfill_qr_index(entity_types=None, batch_size=BACKFILL_BATCH_SIZE) -> Dict[str, int]:
+    """Index every entity missing from QRTokenIndex, returns counts per entity type"""
+    counts = {}
+    for entity_type in entity_types or HASH_ENTITY_MODELS:
+        pending = list(_unindexed_pks(entity_type).order_by('pk'))
+        for chunk in _chunks(pending, batch_size):
+            _index_rows(entity_type, chunk)
+        counts[entity_type] = len(pending)
+    return counts
+
+
+def backfill_qr_tokens(entity_types=None, batch_size=BACKFILL_BATCH_SIZE) -> Dict[str, int]:
+    """Fill missing `qr_token` values on QRCodeMixin models with bulk_update"""
+    from django.db.models import Q
+    from core.qr_utils import QRCodeMixin
+
+    counts = {}
+    for entity_type in entity_types or HASH_ENTITY_MODELS:
+        model = get_entity_model(entity_type)
+        if not issubclass(model, QRCodeMixin):
+            continue
+
+        pending = list(
+            model.objects.filter(Q(qr_token__isnull=True) | Q(qr_token=''))
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        for chunk in _chunks(pending, batch_size):
+            objects = model.objects.filter(pk__in=chunk)
+            if entity_type == 'room':
+                objects = objects.select_related('department', 'ward')
+            objects = list(objects)
+            for obj in objects:
+                obj.qr_token = obj.generate_qr_token()
+            with transaction.atomic():
+                model.objects.bulk_update(objects, ['qr_token'])
+        counts[entity_type] = len(pending)
+    return counts
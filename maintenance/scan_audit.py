@@ -0,0 +1,449 @@
+"""
+سجل مسح QR المؤجل (write-behind)
+بدل QRScanLog.objects.create في كل مسحة (وكل الممرضين بيمسحوا في نفس الوقت الصبح فكلهم
+بيستنوا قفل الكتابة في SQLite): التسجيل بيضيف السطر لطابور في الذاكرة ولملف spool على الديسك
+وبيرجع فوراً، و thread في الخلفية بيكتب المعلق بـ bulk_create كل batch_size سجل أو كل
+flush_interval_ms. عند قفل العملية (atexit) المعلق بيتكتب، ولو العملية ماتت فجأة ملف الـ spool
+بتاعها بيتقري تاني (replay_spool) من أول عملية تبدأ بعدها أو من المهمة الدورية
+كل سجل ليه reference (UUID) من لحظة التسجيل، فالـ view بيقدر يرجعه ويعدل السجل بعد كده (update)
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .scheduler_config import get_config
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.jsonl'
+
+# حقول QRScanLog اللي بتتسجل (scanned_by بيتخزن كـ id)
+FIELDS = (
+    'qr_code', 'entity_type', 'entity_id', 'entity_data', 'scanned_by_id', 'device_type', 'scanner_id',
+    'ip_address', 'user_agent', 'token_signature', 'is_secure', 'is_ephemeral', 'session_id',
+    'flow_name', 'flow_executed', 'scanned_at', 'reference',
+)
+
+
+def _spool_dir():
+    path = get_config('scan_audit.spool_dir')
+    if not path:
+        return None
+    path = Path(path)
+    if not path.is_absolute():
+        path = Path(settings.BASE_DIR) / path
+    return path
+
+
+def _encode(fields):
+    row = dict(fields)
+    row['scanned_at'] = row['scanned_at'].isoformat()
+    return json.dumps(row, ensure_ascii=False, default=str)
+
+
+def _decode(line):
+    row = json.loads(line)
+    if 'update' not in row:
+        row['scanned_at'] = datetime.fromisoformat(row['scanned_at'])
+    return row
+
+
+def _write_line(spool, line):
+    # flush بس بيوصل لكاش نظام التشغيل، والـ fsync بيحصل على دفعات من الـ thread (sync_spool)
+    spool.write(line + '\n')
+    spool.flush()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_rows(rows):
+    """
+    كتابة سجلات في QRScanLog بـ bulk_create، ولو الدفعة فشلت بسبب سطر واحد
+    (مستخدم اتمسح مثلاً) بنكتبها سطر سطر ونسيب اللي فيه مشكلة بس
+    بترجع عدد اللي اتكتب
+    """
+    from .models import QRScanLog
+
+    if not rows:
+        return 0
+    try:
+        with transaction.atomic():
+            QRScanLog.objects.bulk_create([QRScanLog(**row) for row in rows])
+        return len(rows)
+    except IntegrityError:
+        written = 0
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    QRScanLog.objects.create(**row)
+                written += 1
+            except IntegrityError as e:
+                logger.warning(f"سجل مسح QR متكتبش ({row.get('qr_code')}): {str(e)}")
+        return written
+
+
+class ScanAuditBuffer:
+    """
+    طابور سجلات المسح في العملية دي
+    كل سجل بيتكتب في ملف الـ spool (سطر JSON) قبل ما يرجع، فالملف دايماً فيه كل اللي
+    لسه متكتبش في قاعدة البيانات، وبعد كل كتابة ناجحة بنشيل الجزء اللي اتكتب من أول الملف
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # بيمنع كتابتين في نفس الوقت (الـ thread ونداء flush مباشر)
+        self._flush_lock = threading.Lock()
+        self._rows = []
+        self._spool = None
+        self._spool_path = None
+        self._spool_pid = None
+        self._oldest = None
+        # سطور في الـ spool لسه موصلتش للديسك (fsync)
+        self._unsynced = False
+        # الدفعة اللي بتتكتب دلوقتي (reference -> السجل) والتعديلات اللي وصلت لها أثناء الكتابة
+        self._in_flight = {}
+        self._deferred_updates = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self._atexit = False
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_flush_seconds = None
+
+    # ────────────────────────────  التسجيل  ────────────────────────────
+
+    def record(self, **fields):
+        """إضافة سجل للطابور (من غير أي استعلام)، والكتابة بتحصل في الخلفية"""
+        fields.setdefault('scanned_at', timezone.now())
+        fields.setdefault('reference', uuid.uuid4())
+        row = {name: fields.get(name) for name in FIELDS if name in fields}
+        with self._lock:
+            self._ensure_started()
+            spool = self._open_spool()
+            if spool is not None:
+                _write_line(spool, _encode(row))
+                self._unsynced = True
+            self._rows.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = self._due()
+        if self._thread is None:
+            # من غير thread مفيش حد يعمل fsync على دفعات، فبيحصل مع كل سجل
+            self.sync_spool()
+        if due:
+            if self._thread is not None:
+                self._wakeup.set()
+            else:
+                self.flush()
+        return row
+
+    def _due(self):
+        if not self._rows:
+            return False
+        if len(self._rows) >= get_config('scan_audit.batch_size', 200):
+            return True
+        return (time.monotonic() - self._oldest) * 1000 >= get_config('scan_audit.flush_interval_ms', 500)
+
+    def pending(self):
+        return len(self._rows)
+
+    def update(self, reference, **fields):
+        """
+        تعديل سجل اتسجل قبل كده (نتيجة الـ flow بعد المسح)
+        لو لسه في الطابور بيتعدل في الذاكرة وسطر التعديل بيتضاف للـ spool، ولو في الدفعة اللي
+        بتتكتب دلوقتي بيتشال لحد ما الكتابة تخلص، ولو اتكتب خلاص بيتعدل في قاعدة البيانات بالـ reference
+        مش بيستنى قفل الكتابة، فالمسحة ما تقفش ورا bulk_create بطيء
+        """
+        from .models import QRScanLog
+
+        key = str(reference)
+        with self._lock:
+            row = next((row for row in self._rows if str(row.get('reference')) == key), None)
+            if row is not None:
+                row.update(fields)
+            elif key in self._in_flight:
+                self._deferred_updates.setdefault(key, {}).update(fields)
+            if row is not None or key in self._in_flight:
+                spool = self._open_spool()
+                if spool is not None:
+                    _write_line(spool, json.dumps(
+                        {'update': key, 'fields': fields}, ensure_ascii=False, default=str,
+                    ))
+                    self._unsynced = True
+                return True
+        return QRScanLog.objects.filter(reference=reference).update(**fields) > 0
+
+    def _apply_deferred_updates(self, updates):
+        from .models import QRScanLog
+
+        for reference, fields in updates.items():
+            try:
+                QRScanLog.objects.filter(reference=reference).update(**fields)
+            except Exception as e:
+                # سطر التعديل لسه في الـ spool لحد الـ trim الجاي
+                logger.warning(f"تعذر تعديل سجل المسح {reference}: {str(e)}")
+
+    # ────────────────────────────  الكتابة  ────────────────────────────
+
+    def flush(self):
+        """كتابة كل المعلق دلوقتي، بترجع عدد السجلات اللي اتكتبت"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                self._oldest = None
+                self._in_flight = {str(row.get('reference')): row for row in rows}
+                spool_offset = self._spool.tell() if self._spool is not None else None
+            if not rows:
+                return 0
+            started = time.monotonic()
+            try:
+                written = write_rows(rows)
+            except Exception as e:
+                # قاعدة البيانات مقفولة أو واقعة (أو أي خطأ تاني): السجلات ترجع أول الطابور والـ spool زي ما هو
+                self.failures += 1
+                log = logger.warning if isinstance(e, DatabaseError) else logger.exception
+                log(f"تعذر كتابة {len(rows)} سجل مسح QR: {str(e)}")
+                with self._lock:
+                    for reference, fields in self._deferred_updates.items():
+                        self._in_flight[reference].update(fields)
+                    self._in_flight, self._deferred_updates = {}, {}
+                    self._rows[:0] = rows
+                    self._oldest = self._oldest or time.monotonic()
+                return 0
+            with self._lock:
+                self._in_flight, updates, self._deferred_updates = {}, self._deferred_updates, {}
+                self._trim_spool(spool_offset)
+            self._apply_deferred_updates(updates)
+            self.flushed += written
+            self.batches += 1
+            self.last_flush_seconds = time.monotonic() - started
+            return written
+
+    def _trim_spool(self, offset):
+        """شيل الجزء اللي اتكتب من أول الـ spool (اللي اتضاف أثناء الكتابة بيفضل)"""
+        if self._spool is None or offset is None:
+            return
+        self._spool.flush()
+        with open(self._spool_path, 'rb') as spool:
+            spool.seek(offset)
+            tail = spool.read()
+        # الباقي بيتكتب في ملف جنبه وبيحل مكانه بـ rename، فلو العملية وقعت في النص
+        # الـ spool القديم بيفضل كامل (أسوأ حاجة سجلات بتتكتب مرتين، مش بتضيع)
+        temp = self._spool_path.with_name(f'{self._spool_path.name}.tmp')
+        with open(temp, 'wb') as spool:
+            spool.write(tail)
+            spool.flush()
+            os.fsync(spool.fileno())
+        os.replace(temp, self._spool_path)
+        # الملف الجديد اتعمله fsync كامل، فالسطور اللي اتنقلت له وصلت للديسك
+        self._unsynced = False
+        self._spool.close()
+        self._spool = open(self._spool_path, 'a+', encoding='utf-8')
+
+    # ────────────────────────────  الـ spool  ────────────────────────────
+
+    def sync_spool(self):
+        """
+        fsync واحد لكل السطور اللي اتضافت من آخر مرة (group commit)
+        بيحصل برا القفل على نسخة من الـ fd، فالمسحات ما تستناش الديسك
+        """
+        if not get_config('scan_audit.fsync', True):
+            return
+        with self._lock:
+            if not self._unsynced or self._spool is None:
+                return
+            fd = os.dup(self._spool.fileno())
+            self._unsynced = False
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            self._unsynced = True
+            logger.warning(f"تعذر fsync لـ spool سجلات المسح: {str(e)}")
+        finally:
+            os.close(fd)
+
+    def _open_spool(self):
+        directory = _spool_dir()
+        if directory is None:
+            return None
+        pid = os.getpid()
+        if self._spool is not None and self._spool_pid == pid:
+            return self._spool
+        # أول سجل في العملية دي (أو بعد fork): ملف باسم الـ pid
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'qrscan-{pid}{SPOOL_SUFFIX}'
+        if path.exists():
+            # ملف قديم لعملية ماتت وكان ليها نفس الـ pid
+            _claim_and_replay(path)
+        self._spool = open(path, 'a+', encoding='utf-8')
+        self._spool_path = path
+        self._spool_pid = pid
+        return self._spool
+
+    # ────────────────────────────  الخلفية  ────────────────────────────
+
+    def _ensure_started(self):
+        if not self._atexit:
+            atexit.register(self.shutdown)
+            self._atexit = True
+        running = self._thread is not None and self._thread.is_alive()
+        if not running and get_config('scan_audit.background', True) and not self._stopping:
+            self._thread = threading.Thread(target=self._run, name='qr-scan-audit', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # أول ما تبدأ: أي spool لعملية ماتت
+        try:
+            replay_spool()
+        except Exception as e:
+            logger.warning(f"تعذر استرجاع spool سجلات المسح: {str(e)}")
+        while not self._stopping:
+            interval = min(
+                get_config('scan_audit.flush_interval_ms', 500), get_config('scan_audit.fsync_interval_ms', 50)
+            ) / 1000
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.sync_spool()
+            except Exception as e:
+                logger.warning(f"فشل fsync سجلات المسح في الخلفية: {str(e)}")
+            with self._lock:
+                due = self._due()
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    self.failures += 1
+                    logger.warning(f"فشل كتابة سجلات المسح في الخلفية: {str(e)}")
+                finally:
+                    close_old_connections()
+
+    def shutdown(self):
+        """قفل العملية: وقف الـ thread وكتابة كل المعلق، والـ spool بيتمسح لو فضي"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+        with self._lock:
+            if self._spool is not None:
+                path, empty = self._spool_path, self._spool.tell() == 0 and not self._rows
+                self._spool.close()
+                self._spool = None
+                if empty:
+                    path.unlink(missing_ok=True)
+        self._stopping = False
+
+    def stats(self):
+        return {
+            'pending': self.pending(),
+            'flushed': self.flushed,
+            'batches': self.batches,
+            'failures': self.failures,
+            'last_flush_seconds': self.last_flush_seconds,
+            'background': self._thread is not None,
+        }
+
+
+buffer = ScanAuditBuffer()
+
+
+def record(**fields):
+    return buffer.record(**fields)
+
+
+def flush():
+    return buffer.flush()
+
+
+def update(reference, **fields):
+    return buffer.update(reference, **fields)
+
+
+def _claim_and_replay(path):
+    """
+    قراية spool ملف وكتابته، بعد ما نحجزه بـ rename (لو عمليتين حاولوا مع بعض واحدة بس بتنجح)
+    بترجع عدد السجلات اللي اتكتبت
+    """
+    claimed = path.with_name(f'{path.name}.replay-{os.getpid()}')
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return 0
+    rows = []
+    by_reference = {}
+    orphans = {}
+    with open(claimed, encoding='utf-8') as spool:
+        for line in spool:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = _decode(line)
+            except (ValueError, KeyError):
+                # آخر سطر ممكن يكون اتقطع لو العملية ماتت وهي بتكتبه
+                logger.warning(f"سطر تالف في {claimed.name} اتساب")
+                continue
+            if 'update' in row:
+                # سطر تعديل (update) بييجي بعد سطر السجل بتاعه، ولو السجل اتشال بالـ trim
+                # يبقى اتكتب خلاص والتعديل بيتعمل في قاعدة البيانات
+                if row['update'] in by_reference:
+                    by_reference[row['update']].update(row['fields'])
+                else:
+                    orphans.setdefault(row['update'], {}).update(row['fields'])
+                continue
+            rows.append(row)
+            if row.get('reference'):
+                by_reference[row['reference']] = row
+    written = write_rows(rows)
+    if orphans:
+        from .models import QRScanLog
+
+        for reference, fields in orphans.items():
+            QRScanLog.objects.filter(reference=reference).update(**fields)
+    claimed.unlink()
+    if written:
+        logger.info(f"اتكتب {written} سجل مسح QR من {path.name}")
+    return written
+
+
+def replay_spool():
+    """كتابة ملفات الـ spool اللي عملياتها مش شغالة (أو اتحجزت ووقفت في النص)"""
+    directory = _spool_dir()
+    if directory is None or not directory.exists():
+        return 0
+    total = 0
+    for path in sorted(directory.iterdir()):
+        name = path.name
+        if name.endswith(SPOOL_SUFFIX):
+            pid = name[len('qrscan-'):-len(SPOOL_SUFFIX)]
+        elif f'{SPOOL_SUFFIX}.replay-' in name:
+            pid = name.rsplit('-', 1)[-1]
+        else:
+            continue
+        if not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+            continue
+        total += _claim_and_replay(path)
+    return total
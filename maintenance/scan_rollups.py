@@ -0,0 +1,386 @@
+# تجميع مسحات QR في QRScanRollup
+# المهمة الدورية بتكمل من آخر سجل QRScanLog اتجمع (بالـ id) وبتزود عدادات الساعة لكل
+# (نوع كيان، قسم، ماسح، flow) وآخر مسحة لكل كيان في QRScanLastSeen، والخريطة الحرارية
+# والأجهزة الخاملة بيقروا من الصفوف المجمعة بدل ما يلفوا على السجلات الخام.
+# الـ id بيتحجز مع الـ insert مش مع الـ commit، فسجل ممكن يظهر بعد سجلات بـ id أكبر منه:
+# الـ ids الناقصة تحت المؤشر بتتحفظ فيه وبتتفحص تاني في كل تشغيل لحد gap_timeout.
+# التنظيف اختياري: السجلات الخام اللي اتجمعت بتتمسح بعد raw_retention_days، وصفوف الساعات
+# القديمة بتتدمج في صف يومي، وتاريخ الجلسات المنتهية بيتمسح بعد history_retention_days
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import CharField, Count, F, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import QRScanLastSeen, QRScanLog, QRScanRollup, QRScanRollupCursor, ScanHistory
+from .scheduler_config import get_config
+
+CURSOR_NAME = 'qr_scan_log'
+DAYS_PER_CHUNK = 31
+DELETE_CHUNK = 2000
+# الـ ids الناقصة بتتدور بس في آخر الرقم ده تحت أكبر id في الدفعة (الـ transactions المفتوحة
+# دايماً قريبة من الآخر، والفجوات الأقدم سجلات اتمسحت أو اترجعت)
+GAP_WINDOW = 2000
+
+# الموديل وحقل القسم لكل نوع كيان، والأنواع التانية (مستخدم، مريض...) بتتجمع من غير قسم
+ENTITY_MODELS = {
+    'device': ('maintenance.Device', 'department_id', 'name'),
+    'accessory': ('maintenance.DeviceAccessory', 'device__department_id', 'name'),
+    'room': ('manager.Room', 'department_id', 'number'),
+    'bed': ('manager.Bed', 'room__department_id', 'bed_number'),
+}
+
+ROLLUP_FIELDS = ('bucket', 'entity_type', 'department_id', 'scanner_id', 'flow_name')
+LOG_FIELDS = ('pk', 'scanned_at', 'entity_type', 'entity_id', 'scanner_id', 'flow_name')
+
+
+def hour_bucket(value):
+    """بداية الساعة بالتوقيت المحلي"""
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(value):
+    """بداية اليوم بالتوقيت المحلي"""
+    return timezone.localtime(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _numeric_ids(entity_ids):
+    return {int(entity_id) for entity_id in entity_ids if entity_id and str(entity_id).isdigit()}
+
+
+def resolve_departments(entities):
+    """{(entity_type, entity_id): department_id} لكل الكيانات، استعلام واحد لكل نوع"""
+    ids_by_type = defaultdict(set)
+    for entity_type, entity_id in entities:
+        ids_by_type[entity_type].add(entity_id)
+
+    departments = {}
+    for entity_type, entity_ids in ids_by_type.items():
+        ids = _numeric_ids(entity_ids)
+        if not ids:
+            continue
+        if entity_type == 'department':
+            # القسم نفسه (لو لسه موجود)
+            model, field = apps.get_model('manager.Department'), 'pk'
+        elif entity_type in ENTITY_MODELS:
+            label, field, _ = ENTITY_MODELS[entity_type]
+            model = apps.get_model(label)
+        else:
+            continue
+        for pk, department_id in model.objects.filter(pk__in=ids).values_list('pk', field):
+            departments[(entity_type, str(pk))] = department_id
+    return departments
+
+
+# ────────────────────────────  Upserts  ────────────────────────────
+
+def _add_counts(counts, granularity, now):
+    """زيادة عدادات صفوف QRScanRollup: counts = {(bucket, entity_type, department_id, scanner_id, flow_name): scans}"""
+    if not counts:
+        return 0
+    existing = {
+        tuple(getattr(row, field) for field in ROLLUP_FIELDS): row
+        for row in QRScanRollup.objects.filter(granularity=granularity, bucket__in={key[0] for key in counts})
+    }
+    changed, created = [], []
+    for key, scans in counts.items():
+        row = existing.get(key)
+        if row is None:
+            created.append(QRScanRollup(granularity=granularity, scans=scans, **dict(zip(ROLLUP_FIELDS, key))))
+        else:
+            row.scans += scans
+            row.updated_at = now
+            changed.append(row)
+    QRScanRollup.objects.bulk_update(changed, ['scans', 'updated_at'], batch_size=500)
+    QRScanRollup.objects.bulk_create(created, batch_size=500)
+    return len(counts)
+
+
+def _touch_last_seen(seen):
+    """تحديث آخر مسحة: seen = {(entity_type, entity_id): (last_scanned_at, scans, department_id)}"""
+    ids_by_type = defaultdict(list)
+    for entity_type, entity_id in seen:
+        ids_by_type[entity_type].append(entity_id)
+
+    changed, created = [], []
+    for entity_type, entity_ids in ids_by_type.items():
+        existing = {
+            row.entity_id: row
+            for row in QRScanLastSeen.objects.filter(entity_type=entity_type, entity_id__in=entity_ids)
+        }
+        for entity_id in entity_ids:
+            last_scanned_at, scans, department_id = seen[(entity_type, entity_id)]
+            row = existing.get(entity_id)
+            if row is None:
+                created.append(QRScanLastSeen(
+                    entity_type=entity_type, entity_id=entity_id, department_id=department_id,
+                    last_scanned_at=last_scanned_at, scans=scans,
+                ))
+                continue
+            row.scans += scans
+            row.last_scanned_at = max(row.last_scanned_at, last_scanned_at)
+            if department_id is not None:
+                row.department_id = department_id
+            changed.append(row)
+    QRScanLastSeen.objects.bulk_update(changed, ['scans', 'last_scanned_at', 'department_id'], batch_size=500)
+    QRScanLastSeen.objects.bulk_create(created, batch_size=500)
+
+
+# ────────────────────────────  Rollup  ────────────────────────────
+
+def _rollup_batch(rows, cursor, now):
+    departments = resolve_departments({(entity_type, entity_id) for _, _, entity_type, entity_id, _, _ in rows})
+    counts = Counter()
+    seen = {}
+    for pk, scanned_at, entity_type, entity_id, scanner_id, flow_name in rows:
+        entity_type = entity_type or ''
+        department_id = departments.get((entity_type, entity_id))
+        counts[(hour_bucket(scanned_at), entity_type, department_id, scanner_id or '', flow_name or '')] += 1
+        if not entity_id:
+            continue
+        last = seen.get((entity_type, entity_id))
+        if last is None:
+            seen[(entity_type, entity_id)] = (scanned_at, 1, department_id)
+        else:
+            seen[(entity_type, entity_id)] = (max(last[0], scanned_at), last[1] + 1, department_id)
+
+    # المؤشر (last_log_id والفجوات) بيتحفظ في نفس الـ transaction مع العدادات
+    with transaction.atomic():
+        buckets = _add_counts(counts, 'hour', now)
+        _touch_last_seen(seen)
+        cursor.save(update_fields=['last_log_id', 'gaps', 'updated_at'])
+    return buckets
+
+
+def _track_gaps(cursor, rows, now):
+    """الـ ids اللي مش موجودة بين المؤشر وآخر الدفعة (لسه ما اتعملهاش commit أو اترجعت)"""
+    last = rows[-1][0]
+    first = max(cursor.last_log_id, last - GAP_WINDOW) + 1
+    present = {row[0] for row in rows}
+    seen_at = now.isoformat()
+    for pk in range(first, last):
+        if pk not in present:
+            cursor.gaps[str(pk)] = seen_at
+
+
+def _recheck_gaps(cursor, now):
+    """
+    الـ ids الناقصة اللي ظهرت من آخر تشغيل بتتجمع، واللي فضلت ناقصة أكتر من gap_timeout
+    بتتساب (transaction اترجعت أو السجل اتمسح)
+    بترجع (عدد المسحات، عدد صفوف الساعات)
+    """
+    rows = list(
+        QRScanLog.objects.filter(pk__in=[int(pk) for pk in cursor.gaps]).order_by('pk').values_list(*LOG_FIELDS)
+    )
+    for row in rows:
+        del cursor.gaps[str(row[0])]
+    expired = now - get_config('scan_rollups.gap_timeout', timedelta(minutes=10))
+    cursor.gaps = {pk: seen_at for pk, seen_at in cursor.gaps.items() if datetime.fromisoformat(seen_at) >= expired}
+    if not rows:
+        cursor.save(update_fields=['gaps', 'updated_at'])
+        return 0, 0
+    return len(rows), _rollup_batch(rows, cursor, now)
+
+
+def rollup_scans(batch_size=None, now=None):
+    """
+    المهمة الدورية: تجميع سجلات QRScanLog الجديدة من آخر تشغيل
+    السجلات المؤجلة (scan_audit) بتاخد id أكبر لما تتكتب، فبتتحسب في ساعتها الأصلية حتى لو اتأخرت،
+    والسجل اللي اتعمله commit بعد سجل id أكبر منه بيتلقط من فجوات المؤشر
+    """
+    started = time.monotonic()
+    now = now or timezone.now()
+    batch_size = batch_size or get_config('scan_rollups.batch_size', 5000)
+    cursor, _ = QRScanRollupCursor.objects.get_or_create(name=CURSOR_NAME)
+
+    scans = buckets = 0
+    if cursor.gaps:
+        scans, buckets = _recheck_gaps(cursor, now)
+    while True:
+        rows = list(
+            QRScanLog.objects.filter(pk__gt=cursor.last_log_id).order_by('pk').values_list(*LOG_FIELDS)[:batch_size]
+        )
+        if not rows:
+            break
+        _track_gaps(cursor, rows, now)
+        cursor.last_log_id = rows[-1][0]
+        buckets += _rollup_batch(rows, cursor, now)
+        scans += len(rows)
+
+    return {
+        'scans': scans,
+        'buckets': buckets,
+        'last_log_id': cursor.last_log_id,
+        'gaps': len(cursor.gaps),
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+
+# ────────────────────────────  Retention  ────────────────────────────
+
+def downsample(before, now=None):
+    """دمج صفوف الساعات في الأيام الكاملة قبل before في صف يومي واحد لكل مجموعة أبعاد"""
+    now = now or timezone.now()
+    cutoff = day_bucket(before)
+    hourly = QRScanRollup.objects.filter(granularity='hour', bucket__lt=cutoff)
+    first = hourly.aggregate(first=Min('bucket'))['first']
+    merged = 0
+    while first is not None and first < cutoff:
+        chunk_start = day_bucket(first)
+        chunk_end = min(day_bucket(chunk_start + timedelta(days=DAYS_PER_CHUNK)), cutoff)
+        chunk = hourly.filter(bucket__gte=chunk_start, bucket__lt=chunk_end)
+        counts = Counter()
+        for bucket, *dimensions, scans in chunk.values_list(*ROLLUP_FIELDS, 'scans').iterator():
+            counts[(day_bucket(bucket), *dimensions)] += scans
+        with transaction.atomic():
+            _add_counts(counts, 'day', now)
+            merged += chunk.delete()[0]
+        first = chunk_end if chunk_end < cutoff else None
+    return merged
+
+
+def _delete_in_chunks(queryset):
+    """مسح على دفعات عشان قفل الكتابة ميطولش"""
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by().values_list('pk', flat=True)[:DELETE_CHUNK])
+        if not pks:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+
+
+def _retention(name, now):
+    days = get_config(f'scan_rollups.{name}')
+    return now - timedelta(days=days) if days else None
+
+
+def compact(now=None):
+    """
+    تنظيف السجلات القديمة: السجلات الخام اللي اتجمعت بس، وصفوف الساعات بتتحول لأيام،
+    وتاريخ الجلسات اللي خلصت (الجلسات النشطة حالتها بتتبني من ScanHistory فمش بتتلمس)
+    كل مدة None افتراضياً (من غير تنظيف) لحد ما تتحدد في الإعدادات
+    """
+    started = time.monotonic()
+    now = now or timezone.now()
+    cursor = QRScanRollupCursor.objects.filter(name=CURSOR_NAME).first()
+    result = {'raw_logs': 0, 'hourly_rows': 0, 'history_rows': 0}
+
+    raw_cutoff = _retention('raw_retention_days', now)
+    if raw_cutoff and cursor is not None:
+        result['raw_logs'] = _delete_in_chunks(
+            QRScanLog.objects.filter(pk__lte=cursor.last_log_id, scanned_at__lt=raw_cutoff).exclude(
+                pk__in=[int(pk) for pk in cursor.gaps],
+            )
+        )
+
+    hourly_cutoff = _retention('hourly_retention_days', now)
+    if hourly_cutoff:
+        result['hourly_rows'] = downsample(hourly_cutoff, now)
+
+    history_cutoff = _retention('history_retention_days', now)
+    if history_cutoff:
+        result['history_rows'] = _delete_in_chunks(
+            ScanHistory.objects.filter(scanned_at__lt=history_cutoff).exclude(session__status='active')
+        )
+
+    result['seconds'] = round(time.monotonic() - started, 3)
+    return result
+
+
+# ────────────────────────────  Queries  ────────────────────────────
+
+def heatmap(days=30, department_id=None, entity_type=None, now=None):
+    """
+    مصفوفة 7×24 (يوم الأسبوع بترتيب weekday() × الساعة بالتوقيت المحلي) لآخر days يوم
+    من صفوف الساعات بس، فالمدة أقصاها hourly_retention_days
+    """
+    now = now or timezone.now()
+    hourly_days = get_config('scan_rollups.hourly_retention_days')
+    if hourly_days:
+        days = min(days, hourly_days)
+    since = hour_bucket(now - timedelta(days=days))
+
+    rows = QRScanRollup.objects.filter(granularity='hour', bucket__gte=since)
+    if department_id:
+        rows = rows.filter(department_id=department_id)
+    if entity_type:
+        rows = rows.filter(entity_type=entity_type)
+
+    matrix = [[0] * 24 for _ in range(7)]
+    total = 0
+    for bucket, scans in rows.order_by().values('bucket').annotate(scans=Sum('scans')).values_list('bucket', 'scans'):
+        local = timezone.localtime(bucket)
+        matrix[local.weekday()][local.hour] += scans
+        total += scans
+
+    by_department = [
+        {'department_id': row['department_id'], 'department': row['department__name'], 'scans': row['scans']}
+        for row in rows.order_by().values('department_id', 'department__name').annotate(scans=Sum('scans')).order_by('-scans')
+    ]
+    by_entity_type = dict(
+        rows.order_by().values('entity_type').annotate(scans=Sum('scans')).values_list('entity_type', 'scans')
+    )
+    return {
+        'days': days,
+        'since': since.isoformat(),
+        'total': total,
+        'matrix': matrix,
+        'by_department': by_department,
+        'by_entity_type': by_entity_type,
+        'updated_at': _last_update(),
+    }
+
+
+def _last_update():
+    last = QRScanRollup.objects.aggregate(last=Max('updated_at'))['last']
+    return last.isoformat() if last else None
+
+
+def idle_assets(entity_type='device', days=30, department_id=None, limit=100, now=None):
+    """
+    الكيانات اللي ما اتمسحتش من days يوم أو عمرها ما اتمسحت، اللي عمرها ما اتمسحت الأول
+    وبعدها الأقدم في آخر مسحة
+    """
+    if entity_type not in ENTITY_MODELS:
+        raise ValueError(f"نوع كيان غير مدعوم: {entity_type}")
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=days)
+    label, department_field, label_field = ENTITY_MODELS[entity_type]
+    model = apps.get_model(label)
+
+    # آخر مسحة لكل كيان من QRScanLastSeen (entity_id نص) والفلترة والترتيب في قاعدة البيانات
+    seen = QRScanLastSeen.objects.filter(entity_type=entity_type, entity_id=Cast(OuterRef('pk'), CharField()))
+    entities = model.objects.annotate(
+        last_scanned_at=Subquery(seen.values('last_scanned_at')[:1]),
+        scans=Subquery(seen.values('scans')[:1]),
+    ).filter(Q(last_scanned_at__isnull=True) | Q(last_scanned_at__lt=cutoff))
+    if department_id:
+        entities = entities.filter(**{department_field: department_id})
+
+    counts = entities.aggregate(total=Count('pk'), never_scanned=Count('pk', filter=Q(last_scanned_at__isnull=True)))
+    # اللي عمرها ما اتمسحت الأول وبعدها الأقدم في آخر مسحة
+    page = entities.order_by(F('last_scanned_at').asc(nulls_first=True), 'pk').values_list(
+        'pk', label_field, department_field, 'last_scanned_at', 'scans',
+    )[:limit]
+    assets = [
+        {
+            'id': pk,
+            'name': name,
+            'department_id': candidate_department,
+            'last_scanned_at': last_scanned_at.isoformat() if last_scanned_at else None,
+            'idle_days': (now - last_scanned_at).days if last_scanned_at else None,
+            'scans': scans or 0,
+        }
+        for pk, name, candidate_department, last_scanned_at, scans in page
+    ]
+    return {
+        'entity_type': entity_type,
+        'days': days,
+        'total': counts['total'],
+        'never_scanned': counts['never_scanned'],
+        'assets': assets,
+    }
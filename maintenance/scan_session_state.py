@@ -0,0 +1,299 @@
+# حالة جلسة المسح في الكاش، بتتزود مع كل مسحة
+# بدل ما كل مسحة تقرا ScanHistory الجلسة كلها من الأول وتفك JSON كل صف، وبعدها
+# تسأل تاني عن المستخدمين والأجهزة والملحقات بـ filter وcount منفصلين: كل جلسة نشطة
+# ليها حالة في الكاش (الكيانات بالترتيب + صفوف ScanHistory اللي لسه متكتبتش)
+# والمسحة الجديدة بتضيف عنصر واحد. الكتابة لقاعدة البيانات بتحصل مرة واحدة عند إنهاء
+# الجلسة (حفظ/إنهاء/إلغاء/انتهاء المهلة) بـ bulk_create، ولو الكاش ضاع بنبني الحالة
+# من ScanHistory في استعلام واحد
+# تأجيل الكتابة بيشتغل بس مع كاش مشترك بين العمليات (الكاش المحلي بيضيع المعلق مع العملية)،
+# ومهمة scan_sessions بتقفل الجلسات الخاملة وتكتب صفوفها قبل ما حالة الكاش تخلص
+# كل قراية-تعديل-كتابة للحالة بتحصل جوه قفل للجلسة (cache.add) عشان مسحتين في نفس الوقت
+# ما يضيعوش بعض، وعمليتين بيكتبوا المعلق ما يكتبوهوش مرتين
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from core.shared_cache import is_shared_cache
+
+from .scheduler_config import get_config
+
+KEY_PREFIX = 'cmms_scan_session:'
+
+# القفل بيخلص لوحده بعد المدة دي لو العملية اللي ماسكاه وقعت
+LOCK_TTL = 30
+LOCK_WAIT = 5
+
+USER_TYPES = ('user', 'customuser', 'doctor')
+LOCATION_TYPES = ('department', 'room', 'bed')
+
+
+def _key(session_id):
+    return f'{KEY_PREFIX}{session_id}'
+
+
+class ScanSessionBusy(Exception):
+    """الجلسة مقفولة من طلب تاني أكتر من LOCK_WAIT ثانية"""
+
+
+@contextmanager
+def session_lock(session):
+    """
+    قفل على حالة الجلسة: cache.add ذري (في الكاش المشترك بين العمليات وفي LocMemCache
+    جوه العملية) فطلب واحد بس بيعدل الحالة في نفس الوقت
+    """
+    key = f'{_key(session.session_id)}:lock'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(key, token, timeout=LOCK_TTL):
+        if time.monotonic() >= deadline:
+            raise ScanSessionBusy(f'scan session {session.session_id} is locked')
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        # لو القفل خلص واتاخد من طلب تاني منمسحش قفله
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def _ttl():
+    return int(get_config('scan_sessions.state_ttl').total_seconds())
+
+
+def defer_history():
+    """صفوف ScanHistory بتستنى في الكاش؟ (None في الإعدادات = بس لو الكاش مشترك)"""
+    defer = get_config('scan_sessions.defer_history', None)
+    if defer is None:
+        return is_shared_cache()
+    return defer
+
+
+def scanned_time(entity):
+    """وقت المسحة كـ datetime"""
+    return datetime.fromisoformat(entity['scanned_at']) if entity.get('scanned_at') else None
+
+
+def _parse(entity_data):
+    """entity_data ممكن يكون dict أو نص JSON (الصفوف القديمة كانت بتتحفظ بـ json.dumps)"""
+    if not entity_data:
+        return {}
+    if isinstance(entity_data, dict):
+        return entity_data
+    try:
+        return json.loads(entity_data)
+    except (TypeError, ValueError):
+        return {}
+
+
+class ScanSessionState:
+    """
+    الكيانات الممسوحة في جلسة بالترتيب، بنفس شكل get_scanned_entities القديمة
+    {'type', 'id', 'data', 'scanned_at'}، ومعاها صفوف التاريخ المعلقة
+    """
+
+    def __init__(self, session, entities=None, pending=None):
+        self.session = session
+        self.entities = entities or []
+        self.pending = pending or []
+        # الكائنات المحملة في الطلب ده بس (مش بتتخزن في الكاش عشان متبقاش قديمة)
+        self._resolved = {}
+
+    # ────────────────────────────  الأسئلة  ────────────────────────────
+
+    @property
+    def count(self):
+        return len(self.entities)
+
+    @property
+    def entity_types(self):
+        return [entity['type'] for entity in self.entities]
+
+    def has(self, *entity_types):
+        return any(entity['type'] in entity_types for entity in self.entities)
+
+    def of_type(self, *entity_types):
+        return [entity for entity in self.entities if entity['type'] in entity_types]
+
+    def unique(self, *entity_types):
+        """أول مسحة لكل كيان من الأنواع دي بترتيب المسح (المسح المكرر لنفس الكيان بيتساب)"""
+        seen = {}
+        for entity in self.of_type(*entity_types):
+            seen.setdefault(entity['id'], entity)
+        return list(seen.values())
+
+    def ids(self, *entity_types):
+        return [entity['id'] for entity in self.unique(*entity_types)]
+
+    def last(self, *entity_types):
+        for entity in reversed(self.entities):
+            if entity['type'] in entity_types:
+                return entity
+        return None
+
+    def resolve(self, queryset, *entity_types):
+        """
+        {id: كائن} لكل كيانات الأنواع دي في استعلام واحد (in_bulk)، والمحذوف بيتساب
+        queryset ممكن يكون الموديل نفسه أو queryset عليه select_related
+        """
+        if not isinstance(queryset, QuerySet):
+            queryset = queryset._default_manager.all()
+        key = (queryset.model._meta.label, entity_types)
+        if key not in self._resolved:
+            self._resolved[key] = queryset.in_bulk(self.ids(*entity_types))
+        return self._resolved[key]
+
+    def objects(self, queryset, *entity_types):
+        """الكائنات نفسها بترتيب المسح"""
+        resolved = self.resolve(queryset, *entity_types)
+        return [resolved[entity_id] for entity_id in self.ids(*entity_types) if entity_id in resolved]
+
+    # ────────────────────────────  التخزين  ────────────────────────────
+
+    def _dump(self):
+        return {'entities': self.entities, 'pending': self.pending}
+
+    def save(self):
+        cache.set(_key(self.session.session_id), self._dump(), timeout=_ttl())
+
+
+def load(session):
+    """حالة الجلسة من الكاش، ولو مش موجودة من ScanHistory (استعلام واحد)"""
+    from .models import ScanHistory
+
+    cached = cache.get(_key(session.session_id))
+    if cached is not None:
+        return ScanSessionState(session, cached['entities'], cached['pending'])
+
+    entities = [
+        {
+            'type': entity_type,
+            'id': entity_id,
+            'data': _parse(entity_data),
+            'scanned_at': scanned_at.isoformat() if scanned_at else None,
+        }
+        for entity_type, entity_id, entity_data, scanned_at in ScanHistory.objects.filter(
+            session=session, is_valid=True,
+        ).order_by('scanned_at', 'pk').values_list('entity_type', 'entity_id', 'entity_data', 'scanned_at')
+    ]
+    state = ScanSessionState(session, entities)
+    state.save()
+    return state
+
+
+def append(session, scanned_code, entity_type, entity_id, entity_data=None, state=None):
+    """
+    إضافة مسحة للجلسة: عنصر واحد في الحالة، وصف ScanHistory معلق لحد إنهاء الجلسة
+    (أو بيتكتب في ساعتها لو التأجيل مقفول، شوف defer_history)
+    الحالة بتتقري تاني جوه القفل، و state لو اتبعتت بتتحدث بالنسخة الجديدة
+    """
+    from .models import ScanHistory
+
+    with session_lock(session):
+        current = load(session)
+        scanned_at = timezone.now()
+        current.entities.append({
+            'type': entity_type,
+            'id': entity_id,
+            'data': _parse(entity_data),
+            'scanned_at': scanned_at.isoformat(),
+        })
+        row = {
+            'scanned_code': scanned_code or '',
+            'entity_type': entity_type,
+            'entity_id': entity_id,
+            # نفس صيغة التخزين القديمة (نص JSON)
+            'entity_data': json.dumps(entity_data or {}),
+            'scanned_at': scanned_at,
+        }
+        if defer_history():
+            current.pending.append(row)
+            if len(current.pending) >= get_config('scan_sessions.max_pending', 50):
+                _write_pending(current)
+        else:
+            ScanHistory.objects.create(session=session, is_valid=True, **row)
+        current.save()
+    if state is None:
+        return current
+    state.entities, state.pending = current.entities, current.pending
+    return state
+
+
+def _write_pending(state):
+    """كتابة صفوف ScanHistory المعلقة في insert واحد، بوقت المسح الحقيقي (جوه القفل)"""
+    from .models import ScanHistory
+
+    if not state.pending:
+        return 0
+    rows = [ScanHistory(session=state.session, is_valid=True, **row) for row in state.pending]
+    with transaction.atomic():
+        created = ScanHistory.objects.bulk_create(rows)
+        # auto_now_add بيحط وقت الكتابة، فبنرجع وقت كل مسحة في update واحد
+        for obj, row in zip(created, state.pending):
+            obj.scanned_at = row['scanned_at']
+        if created and created[0].pk is not None:
+            ScanHistory.objects.bulk_update(created, ['scanned_at'])
+    state.pending = []
+    return len(rows)
+
+
+def flush(state):
+    """
+    كتابة المعلق: بيتقري من الكاش جوه القفل، فلو طلب تاني كتبه خلاص مبيتكتبش تاني
+    ولو مسحة اتضافت بعد ما state اتقرت بتتكتب معاه
+    """
+    with session_lock(state.session):
+        current = cache.get(_key(state.session.session_id))
+        if current is not None:
+            state.entities, state.pending = current['entities'], current['pending']
+        count = _write_pending(state)
+        if count:
+            state.save()
+    return count
+
+
+def commit(session, state=None):
+    """إنهاء الجلسة: كتابة المعلق ومسح الحالة من الكاش (الحالة بعد كده بتتبني من قاعدة البيانات)"""
+    state = state or ScanSessionState(session)
+    with session_lock(session):
+        current = cache.get(_key(session.session_id))
+        if current is not None:
+            state.entities, state.pending = current['entities'], current['pending']
+        count = _write_pending(state)
+        discard(session)
+    return count
+
+
+def discard(session):
+    cache.delete(_key(session.session_id))
+
+
+def expire_idle_sessions(now=None):
+    """
+    الجلسات النشطة اللي مفيهاش مسح من scan_sessions.idle_timeout بتتقفل expired وصفوفها
+    المعلقة بتتكتب، بدل ما تستنى مسحة جديدة على نفس الجلسة أو تضيع لما حالة الكاش تخلص
+    """
+    from .models import ScanSession
+
+    now = now or timezone.now()
+    cutoff = now - get_config('scan_sessions.idle_timeout', timedelta(minutes=30))
+    expired = written = 0
+    # updated_at مبيتغيرش مع المسحات المؤجلة، فآخر مسحة في الحالة هي اللي بتحدد
+    for session in list(ScanSession.objects.filter(status='active', updated_at__lt=cutoff)):
+        state = load(session)
+        last_scan = scanned_time(state.entities[-1]) if state.entities else None
+        if last_scan is not None and last_scan >= cutoff:
+            continue
+        with transaction.atomic():
+            # التحديث الشرطي عشان طلب المسح اللي قفل نفس الجلسة ميتكتبش مرتين
+            if not ScanSession.objects.filter(pk=session.pk, status='active').update(status='expired', updated_at=now):
+                continue
+            written += commit(session, state)
+        expired += 1
+    return {'expired': expired, 'history_rows': written}
@@ -54,6 +54,9 @@ class CMMSScheduler:
             # معالجة طابور الإشعارات
             self.process_notification_queue()
             
+            # تحديث لقطات المؤشرات اليومية
+            self.rollup_kpi_snapshots()
+            
             # تنظيف البيانات القديمة
             self.cleanup_old_data()
             
@@ -65,77 +68,16 @@ class CMMSScheduler:
     def create_due_preventive_maintenance(self):
         """
         إنشاء طلبات الصيانة الوقائية المستحقة
+        على دفعات من maintenance.pm_generation مع إشعار ملخص واحد لكل فني
         """
+        from .pm_generation import generate_due_pm_work_orders
+
         logger.info("فحص الصيانة الوقائية المستحقة")
-        
-        today = date.today()
-        due_schedules = PreventiveMaintenanceSchedule.objects.filter(
-            is_active=True,
-            next_due_date__lte=today
-        ).select_related('device', 'job_plan', 'created_by')
-        
-        created_count = 0
-        
-        for schedule in due_schedules:
-            try:
-                with transaction.atomic():
-                    # التحقق من عدم وجود طلب خدمة مفتوح للجهاز
-                    existing_request = ServiceRequest.objects.filter(
-                        device=schedule.device,
-                        request_type='preventive',
-                        status__in=['new', 'assigned', 'in_progress']
-                    ).exists()
-                    
-                    if existing_request:
-                        logger.info(f"يوجد طلب صيانة وقائية مفتوح للجهاز {schedule.device.name}")
-                        continue
-                    
-                    # إنشاء طلب خدمة جديد
-                    service_request = ServiceRequest.objects.create(
-                        title=f"صيانة وقائية - {schedule.device.name}",
-                        description=f"صيانة وقائية مجدولة للجهاز {schedule.device.name}",
-                        device=schedule.device,
-                        request_type='preventive',
-                        priority='medium',
-                        reporter=schedule.created_by or self._get_system_user(),
-                        assigned_to=schedule.created_by,
-                        is_auto_generated=True
-                    )
-                    
-                    # تحديد SLA المناسب
-                    sla = self._get_appropriate_sla(schedule.device, 'preventive', 'medium')
-                    if sla:
-                        service_request.sla = sla
-                        service_request.response_due = timezone.now() + timedelta(hours=sla.response_time_hours)
-                        service_request.resolution_due = timezone.now() + timedelta(hours=sla.resolution_time_hours)
-                        service_request.save()
-                    
-                    # إنشاء أمر شغل
-                    work_order = WorkOrder.objects.create(
-                        service_request=service_request,
-                        assignee=schedule.created_by,
-                        job_plan=schedule.job_plan
-                    )
-                    
-                    # تحديث جدول الصيانة الوقائية
-                    schedule.last_completed_date = today
-                    schedule.next_due_date = self._calculate_next_due_date(schedule)
-                    schedule.save()
-                    
-                    # إرسال إشعار
-                    self.notification_manager.send_pm_due_notification(
-                        schedule.device,
-                        schedule.created_by or self._get_system_user(),
-                        schedule.next_due_date
-                    )
-                    
-                    created_count += 1
-                    logger.info(f"تم إنشاء طلب صيانة وقائية للجهاز {schedule.device.name}")
-                    
-            except Exception as e:
-                logger.error(f"خطأ في إنشاء طلب صيانة وقائية للجهاز {schedule.device.name}: {str(e)}")
-        
-        logger.info(f"تم إنشاء {created_count} طلب صيانة وقائية")
+
+        result = generate_due_pm_work_orders()
+
+        logger.info(f"تم إنشاء {result['created']} طلب صيانة وقائية")
+        return result['created']
         
     def check_sla_violations(self):
         """
@@ -350,69 +292,27 @@ class CMMSScheduler:
                 
         logger.info(f"تم فحص {overdue_orders.count()} أمر شغل متأخر")
         
-    def process_notification_queue(self):
+    def rollup_kpi_snapshots(self):
         """
-        معالجة طابور الإشعارات المؤجلة
+        تحديث لقطات المؤشرات اليومية للأيام اللي اتغيرت من آخر تشغيل
         """
-        logger.info("معالجة طابور الإشعارات")
+        from .kpi_snapshots import rollup_kpi_snapshots
         
-        now = timezone.now()
-        
-        # الإشعارات المجدولة للإرسال
-        pending_notifications = NotificationQueue.objects.filter(
-            status='pending',
-            scheduled_at__lte=now
-        ).order_by('priority', 'created_at')[:50]  # معالجة 50 إشعار في المرة
+        result = rollup_kpi_snapshots()
+        logger.info(
+            f"تم تحديث لقطات المؤشرات: {result['days']} يوم، {result['device_days']} جهاز/يوم، {result['rows']} صف"
+        )
+        return result
         
-        processed_count = 0
+    def process_notification_queue(self):
+        """
+        معالجة طابور الإشعارات المؤجلة
+        الإرسال على دفعات محجوزة باتصال SMTP واحد لكل دفعة (notification_dispatch)
+        """
+        from .notification_dispatch import dispatch_pending
         
-        for notification in pending_notifications:
-            try:
-                notification.status = 'processing'
-                notification.save()
-                
-                if notification.notification_type == 'email':
-                    # إرسال إيميل
-                    success = self.notification_manager._send_email(
-                        notification.recipient_email,
-                        notification.subject,
-                        notification.message
-                    )
-                elif notification.notification_type == 'system':
-                    # إنشاء إشعار نظام
-                    SystemNotification.objects.create(
-                        user=notification.recipient_user,
-                        title=notification.subject,
-                        message=notification.message,
-                        notification_type='info'
-                    )
-                    success = True
-                else:
-                    success = False
-                    
-                if success:
-                    notification.status = 'sent'
-                    notification.sent_at = now
-                else:
-                    notification.status = 'failed'
-                    notification.attempts += 1
-                    
-                    # إعادة المحاولة إذا لم نصل للحد الأقصى
-                    if notification.attempts < notification.max_attempts:
-                        notification.status = 'pending'
-                        notification.scheduled_at = now + timedelta(minutes=30)
-                        
-                notification.save()
-                processed_count += 1
-                
-            except Exception as e:
-                logger.error(f"خطأ في معالجة الإشعار {notification.id}: {str(e)}")
-                notification.status = 'failed'
-                notification.error_message = str(e)
-                notification.attempts += 1
-                notification.save()
-                
-        logger.info(f"تم معالجة {processed_count} إشعار")
+        logger.info("معالجة طابور الإشعارات")
+        return dispatch_pending()
         
     def cleanup_old_data(self):
         """
@@ -438,8 +338,8 @@ class CMMSScheduler:
         
         # حذف الإشعارات المرسلة من الطابور الأقدم من 7 أيام
         old_queue_items = NotificationQueue.objects.filter(
-            status='sent',
-            sent_at__lt=timezone.now() - timedelta(days=7)
+            status='completed',
+            processed_at__lt=timezone.now() - timedelta(days=7)
         )
         deleted_queue = old_queue_items.count()
         old_queue_items.delete()
@@ -471,16 +371,14 @@ class CMMSScheduler:
         """
         الحصول على SLA المناسب للجهاز ونوع الطلب
         """
-        try:
-            sla_matrix = SLAMatrix.objects.get(
-                device_category=device.category,
-                request_type=request_type,
-                priority=priority
-            )
-            return sla_matrix.sla
-        except SLAMatrix.DoesNotExist:
-            # البحث عن SLA افتراضي
-            return SLA.objects.filter(is_active=True).first()
+        from .sla_resolver import resolver
+        
+        # المصفوفة مش بتفرق بنوع الطلب، فالطلبات المجدولة بتاخد خطورة وتأثير متوسطين
+        sla_matrix = resolver.lookup(device.category_id, 'medium', 'moderate', priority)
+        if sla_matrix:
+            return sla_matrix
+        # البحث عن SLA افتراضي
+        return resolver.default_definition()
             
     def _get_system_user(self):
         """
@@ -40,13 +40,20 @@ SCHEDULER_CONFIG = {
         'low_stock_multiplier': 1.5,  # تحذير عند 1.5 ضعف الحد الأدنى
     },
     
-    # معالجة طابور الإشعارات كل 15 دقيقة
+    # معالجة طابور الإشعارات كل دقيقة (دفعات على اتصال SMTP واحد)
     'notification_queue': {
         'enabled': True,
-        'interval': timedelta(minutes=15),
-        'batch_size': 50,  # معالجة 50 إشعار في المرة
+        'interval': timedelta(minutes=1),
+        'batch_size': 50,  # حجم الدفعة المحجوزة للعامل الواحد
         'retry_delay_minutes': 30,  # إعادة المحاولة بعد 30 دقيقة
         'max_attempts': 3,  # الحد الأقصى للمحاولات
+        'claim_timeout_minutes': 10,  # الدفعة المحجوزة أطول من كده بترجع للطابور
+    },
+    
+    # تحديث لقطات المؤشرات اليومية كل ساعة (الأيام المتغيرة فقط)
+    'kpi_snapshots': {
+        'enabled': True,
+        'interval': timedelta(hours=1),
     },
     
     # تنظيف البيانات القديمة أسبوعياً يوم الأحد في الساعة 2 صباحاً
@@ -70,6 +77,75 @@ SCHEDULER_CONFIG = {
         'email_delay_seconds': 2,  # تأخير ثانيتين بين الإيميلات
     },
     
+    # توليد أوامر الصيانة الوقائية على دفعات (maintenance.pm_generation)
+    'pm_generation': {
+        'chunk_size': 200,  # عدد الجداول في كل transaction
+        'digest_max_items': 20,  # أقصى عدد أوامر بتتكتب في إشعار الملخص
+    },
+    
+    # تقويم توقعات الصيانة الوقائية (maintenance.pm_forecast)، بيتمد يومياً مع الأفق
+    'pm_forecast': {
+        'horizon_days': 90,  # المواعيد المتوقعة لحد كام يوم قدام
+        'chunk_size': 500,  # عدد الجداول في كل دفعة مقارنة
+    },
+    
+    # مطابقة سجلات التوقف (maintenance.downtime_tracker)، الفتح والإقفال بيحصلوا مع تغيير الحالة
+    'downtime': {
+        'reconcile_interval': timedelta(minutes=15),
+    },
+    
+    # رسم صور QR في الخلفية (core.qr_render)، الحفظ بيقدم موعدها كمان
+    'qr_render': {
+        'interval': timedelta(minutes=5),
+    },
+
+    # حالة جلسات المسح في الكاش (maintenance.scan_session_state)
+    'scan_sessions': {
+        'state_ttl': timedelta(hours=4),  # أطول من مهلة الجلسة (30 دقيقة افتراضياً)
+        'defer_history': None,  # صفوف ScanHistory بتتكتب مرة واحدة عند إنهاء الجلسة (None = بس لو الكاش مشترك بين العمليات)
+        'idle_timeout': timedelta(minutes=30),  # الجلسة النشطة من غير مسح المدة دي بتتقفل وصفوفها بتتكتب
+        'expire_interval': timedelta(minutes=5),  # مهمة قفل الجلسات الخاملة (لازم أقل بكتير من state_ttl)
+        'max_pending': 50,  # لو المسحات المعلقة وصلت للعدد ده بتتكتب حتى لو الجلسة لسه شغالة
+    },
+
+    # سجل مسح QR المؤجل (maintenance.scan_audit)
+    'scan_audit': {
+        'batch_size': 200,  # bulk_create لما المعلق يوصل للعدد ده
+        'flush_interval_ms': 500,  # أو بعد المدة دي من أول سجل معلق
+        'spool_dir': 'spool/qr_scan_audit',  # نسخة على الديسك لحد الكتابة (نسبة لـ BASE_DIR، و None يقفلها)
+        'fsync': True,  # الـ spool بيوصل للديسك (fsync واحد من الـ thread لكل السطور الجديدة)
+        'fsync_interval_ms': 50,  # أقصى مدة سطر يفضل في كاش نظام التشغيل بس
+        'background': True,  # thread بيكتب في الخلفية (من غيره الكتابة بتحصل مع التسجيل اللي بعده)
+        'replay_interval': timedelta(minutes=5),  # مهمة كتابة spool العمليات اللي وقفت فجأة
+    },
+    
+    # تجميع مسحات QR بالساعة (maintenance.scan_rollups)
+    'scan_rollups': {
+        'interval': timedelta(minutes=15),
+        'batch_size': 5000,  # عدد سجلات QRScanLog في كل transaction
+        'gap_timeout': timedelta(minutes=10),  # id ناقص تحت آخر سجل متجمع بيتفحص تاني لحد المدة دي
+        # التنظيف اختياري (None = من غير مسح)، مثلاً 90 / 180 / 180
+        'raw_retention_days': None,  # السجلات الخام اللي اتجمعت بتتمسح بعد المدة دي
+        'hourly_retention_days': None,  # صفوف الساعات الأقدم بتتدمج في صف يومي
+        'history_retention_days': None,  # ScanHistory للجلسات اللي خلصت
+    },
+
+    # سحب البصمات من أجهزة ZKTeco (hr.zkteco_ingest)، وزرار المزامنة بيقدم موعدها بس
+    'zkteco_ingest': {
+        'interval': timedelta(minutes=5),
+    },
+
+    # طابور المهام (maintenance.job_queue)
+    'job_queue': {
+        'concurrency': 2,  # عدد العمال في كل عملية
+        'poll_interval_seconds': 5,  # فحص الطابور كل 5 ثواني
+        'lease_ttl_seconds': 30,  # مدة قفل القيادة قبل ما عملية تانية تاخده
+        'max_retries': 3,  # عدد مرات إعادة المحاولة للمهمة الفاشلة
+        'retry_backoff_seconds': 60,  # أول مهلة إعادة وبتتضاعف مع كل محاولة
+        'heartbeat_seconds': 30,  # العامل بيحدث نبضة التشغيل الشغال كل 30 ثانية
+        'heartbeat_timeout_seconds': 120,  # تشغيل من غير نبضة المدة دي يعتبر عامله وقع
+    },
+    
     # إعدادات الأداء
     'performance': {
         'max_execution_time_minutes': 30,  # الحد الأقصى لوقت التنفيذ
@@ -95,7 +171,8 @@ TASK_PRIORITIES = {
     'preventive_maintenance': 3,
     'calibration_check': 4,
     'spare_parts_check': 5,
-    'data_cleanup': 6,  # أقل أولوية
+    'kpi_snapshots': 6,
+    'data_cleanup': 7,  # أقل أولوية
 }
 
 # إعدادات قوالب الإشعارات الافتراضية
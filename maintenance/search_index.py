@@ -0,0 +1,419 @@
+"""
+البحث الموحد في الأجهزة والمرضى والبلاغات وقطع الغيار والموردين
+كل كائن ليه صف في SearchDocument بيتحدث من الإشارات، وعلى SQLite جدول FTS5 (external content)
+بيتزامن معاه بـ triggers فالبحث بيبقى MATCH مرتب بـ bm25 بدل icontains على كل جدول
+وعلى أي قاعدة تانية (أو لو جدول FTS مش موجود) بنرجع لبحث icontains على جدول الفهرس لوحده
+البحث بيتم على النص الموحد، والعرض والتظليل على النص الأصلي (display_title / display_body)
+"""
+
+import html
+import logging
+import math
+import re
+
+from django.apps import apps
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Length
+
+from core.text_normalization import ARABIC_LETTERS, ARABIC_MARKS, normalize_arabic
+
+from .models import SearchDocument
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'maintenance_searchdocument_fts'
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+REBUILD_CHUNK_SIZE = 2000
+SNIPPET_LENGTH = 200
+
+# علامات مؤقتة للتظليل قبل الـ escape
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+_TOKEN = re.compile(r'\w+')
+
+# أنواع الكائنات: الاسم -> الموديل وحقول العنوان والنص ومسار المستشفى
+SEARCH_ENTITIES = {}
+
+
+def register_entity(name, model_label, title_fields, body_fields=(), hospital_field=None):
+    SEARCH_ENTITIES[name] = {
+        'model': model_label,
+        'title_fields': tuple(title_fields),
+        'body_fields': tuple(body_fields),
+        'hospital_field': hospital_field,
+    }
+
+
+register_entity('device', 'maintenance.Device', ['name'],
+                ['serial_number', 'model', 'manufacturer'], 'department__hospital_id')
+register_entity('patient', 'manager.Patient', ['first_name', 'middle_name', 'last_name'],
+                ['mrn', 'medical_file_number', 'national_id', 'phone_number'], 'hospital_id')
+register_entity('service_request', 'maintenance.ServiceRequest', ['title'],
+                ['description'], 'device__department__hospital_id')
+register_entity('spare_part', 'maintenance.SparePart', ['name'],
+                ['part_number', 'manufacturer', 'model_number', 'description'])
+register_entity('supplier', 'maintenance.Supplier', ['name'],
+                ['code', 'contact_person', 'email', 'phone', 'city'])
+
+
+def entity_for_model(model):
+    label = model._meta.label
+    for name, definition in SEARCH_ENTITIES.items():
+        if definition['model'] == label:
+            return name
+    return None
+
+
+# ────────────────────────────  FTS5  ────────────────────────────
+
+def _fts_sql():
+    docs = SearchDocument._meta.db_table
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"title, body, content='{docs}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {docs}_ai AFTER INSERT ON {docs} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+        f"CREATE TRIGGER IF NOT EXISTS {docs}_ad AFTER DELETE ON {docs} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+        f"CREATE TRIGGER IF NOT EXISTS {docs}_au AFTER UPDATE ON {docs} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+        f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    ]
+
+
+def ensure_fts(db=None):
+    """إنشاء جدول FTS5 والـ triggers لو القاعدة SQLite، بيرجع True لو متاح"""
+    db = db or connection
+    if db.vendor != 'sqlite':
+        return False
+    with db.cursor() as cursor:
+        for statement in _fts_sql():
+            cursor.execute(statement)
+    return True
+
+
+def fts_available():
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def rebuild_fts():
+    """إعادة بناء جدول FTS من SearchDocument (بعد تحميل جماعي مثلاً)"""
+    if not ensure_fts():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+# ────────────────────────────  Indexing  ────────────────────────────
+
+def _join(values):
+    return ' '.join(str(value) for value in values if value not in (None, ''))
+
+
+def _value_fields(definition):
+    fields = ['pk', *definition['title_fields'], *definition['body_fields']]
+    if definition['hospital_field']:
+        fields.append(definition['hospital_field'])
+    return fields
+
+
+def _document(entity, definition, row):
+    titles = len(definition['title_fields'])
+    bodies = len(definition['body_fields'])
+    title = _join(row[1:1 + titles])[:500]
+    body = _join(row[1 + titles:1 + titles + bodies])
+    return SearchDocument(
+        entity=entity,
+        object_id=row[0],
+        title=normalize_arabic(title),
+        body=normalize_arabic(body),
+        display_title=title,
+        display_body=body,
+        hospital_id=row[-1] if definition['hospital_field'] else None,
+    )
+
+
+def index_instance(instance):
+    """تحديث صف الكائن في الفهرس (بيتنادى من post_save)"""
+    entity = entity_for_model(type(instance))
+    if entity is None:
+        return
+    definition = SEARCH_ENTITIES[entity]
+    model = apps.get_model(definition['model'])
+    try:
+        with transaction.atomic():
+            row = model.objects.filter(pk=instance.pk).values_list(*_value_fields(definition)).first()
+            if row is None:
+                return
+            document = _document(entity, definition, row)
+            SearchDocument.objects.update_or_create(
+                entity=entity, object_id=instance.pk,
+                defaults={
+                    'title': document.title, 'body': document.body, 'display_title': document.display_title,
+                    'display_body': document.display_body, 'hospital_id': document.hospital_id,
+                },
+            )
+    except DatabaseError as e:
+        # الفهرس ما يوقفش حفظ الكائن نفسه
+        logger.warning(f"تعذر تحديث فهرس البحث لـ {entity}:{instance.pk}: {str(e)}")
+
+
+def index_objects(model, pks):
+    """فهرسة صفوف اتعملت بـ bulk_create (مفيش post_save) في استعلام قراءة وكتابة واحدة"""
+    entity = entity_for_model(model)
+    if entity is None or not pks:
+        return 0
+    definition = SEARCH_ENTITIES[entity]
+    try:
+        with transaction.atomic():
+            rows = model.objects.filter(pk__in=pks).values_list(*_value_fields(definition))
+            documents = [_document(entity, definition, row) for row in rows]
+            SearchDocument.objects.filter(entity=entity, object_id__in=pks).delete()
+            SearchDocument.objects.bulk_create(documents)
+            return len(documents)
+    except DatabaseError as e:
+        logger.warning(f"تعذر تحديث فهرس البحث لـ {len(pks)} صف من {entity}: {str(e)}")
+        return 0
+
+
+def remove_instance(instance):
+    entity = entity_for_model(type(instance))
+    if entity is None:
+        return
+    try:
+        with transaction.atomic():
+            SearchDocument.objects.filter(entity=entity, object_id=instance.pk).delete()
+    except DatabaseError as e:
+        logger.warning(f"تعذر حذف {entity}:{instance.pk} من فهرس البحث: {str(e)}")
+
+
+def rebuild_index(entities=None, chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    إعادة بناء الفهرس من الجداول الأصلية
+    القراءة بـ values_list().iterator() والكتابة bulk_create على دفعات، وبعدها rebuild لجدول FTS
+    """
+    counts = {}
+    with transaction.atomic():
+        # لو جدول FTS لسه جديد محتاج rebuild كامل، غير كده الـ triggers بتزامنه مع الكتابة
+        fts_was_missing = not fts_available()
+        ensure_fts()
+        for entity in entities or SEARCH_ENTITIES:
+            definition = SEARCH_ENTITIES[entity]
+            model = apps.get_model(definition['model'])
+            SearchDocument.objects.filter(entity=entity).delete()
+
+            batch, total = [], 0
+            rows = model.objects.order_by().values_list(*_value_fields(definition)).iterator(chunk_size=chunk_size)
+            for row in rows:
+                batch.append(_document(entity, definition, row))
+                if len(batch) >= chunk_size:
+                    SearchDocument.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                SearchDocument.objects.bulk_create(batch)
+                total += len(batch)
+            counts[entity] = total
+        if fts_was_missing:
+            rebuild_fts()
+    return counts
+
+
+# ────────────────────────────  Search  ────────────────────────────
+
+def query_tokens(query):
+    return _TOKEN.findall(normalize_arabic(query))
+
+
+_ARABIC_ARTICLE = 'ال'
+
+
+def token_variants(token):
+    """الكلمة بأداة التعريف ومن غيرها (أشعة تلاقي الأشعة والعكس)"""
+    if not '\u0621' <= token[0] <= '\u064a':
+        return [token]
+    if token.startswith(_ARABIC_ARTICLE) and len(token) > 3:
+        return [token, token[len(_ARABIC_ARTICLE):]]
+    return [token, _ARABIC_ARTICLE + token]
+
+
+def _fts_query(tokens):
+    # كل كلمة prefix والكلمات كلها لازم تتطابق (AND)
+    return ' AND '.join(
+        '({})'.format(' OR '.join('"{}"*'.format(variant.replace('"', '""')) for variant in token_variants(token)))
+        for token in tokens
+    )
+
+
+def _render(text):
+    """escape للنص وتحويل علامات التظليل لـ <mark>"""
+    return html.escape(text or '').replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def _match_spans(text, tokens):
+    """
+    مواضع الكلمات في النص الأصلي
+    المطابقة على النص بعد التوحيد، والتوحيد بيشيل حروف بس (التشكيل والتطويل) أو بيبدل حرف بحرف،
+    فكل حرف في النص الموحد ليه مكان واحد في الأصلي
+    """
+    normalized, offsets = [], []
+    for index, char in enumerate(text):
+        if ARABIC_MARKS.match(char):
+            continue
+        normalized.append(char.translate(ARABIC_LETTERS))
+        offsets.append(index)
+    variants = {variant for token in tokens for variant in token_variants(token)}
+    pattern = re.compile('|'.join(re.escape(variant) for variant in sorted(variants, key=len, reverse=True)), re.IGNORECASE)
+    return [
+        (offsets[match.start()], offsets[match.end() - 1] + 1)
+        for match in pattern.finditer(''.join(normalized)) if match.end() > match.start()
+    ]
+
+
+def _highlight(text, tokens, start=0, end=None):
+    """النص الأصلي (أو جزء منه) بعد الـ escape والكلمات المطابقة جوه <mark>"""
+    if not text:
+        return ''
+    end = len(text) if end is None else end
+    parts, position = [], start
+    for span_start, span_end in _match_spans(text, tokens):
+        if span_start < position or span_end > end:
+            continue
+        parts.append(text[position:span_start])
+        parts.append(f'{_MARK_START}{text[span_start:span_end]}{_MARK_END}')
+        position = span_end
+    parts.append(text[position:end])
+    return _render(''.join(parts))
+
+
+def _snippet(text, tokens, length=SNIPPET_LENGTH):
+    """جزء من النص الأصلي حوالين أول كلمة مطابقة"""
+    if not text:
+        return ''
+    spans = _match_spans(text, tokens)
+    start = max(0, spans[0][0] - length // 3) if spans else 0
+    end = min(len(text), start + length)
+    snippet = _highlight(text, tokens, start, end)
+    return ('…' if start else '') + snippet + ('…' if end < len(text) else '')
+
+
+def _hit(entity, object_id, title, body, tokens, score):
+    return {'type': entity, 'id': object_id, 'title': _highlight(title, tokens),
+            'snippet': _snippet(body, tokens), 'score': score}
+
+
+def _filters(entities, hospital_id):
+    clauses, params = [], []
+    if entities:
+        clauses.append(f"d.entity IN ({', '.join(['%s'] * len(entities))})")
+        params.extend(entities)
+    if hospital_id is not None:
+        # قطع الغيار والموردين مش تابعين لمستشفى
+        clauses.append('(d.hospital_id = %s OR d.hospital_id IS NULL)')
+        params.append(hospital_id)
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+
+def _search_fts(tokens, entities, hospital_id, offset, limit):
+    docs = SearchDocument._meta.db_table
+    where, params = _filters(entities, hospital_id)
+    match = _fts_query(tokens)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {FTS_TABLE} f JOIN {docs} d ON d.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s{where}",
+            [match, *params],
+        )
+        total = cursor.fetchone()[0]
+        # التظليل في بايثون على النص الأصلي، مش highlight() بتاعة FTS اللي بتشتغل على النص الموحد
+        cursor.execute(
+            f"SELECT d.entity, d.object_id, d.display_title, d.title, d.display_body, d.body, "
+            f"bm25({FTS_TABLE}, 10.0, 1.0) AS score "
+            f"FROM {FTS_TABLE} f JOIN {docs} d ON d.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s{where} ORDER BY score LIMIT %s OFFSET %s",
+            [match, *params, limit, offset],
+        )
+        hits = [
+            # صفوف قبل حقول العرض (لحد rebuild_search_index) بتتعرض بالنص الموحد
+            _hit(entity, object_id, display_title or title, display_body or body, tokens, round(-score, 4))
+            for entity, object_id, display_title, title, display_body, body, score in cursor.fetchall()
+        ]
+    return total, hits
+
+
+def _search_fallback(tokens, entities, hospital_id, offset, limit):
+    documents = SearchDocument.objects.all()
+    for token in tokens:
+        matches = Q()
+        for variant in token_variants(token):
+            matches |= Q(title__icontains=variant) | Q(body__icontains=variant)
+        documents = documents.filter(matches)
+    if entities:
+        documents = documents.filter(entity__in=entities)
+    if hospital_id is not None:
+        documents = documents.filter(Q(hospital_id=hospital_id) | Q(hospital_id__isnull=True))
+
+    first = tokens[0]
+    documents = documents.annotate(
+        tier=Case(
+            When(title__istartswith=first, then=Value(0)),
+            When(title__icontains=first, then=Value(1)),
+            default=Value(2), output_field=IntegerField(),
+        ),
+        title_length=Length('title'),
+    ).order_by('tier', 'title_length', 'pk')
+
+    total = documents.count()
+    hits = [
+        _hit(document.entity, document.object_id, document.display_title or document.title,
+             document.display_body or document.body, tokens, float(2 - document.tier))
+        for document in documents[offset:offset + limit]
+    ]
+    return total, hits
+
+
+def search(query, entities=None, hospital_id=None, page=1, page_size=DEFAULT_PAGE_SIZE):
+    """
+    بحث مرتب ومقسم لصفحات في الفهرس الموحد
+    بيرجع dict فيه count و num_pages و hits (type, id, title و snippet بعد التظليل بـ <mark>, score)
+    """
+    page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    page = max(1, int(page or 1))
+    result = {'query': query, 'page': page, 'page_size': page_size, 'count': 0, 'num_pages': 0, 'hits': []}
+
+    tokens = query_tokens(query)
+    if not tokens:
+        return result
+
+    offset = (page - 1) * page_size
+    entities = list(entities) if entities else None
+    total, hits = None, None
+    if fts_available():
+        try:
+            total, hits = _search_fts(tokens, entities, hospital_id, offset, page_size)
+        except DatabaseError as e:
+            logger.warning(f"فشل بحث FTS، هنرجع للبحث العادي: {str(e)}")
+    if hits is None:
+        total, hits = _search_fallback(tokens, entities, hospital_id, offset, page_size)
+
+    result.update(count=total, num_pages=math.ceil(total / page_size), hits=hits)
+    return result
+
+
+def load_objects(hits):
+    """الكائنات الأصلية لنتايج الصفحة: {type: {id: object}} باستعلام واحد لكل نوع"""
+    ids = {}
+    for hit in hits:
+        ids.setdefault(hit['type'], []).append(hit['id'])
+    return {
+        entity: apps.get_model(SEARCH_ENTITIES[entity]['model']).objects.in_bulk(object_ids)
+        for entity, object_ids in ids.items()
+    }
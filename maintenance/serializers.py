@@ -60,6 +60,8 @@ class DeviceSerializer(serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     clean_status_display = serializers.CharField(source='get_clean_status_display', read_only=True)
     sterilization_status_display = serializers.CharField(source='get_sterilization_status_display', read_only=True)
+    # الصورة مش متخزنة، بتترسم من الـ token على general:qr_image
+    qr_image_url = serializers.CharField(source='qr_png_url', read_only=True)
     
     class Meta:
         model = Device
@@ -70,7 +72,7 @@ class DeviceSerializer(serializers.ModelSerializer):
             'sterilization_status', 'sterilization_status_display',
             'purchase_date', 'warranty_expiry', 'last_maintained_at',
             'last_cleaned_at', 'last_sterilized_at', 'notes',
-            'qr_token', 'qr_code'
+            'qr_token', 'qr_image_url'
         ]
 
 class DeviceAccessorySerializer(serializers.ModelSerializer):
@@ -79,13 +81,14 @@ class DeviceAccessorySerializer(serializers.ModelSerializer):
     """
     device = DeviceSerializer(read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
+    qr_image_url = serializers.CharField(source='qr_png_url', read_only=True)
     
     class Meta:
         model = DeviceAccessory
         fields = [
             'id', 'name', 'serial_number', 'model', 'device',
             'status', 'status_display', 'purchase_date', 'warranty_expiry',
-            'notes', 'qr_token', 'qr_code'
+            'notes', 'qr_token', 'qr_image_url'
         ]
 
 class SupplierSerializer(serializers.ModelSerializer):
@@ -1,93 +1,57 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from django.apps import apps
 from core.qr_utils import QRCodeMixin
-from manager.models import Patient, Bed
+from manager.models import Patient
 from hr.models import CustomUser
 from maintenance.models import *
 
 @receiver(post_save)
 def generate_qr_code_on_save(sender, instance, created, **kwargs):
     """
-    Auto-generate QR codes for models that inherit from QRCodeMixin
+    Assign QR tokens for models that inherit from QRCodeMixin.
+    Images are rendered on request from the token (core.qr_cache), nothing is stored.
     """
-    # Only process instances that inherit from QRCodeMixin
-    if isinstance(instance, QRCodeMixin):
-        # Only generate if it's a new instance or QR code doesn't exist
-        if created or not instance.qr_token or not instance.qr_code:
-            try:
-                # Generate QR token and code
-                if not instance.qr_token:
-                    instance.qr_token = instance.generate_qr_token()
-                
-                # Generate QR code image
-                if not instance.qr_code:
-                    instance.generate_qr_code()
-                    # Save without triggering signals again
-                    instance.save(update_fields=['qr_code', 'qr_token'])
-                    
-            except Exception as e:
-                print(f"Error generating QR code for {instance}: {e}")
-
-@receiver(post_save, sender=Patient)
-def generate_patient_qr_code(sender, instance, created, **kwargs):
-    """Generate QR code for patients with special format"""
-    if created or not instance.qr_token:
-        try:
+    if not isinstance(instance, QRCodeMixin) or kwargs.get('raw'):
+        return
+    try:
+        if not instance.qr_token:
+            # The token hashes the pk, so it can only be set after the insert
             instance.qr_token = instance.generate_qr_token()
-            instance.generate_qr_code()
-            # Use update to avoid triggering signals again
-            Patient.objects.filter(pk=instance.pk).update(
-                qr_token=instance.qr_token
-            )
-            instance.save(update_fields=['qr_code'])
-        except Exception as e:
-            print(f"Error generating Patient QR code: {e}")
+            sender._default_manager.filter(pk=instance.pk).update(qr_token=instance.qr_token)
+    except Exception as e:
+        print(f"Error assigning QR token for {instance}: {e}")
 
 
-@receiver(post_save, sender=Bed)
-def generate_bed_qr_code(sender, instance, created, **kwargs):
-    """Generate QR code for beds"""
-    if created or not instance.qr_token:
-        try:
-            instance.qr_token = instance.generate_qr_token()
-            instance.generate_qr_code()
-            Bed.objects.filter(pk=instance.pk).update(
-                qr_token=instance.qr_token
-            )
-            instance.save(update_fields=['qr_code'])
-        except Exception as e:
-            print(f"Error generating Bed QR code: {e}")
+def index_qr_token_hash(sender, instance, created, **kwargs):
+    """Keep QRTokenIndex in sync so scans resolve with one indexed lookup"""
+    from maintenance.qr_resolver import entity_type_for_model, index_entity
 
+    if not created or kwargs.get('raw'):
+        return
+    try:
+        index_entity(entity_type_for_model(sender), instance.pk)
+    except Exception as e:
+        logger.error(f"Error indexing QR hash for {instance}: {e}")
 
-@receiver(post_save, sender=CustomUser)
-def generate_user_qr_code(sender, instance, created, **kwargs):
-    """Generate QR code for users (doctors, nurses, staff)"""
-    if created or not instance.qr_token:
-        try:
-            instance.qr_token = instance.generate_qr_token()
-            instance.generate_qr_code()
-            CustomUser.objects.filter(pk=instance.pk).update(
-                qr_token=instance.qr_token
-            )
-            instance.save(update_fields=['qr_code'])
-        except Exception as e:
-            print(f"Error generating User QR code: {e}")
 
+def unindex_qr_token_hash(sender, instance, **kwargs):
+    from maintenance.qr_resolver import entity_type_for_model, unindex_entity
 
-@receiver(post_save, sender=DeviceAccessory)
-def generate_accessory_qr_code(sender, instance, created, **kwargs):
-    """Generate QR code for device accessories"""
-    if created or not instance.qr_token:
-        try:
-            instance.qr_token = instance.generate_qr_token()
-            instance.generate_qr_code()
-            DeviceAccessory.objects.filter(pk=instance.pk).update(
-                qr_token=instance.qr_token
-            )
-            instance.save(update_fields=['qr_code'])
-        except Exception as e:
-            print(f"Error generating DeviceAccessory QR code: {e}")
+    unindex_entity(entity_type_for_model(sender), instance.pk)
+
+
+def _connect_qr_token_index():
+    """Only the models with hashed QR labels (qr_resolver.HASH_ENTITY_MODELS)"""
+    from maintenance.qr_resolver import HASH_ENTITY_MODELS
+
+    for entity_type, model_key in HASH_ENTITY_MODELS.items():
+        model = apps.get_model(*model_key)
+        post_save.connect(index_qr_token_hash, sender=model, dispatch_uid=f'index_qr_token_hash:{entity_type}')
+        post_delete.connect(unindex_qr_token_hash, sender=model, dispatch_uid=f'unindex_qr_token_hash:{entity_type}')
+
+
+_connect_qr_token_index()
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -132,88 +96,16 @@ def check_and_generate_pm_work_orders():
     """
     فحص وإنشاء أوامر الصيانة الوقائية المستحقة
     يتم استدعاء هذه الدالة تلقائياً كل ساعة
+    التوليد نفسه على دفعات في maintenance.pm_generation وبترجع عدد الأوامر الجديدة
     """
+    from maintenance.pm_generation import generate_due_pm_work_orders
+
     try:
-        today = date.today()
-        
-        # إضافة logs للتشخيص
-        total_schedules = PreventiveMaintenanceSchedule.objects.count()
-        active_schedules = PreventiveMaintenanceSchedule.objects.filter(is_active=True).count()
-        
-        logger.info(f"إجمالي جداول الصيانة: {total_schedules}")
-        logger.info(f"جداول الصيانة النشطة: {active_schedules}")
-        
-        # البحث عن جداول الصيانة المستحقة (فقط التي موعدها اليوم أو قبل اليوم)
-        due_schedules = PreventiveMaintenanceSchedule.objects.filter(
-            is_active=True,
-            next_due_date__lte=today
-        ).select_related('device', 'job_plan', 'created_by', 'assigned_to')
-        
-        logger.info(f"جداول الصيانة المستحقة اليوم ({today}): {due_schedules.count()}")
-        
-        # طباعة تفاصيل الجداول للتشخيص
-        for schedule in due_schedules:
-            logger.info(f"جدول مستحق: {schedule.device.name} - تاريخ الاستحقاق: {schedule.next_due_date}")
-        
-        created_count = 0
-        
-        for schedule in due_schedules:
-            try:
-                # التحقق من عدم وجود بلاغ صيانة وقائية مفتوح للجهاز
-                existing_request = ServiceRequest.objects.filter(
-                    device=schedule.device,
-                    request_type='preventive',
-                    status__in=['new', 'assigned', 'in_progress']
-                ).exists()
-                
-                if existing_request:
-                    logger.info(f"يوجد بلاغ صيانة وقائية مفتوح للجهاز {schedule.device.name} - تم التجاهل")
-                    continue
-                
-                # إنشاء بلاغ الصيانة الوقائية
-                service_request = ServiceRequest.objects.create(
-                    device=schedule.device,
-                    reporter=schedule.created_by,
-                    title=f"صيانة وقائية - {schedule.device.name}",
-                    description=f"صيانة وقائية مجدولة للجهاز {schedule.device.name} - {schedule.job_plan.name if schedule.job_plan else 'صيانة عامة'}",
-                    request_type='preventive',
-                    priority='medium',
-                    status='new',
-                    assigned_to=schedule.assigned_to,
-                    estimated_hours=schedule.job_plan.estimated_hours if schedule.job_plan else 2.0
-                )
-                
-                # إنشاء أمر الشغل (سيتم إنشاؤه تلقائياً بواسطة signal البلاغ)
-                # لكن نتأكد من إنشاؤه يدوياً للتحكم الكامل
-                wo = WorkOrder.objects.create(
-                    service_request=service_request,
-                    title=f"صيانة وقائية - {schedule.device.name}",
-                    description=f"صيانة وقائية مجدولة للجهاز {schedule.device.name} حسب الخطة {schedule.job_plan.name}",
-                    assignee=schedule.assignee,
-                    priority='medium',
-                    wo_type='preventive',
-                    status='new',
-                    created_by=service_request.created_by
-                )
-                
-                # تحديث جدول الصيانة
-                schedule.last_completed_date = today
-                schedule.next_due_date = schedule.calculate_next_due_date()
-                schedule.save(update_fields=['last_completed_date', 'next_due_date'])
-                
-                created_count += 1
-                
-                logger.info(f"تم إنشاء أمر صيانة وقائية {wo.wo_number} للجهاز {schedule.device.name}")
-                
-            except Exception as e:
-                logger.error(f"خطأ في إنشاء أمر الصيانة الوقائية للجدول {schedule.id}: {str(e)}")
-                continue
-        
-        if created_count > 0:
-            logger.info(f"تم إنشاء {created_count} أمر صيانة وقائية جديد")
-        
-        return created_count
-        
+        result = generate_due_pm_work_orders()
+        if result['created'] > 0:
+            logger.info(f"تم إنشاء {result['created']} أمر صيانة وقائية جديد")
+        return result['created']
+
     except Exception as e:
         logger.error(f"خطأ عام في فحص الصيانة الوقائية: {str(e)}")
         return 0
@@ -230,26 +122,25 @@ def auto_create_work_order(sender, instance, created, **kwargs):
             # التحقق من عدم وجود أمر شغل مسبق
             if not instance.work_orders.exists():
                 
-                # تحديد SLA المناسب من المصفوفة
-                sla_definition = None
-                try:
-                    sla_matrix = SLAMatrix.objects.get(
-                        device_category=instance.device.category,
-                        severity=instance.severity,
-                        impact=instance.impact,
-                        priority=instance.priority,
-                        is_active=True
-                    )
-                    sla_definition = sla_matrix.sla_definition
-                except SLAMatrix.DoesNotExist:
+                # تحديد SLA المناسب من المصفوفة (من الفهرس اللي في الذاكرة)
+                from maintenance.sla_resolver import resolver
+                sla_times = None
+                sla_matrix = resolver.lookup(
+                    instance.device.category_id, instance.severity, instance.impact, instance.priority
+                )
+                if sla_matrix:
+                    # الأوقات الأساسية لتعريف SLA المربوط بالخلية
+                    sla_times = (sla_matrix.sla_response_time_hours, sla_matrix.sla_resolution_time_hours)
+                else:
                     # البحث عن SLA افتراضي
-                    from .models import SLADefinition
-                    sla_definition = SLADefinition.objects.filter(is_active=True).first()
+                    sla_definition = resolver.default_definition()
+                    if sla_definition:
+                        sla_times = (sla_definition.response_time_hours, sla_definition.resolution_time_hours)
                 
                 # تحديث البلاغ بمعلومات SLA
-                if sla_definition:
-                    instance.response_due = timezone.now() + timedelta(hours=sla_definition.response_time_hours)
-                    instance.resolution_due = timezone.now() + timedelta(hours=sla_definition.resolution_time_hours)
+                if sla_times:
+                    instance.response_due = timezone.now() + timedelta(hours=sla_times[0])
+                    instance.resolution_due = timezone.now() + timedelta(hours=sla_times[1])
                     instance.save(update_fields=['response_due', 'resolution_due'])
                 
                 # إنشاء أمر الشغل تلقائياً مع المواعيد المجدولة
@@ -319,6 +210,39 @@ def update_service_request_status(sender, instance, created, **kwargs):
             logger.error(f"خطأ في تحديث حالة البلاغ لأمر الشغل {instance.id}: {str(e)}")
 
 
+# ═══════════════════════════════════════════════════════════════
+# KPI SNAPSHOTS - تعليم اللقطات اليومية عند الحذف
+# ═══════════════════════════════════════════════════════════════
+# التعديلات بتتلقط من updated_at في مهمة التجميع، لكن الحذف مالوش أثر فبنعلم اليوم هنا
+
+@receiver(post_delete, sender=WorkOrder)
+def mark_kpi_snapshot_stale_on_work_order_delete(sender, instance, **kwargs):
+    from maintenance.kpi_snapshots import mark_snapshots_stale
+
+    device_id = ServiceRequest.objects.filter(
+        pk=instance.service_request_id
+    ).values_list('device_id', flat=True).first()
+    if instance.created_at:
+        mark_snapshots_stale(device_id, [timezone.localdate(instance.created_at)])
+
+
+@receiver(post_delete, sender=DowntimeEvent)
+def mark_kpi_snapshot_stale_on_downtime_delete(sender, instance, **kwargs):
+    from maintenance.kpi_snapshots import days_between, mark_snapshots_stale
+
+    if instance.start_time:
+        end_time = min(instance.end_time or timezone.now(), timezone.now())
+        mark_snapshots_stale(instance.device_id, days_between(instance.start_time, end_time))
+
+
+@receiver(post_delete, sender=CalibrationRecord)
+def mark_kpi_snapshot_stale_on_calibration_delete(sender, instance, **kwargs):
+    from maintenance.kpi_snapshots import mark_snapshots_stale
+
+    if instance.calibration_date:
+        mark_snapshots_stale(instance.device_id, [instance.calibration_date])
+
+
 @receiver(post_save, sender=DeviceUsageLog)
 def auto_create_maintenance_request(sender, instance, created, **kwargs):
     """
@@ -369,7 +293,44 @@ def auto_create_maintenance_request(sender, instance, created, **kwargs):
 
 
 # تم حذف دوال DowntimeEvent لأنها لم تعد مستخدمة
-# النظام الآن يستخدم DeviceDowntime مع المراقبة التلقائية في tasks.py
+# النظام الآن يستخدم DeviceDowntime اللي بيتفتح ويتقفل من تغييرات الحالة (maintenance.downtime_tracker)
+
+
+# ═══════════════════════════════════════════════════════════════
+# DOWNTIME TRACKER - فتح وإقفال توقف الجهاز مع تغيير حالة أمر الشغل أو البلاغ
+# ═══════════════════════════════════════════════════════════════
+
+@receiver(post_init, sender=WorkOrder)
+@receiver(post_init, sender=ServiceRequest)
+def remember_downtime_status(sender, instance, **kwargs):
+    # الحالة اللي اتحملت من قاعدة البيانات (من غير استعلام لو الحقل مؤجل)
+    instance._downtime_status = instance.__dict__.get('status') if instance.pk else None
+
+
+@receiver(post_save, sender=WorkOrder)
+@receiver(post_save, sender=ServiceRequest)
+def track_downtime_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    from maintenance.downtime_tracker import record_transition
+
+    previous = None if created else getattr(instance, '_downtime_status', None)
+    try:
+        record_transition(instance, previous, instance.status)
+    except Exception as e:
+        logger.error(f"خطأ في تتبع توقف الجهاز لـ {instance}: {str(e)}")
+    instance._downtime_status = instance.status
+
+
+@receiver(post_delete, sender=WorkOrder)
+@receiver(post_delete, sender=ServiceRequest)
+def track_downtime_on_delete(sender, instance, **kwargs):
+    from maintenance.downtime_tracker import record_transition
+
+    try:
+        record_transition(instance, instance.status, None)
+    except Exception as e:
+        logger.error(f"خطأ في تتبع توقف الجهاز لـ {instance}: {str(e)}")
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -377,128 +338,100 @@ def auto_create_maintenance_request(sender, instance, created, **kwargs):
 # ═══════════════════════════════════════════════════════════════
 
 @receiver(post_save, sender=DeviceCategory)
-def auto_generate_sla_matrix_for_category(sender, instance, created, **kwargs):
+def auto_generate_sla_matrix_for_category(sender, instance, created, raw=False, **kwargs):
     """
     إنشاء مصفوفة SLA تلقائياً عند إضافة فئة جهاز جديدة
+    كل الخلايا بتتحسب في الذاكرة وبتتكتب بـ bulk_create واحد
     """
-    if created:
+    if created and not raw:
         try:
-            from .models import SLADefinition, SLAMatrix, SEVERITY_CHOICES, IMPACT_CHOICES, PRIORITY_CHOICES
-            
-            # الحصول على جميع تعريفات SLA الموجودة (المنشأة يدوياً)
-            available_slas = list(SLADefinition.objects.all())
-            
-            if not available_slas:
+            from maintenance.sla_matrix import sync_sla_matrix
+
+            definitions = list(SLADefinition.objects.all())
+            if not definitions:
                 # إنشاء تعريفات SLA الأساسية إذا لم تكن موجودة
-                sla_definitions = create_default_sla_definitions()
-                available_slas = list(SLADefinition.objects.all())
-            
-            # إنشاء جميع التركيبات: عدد SLA × 4 severity × 4 impact × 4 priority
-            severity_choices = [choice[0] for choice in SEVERITY_CHOICES]
-            impact_choices = [choice[0] for choice in IMPACT_CHOICES]
-            priority_choices = [choice[0] for choice in PRIORITY_CHOICES]
-            
-            created_count = 0
-            
-            # إنشاء مدخل لكل SLA مع كل تركيبة severity + impact بناءً على أولوية SLA
-            for sla in available_slas:
-                # تحديد الأولوية المرتبطة بهذا SLA
-                sla_priority = sla.priority if sla.priority else 'medium'  # افتراضي متوسط
-                
-                for severity in severity_choices:
-                    for impact in impact_choices:
-                        # إنشاء مدخل فقط للأولوية المطابقة لأولوية SLA
-                        matrix_entry, created_entry = SLAMatrix.objects.get_or_create(
-                            device_category=instance,
-                            severity=severity,
-                            impact=impact,
-                            priority=sla_priority,
-                            sla_definition=sla
-                        )
-                        
-                        if created_entry:
-                            created_count += 1
-            
-            logger.info(f"تم إنشاء {created_count} مدخل في مصفوفة SLA للفئة الجديدة: {instance.name}")
-            
+                definitions = list(create_default_sla_definitions().values())
+
+            result = sync_sla_matrix(categories=[instance], definitions=definitions)
+            logger.info(f"تم إنشاء {result['created']} مدخل في مصفوفة SLA للفئة الجديدة: {instance.name}")
+
         except Exception as e:
             logger.error(f"خطأ في إنشاء مصفوفة SLA للفئة الجديدة {instance.name}: {str(e)}")
 
 
 def create_default_sla_definitions():
     """إنشاء تعريفات SLA الافتراضية"""
-    from .models import SLADefinition
-    
     sla_configs = [
         {
             'name': 'حرج - استجابة فورية',
             'description': 'للأجهزة الحرجة في العناية المركزة',
             'response_time_minutes': 5,
             'resolution_time_hours': 1,
-            'escalation_time_minutes': 15,
         },
         {
             'name': 'عالي - استجابة سريعة',
             'description': 'للأجهزة عالية الأولوية',
             'response_time_minutes': 15,
             'resolution_time_hours': 4,
-            'escalation_time_minutes': 30,
         },
         {
             'name': 'متوسط - استجابة عادية',
             'description': 'للأجهزة متوسطة الأولوية',
             'response_time_minutes': 60,
             'resolution_time_hours': 24,
-            'escalation_time_minutes': 120,
         },
         {
             'name': 'منخفض - استجابة مؤجلة',
             'description': 'للأجهزة منخفضة الأولوية',
             'response_time_minutes': 240,
             'resolution_time_hours': 72,
-            'escalation_time_minutes': 480,
         },
     ]
-    
-    sla_definitions = {}
-    
-    for config in sla_configs:
-        sla_def, created = SLADefinition.objects.get_or_create(
+
+    existing = {sla.name: sla for sla in SLADefinition.objects.filter(name__in=[c['name'] for c in sla_configs])}
+    missing = [
+        SLADefinition(
             name=config['name'],
-            defaults={
-                'description': config['description'],
-                'response_time_hours': config['response_time_minutes'] / 60,  # تحويل الدقائق إلى ساعات
-                'resolution_time_hours': config['resolution_time_hours'],
-                'escalation_time_hours': config['escalation_time_minutes'] / 60,
-                'is_active': True,
-                'device_category': None,  # SLA عام لجميع الفئات
-            }
+            description=config['description'],
+            # الحقل بالساعات الصحيحة فأقل من ساعة بيتقرب لساعة
+            response_time_hours=max(1, config['response_time_minutes'] // 60),
+            resolution_time_hours=config['resolution_time_hours'],
+            is_active=True,
+            device_category=None,  # SLA عام لجميع الفئات
         )
-        sla_definitions[config['name']] = sla_def
-        
-        if created:
-            logger.info(f'تم إنشاء تعريف SLA: {config["name"]}')
-    
-    return sla_definitions
+        for config in sla_configs
+        if config['name'] not in existing
+    ]
+    # bulk_create مش بيبعت post_save، فالمصفوفة بيولدها اللي نادى الدالة مرة واحدة
+    for sla_def in SLADefinition.objects.bulk_create(missing):
+        existing[sla_def.name] = sla_def
+        logger.info(f'تم إنشاء تعريف SLA: {sla_def.name}')
+
+    return {config['name']: existing[config['name']] for config in sla_configs}
 
 
 @receiver(post_save, sender=SLADefinition)
-def auto_update_existing_matrix_entries(sender, instance, created, **kwargs):
+def auto_update_existing_matrix_entries(sender, instance, created, raw=False, **kwargs):
     """
-    تحديث مدخلات المصفوفة الموجودة عند تحديث تعريف SLA
+    مزامنة مصفوفة SLA عند إنشاء أو تحديث تعريف SLA:
+    التعريف الجديد بياخد خلاياه في كل الفئات، والتعريف المحدث
+    بتتحسب أوقات خلاياه الموجودة من جديد
     """
-    if not created:  # فقط عند التحديث
-        try:
-            from .models import SLAMatrix
-            
-            # تحديث جميع مدخلات المصفوفة التي تستخدم هذا التعريف
-            updated_count = SLAMatrix.objects.filter(sla_definition=instance).count()
-            
-            if updated_count > 0:
-                logger.info(f"تم تحديث {updated_count} مدخل في مصفوفة SLA بعد تحديث التعريف: {instance.name}")
-                
-        except Exception as e:
-            logger.error(f"خطأ في تحديث مدخلات المصفوفة بعد تحديث التعريف {instance.name}: {str(e)}")
+    if raw:
+        return
+    try:
+        from maintenance.sla_matrix import sync_sla_matrix
+
+        result = sync_sla_matrix(definitions=[instance], create=created, recalculate=not created)
+        changed = result['created'] + result['updated'] + result['deactivated']
+        if changed:
+            logger.info(
+                f"مصفوفة SLA بعد حفظ التعريف {instance.name}: "
+                f"{result['created']} جديد، {result['updated']} محدث، {result['deactivated']} موقوف"
+            )
+
+    except Exception as e:
+        logger.error(f"خطأ في تحديث مدخلات المصفوفة بعد تحديث التعريف {instance.name}: {str(e)}")
 
 
 def generate_sla_matrix_for_existing_categories():
@@ -506,65 +439,204 @@ def generate_sla_matrix_for_existing_categories():
     إنشاء مصفوفة SLA للفئات الموجودة التي لا تحتوي على مصفوفة
     """
     try:
-        from .models import DeviceCategory, SLADefinition, SLAMatrix, SEVERITY_CHOICES, IMPACT_CHOICES
-        
-        # الحصول على جميع تعريفات SLA الموجودة (المنشأة يدوياً)
-        available_slas = list(SLADefinition.objects.all())
-        
-        if not available_slas:
+        from maintenance.sla_matrix import sync_sla_matrix
+
+        definitions = list(SLADefinition.objects.all())
+        if not definitions:
             # إنشاء تعريفات SLA الأساسية إذا لم تكن موجودة
-            sla_definitions = create_default_sla_definitions()
-            available_slas = list(SLADefinition.objects.all())
-        
+            definitions = list(create_default_sla_definitions().values())
+
         # الحصول على الفئات التي لا تحتوي على مصفوفة SLA
-        categories_without_matrix = DeviceCategory.objects.filter(
-            slamatrix__isnull=True
-        ).distinct()
-        
-        if not categories_without_matrix.exists():
+        categories_without_matrix = list(
+            DeviceCategory.objects.filter(slamatrix__isnull=True).values_list('pk', flat=True)
+        )
+
+        if not categories_without_matrix:
             logger.info("جميع فئات الأجهزة تحتوي على مصفوفة SLA")
             return 0
-        
-        # إنشاء جميع التركيبات الممكنة: 4 severity × 4 impact × 4 priority مع SLA ثابت لكل تركيبة
-        severity_choices = [choice[0] for choice in SEVERITY_CHOICES]
-        impact_choices = [choice[0] for choice in IMPACT_CHOICES]
-        priority_choices = [choice[0] for choice in PRIORITY_CHOICES]
-        
-        sla_rules = []
-        
-        # إنشاء مدخل لكل SLA مع كل تركيبة severity + impact بناءً على أولوية SLA
-        for sla in available_slas:
-            # تحديد الأولوية المرتبطة بهذا SLA
-            sla_priority = sla.priority if sla.priority else 'medium'  # افتراضي متوسط
-            
-            for severity in severity_choices:
-                for impact in impact_choices:
-                    # إنشاء مدخل فقط للأولوية المطابقة لأولوية SLA
-                    sla_rules.append((severity, impact, sla_priority, sla))
-        
-        total_created = 0
-        
-        for category in categories_without_matrix:
-            created_count = 0
-            
-            for severity, impact, priority, sla in sla_rules:
-                matrix_entry, created_entry = SLAMatrix.objects.get_or_create(
-                    device_category=category,
-                    severity=severity,
-                    impact=impact,
-                    priority=priority,
-                    sla_definition=sla
-                )
-                
-                if created_entry:
-                    created_count += 1
-            
-            total_created += created_count
-            logger.info(f"تم إنشاء {created_count} مدخل في مصفوفة SLA للفئة: {category.name}")
-        
+
+        total_created = sync_sla_matrix(categories=categories_without_matrix, definitions=definitions)['created']
         logger.info(f"تم إنشاء {total_created} مدخل إجمالي في مصفوفة SLA للفئات الموجودة")
         return total_created
-        
+
     except Exception as e:
         logger.error(f"خطأ في إنشاء مصفوفة SLA للفئات الموجودة: {str(e)}")
         return 0
+
+
+# ═══════════════════════════════════════════════════════════════
+# SLA RESOLVER - إصدار جديد لفهرس SLA اللي في الذاكرة
+# ═══════════════════════════════════════════════════════════════
+
+@receiver([post_save, post_delete], sender=SLAMatrix)
+@receiver([post_save, post_delete], sender=SLADefinition)
+@receiver([post_save, post_delete], sender=JobPlan)
+def invalidate_sla_resolver(sender, **kwargs):
+    from django.db import transaction
+    from maintenance.sla_resolver import invalidate
+    # لو اتحمل قبل الـ commit هيتحمل من غير التعديل
+    transaction.on_commit(invalidate)
+
+
+# ═══════════════════════════════════════════════════════════════
+# QR OPERATIONS - إصدار جديد لشجرة مطابقة العمليات
+# ═══════════════════════════════════════════════════════════════
+
+@receiver([post_save, post_delete], sender=OperationDefinition)
+@receiver([post_save, post_delete], sender=OperationStep)
+def invalidate_qr_operation_matcher(sender, **kwargs):
+    from django.db import transaction
+    from maintenance.qr_operation_matcher import invalidate
+    # لو اتبنت قبل الـ commit هتتبني من غير التعديل
+    transaction.on_commit(invalidate)
+
+
+# ═══════════════════════════════════════════════════════════════
+# PM FORECAST - تحديث مواعيد الجدول المتغير بس في تقويم التوقعات
+# ═══════════════════════════════════════════════════════════════
+
+@receiver(post_save, sender=PreventiveMaintenanceSchedule)
+def sync_pm_forecast_for_schedule(sender, instance, **kwargs):
+    # الحذف بيمسح المواعيد بالـ CASCADE
+    from maintenance.pm_forecast import sync_forecast
+
+    sync_forecast([instance])
+
+
+@receiver(post_save, sender=JobPlan)
+def sync_pm_forecast_for_job_plan(sender, instance, created, **kwargs):
+    # الساعات المقدرة متخزنة مع كل موعد
+    if not created:
+        from maintenance.pm_forecast import sync_forecast
+
+        sync_forecast(instance.pm_schedules.values_list('pk', flat=True))
+
+
+# ═══════════════════════════════════════════════════════════════
+# DASHBOARD CACHE - إبطال كاش الداشبورد للقسم المتأثر بس
+# ═══════════════════════════════════════════════════════════════
+
+@receiver([post_save, post_delete], sender=WorkOrder)
+def invalidate_dashboard_cache_for_work_order(sender, instance, **kwargs):
+    from maintenance.dashboard_cache import invalidate_service_requests
+
+    invalidate_service_requests([instance.service_request_id])
+
+
+@receiver([post_save, post_delete], sender=ServiceRequest)
+@receiver([post_save, post_delete], sender=DowntimeEvent)
+@receiver([post_save, post_delete], sender=CalibrationRecord)
+def invalidate_dashboard_cache_for_device_record(sender, instance, **kwargs):
+    from maintenance.dashboard_cache import invalidate_devices
+
+    invalidate_devices([instance.device_id])
+
+
+@receiver(post_init, sender=Device)
+def remember_dashboard_department(sender, instance, **kwargs):
+    # القسم اللي اتحمل من قاعدة البيانات (من غير استعلام لو الحقل مؤجل)
+    instance._dashboard_department_id = instance.__dict__.get('department_id') if instance.pk else None
+
+
+@receiver(post_save, sender=Device)
+def invalidate_dashboard_cache_for_device(sender, instance, created, **kwargs):
+    # جهاز جديد أو اتنقل لقسم تاني: القسمين بيتبطلوا (القديم بيخسر مؤشرات الجهاز)
+    from maintenance.dashboard_cache import invalidate_department
+
+    previous = getattr(instance, '_dashboard_department_id', None)
+    if created or previous != instance.department_id:
+        if not created:
+            invalidate_department(previous)
+        invalidate_department(instance.department_id)
+    instance._dashboard_department_id = instance.department_id
+
+
+@receiver(post_delete, sender=Device)
+def invalidate_dashboard_cache_for_deleted_device(sender, instance, **kwargs):
+    from maintenance.dashboard_cache import invalidate_department
+
+    invalidate_department(instance.department_id)
+
+
+@receiver([post_save, post_delete], sender=SparePart)
+def invalidate_dashboard_cache_for_spare_part(sender, instance, **kwargs):
+    # قطع الغيار مش مربوطة بقسم فبتأثر على كل الأقسام
+    from maintenance.dashboard_cache import invalidate_all
+
+    invalidate_all()
+
+
+# ═══════════════════════════════════════════════════════════════
+# SEARCH INDEX - تحديث فهرس البحث الموحد مع كل حفظ أو حذف
+# ═══════════════════════════════════════════════════════════════
+
+@receiver(post_save, sender=Device)
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=ServiceRequest)
+@receiver(post_save, sender=SparePart)
+@receiver(post_save, sender=Supplier)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from maintenance.search_index import index_instance
+
+    index_instance(instance)
+
+
+@receiver(post_delete, sender=Device)
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=ServiceRequest)
+@receiver(post_delete, sender=SparePart)
+@receiver(post_delete, sender=Supplier)
+def remove_from_search_index(sender, instance, **kwargs):
+    from maintenance.search_index import remove_instance
+
+    remove_instance(instance)
+
+
+# ═══════════════════════════════════════════════════════════════
+# PERMISSIONS - إبطال لقطات الأدوار والصلاحيات لما المجموعات تتغير
+# ═══════════════════════════════════════════════════════════════
+
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+def invalidate_roles_for_user_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    from maintenance.permissions import invalidate_all_roles, invalidate_user_roles
+
+    if not reverse:
+        invalidate_user_roles([instance.pk])
+    elif pk_set:
+        # التعديل من ناحية المجموعة أو الصلاحية: pk_set فيها أرقام المستخدمين
+        invalidate_user_roles(pk_set)
+    else:
+        # clear من ناحية المجموعة مش بيقول مين اتشال
+        invalidate_all_roles()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_roles_for_group_permissions(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        from maintenance.permissions import invalidate_all_roles
+
+        invalidate_all_roles()
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_roles_for_group(sender, **kwargs):
+    from maintenance.permissions import invalidate_all_roles
+
+    invalidate_all_roles()
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_roles_for_user(sender, instance, **kwargs):
+    # is_superuser و is_active جزء من اللقطة
+    from maintenance.permissions import invalidate_user_roles
+
+    invalidate_user_roles([instance.pk])
@@ -0,0 +1,140 @@
+# توليد مصفوفة SLA مجمعة
+# بدل get_or_create لكل خلية: بنحسب المصفوفة المطلوبة في الذاكرة، ونقارنها بالصفوف الموجودة
+# في استعلام واحد، وبعدين bulk_create للناقص و bulk_update للمتغير جوه transaction واحدة
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    IMPACT_CHOICES, PRIORITY_CHOICES, SEVERITY_CHOICES,
+    DeviceCategory, SLADefinition, SLAMatrix,
+)
+from .sla_resolver import invalidate
+
+SEVERITIES = [choice[0] for choice in SEVERITY_CHOICES]
+IMPACTS = [choice[0] for choice in IMPACT_CHOICES]
+PRIORITIES = [choice[0] for choice in PRIORITY_CHOICES]
+
+BATCH_SIZE = 500
+
+
+def default_rules(definitions):
+    """
+    القاعدة الافتراضية: كل تعريف SLA مع كل تركيبة خطورة × تأثير
+    بأولوية التعريف نفسه (متوسط لو مش محددة)
+    """
+    return [
+        (severity, impact, sla.priority or 'medium', sla)
+        for sla in definitions
+        for severity in SEVERITIES
+        for impact in IMPACTS
+    ]
+
+
+def _cell_key(category_id, severity, impact, priority, sla_id):
+    # نفس أعمدة unique_together بتاعة SLAMatrix
+    return (category_id, severity, impact, priority, sla_id)
+
+
+def sync_sla_matrix(categories=None, definitions=None, rules=None, create=True,
+                    recalculate=False, deactivate_missing=False, dry_run=False):
+    """
+    مزامنة مصفوفة SLA مع الفئات والتعريفات
+
+    categories / definitions: النطاق (الافتراضي كل الفئات وكل التعريفات)
+    rules: قائمة (severity, impact, priority, sla) بدل القاعدة الافتراضية
+    create: إنشاء الخلايا الناقصة
+    recalculate: إعادة حساب الأوقات وحالة التفعيل للخلايا الموجودة من التعريف
+    deactivate_missing: إيقاف الخلايا الموجودة اللي مبقتش مطلوبة (مثلاً أولوية التعريف اتغيرت)
+    dry_run: حساب الفرق بس من غير كتابة
+
+    بترجع عدد الخلايا: created / updated / deactivated / unchanged
+    """
+    if categories is None:
+        category_ids = list(DeviceCategory.objects.values_list('pk', flat=True))
+    else:
+        category_ids = [getattr(category, 'pk', category) for category in categories]
+
+    if definitions is None:
+        definitions = list(SLADefinition.objects.all())
+    else:
+        definitions = list(definitions)
+    definitions_by_id = {sla.pk: sla for sla in definitions}
+
+    if rules is None:
+        rules = default_rules(definitions)
+
+    result = {'created': 0, 'updated': 0, 'deactivated': 0, 'unchanged': 0}
+    if not category_ids or not definitions_by_id:
+        return result
+
+    # الخلايا الموجودة في النطاق في استعلام واحد
+    existing = {
+        _cell_key(cell.device_category_id, cell.severity, cell.impact, cell.priority, cell.sla_definition_id): cell
+        for cell in SLAMatrix.objects.filter(
+            device_category_id__in=category_ids,
+            sla_definition_id__in=list(definitions_by_id),
+        )
+    }
+
+    to_create = []
+    desired = set()
+    for category_id in category_ids:
+        for severity, impact, priority, sla in rules:
+            key = _cell_key(category_id, severity, impact, priority, sla.pk)
+            desired.add(key)
+            if key in existing or not create:
+                continue
+            cell = SLAMatrix(
+                device_category_id=category_id,
+                severity=severity,
+                impact=impact,
+                priority=priority,
+                sla_definition=sla,
+                is_active=sla.is_active,
+            )
+            # bulk_create مش بيعدي على save() فبنحسب الأوقات هنا
+            cell.response_time_hours, cell.resolution_time_hours = cell.calculate_sla_times()
+            to_create.append(cell)
+
+    now = timezone.now()
+    to_update = []
+    for key, cell in existing.items():
+        sla = definitions_by_id[cell.sla_definition_id]
+        cell.sla_definition = sla
+        values = {}
+        if recalculate:
+            values['response_time_hours'], values['resolution_time_hours'] = cell.calculate_sla_times()
+            values['is_active'] = sla.is_active
+        if deactivate_missing and key not in desired:
+            values['is_active'] = False
+
+        changed = {field: value for field, value in values.items() if getattr(cell, field) != value}
+        if not changed:
+            result['unchanged'] += 1
+            continue
+        if changed.get('is_active') is False:
+            result['deactivated'] += 1
+        else:
+            result['updated'] += 1
+        for field, value in changed.items():
+            setattr(cell, field, value)
+        # bulk_update مش بيحدث auto_now
+        cell.updated_at = now
+        to_update.append(cell)
+
+    result['created'] = len(to_create)
+    if dry_run or not (to_create or to_update):
+        return result
+
+    with transaction.atomic():
+        if to_create:
+            SLAMatrix.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        if to_update:
+            SLAMatrix.objects.bulk_update(
+                to_update,
+                ['response_time_hours', 'resolution_time_hours', 'is_active', 'updated_at'],
+                batch_size=BATCH_SIZE,
+            )
+    # bulk_create و bulk_update مش بيبعتوا post_save
+    transaction.on_commit(invalidate)
+    return result
@@ -0,0 +1,152 @@
+# فهرس SLA في الذاكرة لفرز البلاغات
+# مصفوفة SLA كلها (الفئة، الخطورة، التأثير، الأولوية) بتتحمل مرة واحدة في dict صغير،
+# ومعاها تعريفات SLA النشطة وخطط العمل. الإصدار بصمة من القاعدة (maintenance.fingerprint_cache)،
+# فأي حفظ أو حذف من أي عملية بيغير البصمة وكل عملية بتعيد التحميل لما تلاقيها اتغيرت
+from collections import namedtuple
+
+from .fingerprint_cache import FingerprintedCache
+
+# نفس معاملات SLAMatrix.calculate_sla_times (كلما ارتفعت القيمة، قل الوقت المسموح)
+SEVERITY_MULTIPLIERS = {'low': 2.0, 'medium': 1.0, 'high': 0.5, 'critical': 0.25}
+IMPACT_MULTIPLIERS = {'minimal': 2.0, 'moderate': 1.0, 'significant': 0.5, 'extensive': 0.25}
+PRIORITY_MULTIPLIERS = {'low': 2.0, 'medium': 1.0, 'high': 0.5, 'critical': 0.25}
+
+# أوقات أساسية لما مفيش خلية في المصفوفة
+DEFAULT_BASE_RESPONSE_HOURS = 12
+DEFAULT_BASE_RESOLUTION_HOURS = 36
+
+# أسماء الحقول زي الموديل عشان الكود القديم اللي بيقرا sla.response_time_hours يشتغل زي ما هو
+SLAMatch = namedtuple('SLAMatch', [
+    'matrix_id', 'response_time_hours', 'resolution_time_hours',
+    'sla_definition_id', 'sla_name', 'sla_response_time_hours', 'sla_resolution_time_hours',
+])
+SLADefinitionRow = namedtuple('SLADefinitionRow', [
+    'id', 'name', 'device_category_id', 'response_time_hours', 'resolution_time_hours',
+])
+
+
+def default_sla_times(severity, impact, priority,
+                      base_response=DEFAULT_BASE_RESPONSE_HOURS, base_resolution=DEFAULT_BASE_RESOLUTION_HOURS):
+    """أوقات (استجابة، حل) محسوبة من المعاملات لما مفيش خلية في المصفوفة"""
+    final_multiplier = (
+        SEVERITY_MULTIPLIERS.get(severity, 1.0)
+        + IMPACT_MULTIPLIERS.get(impact, 1.0)
+        + PRIORITY_MULTIPLIERS.get(priority, 1.0)
+    ) / 3
+    return max(1, int(base_response * final_multiplier)), max(2, int(base_resolution * final_multiplier))
+
+
+class SLAResolver(FingerprintedCache):
+    """
+    إجابات SLA من الذاكرة
+    كل جزء (المصفوفة، التعريفات، خطط العمل) بيتحمل في استعلام واحد أول ما حد يحتاجه
+    """
+
+    models = ('maintenance.SLAMatrix', 'maintenance.SLADefinition', 'maintenance.JobPlan')
+    check_interval_setting = 'CMMS_SLA_RESOLVER_CHECK_INTERVAL'
+
+    # ────────────────────────────  التحميل  ────────────────────────────
+
+    def _load_matrix(self):
+        from .models import SLAMatrix
+
+        matrix = {}
+        rows = SLAMatrix.objects.filter(is_active=True).order_by('pk').values_list(
+            'pk', 'device_category_id', 'severity', 'impact', 'priority',
+            'response_time_hours', 'resolution_time_hours', 'sla_definition_id', 'sla_definition__name',
+            'sla_definition__response_time_hours', 'sla_definition__resolution_time_hours',
+        )
+        for pk, category_id, severity, impact, priority, *values in rows:
+            # أول خلية بالـ pk زي .filter(...).first()
+            matrix.setdefault((category_id, severity, impact, priority), SLAMatch(pk, *values))
+        return matrix
+
+    def _load_definitions(self):
+        from .models import SLADefinition
+
+        # بنفس ترتيب الموديل عشان "أول تعريف نشط" يفضل هو هو
+        ordering = SLADefinition._meta.ordering or ['pk']
+        rows = SLADefinition.objects.filter(is_active=True).order_by(*ordering, 'pk').values_list(
+            'pk', 'name', 'device_category_id', 'response_time_hours', 'resolution_time_hours',
+        )
+        return {row[0]: SLADefinitionRow(*row) for row in rows}
+
+    def _load_job_plan_hours(self):
+        from .models import JobPlan
+
+        ordering = JobPlan._meta.ordering or ['pk']
+        hours = {}
+        rows = JobPlan.objects.filter(is_active=True).order_by(*ordering, 'pk').values_list(
+            'device_category_id', 'estimated_hours',
+        )
+        for category_id, estimated_hours in rows:
+            hours.setdefault(category_id, estimated_hours)
+        return hours
+
+    @property
+    def matrix(self):
+        """{(category_id, severity, impact, priority): SLAMatch}"""
+        return self.section('matrix', self._load_matrix)
+
+    @property
+    def definitions(self):
+        """{pk: SLADefinitionRow} للتعريفات النشطة بترتيب الموديل"""
+        return self.section('definitions', self._load_definitions)
+
+    @property
+    def job_plan_hours(self):
+        """{category_id: estimated_hours} لأول خطة عمل نشطة في كل فئة"""
+        return self.section('job_plan_hours', self._load_job_plan_hours)
+
+    # ────────────────────────────  الأسئلة  ────────────────────────────
+
+    def lookup(self, category_id, severity, impact, priority):
+        """خلية المصفوفة النشطة أو None"""
+        return self.matrix.get((category_id, severity, impact, priority))
+
+    def definition(self, definition_id):
+        return self.definitions.get(definition_id)
+
+    def default_definition(self):
+        """أول تعريف SLA نشط (نفس SLADefinition.objects.filter(is_active=True).first())"""
+        return next(iter(self.definitions.values()), None)
+
+    def category_definitions(self):
+        """{category_id: SLADefinitionRow} لأول تعريف نشط مربوط بكل فئة"""
+        result = {}
+        for row in self.definitions.values():
+            if row.device_category_id is not None:
+                result.setdefault(row.device_category_id, row)
+        return result
+
+    def resolve_times(self, category_id, severity, impact, priority):
+        """
+        (استجابة، حل، الخلية) للبلاغ
+        من المصفوفة لو فيه خلية، وإلا الحساب الافتراضي والخلية None
+        """
+        match = self.lookup(category_id, severity, impact, priority)
+        if match is not None:
+            return match.response_time_hours, match.resolution_time_hours, match
+        response, resolution = default_sla_times(severity, impact, priority)
+        return response, resolution, None
+
+    def stats(self):
+        matrix, definitions = self.cached('matrix'), self.cached('definitions')
+        return {
+            'version': self._version,
+            'loads': self.loads,
+            'matrix_cells': len(matrix) if matrix is not None else None,
+            'definitions': len(definitions) if definitions is not None else None,
+        }
+
+
+resolver = SLAResolver()
+
+
+def invalidate():
+    """
+    أي تعديل في المصفوفة أو التعريفات أو خطط العمل: العملية دي بتعيد التحميل فوراً
+    والعمليات التانية بتلاحظ البصمة الجديدة خلال CMMS_SLA_RESOLVER_CHECK_INTERVAL
+    بيتنادى بعد الـ commit عشان التحميل الجاي يشوف التعديل
+    """
+    resolver.clear()
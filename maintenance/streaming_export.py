@@ -0,0 +1,149 @@
+"""
+Streaming exports
+Shared helpers that turn a queryset into an XLSX, CSV or NDJSON download
+without holding the whole result set (or a full in-memory workbook) in memory.
+Rows are read with chunked `iterator()` calls and written as they arrive.
+"""
+
+import csv
+import json
+import os
+import tempfile
+from itertools import chain, islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+WIDTH_SAMPLE_ROWS = 200
+MAX_COLUMN_WIDTH = 50
+FILE_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'ndjson': ('ndjson', 'application/x-ndjson; charset=utf-8'),
+}
+
+
+def iter_rows(queryset, row_func, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield `row_func(obj)` for every object, reading the queryset in chunks"""
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield row_func(obj)
+
+
+def _attachment(response, filename):
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _cell_text(value):
+    return '' if value is None else str(value)
+
+
+def sample_column_widths(headers, rows):
+    """Column widths from the header and a sample of rows (the old code rescanned every cell)"""
+    widths = [len(str(header)) for header in headers]
+    for row in rows:
+        for index, value in enumerate(row[:len(widths)]):
+            widths[index] = max(widths[index], len(_cell_text(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+# ────────────────────────────  CSV / NDJSON  ────────────────────────────
+
+class _Echo:
+    """File-like object whose write() hands the line back to the csv writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_ndjson(headers, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(headers, row)), ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+
+# ────────────────────────────  XLSX  ────────────────────────────
+
+def _write_xlsx(path, headers, rows, sheet_title):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+
+    # Widths must be set before the first row in write-only mode, so buffer a sample
+    rows = iter(rows)
+    sample = list(islice(rows, WIDTH_SAMPLE_ROWS))
+    for index, width in enumerate(sample_column_widths(headers, sample), 1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        header_cells.append(cell)
+    sheet.append(header_cells)
+
+    for row in chain(sample, rows):
+        sheet.append(list(row))
+    workbook.save(path)
+
+
+def iter_xlsx(headers, rows, sheet_title='Sheet'):
+    """
+    Build the workbook in write-only mode (rows go straight to a temp file)
+    and stream the finished file back in chunks.
+    """
+    handle, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(handle)
+    try:
+        _write_xlsx(path, headers, rows, sheet_title)
+        with open(path, 'rb') as xlsx_file:
+            while True:
+                chunk = xlsx_file.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+# ────────────────────────────  Responses  ────────────────────────────
+
+def export_response(export_format, filename, headers, rows, sheet_title='Sheet'):
+    """
+    StreamingHttpResponse for `rows` (an iterable of lists) in xlsx, csv or ndjson.
+    `filename` is given without extension.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    extension, content_type = EXPORT_FORMATS[export_format]
+
+    if export_format == 'xlsx':
+        content = iter_xlsx(headers, rows, sheet_title=sheet_title)
+    elif export_format == 'csv':
+        content = iter_csv(headers, rows)
+    else:
+        content = iter_ndjson(headers, rows)
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    return _attachment(response, f"{filename}.{extension}")
+
+
+def json_response(filename, data, indent=2):
+    """Stream a JSON document with iterencode instead of one big json.dumps string"""
+    encoder = json.JSONEncoder(ensure_ascii=False, indent=indent, default=str)
+    response = StreamingHttpResponse(encoder.iterencode(data), content_type='application/json; charset=utf-8')
+    return _attachment(response, filename)
@@ -1,11 +1,9 @@
 """
 مهام الخلفية للصيانة - Background Tasks for Maintenance
-يحتوي على المهام التي تعمل في الخلفية لإدارة الصيانة التلقائية
+يحتوي على أجسام المهام الدورية لإدارة الصيانة التلقائية
+الجدولة والتنفيذ بيتموا من طابور المهام في maintenance.job_queue
 """
 
-import threading
-import time
-import schedule
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
@@ -15,63 +13,10 @@ logger = logging.getLogger(__name__)
 
 class MaintenanceTaskRunner:
     """
-    مدير المهام التلقائية للصيانة
-    يشغل المهام في الخلفية بدون الحاجة لتدخل بشري
+    أجسام المهام التلقائية للصيانة
+    كل دالة بتسجل الخطأ وترفعه عشان طابور المهام يسجل الفشل ويعيد المحاولة
     """
     
-    def __init__(self):
-        self.running = False
-        self.thread = None
-        
-    def start(self):
-        """بدء تشغيل المهام التلقائية"""
-        if not self.running:
-            self.running = True
-            self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
-            self.thread.start()
-            logger.info("تم بدء تشغيل مهام الصيانة التلقائية")
-    
-    def stop(self):
-        """إيقاف المهام التلقائية"""
-        self.running = False
-        if self.thread:
-            self.thread.join()
-        logger.info("تم إيقاف مهام الصيانة التلقائية")
-    
-    def _run_scheduler(self):
-        """تشغيل الجدولة في الخلفية"""
-        # جدولة المهام بأوقات منطقية
-        
-        # فحص الصيانة الوقائية كل 6 ساعات
-        schedule.every(6).hours.do(self._check_pm_schedules)
-        
-        # فحص انتهاكات SLA كل 30 دقيقة
-        schedule.every(30).minutes.do(self._check_sla_violations)
-        
-        # الفحص اليومي للصيانة مرة واحدة يومياً في الساعة 8 صباحاً
-        schedule.every().day.at("08:00").do(self._daily_maintenance_check)
-        
-        # إرسال التقارير اليومية في الساعة 9 مساءً
-        schedule.every().day.at("21:00").do(self._send_daily_reports)
-        
-        # مراقبة التوقف كل ساعة
-        schedule.every(1).hours.do(self._monitor_downtime_schedules)
-        
-        # فحص المعايرات مرة يومياً في الساعة 9 صباحاً
-        schedule.every().day.at("09:00").do(self._check_calibration_schedules)
-        
-        logger.info("تم إعداد جدولة المهام التلقائية")
-        
-        while self.running:
-            try:
-                # تشغيل المهام المجدولة
-                schedule.run_pending()
-                time.sleep(60)  # فحص كل دقيقة
-            except Exception as e:
-                error_time = timezone.now()
-                logger.error(f"خطأ في تشغيل المهام المجدولة في {error_time}: {str(e)}")
-                time.sleep(60)  # انتظار دقيقة واحدة عند حدوث خطأ
-    
     def _check_pm_schedules(self):
         """فحص جداول الصيانة الوقائية وإنشاء أوامر الشغل"""
         try:
@@ -80,6 +25,7 @@ class MaintenanceTaskRunner:
             logger.info(f"فحص الصيانة الوقائية تم بنجاح: {result}")
         except Exception as e:
             logger.error(f"خطأ في فحص الصيانة الوقائية: {str(e)}")
+            raise
     
     def _check_sla_violations(self):
         """فحص انتهاكات SLA وإرسال تنبيهات"""
@@ -94,10 +40,15 @@ class MaintenanceTaskRunner:
                 created_at__lt=now - timedelta(days=7)  # استخدام created_at بدلاً من resolution_due
             )
             
+            alerts = []
             for request in overdue_requests:
                 logger.warning(f"بلاغ متأخر: {request.id} - {request.title}")
-                # إرسال تنبيه للمسؤولين
-                self._send_sla_violation_alert(request)
+                # تنبيه للمسؤولين (بيتبعت من طابور الإشعارات)
+                alerts.extend(self._sla_violation_alerts(request))
+            
+            if alerts:
+                from .notification_dispatch import enqueue_notifications
+                enqueue_notifications(alerts)
             
             # فحص أوامر الشغل المتأخرة
             overdue_work_orders = WorkOrder.objects.filter(
@@ -110,6 +61,7 @@ class MaintenanceTaskRunner:
                 
         except Exception as e:
             logger.error(f"خطأ في فحص انتهاكات SLA: {str(e)}")
+            raise
     
     def _daily_maintenance_check(self):
         """الفحص اليومي للصيانة"""
@@ -136,6 +88,7 @@ class MaintenanceTaskRunner:
                 
         except Exception as e:
             logger.error(f"خطأ في الفحص اليومي: {str(e)}")
+            raise
     
     def _send_daily_reports(self):
         """إرسال التقارير اليومية"""
@@ -152,309 +105,129 @@ class MaintenanceTaskRunner:
             
         except Exception as e:
             logger.error(f"خطأ في إرسال التقارير اليومية: {str(e)}")
+            raise
     
-    def _send_sla_violation_alert(self, service_request):
-        """إرسال تنبيه انتهاك SLA"""
+    def _process_notification_queue(self):
+        """إرسال طابور الإشعارات على دفعات"""
         try:
-            from .models import SystemNotification
-            
-            SystemNotification.objects.create(
-                title="انتهاك SLA",
-                message=f"البلاغ {service_request.id} متأخر عن الموعد المحدد",
-                notification_type='sla_violation',
-                priority='high',
-                related_object_type='service_request',
-                related_object_id=service_request.id
-            )
-            
+            from .notification_dispatch import dispatch_pending
+            result = dispatch_pending()
+            logger.info(f"معالجة طابور الإشعارات تمت بنجاح: {result}")
         except Exception as e:
-            logger.error(f"خطأ في إرسال تنبيه SLA: {str(e)}")
-
-    def _monitor_downtime_schedules(self):
-        """مراقبة جداول التوقف لأوامر الشغل وطلبات الخدمة"""
+            logger.error(f"خطأ في معالجة طابور الإشعارات: {str(e)}")
+            raise
+    
+    def _render_qr_images(self):
+        """رسم صور QR الناقصة على دفعات (الحفظ بيحط التوكن بس)"""
         try:
-            from .models import WorkOrder, ServiceRequest, DeviceDowntime
-            from decimal import Decimal
-            
-            now = timezone.now()
-            
-            # فحص أوامر الشغل النشطة (التي لها جهاز مرتبط عبر طلب الخدمة)
-            active_work_orders = WorkOrder.objects.filter(
-                status__in=['new', 'assigned', 'in_progress'],
-                service_request__device__isnull=False
-            ).select_related('service_request__device')
-            
-            # فحص طلبات الخدمة النشطة
-            active_service_requests = ServiceRequest.objects.filter(
-                status__in=['new', 'assigned', 'in_progress'],
-                device__isnull=False
-            ).select_related('device')
-            
-            processed_count = 0
-            
-            # معالجة أوامر الشغل
-            for wo in active_work_orders:
-                device = wo.service_request.device
-                processed_count += self._process_device_downtime(device, wo, None, now)
-            
-            # معالجة طلبات الخدمة التي ليس لها أوامر شغل نشطة
-            for sr in active_service_requests:
-                # التحقق من عدم وجود أوامر شغل نشطة لهذا الطلب
-                has_active_wo = sr.work_orders.filter(
-                    status__in=['new', 'assigned', 'in_progress']
-                ).exists()
-                
-                if not has_active_wo:
-                    processed_count += self._process_device_downtime(sr.device, None, sr, now)
-            
-            # فحص وإنهاء سجلات التوقف للأعمال المكتملة
-            ended_count = self._end_completed_downtimes(now)
-            
-            if processed_count > 0:
-                logger.info(f"تم معالجة {processed_count} جهاز في مراقبة التوقف")
-                
-            if ended_count > 0:
-                logger.info(f"تم إنهاء {ended_count} سجل توقف للأعمال المكتملة")
-                
+            from core.qr_render import render_pending
+            result = render_pending()
+            logger.info(f"رسم صور QR تم بنجاح: {result}")
         except Exception as e:
-            logger.error(f"خطأ في مراقبة جداول التوقف: {str(e)}")
-
-    def _process_device_downtime(self, device, work_order, service_request, current_time):
-        """معالجة توقف جهاز واحد"""
+            logger.error(f"خطأ في رسم صور QR: {str(e)}")
+            raise
+    
+    def _ingest_zkteco_attendance(self):
+        """سحب البصمات الجديدة من أجهزة ZKTeco النشطة"""
         try:
-            from .models import DeviceDowntime
-            
-            # البحث عن توقف نشط للجهاز
-            active_downtime = DeviceDowntime.objects.filter(
-                device=device,
-                end_time__isnull=True
-            ).first()
-            
-            if active_downtime:
-                # تحديث التوقف الموجود
-                return self._update_existing_downtime(active_downtime, work_order, service_request, current_time)
-            else:
-                # إنشاء توقف جديد
-                return self._create_new_downtime(device, work_order, service_request, current_time)
-                
+            from hr.zkteco_ingest import ingest_all
+            results = ingest_all()
+            failed = sum(1 for result in results if 'error' in result)
+            logger.info(f"سحب الحضور من {len(results)} جهاز ZKTeco تم ({failed} فشل)")
         except Exception as e:
-            logger.error(f"خطأ في معالجة توقف الجهاز {device.id}: {str(e)}")
-            return 0
-
-    def _update_existing_downtime(self, downtime, work_order, service_request, current_time):
-        """تحديث توقف موجود"""
+            logger.error(f"خطأ في سحب الحضور من ZKTeco: {str(e)}")
+            raise
+    
+    def _replay_scan_audit_spool(self):
+        """كتابة سجلات المسح اللي فضلت في spool عمليات وقفت فجأة"""
         try:
-            updated = False
-            
-            # تحديث أمر الشغل إذا لم يكن مربوط
-            if work_order and not downtime.work_order:
-                downtime.work_order = work_order
-                updated = True
-                
-            # تحديث السبب والوصف حسب نوع العمل
-            if work_order:
-                new_reason = self._determine_downtime_reason(work_order.wo_type)
-                if downtime.reason != new_reason:
-                    downtime.reason = new_reason
-                    updated = True
-                    
-                if not downtime.description and work_order.description:
-                    downtime.description = f"أمر شغل: {work_order.title} - {work_order.description}"
-                    updated = True
-                    
-            elif service_request:
-                if not downtime.description and service_request.description:
-                    downtime.description = f"طلب خدمة: {service_request.title} - {service_request.description}"
-                    updated = True
-            
-            if updated:
-                downtime.save()
-                return 1
-                
+            from .scan_audit import replay_spool
+            written = replay_spool()
+            if written:
+                logger.info(f"اتكتب {written} سجل مسح QR من الـ spool")
         except Exception as e:
-            logger.error(f"خطأ في تحديث التوقف الموجود: {str(e)}")
-            
-        return 0
+            logger.error(f"خطأ في استرجاع سجلات المسح: {str(e)}")
+            raise
+    
+    def _expire_scan_sessions(self):
+        """قفل جلسات المسح الخاملة وكتابة صفوف ScanHistory المعلقة بتاعتها"""
+        try:
+            from .scan_session_state import expire_idle_sessions
+            result = expire_idle_sessions()
+            if result['expired']:
+                logger.info(f"اتقفلت {result['expired']} جلسة مسح خاملة واتكتب {result['history_rows']} صف تاريخ")
+        except Exception as e:
+            logger.error(f"خطأ في قفل جلسات المسح الخاملة: {str(e)}")
+            raise
+    
+    def _rollup_qr_scans(self):
+        """تجميع مسحات QR الجديدة بالساعة وتنظيف السجلات الخام القديمة"""
+        try:
+            from .scan_rollups import compact, rollup_scans
+            result = rollup_scans()
+            cleanup = compact()
+            logger.info(f"تجميع مسحات QR تم بنجاح: {result} - التنظيف: {cleanup}")
+        except Exception as e:
+            logger.error(f"خطأ في تجميع مسحات QR: {str(e)}")
+            raise
+    
+    def _sla_violation_alerts(self, service_request):
+        """تنبيهات انتهاك SLA لمقدم البلاغ والفني المعين (من غير حفظ)"""
+        from .models import SystemNotification
+        
+        recipient_ids = {service_request.reporter_id, service_request.assigned_to_id} - {None}
+        return [
+            SystemNotification(
+                title="انتهاك SLA",
+                message=f"البلاغ {service_request.id} متأخر عن الموعد المحدد",
+                notification_type='sla_breach',
+                priority='high',
+                recipient_id=recipient_id,
+                service_request=service_request,
+            )
+            for recipient_id in recipient_ids
+        ]
 
-    def _end_completed_downtimes(self, current_time):
-        """إنهاء سجلات التوقف للأعمال المكتملة"""
+    def _monitor_downtime_schedules(self):
+        """
+        مطابقة دورية لسجلات التوقف مع أوامر الشغل وطلبات الخدمة النشطة
+        الفتح والإقفال نفسهم بيحصلوا مع تغيير الحالة (maintenance.downtime_tracker)،
+        والمطابقة بتصلح بس اللي فات على الإشارات
+        """
         try:
-            from .models import DeviceDowntime, WorkOrder, ServiceRequest
+            from .downtime_tracker import reconcile
+            result = reconcile()
             
-            ended_count = 0
-            
-            # البحث عن سجلات التوقف النشطة
-            active_downtimes = DeviceDowntime.objects.filter(
-                end_time__isnull=True
-            ).select_related('work_order', 'device')
-            
-            for downtime in active_downtimes:
-                should_end = False
-                end_reason = ""
+            if result['opened'] > 0:
+                logger.info(f"تم فتح {result['opened']} سجل توقف فات على تغييرات الحالة")
                 
-                # فحص أمر الشغل المرتبط
-                if downtime.work_order:
-                    wo = downtime.work_order
-                    if wo.status in ['completed', 'cancelled', 'closed']:
-                        should_end = True
-                        end_reason = f"تم إنهاء أمر الشغل {wo.wo_number} - الحالة: {wo.get_status_display()}"
-                        # استخدام تاريخ الإكمال الفعلي من أمر الشغل
-                        if hasattr(wo, 'completed_at') and wo.completed_at:
-                            current_time = wo.completed_at
-                        elif hasattr(wo, 'actual_end') and wo.actual_end:
-                            current_time = wo.actual_end
-                        elif wo.updated_at:
-                            current_time = wo.updated_at
-                        # إذا لم يوجد تاريخ إكمال، استخدم الوقت الحالي
+            if result['closed'] > 0:
+                logger.info(f"تم إنهاء {result['closed']} سجل توقف للأعمال المكتملة")
                 
-                # فحص طلبات الخدمة المرتبطة بالجهاز
-                if not should_end:
-                    # البحث عن طلبات خدمة مكتملة للجهاز
-                    completed_srs = ServiceRequest.objects.filter(
-                        device=downtime.device,
-                        status__in=['resolved', 'closed', 'completed']
-                    ).order_by('-resolved_at', '-closed_at', '-updated_at')
-                    
-                    # البحث عن طلبات خدمة نشطة للجهاز
-                    active_srs = ServiceRequest.objects.filter(
-                        device=downtime.device,
-                        status__in=['new', 'assigned', 'in_progress']
-                    )
-                    
-                    # إذا لم توجد طلبات خدمة نشطة ولا أوامر شغل نشطة
-                    if not active_srs.exists():
-                        active_wos = WorkOrder.objects.filter(
-                            service_request__device=downtime.device,
-                            status__in=['new', 'assigned', 'in_progress']
-                        )
-                        
-                        if not active_wos.exists():
-                            should_end = True
-                            end_reason = "لا توجد أعمال نشطة للجهاز"
-                            
-                            # استخدام تاريخ حل آخر طلب خدمة إذا وجد
-                            if completed_srs.exists():
-                                latest_sr = completed_srs.first()
-                                if hasattr(latest_sr, 'resolved_at') and latest_sr.resolved_at:
-                                    current_time = latest_sr.resolved_at
-                                elif hasattr(latest_sr, 'closed_at') and latest_sr.closed_at:
-                                    current_time = latest_sr.closed_at
-                                elif latest_sr.updated_at:
-                                    current_time = latest_sr.updated_at
-                
-                # إنهاء سجل التوقف إذا لزم الأمر
-                if should_end:
-                    downtime.end_time = current_time
-                    
-                    # إضافة ملاحظة الإنهاء مع التاريخ
-                    end_note = f"\n\nتم الإنهاء تلقائياً: {end_reason}\nتاريخ النهاية: {current_time}"
-                    if downtime.description:
-                        downtime.description += end_note
-                    else:
-                        downtime.description = f"تم الإنهاء تلقائياً: {end_reason}\nتاريخ النهاية: {current_time}"
-                    
-                    downtime.save()
-                    ended_count += 1
-                    
-                    logger.info(f"تم إنهاء سجل التوقف {downtime.id} للجهاز {downtime.device.name} في {current_time}")
-            
-            return ended_count
-            
         except Exception as e:
-            logger.error(f"خطأ في إنهاء سجلات التوقف المكتملة: {str(e)}")
-            return 0
+            logger.error(f"خطأ في مراقبة جداول التوقف: {str(e)}")
+            raise
 
-    def _create_new_downtime(self, device, work_order, service_request, current_time):
-        """إنشاء توقف جديد للجهاز"""
+    def _rollup_kpi_snapshots(self):
+        """تحديث لقطات المؤشرات اليومية للأيام المتغيرة"""
         try:
-            from .models import DeviceDowntime
-            from django.contrib.auth import get_user_model
-            
-            User = get_user_model()
-            
-            # تحديد السبب والتأثير
-            reason = 'other'
-            impact_description = 'توقف الجهاز عن العمل'
-            financial_impact = self._get_existing_cost(work_order, service_request)
-            
-            if work_order:
-                reason = self._determine_downtime_reason(work_order.wo_type)
-                description = f"أمر شغل: {work_order.title}"
-                reported_by = work_order.created_by
-            elif service_request:
-                reason = 'breakdown' if service_request.priority in ['high', 'critical'] else 'maintenance'
-                description = f"طلب خدمة: {service_request.title}"
-                reported_by = service_request.requested_by
-            else:
-                description = "توقف تلقائي - تم اكتشافه بواسطة النظام"
-                # استخدام أول مستخدم متاح أو إنشاء مستخدم النظام
-                reported_by = User.objects.filter(is_superuser=True).first()
-                if not reported_by:
-                    reported_by = User.objects.first()
-            
-            # إنشاء سجل التوقف
-            downtime = DeviceDowntime.objects.create(
-                device=device,
-                start_time=current_time,
-                reason=reason,
-                description=description,
-                reported_by=reported_by,
-                work_order=work_order
-            )
-            
-            # إضافة معلومات التأثير والتأثير المالي كملاحظات
-            if financial_impact:
-                impact_notes = f"التأثير: {impact_description}\nالتأثير المالي من أمر الشغل: {financial_impact} ريال"
-            else:
-                impact_notes = f"التأثير: {impact_description}\nالتأثير المالي: غير محدد"
-            if downtime.description:
-                downtime.description += f"\n{impact_notes}"
-            else:
-                downtime.description = impact_notes
-            downtime.save()
-            
-            logger.info(f"تم إنشاء توقف جديد للجهاز {device.name} - السبب: {reason}")
-            
-            return 1
-            
+            from .kpi_snapshots import rollup_kpi_snapshots
+            result = rollup_kpi_snapshots()
+            logger.info(f"تحديث لقطات المؤشرات تم بنجاح: {result}")
         except Exception as e:
-            logger.error(f"خطأ في إنشاء توقف جديد للجهاز {device.id}: {str(e)}")
-            return 0
-
-    def _determine_downtime_reason(self, wo_type):
-        """تحديد سبب التوقف حسب نوع أمر الشغل"""
-        reason_mapping = {
-            'corrective': 'breakdown',
-            'preventive': 'maintenance',
-            'predictive': 'maintenance',
-            'emergency': 'breakdown',
-            'calibration': 'calibration',
-            'inspection': 'maintenance'
-        }
-        return reason_mapping.get(wo_type, 'other')
-
-    def _get_existing_cost(self, work_order, service_request):
-        """استخراج التكلفة الموجودة من أمر الشغل أو طلب الخدمة"""
+            logger.error(f"خطأ في تحديث لقطات المؤشرات: {str(e)}")
+            raise
+    
+    def _sync_pm_forecast(self):
+        """مد تقويم توقعات الصيانة الوقائية مع الأفق ومسح المواعيد اللي عدت"""
         try:
-            if work_order:
-                # محاولة الحصول على التكلفة من أمر الشغل
-                if work_order.total_cost:
-                    return float(work_order.total_cost)
-                elif work_order.labor_cost or work_order.parts_cost:
-                    labor = float(work_order.labor_cost or 0)
-                    parts = float(work_order.parts_cost or 0)
-                    return labor + parts
-                elif work_order.estimated_hours:
-                    # تقدير بناءً على الساعات المقدرة (50 ريال/ساعة كمعدل افتراضي)
-                    return float(work_order.estimated_hours) * 50
-            
-            # إذا لم توجد تكلفة في أمر الشغل أو طلب الخدمة، لا نحسب شيء
-            return None
-            
+            from .pm_forecast import sync_forecast
+            result = sync_forecast()
+            logger.info(f"تحديث تقويم توقعات الصيانة الوقائية تم بنجاح: {result}")
         except Exception as e:
-            logger.error(f"خطأ في استخراج التكلفة الموجودة: {str(e)}")
-            return None
-
+            logger.error(f"خطأ في تحديث تقويم توقعات الصيانة الوقائية: {str(e)}")
+            raise
+    
     def _check_calibration_schedules(self):
         """فحص المعايرات المستحقة وإنشاء Work Orders و Service Requests تلقائياً"""
         try:
@@ -557,6 +330,7 @@ class MaintenanceTaskRunner:
             
         except Exception as e:
             logger.error(f"خطأ في فحص المعايرات المستحقة: {str(e)}")
+            raise
     
     def _get_system_user(self):
         """الحصول على مستخدم النظام للعمليات التلقائية"""
@@ -582,15 +356,35 @@ class MaintenanceTaskRunner:
             return None
 
 
-# إنشاء مثيل عام للمدير
-maintenance_task_runner = MaintenanceTaskRunner()
+# خدمة طابور المهام داخل العملية (لو مفعلة)
+maintenance_job_queue = None
 
 
 def start_maintenance_tasks():
-    """بدء تشغيل مهام الصيانة التلقائية"""
-    maintenance_task_runner.start()
+    """
+    بدء طابور المهام داخل عملية السيرفر (بيتنادى من core.wsgi و core.asgi)
+    شغال افتراضياً وقفل القيادة بيخلي تشغيله في أكتر من عملية آمن
+    CMMS_JOB_QUEUE_AUTOSTART = False بيقفله لما يكون فيه: python manage.py run_job_queue
+    """
+    global maintenance_job_queue
+    if maintenance_job_queue is not None:
+        return
+    if not getattr(settings, 'CMMS_JOB_QUEUE_AUTOSTART', True):
+        logger.info("طابور المهام مش شغال في العملية دي - المهام الدورية محتاجة: python manage.py run_job_queue")
+        return
+    try:
+        from .job_queue import JobQueueService
+        maintenance_job_queue = JobQueueService(
+            concurrency=getattr(settings, 'CMMS_JOB_QUEUE_CONCURRENCY', None)
+        )
+        maintenance_job_queue.start()
+    except Exception as e:
+        logger.error(f"خطأ في بدء مهام الصيانة التلقائية: {str(e)}")
 
 
 def stop_maintenance_tasks():
-    """إيقاف مهام الصيانة التلقائية"""
-    maintenance_task_runner.stop()
+    """إيقاف طابور المهام"""
+    global maintenance_job_queue
+    if maintenance_job_queue is not None:
+        maintenance_job_queue.stop()
+        maintenance_job_queue = None
@@ -0,0 +1,171 @@
+# اختبارات كاش الداشبورد
+# هنا بنتأكد إن النتيجة بتتخزن لكل قسم وإن التعديل بيبطل كاش القسم المتأثر بس
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from maintenance.dashboard_cache import get_cache_stats
+from maintenance.kpi_utils import (
+    calculate_mtbf, calculate_spare_parts_stats, calculate_work_order_stats, get_dashboard_summary,
+)
+from maintenance.models import (
+    DashboardCacheGeneration, Device, DeviceCategory, ServiceRequest, SparePart, WorkOrder,
+)
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class DashboardCacheTest(TestCase):
+    """كاش نتايج kpi_utils لكل قسم"""
+
+    @classmethod
+    def setUpTestData(cls):
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        cls.user = User.objects.create_user(username='cache_user', password='testpass123')
+        cls.category = category = DeviceCategory.objects.create(name='فئة')
+
+        cls.departments, cls.devices = [], []
+        for i in range(2):
+            department = Department.objects.create(name=f'قسم {i}', hospital=hospital)
+            room = Room.objects.create(number=str(i), ward=ward, department=department, room_type='regular_ROOM')
+            cls.departments.append(department)
+            cls.devices.append(Device.objects.create(
+                name=f'جهاز {i}', category=category, department=department, room=room
+            ))
+
+    def setUp(self):
+        cache.clear()
+
+    def add_work_order(self, device):
+        sr = ServiceRequest.objects.create(
+            device=device, reporter=self.user, title='بلاغ', status='assigned', request_type='corrective'
+        )
+        return WorkOrder.objects.create(service_request=sr, title='أمر', created_by=self.user)
+
+    def test_repeated_call_is_served_from_cache(self):
+        department_id = self.departments[0].pk
+        first = calculate_work_order_stats(department_id=department_id)
+
+        # استعلام واحد لأرقام الأجيال بس
+        with self.assertNumQueries(1):
+            self.assertEqual(calculate_work_order_stats(department_id=department_id), first)
+        # القيمة جاية من الـ query string كنص
+        with self.assertNumQueries(1):
+            calculate_work_order_stats(department_id=str(department_id))
+
+        stats = get_cache_stats()['functions']['calculate_work_order_stats']
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_time_window_is_part_of_the_key(self):
+        department_id = self.departments[0].pk
+        calculate_work_order_stats(department_id=department_id, days=30)
+        calculate_work_order_stats(department_id=department_id, days=7)
+
+        self.assertEqual(get_cache_stats()['functions']['calculate_work_order_stats']['misses'], 2)
+
+    def test_work_order_change_invalidates_only_its_department(self):
+        first, second = (department.pk for department in self.departments)
+        before = calculate_work_order_stats(department_id=first)
+        calculate_work_order_stats(department_id=second)
+        calculate_work_order_stats()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_work_order(self.devices[0])
+
+        self.assertEqual(calculate_work_order_stats(department_id=first)['total'], before['total'] + 1)
+        with self.assertNumQueries(1):
+            calculate_work_order_stats(department_id=second)
+        # "كل الأقسام" بتشمل القسم المتعدل
+        stats = get_cache_stats()['functions']['calculate_work_order_stats']
+        calculate_work_order_stats()
+        self.assertEqual(get_cache_stats()['functions']['calculate_work_order_stats']['misses'], stats['misses'] + 1)
+
+    def test_spare_part_change_invalidates_everything(self):
+        before = calculate_spare_parts_stats(department_id=self.departments[0].pk)
+        with self.assertNumQueries(1):
+            calculate_spare_parts_stats(department_id=self.departments[1].pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SparePart.objects.create(
+                part_number='SP-1', name='قطعة', device_category=self.category, current_stock=5, minimum_stock=1,
+                created_by=self.user,
+            )
+        self.assertEqual(calculate_spare_parts_stats()['total_parts'], before['total_parts'] + 1)
+
+    def test_one_bump_per_department_per_transaction(self):
+        # بلاغات وأوامر كتير في نفس الـ transaction = قراية أقسام وزيادة واحدة بعد الـ commit
+        with self.captureOnCommitCallbacks() as callbacks:
+            for _ in range(3):
+                self.add_work_order(self.devices[0])
+            self.add_work_order(self.devices[1])
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(DashboardCacheGeneration.objects.exists())
+
+        with self.assertNumQueries(4):
+            # أقسام الأجهزة + أقسام البلاغات + زيادة الموجود + إنشاء الناقص
+            callbacks[0]()
+        self.assertEqual(
+            dict(DashboardCacheGeneration.objects.values_list('scope', 'generation')),
+            {str(department.pk): 1 for department in self.departments},
+        )
+
+    def test_device_transfer_invalidates_both_departments(self):
+        first, second = (department.pk for department in self.departments)
+        calculate_work_order_stats(department_id=first)
+        calculate_work_order_stats(department_id=second)
+        device = Device.objects.get(pk=self.devices[0].pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            device.name = 'اسم جديد'
+            device.save()
+        with self.assertNumQueries(1):
+            calculate_work_order_stats(department_id=first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            device.department_id = second
+            device.save()
+        calculate_work_order_stats(department_id=first)
+        calculate_work_order_stats(department_id=second)
+        stats = get_cache_stats()['functions']['calculate_work_order_stats']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 4))
+
+    def test_rolled_back_changes_do_not_hold_later_invalidations(self):
+        from django.db import transaction
+
+        try:
+            with transaction.atomic():
+                self.add_work_order(self.devices[0])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.add_work_order(self.devices[1])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            list(DashboardCacheGeneration.objects.values_list('scope', flat=True)), [str(self.departments[1].pk)]
+        )
+
+    def test_generation_lives_in_the_database(self):
+        """إبطال من عملية تانية (كاشها المحلي منفصل) بيوصل عن طريق قاعدة البيانات"""
+        department_id = self.departments[0].pk
+        calculate_mtbf(department_id=department_id)
+        DashboardCacheGeneration.objects.create(scope=str(department_id), generation=7)
+
+        calculate_mtbf(department_id=department_id)
+        stats = get_cache_stats()['functions']['calculate_mtbf']
+        self.assertEqual((stats['hits'], stats['misses']), (0, 2))
+
+    def test_nested_calls_are_counted_once(self):
+        get_dashboard_summary(department_id=self.departments[0].pk)
+
+        stats = get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 1))
+        self.assertEqual(stats['functions']['get_dashboard_summary']['misses'], 1)
+        self.assertEqual(stats['functions']['calculate_reliability_kpis']['misses'], 0)
+        self.assertFalse(stats['shared_cache'])
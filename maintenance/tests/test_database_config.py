@@ -0,0 +1,100 @@
+# اختبارات إعدادات قاعدة البيانات وتوجيه القراءة للنسخة المتماثلة
+# SQLite بـ WAL و busy timeout افتراضياً، و PostgreSQL بالـ pool والـ replica من متغيرات البيئة
+
+from pathlib import Path
+from unittest import mock
+
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from core import database
+from core.database import ReplicaRouter, ReplicaRoutingMiddleware, database_settings, use_replica
+from maintenance.models import Device
+
+BASE_DIR = Path('/srv/hms')
+
+
+class DatabaseSettingsTest(SimpleTestCase):
+    """DATABASES من متغيرات البيئة"""
+
+    def test_sqlite_defaults_to_wal_and_busy_timeout(self):
+        databases = database_settings(BASE_DIR, env={})
+
+        self.assertEqual(list(databases), ['default'])
+        default = databases['default']
+        self.assertEqual(default['NAME'], BASE_DIR / 'db.sqlite3')
+        self.assertEqual(default['OPTIONS']['timeout'], 20)
+        self.assertEqual(default['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA journal_mode=WAL', default['OPTIONS']['init_command'])
+        self.assertIn('PRAGMA synchronous=NORMAL', default['OPTIONS']['init_command'])
+
+        legacy = database_settings(BASE_DIR, env={'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_BUSY_TIMEOUT': '5'})
+        self.assertIn('PRAGMA journal_mode=DELETE', legacy['default']['OPTIONS']['init_command'])
+        self.assertEqual(legacy['default']['OPTIONS']['timeout'], 5)
+
+    def test_postgresql_with_pool_and_replica(self):
+        databases = database_settings(BASE_DIR, env={
+            'DB_ENGINE': 'postgresql', 'DB_NAME': 'hms_prod', 'DB_PASSWORD': 'secret', 'DB_HOST': 'db1',
+            'DB_POOL': '1', 'DB_POOL_MAX_SIZE': '30', 'DB_REPLICA_HOST': 'db2',
+        })
+
+        default, replica = databases['default'], databases['replica']
+        self.assertEqual(default['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(default['OPTIONS']['pool']['max_size'], 30)
+        self.assertEqual(default['CONN_MAX_AGE'], 0)
+        self.assertEqual((replica['HOST'], replica['NAME'], replica['PASSWORD']), ('db2', 'hms_prod', 'secret'))
+        self.assertEqual(replica['TEST'], {'MIRROR': 'default'})
+
+    def test_postgresql_without_pool_keeps_connections(self):
+        databases = database_settings(BASE_DIR, env={'DB_ENGINE': 'postgres'})
+
+        self.assertEqual(list(databases), ['default'])
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 60)
+        self.assertTrue(databases['default']['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('pool', databases['default']['OPTIONS'])
+        with self.assertRaises(ValueError):
+            database_settings(BASE_DIR, env={'DB_ENGINE': 'mysql'})
+
+
+class ReplicaRoutingTest(TestCase):
+    """القراءة للنسخة المتماثلة جوه صفحات الداشبورد بس، والكتابة دايماً للأساسية"""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        patcher = mock.patch.object(database, 'replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sqlite_connection_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    def test_reads_use_replica_only_when_enabled(self):
+        self.assertIsNone(self.router.db_for_read(Device))
+        with use_replica():
+            # TestCase فاتح transaction على الأساسية، فالقراءة بتفضل عليها
+            self.assertEqual(self.router.db_for_read(Device), 'default')
+            with mock.patch.object(connection, 'in_atomic_block', False):
+                self.assertEqual(self.router.db_for_read(Device), 'replica')
+        self.assertEqual(self.router.db_for_write(Device), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'maintenance'))
+        self.assertIsNone(self.router.allow_migrate('default', 'maintenance'))
+
+    def test_middleware_routes_dashboard_reads(self):
+        seen = []
+
+        def view(request):
+            seen.append(database._use_replica.get())
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        factory = RequestFactory()
+        middleware(factory.get('/maintenance/dashboard/api/scans/heatmap/'))
+        middleware(factory.get('/maintenance/department/3/export-report/'))
+        middleware(factory.post('/maintenance/dashboard/api/data/'))
+        middleware(factory.get('/maintenance/api/qr-scan/'))
+
+        self.assertEqual(seen, [True, True, False, False])
+        self.assertFalse(database._use_replica.get())
@@ -0,0 +1,127 @@
+# اختبارات تتبع توقف الأجهزة من تغييرات الحالة
+# التوقف بيتفتح ويتقفل لحظة تغيير الحالة، والمطابقة الدورية بتصلح اللي فات على الإشارات بس
+
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from maintenance.downtime_tracker import reconcile
+from maintenance.models import (
+    Device, DeviceCategory, DeviceDowntime, DowntimeTransition, JobPlan,
+    PreventiveMaintenanceSchedule, ServiceRequest, WorkOrder,
+)
+from maintenance.pm_generation import generate_due_pm_work_orders
+from maintenance.sla_resolver import resolver
+from maintenance.tasks import MaintenanceTaskRunner
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class DowntimeTrackerTest(TestCase):
+    """فتح وإقفال DeviceDowntime مع حالة أوامر الشغل والبلاغات"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='downtime_user', password='testpass123')
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        department = Department.objects.create(name='قسم', hospital=hospital)
+        room = Room.objects.create(number='1', ward=ward, department=department, room_type='regular_ROOM')
+        cls.category = DeviceCategory.objects.create(name='فئة')
+        cls.devices = [
+            Device.objects.create(
+                name=f'جهاز {n}', serial_number=f'DT-{n}', model='M', category=cls.category,
+                department=department, room=room,
+            )
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        resolver.clear()
+
+    def _report(self, device, title='عطل', **kwargs):
+        return ServiceRequest.objects.create(device=device, reporter=self.user, title=title, **kwargs)
+
+    def test_report_opens_downtime_linked_to_its_work_order(self):
+        before = timezone.now()
+        request = self._report(self.devices[0])
+
+        downtime = DeviceDowntime.objects.get(device=self.devices[0])
+        self.assertIsNone(downtime.end_time)
+        self.assertGreaterEqual(downtime.start_time, before)
+        self.assertEqual(downtime.work_order, request.work_orders.get())
+        self.assertEqual(downtime.reason, 'breakdown')
+        self.assertEqual(DowntimeTransition.objects.filter(device=self.devices[0], action='opened').count(), 1)
+
+    def test_resolving_the_work_order_closes_downtime_immediately(self):
+        request = self._report(self.devices[0])
+        work_order = request.work_orders.get()
+
+        work_order.status = 'resolved'
+        work_order.save()
+
+        downtime = DeviceDowntime.objects.get(device=self.devices[0])
+        self.assertIsNotNone(downtime.end_time)
+        self.assertLess(timezone.now() - downtime.end_time, timedelta(minutes=1))
+        closing = DowntimeTransition.objects.get(action='closed')
+        self.assertEqual((closing.downtime, closing.to_status), (downtime, 'resolved'))
+
+    def test_other_active_work_keeps_the_device_down(self):
+        first = self._report(self.devices[0])
+        self._report(self.devices[0], title='عطل تاني')
+
+        work_order = first.work_orders.get()
+        work_order.status = 'closed'
+        work_order.save()
+
+        self.assertEqual(DeviceDowntime.objects.filter(device=self.devices[0], end_time__isnull=True).count(), 1)
+
+    def test_deleting_the_last_active_work_closes_downtime(self):
+        request = self._report(self.devices[0])
+
+        request.delete()
+        self.assertFalse(DeviceDowntime.objects.filter(end_time__isnull=True).exists())
+
+    def test_reconcile_repairs_changes_that_bypassed_signals(self):
+        closed = self._report(self.devices[0])
+        self._report(self.devices[1])
+        ServiceRequest.objects.filter(pk=closed.pk).update(status='closed')
+        WorkOrder.objects.filter(service_request=closed).update(status='closed')
+        # بلاغ نشط من غير إشارات (زي الاستيراد)
+        ServiceRequest.objects.bulk_create([ServiceRequest(
+            device=self.devices[2], reporter=self.user, title='مستورد', status='in_progress',
+        )])
+
+        # أجهزة نشطة (2) + توقفات مفتوحة + مصادر (2) + بداية (2) + إنشاء + نهاية (2) + تحديث + السجل
+        with self.assertNumQueries(12):
+            result = reconcile()
+        self.assertEqual(result, {'opened': 1, 'closed': 1})
+
+        open_devices = set(DeviceDowntime.objects.filter(end_time__isnull=True).values_list('device', flat=True))
+        self.assertEqual(open_devices, {self.devices[1].pk, self.devices[2].pk})
+        self.assertEqual(reconcile(), {'opened': 0, 'closed': 0})
+
+    def test_monitor_task_runs_reconcile(self):
+        self._report(self.devices[0])
+        DeviceDowntime.objects.all().delete()
+
+        MaintenanceTaskRunner()._monitor_downtime_schedules()
+        self.assertTrue(DeviceDowntime.objects.filter(device=self.devices[0], end_time__isnull=True).exists())
+
+    def test_bulk_pm_generation_opens_downtime(self):
+        job_plan = JobPlan.objects.create(name='فحص', device_category=self.category, created_by=self.user)
+        PreventiveMaintenanceSchedule.objects.create(
+            name='جدول', device=self.devices[0], job_plan=job_plan, frequency='monthly',
+            next_due_date=date.today(), created_by=self.user,
+        )
+
+        generate_due_pm_work_orders(notify=False)
+
+        downtime = DeviceDowntime.objects.get(device=self.devices[0])
+        self.assertEqual((downtime.reason, downtime.work_order.wo_type), ('maintenance', 'preventive'))
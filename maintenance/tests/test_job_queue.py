@@ -0,0 +1,176 @@
+# اختبارات طابور المهام
+# هنا بنتأكد إن كل مهمة بتتضاف مرة واحدة بس وإن كل تشغيل بيتسحب بعامل واحد وإن الفشل بيتعاد
+
+from datetime import datetime, time, timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from maintenance.job_queue import (
+    JOB_REGISTRY, acquire_lease, claim_next_run, drain_queue, enqueue_due_jobs, execute_run,
+    job_metrics, next_run_time, queue_is_running, register_job, requeue_stale_runs, scheduler_tick, sync_jobs
+)
+from maintenance.models import JobRun, ScheduledJob
+from maintenance import tasks
+from maintenance.tasks import MaintenanceTaskRunner
+
+
+class JobQueueTest(TestCase):
+    """الجدولة والسحب وإعادة المحاولة"""
+
+    def setUp(self):
+        self.calls = []
+        registry = mock.patch.dict(JOB_REGISTRY, clear=True)
+        registry.start()
+        self.addCleanup(registry.stop)
+
+        register_job('ok_job', lambda: self.calls.append('ok'), interval=timedelta(minutes=30))
+        register_job('bad_job', self.failing, interval=timedelta(hours=1), max_retries=2, retry_backoff_seconds=10)
+        self.now = timezone.now()
+        sync_jobs(self.now)
+        ScheduledJob.objects.update(next_run_at=self.now - timedelta(minutes=1))
+
+    def failing(self):
+        self.calls.append('bad')
+        raise RuntimeError('boom')
+
+    def test_only_lease_holder_schedules(self):
+        self.assertTrue(acquire_lease('a', now=self.now))
+        self.assertFalse(acquire_lease('b', now=self.now))
+        self.assertIsNone(scheduler_tick('b', now=self.now))
+        self.assertEqual(sorted(scheduler_tick('a', now=self.now)), ['bad_job', 'ok_job'])
+
+        # بعد انتهاء القفل عملية تانية تاخد القيادة
+        self.assertTrue(acquire_lease('b', now=self.now + timedelta(minutes=5)))
+
+    def test_due_job_is_enqueued_once(self):
+        self.assertEqual(len(enqueue_due_jobs(self.now)), 2)
+        self.assertEqual(enqueue_due_jobs(self.now), [])
+        self.assertEqual(JobRun.objects.count(), 2)
+        self.assertEqual(
+            ScheduledJob.objects.get(name='ok_job').next_run_at, self.now + timedelta(minutes=30)
+        )
+
+        # المهمة لسه في الطابور فالموعد الجاي مش بيضيف تشغيل تاني
+        self.assertEqual(enqueue_due_jobs(self.now + timedelta(hours=2)), [])
+        self.assertEqual(JobRun.objects.count(), 2)
+
+    def test_run_is_claimed_by_one_worker(self):
+        enqueue_due_jobs(self.now)
+        first = claim_next_run('w1')
+        second = claim_next_run('w2')
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertIsNone(claim_next_run('w3'))
+        self.assertEqual(JobRun.objects.filter(status='running').count(), 2)
+
+    def test_failures_retry_with_backoff(self):
+        ScheduledJob.objects.filter(name='ok_job').update(enabled=False)
+        enqueue_due_jobs(self.now)
+
+        self.assertEqual(drain_queue('w1'), 1)
+        retry = JobRun.objects.get(status='queued')
+        self.assertEqual(retry.attempt, 2)
+        self.assertGreaterEqual(retry.scheduled_for, self.now + timedelta(seconds=10))
+
+        # المهلة بتتضاعف، وبعد max_retries مفيش محاولات تانية
+        JobRun.objects.filter(pk=retry.pk).update(scheduled_for=self.now)
+        drain_queue('w1')
+        retry = JobRun.objects.get(status='queued')
+        self.assertEqual(retry.attempt, 3)
+        JobRun.objects.filter(pk=retry.pk).update(scheduled_for=self.now)
+        drain_queue('w1')
+
+        self.assertEqual(self.calls, ['bad'] * 3)
+        self.assertFalse(JobRun.objects.filter(status='queued').exists())
+        self.assertIn('boom', JobRun.objects.filter(status='failed').first().error)
+
+    def test_run_history_metrics(self):
+        enqueue_due_jobs(self.now)
+        drain_queue('w1')
+
+        metrics = {row['name']: row for row in job_metrics()}
+        self.assertEqual((metrics['ok_job']['runs'], metrics['ok_job']['succeeded']), (1, 1))
+        self.assertEqual(metrics['bad_job']['failed'], 1)
+        self.assertIsNotNone(metrics['ok_job']['avg_ms'])
+        self.assertEqual(ScheduledJob.objects.get(name='ok_job').last_status, 'succeeded')
+
+    def test_stale_running_run_is_retried(self):
+        enqueue_due_jobs(self.now)
+        run = claim_next_run('dead-worker', now=self.now)
+        JobRun.objects.filter(pk=run.pk).update(
+            started_at=self.now - timedelta(hours=2), heartbeat_at=self.now - timedelta(minutes=10)
+        )
+
+        self.assertEqual(requeue_stale_runs(self.now, timeout=timedelta(minutes=2)), 1)
+        self.assertEqual(JobRun.objects.get(pk=run.pk).status, 'failed')
+        self.assertTrue(JobRun.objects.filter(job=run.job, attempt=2, status='queued').exists())
+
+    def test_slow_run_with_live_worker_is_not_retried(self):
+        # المهمة بقالها ساعتين بس العامل لسه بينبض، فمتتعادش وتشتغل مرتين في نفس الوقت
+        enqueue_due_jobs(self.now)
+        run = claim_next_run('slow-worker', now=self.now)
+        JobRun.objects.filter(pk=run.pk).update(
+            started_at=self.now - timedelta(hours=2), heartbeat_at=self.now - timedelta(seconds=20)
+        )
+
+        self.assertEqual(requeue_stale_runs(self.now, timeout=timedelta(minutes=2)), 0)
+        self.assertEqual(JobRun.objects.get(pk=run.pk).status, 'running')
+        self.assertEqual(JobRun.objects.filter(job=run.job).count(), 1)
+
+    def test_late_result_does_not_overwrite_requeued_run(self):
+        enqueue_due_jobs(self.now)
+        run = claim_next_run('slow-worker', now=self.now)
+        JobRun.objects.filter(pk=run.pk).update(heartbeat_at=self.now - timedelta(minutes=10))
+        requeue_stale_runs(self.now, timeout=timedelta(minutes=2))
+
+        execute_run(run)
+        self.assertEqual(JobRun.objects.get(pk=run.pk).status, 'failed')
+        self.assertEqual(JobRun.objects.filter(job=run.job, attempt=2).count(), 1)
+
+    def test_queue_is_running_follows_the_lease(self):
+        self.assertFalse(queue_is_running(self.now))
+        acquire_lease('leader', now=self.now)
+        self.assertTrue(queue_is_running(self.now))
+        self.assertFalse(queue_is_running(self.now + timedelta(minutes=5)))
+
+    def test_daily_job_runs_at_local_time(self):
+        definition = {'run_at': time(8, 0), 'interval': timedelta(days=1)}
+        after = timezone.make_aware(datetime(2026, 3, 1, 9, 0))
+        self.assertEqual(next_run_time(definition, after), timezone.make_aware(datetime(2026, 3, 2, 8, 0)))
+        after = timezone.make_aware(datetime(2026, 3, 1, 7, 0))
+        self.assertEqual(next_run_time(definition, after), timezone.make_aware(datetime(2026, 3, 1, 8, 0)))
+
+
+class DefaultJobsTest(SimpleTestCase):
+    """المهام الافتراضية بتستخدم أجسام MaintenanceTaskRunner الموجودة"""
+
+    def test_default_jobs_point_at_task_bodies(self):
+        self.assertEqual(set(JOB_REGISTRY), {
+            'pm_schedules', 'sla_violations', 'daily_maintenance_check', 'daily_reports',
+            'downtime_monitor', 'calibration_check', 'kpi_snapshots', 'notification_queue',
+            'qr_render', 'pm_forecast', 'scan_audit_spool', 'scan_sessions', 'scan_rollups',
+            'zkteco_ingest',
+        })
+        for definition in JOB_REGISTRY.values():
+            self.assertTrue(hasattr(MaintenanceTaskRunner, definition['func'].__name__))
+
+
+class AutostartTest(SimpleTestCase):
+    """الطابور شغال افتراضياً مع السيرفر وبيتقفل بالإعداد"""
+
+    def setUp(self):
+        service = mock.patch('maintenance.job_queue.JobQueueService')
+        self.service = service.start()
+        self.addCleanup(service.stop)
+        self.addCleanup(setattr, tasks, 'maintenance_job_queue', None)
+
+    def test_starts_by_default(self):
+        tasks.start_maintenance_tasks()
+        tasks.start_maintenance_tasks()
+        self.service.return_value.start.assert_called_once()
+
+    def test_setting_opts_out(self):
+        with self.settings(CMMS_JOB_QUEUE_AUTOSTART=False):
+            tasks.start_maintenance_tasks()
+        self.service.assert_not_called()
@@ -0,0 +1,472 @@
+# اختبارات محرك مؤشرات الأجهزة (MTBF / MTTR / التوفر)
+# هنا بنقارن نتايج DeviceKPIEngine بالحساب القديم (جهاز جهاز) على بيانات مولّدة
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from maintenance.kpi_engine import DeviceKPIEngine
+from maintenance.models import (
+    Device, DeviceCategory, JobPlan, PreventiveMaintenanceSchedule, SLADefinition,
+    ServiceRequest, WorkOrder
+)
+from maintenance.sla_resolver import resolver
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+# ─────────────  الحساب القديم كما كان في kpi_utils (مرجع للمقارنة)  ─────────────
+
+def legacy_calculate_mtbf(device_id=None, department_id=None, days=30):
+    """
+    حساب متوسط الوقت بين الأعطال (MTBF) باستخدام الأوقات الفعلية من Work Orders
+    """
+    # تحديد الفترة الزمنية
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=days)
+    
+    # جلب الأجهزة
+    devices = Device.objects.all()
+    if device_id:
+        devices = devices.filter(id=device_id)
+    if department_id:
+        devices = devices.filter(department_id=department_id)
+    
+    total_mtbf = 0
+    device_count = 0
+    
+    for device in devices:
+        # جلب أوامر الشغل للأعطال التصحيحية والطارئة
+        work_orders = WorkOrder.objects.filter(
+            service_request__device=device,
+            service_request__request_type__in=['corrective', 'breakdown'],
+            created_at__range=[start_date, end_date]
+        ).order_by('created_at')
+        
+        failure_count = work_orders.count()
+        
+        if failure_count >= 2:
+            # حساب الفترات بين الأعطال باستخدام الأوقات الفعلية
+            intervals = []
+            for i in range(1, failure_count):
+                prev_wo = work_orders[i-1]
+                curr_wo = work_orders[i]
+                
+                # استخدام actual_end إذا متوفر، وإلا استخدام created_at
+                prev_end = prev_wo.actual_end if prev_wo.actual_end else prev_wo.created_at
+                curr_start = curr_wo.actual_start if curr_wo.actual_start else curr_wo.created_at
+                
+                interval_hours = (curr_start - prev_end).total_seconds() / 3600
+                if interval_hours > 0:
+                    intervals.append(interval_hours)
+            
+            if intervals:
+                device_mtbf = sum(intervals) / len(intervals)
+                total_mtbf += device_mtbf
+                device_count += 1
+        elif failure_count == 1:
+            # عطل واحد فقط - نحسب من بداية الفترة
+            first_wo = work_orders.first()
+            first_failure = first_wo.actual_start if first_wo.actual_start else first_wo.created_at
+            hours_to_failure = (first_failure - start_date).total_seconds() / 3600
+            if hours_to_failure > 0:
+                total_mtbf += hours_to_failure
+                device_count += 1
+        else:
+            # لا توجد أعطال - الجهاز يعمل بدون مشاكل
+            if device.status == 'working':
+                # نعتبر أن الجهاز عمل طوال الفترة
+                estimated_mtbf = days * 24
+                total_mtbf += estimated_mtbf
+                device_count += 1
+            elif device.status == 'needs_check':
+                estimated_mtbf = days * 20  # 80% من الفترة
+                total_mtbf += estimated_mtbf
+                device_count += 1
+            elif device.status == 'needs_maintenance':
+                estimated_mtbf = days * 12  # 50% من الفترة
+                total_mtbf += estimated_mtbf
+                device_count += 1
+            # نتجاهل الأجهزة المعطلة out_of_order
+    
+    return total_mtbf / device_count if device_count > 0 else 720  # متوسط شهر إذا لم توجد بيانات
+
+def legacy_calculate_mttr(device_id=None, department_id=None, days=30):
+    """
+    حساب متوسط وقت الإصلاح (MTTR) باستخدام الأوقات الفعلية من Work Orders
+    """
+    from maintenance.models import SLADefinition, JobPlan
+    
+    # تحديد الفترة الزمنية
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=days)
+    
+    # جلب أوامر الشغل للأعطال التصحيحية والطارئة
+    work_orders = WorkOrder.objects.filter(
+        created_at__range=[start_date, end_date],
+        service_request__request_type__in=['corrective', 'breakdown']
+    )
+    
+    if device_id:
+        work_orders = work_orders.filter(service_request__device_id=device_id)
+    if department_id:
+        work_orders = work_orders.filter(service_request__device__department_id=department_id)
+    
+    total_repair_time = 0
+    valid_orders = 0
+    
+    for wo in work_orders:
+        repair_time = 0
+        
+        # استخدام actual_hours إذا متوفرة
+        if hasattr(wo, 'actual_hours') and wo.actual_hours:
+            repair_time = float(wo.actual_hours)
+        # استخدام الفرق بين actual_start و actual_end
+        elif wo.actual_start and wo.actual_end:
+            repair_time = (wo.actual_end - wo.actual_start).total_seconds() / 3600
+        # استخدام estimated_hours إذا متوفرة
+        elif hasattr(wo, 'estimated_hours') and wo.estimated_hours:
+            repair_time = float(wo.estimated_hours)
+        # تقدير من الفرق بين created_at و updated_at للأوامر المكتملة
+        elif wo.status in ['closed', 'qa_verified','resolved'] and wo.updated_at and wo.created_at:
+            repair_time = (wo.updated_at - wo.created_at).total_seconds() / 3600
+            # تحديد حد أقصى معقول
+            repair_time = min(repair_time, 72)  # حد أقصى 3 أيام
+        # للأوامر المفتوحة، نحسب الوقت المنقضي حتى الآن
+        elif wo.status in ['new', 'assigned', 'in_progress', 'wait_parts']:
+            repair_time = (timezone.now() - wo.created_at).total_seconds() / 3600
+            # تحديد حد أقصى معقول
+            repair_time = min(repair_time, 48)  # حد أقصى يومين للأوامر المفتوحة
+        else:
+            # تقدير بناءً على الأولوية
+            if wo.service_request.priority == 'critical':
+                repair_time = 2
+            elif wo.service_request.priority == 'high':
+                repair_time = 4
+            elif wo.service_request.priority == 'medium':
+                repair_time = 8
+            else:
+                repair_time = 24
+        
+        if repair_time > 0:
+            total_repair_time += repair_time
+            valid_orders += 1
+    
+    # إذا لم توجد أوامر شغل، نستخدم تقديرات بناءً على الأجهزة
+    if valid_orders == 0:
+        devices = Device.objects.all()
+        if device_id:
+            devices = devices.filter(id=device_id)
+        if department_id:
+            devices = devices.filter(department_id=department_id)
+        
+        # إذا لم توجد أجهزة، نرجع قيمة افتراضية
+        if not devices.exists():
+            return 4.0
+        
+        total_estimated_mttr = 0
+        device_count = 0
+        
+        for device in devices:
+            # البحث عن SLA مناسب
+            applicable_sla = None
+            if device.category:
+                sla_definitions = SLADefinition.objects.filter(
+                    is_active=True,
+                    device_category=device.category
+                )
+                if sla_definitions.exists():
+                    applicable_sla = sla_definitions.first()
+            
+            # البحث عن خطة عمل مناسبة
+            job_plan_duration = None
+            if device.category:
+                job_plans = JobPlan.objects.filter(device_category=device.category, is_active=True)
+                if job_plans.exists():
+                    job_plan = job_plans.first()
+                    if hasattr(job_plan, 'estimated_hours') and job_plan.estimated_hours:
+                        job_plan_duration = float(job_plan.estimated_hours)
+            
+            # تحديد MTTR بناءً على المصادر المتاحة
+            if applicable_sla:
+                estimated_mttr = float(applicable_sla.resolution_time_hours)
+            elif job_plan_duration:
+                estimated_mttr = job_plan_duration
+            else:
+                # تقدير بناءً على حالة الجهاز
+                if device.status == 'working':
+                    estimated_mttr = 2.0
+                elif device.status == 'needs_check':
+                    estimated_mttr = 4.0
+                elif device.status == 'needs_maintenance':
+                    estimated_mttr = 8.0
+                elif device.status == 'out_of_order':
+                    estimated_mttr = 24.0
+                else:
+                    estimated_mttr = 6.0
+            
+            total_estimated_mttr += estimated_mttr
+            device_count += 1
+        
+        return total_estimated_mttr / device_count if device_count > 0 else 4.0
+    
+    return total_repair_time / valid_orders if valid_orders > 0 else 4.0
+
+def legacy_calculate_availability(device_id=None, department_id=None, days=30):
+    """
+    حساب نسبة التوفر (Availability) بناءً على SLA وخطط العمل والبيانات الفعلية
+    """
+    from maintenance.models import SLADefinition, JobPlan
+    
+    # تحديد الفترة الزمنية
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=days)
+    
+    # جلب الأجهزة
+    devices = Device.objects.all()
+    if device_id:
+        devices = devices.filter(id=device_id)
+    if department_id:
+        devices = devices.filter(department_id=department_id)
+    
+    total_availability = 0
+    device_count = 0
+    
+    for device in devices:
+        # البحث عن SLA مناسب للجهاز
+        applicable_sla = None
+        if device.category:
+            sla_definitions = SLADefinition.objects.filter(
+                is_active=True,
+                device_category=device.category
+            )
+            if sla_definitions.exists():
+                applicable_sla = sla_definitions.first()
+        
+        # حساب التوفر بناءً على أوامر الشغل الفعلية
+        corrective_work_orders = WorkOrder.objects.filter(
+            service_request__device=device,
+            service_request__request_type='corrective',
+            created_at__range=[start_date, end_date]
+        )
+        
+        total_downtime_hours = 0
+        
+        # حساب الـ downtime من أوامر الشغل المكتملة
+        completed_orders = corrective_work_orders.filter(status__in=['closed', 'qa_verified'])
+        for wo in completed_orders:
+            if wo.actual_start and wo.actual_end:
+                downtime = (wo.actual_end - wo.actual_start).total_seconds() / 3600
+            elif applicable_sla:
+                downtime = applicable_sla.resolution_time_hours
+            else:
+                # تقدير بناءً على الأولوية
+                if wo.service_request.priority == 'critical':
+                    downtime = 2
+                elif wo.service_request.priority == 'high':
+                    downtime = 4
+                elif wo.service_request.priority == 'medium':
+                    downtime = 8
+                else:
+                    downtime = 24
+            
+            total_downtime_hours += downtime
+        
+        # حساب الـ downtime من أوامر الشغل المفتوحة
+        open_orders = corrective_work_orders.filter(
+            status__in=['new', 'assigned', 'in_progress', 'wait_parts']
+        )
+        
+        for wo in open_orders:
+            # حساب الوقت المنقضي منذ بداية العطل
+            elapsed_time = (timezone.now() - wo.created_at).total_seconds() / 3600
+            
+            if applicable_sla:
+                # إذا تجاوز الوقت المحدد في SLA، نحسب كامل الوقت
+                expected_resolution = applicable_sla.resolution_time_hours
+                downtime = max(elapsed_time, expected_resolution)
+            else:
+                downtime = elapsed_time
+            
+            total_downtime_hours += downtime
+        
+        # حساب نسبة التوفر الأساسية
+        total_period_hours = days * 24
+        uptime_hours = max(0, total_period_hours - total_downtime_hours)
+        device_availability = (uptime_hours / total_period_hours) * 100
+        
+        # تطبيق تأثير حالة الجهاز على التوفر
+        if device.status == 'out_of_order':
+            device_availability = 0
+        elif device.status == 'needs_maintenance':
+            # إذا كان هناك SLA، نستخدم نسبة مبنية على مدى تجاوز SLA
+            if applicable_sla:
+                device_availability = min(device_availability, 40)
+            else:
+                device_availability = min(device_availability, 30)
+        elif device.status == 'needs_check':
+            if applicable_sla:
+                device_availability = min(device_availability, 80)
+            else:
+                device_availability = min(device_availability, 70)
+        elif device.status == 'working':
+            if applicable_sla:
+                device_availability = min(device_availability, 98)  # SLA عادة يستهدف 98%+
+            else:
+                device_availability = min(device_availability, 95)
+        
+        # تطبيق تأثير الصيانة الوقائية المجدولة
+        try:
+            pm_schedules = PreventiveMaintenanceSchedule.objects.filter(
+                device=device,
+                next_due_date__range=[start_date.date(), end_date.date()]
+            )
+            
+            for pm in pm_schedules:
+                if pm.job_plan:
+                    # محاولة الحصول على الوقت المقدر من خطة العمل
+                    pm_downtime = 0
+                    if hasattr(pm.job_plan, 'estimated_hours') and pm.job_plan.estimated_hours:
+                        pm_downtime = float(pm.job_plan.estimated_hours)
+                    elif hasattr(pm.job_plan, 'estimated_duration') and pm.job_plan.estimated_duration:
+                        pm_downtime = pm.job_plan.estimated_duration.total_seconds() / 3600
+                    else:
+                        # تقدير افتراضي للصيانة الوقائية (ساعتان)
+                        pm_downtime = 2
+                    
+                    total_downtime_hours += pm_downtime
+                    # إعادة حساب التوفر
+                    uptime_hours = max(0, total_period_hours - total_downtime_hours)
+                    device_availability = (uptime_hours / total_period_hours) * 100
+        except Exception as e:
+            # في حالة وجود خطأ، نتجاهل تأثير الصيانة الوقائية
+            pass
+        
+        total_availability += max(0, device_availability)
+        device_count += 1
+    
+    return total_availability / device_count if device_count > 0 else 0
+
+
+class DeviceKPIEngineTest(TestCase):
+    """مقارنة المحرك الجديد بالحساب القديم"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(2024)
+        now = timezone.now()
+
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        cls.user = User.objects.create_user(username='kpi_user', password='testpass123')
+
+        cls.departments = [
+            Department.objects.create(name=f'قسم {i}', hospital=hospital) for i in range(2)
+        ]
+        categories = [DeviceCategory.objects.create(name=f'فئة {i}') for i in range(3)]
+
+        # فئة بـ SLA وفئة بخطة عمل بس وفئة من غير الاتنين
+        SLADefinition.objects.create(name='SLA أ', device_category=categories[0], resolution_time_hours=12)
+        SLADefinition.objects.create(name='SLA ب', device_category=categories[0], resolution_time_hours=30)
+        job_plan = JobPlan.objects.create(
+            name='خطة', device_category=categories[1], job_type='preventive',
+            estimated_hours=Decimal('3.5'), created_by=cls.user
+        )
+
+        statuses = ['working', 'needs_check', 'needs_maintenance', 'out_of_order']
+        priorities = ['critical', 'high', 'medium', 'low']
+        wo_statuses = ['new', 'assigned', 'in_progress', 'wait_parts', 'on_hold', 'resolved',
+                       'qa_verified', 'closed', 'cancelled']
+
+        cls.devices = []
+        for i in range(24):
+            department = cls.departments[i % 2]
+            room = Room.objects.create(number=str(i), ward=ward, department=department, room_type='regular_ROOM')
+            device = Device.objects.create(
+                name=f'جهاز {i}', category=categories[i % 3], department=department, room=room,
+                status=statuses[i % 4],
+            )
+            cls.devices.append(device)
+
+            for j in range(rng.randint(0, 4)):
+                sr = ServiceRequest.objects.create(
+                    device=device, reporter=cls.user, title=f'بلاغ {i}-{j}', status='assigned',
+                    request_type=rng.choice(['corrective', 'breakdown', 'preventive']),
+                    priority=rng.choice(priorities),
+                )
+                wo = WorkOrder.objects.create(service_request=sr, title=f'أمر {i}-{j}', created_by=cls.user)
+
+                created_at = now - timedelta(hours=rng.uniform(1, 40 * 24))
+                fields = {'created_at': created_at, 'status': rng.choice(wo_statuses)}
+                if rng.random() < 0.4:
+                    fields['actual_start'] = created_at + timedelta(hours=rng.uniform(0, 5))
+                    fields['actual_end'] = fields['actual_start'] + timedelta(hours=rng.uniform(0.5, 30))
+                elif rng.random() < 0.3:
+                    fields['actual_start'] = created_at + timedelta(hours=rng.uniform(0, 5))
+                if rng.random() < 0.25:
+                    fields['actual_hours'] = Decimal(str(round(rng.uniform(0.5, 20), 2)))
+                if rng.random() < 0.25:
+                    fields['estimated_hours'] = Decimal(str(round(rng.uniform(0.5, 20), 2)))
+                fields['updated_at'] = created_at + timedelta(hours=rng.uniform(0, 100))
+                WorkOrder.objects.filter(pk=wo.pk).update(**fields)
+
+            if i % 5 == 0:
+                PreventiveMaintenanceSchedule.objects.create(
+                    name=f'صيانة {i}', device=device, job_plan=job_plan, frequency='monthly',
+                    next_due_date=(now - timedelta(days=rng.randint(0, 25))).date(), created_by=cls.user,
+                )
+
+        # قسم بأجهزة من غير أوامر شغل عشان نختبر تقديرات MTTR
+        cls.quiet_department = Department.objects.create(name='قسم هادي', hospital=hospital)
+        for i, category in enumerate(categories):
+            room = Room.objects.create(number=f'q{i}', ward=ward, department=cls.quiet_department, room_type='regular_ROOM')
+            Device.objects.create(
+                name=f'جهاز هادي {i}', category=category, department=cls.quiet_department, room=room,
+                status=statuses[i],
+            )
+
+    def assertMatchesLegacy(self, **scope):
+        engine = DeviceKPIEngine(**scope)
+        self.assertAlmostEqual(engine.mtbf(), legacy_calculate_mtbf(**scope), places=4)
+        self.assertAlmostEqual(engine.mttr(), legacy_calculate_mttr(**scope), places=4)
+        self.assertAlmostEqual(engine.availability(), legacy_calculate_availability(**scope), places=4)
+
+    def test_matches_legacy_for_all_devices(self):
+        self.assertMatchesLegacy()
+
+    def test_matches_legacy_per_department(self):
+        for department in self.departments + [self.quiet_department]:
+            self.assertMatchesLegacy(department_id=department.id)
+
+    def test_matches_legacy_per_device(self):
+        for device in self.devices:
+            self.assertMatchesLegacy(device_id=device.id)
+
+    def test_matches_legacy_for_other_windows(self):
+        for days in (7, 90):
+            self.assertMatchesLegacy(department_id=self.departments[0].id, days=days)
+
+    def test_constant_query_count(self):
+        """عدد الاستعلامات ثابت مهما كان عدد الأجهزة"""
+        counts = []
+        for scope in ({'department_id': self.departments[0].id}, {}):
+            # فهرس SLA مشترك بين المحركات؛ بنفضيه عشان المقارنة تكون من الصفر
+            resolver.clear()
+            engine = DeviceKPIEngine(**scope)
+            with CaptureQueriesContext(connection) as queries:
+                engine.mtbf()
+                engine.mttr()
+                engine.availability()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[0], 5)
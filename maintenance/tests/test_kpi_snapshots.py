@@ -0,0 +1,193 @@
+# اختبارات لقطات المؤشرات اليومية
+# هنا بنتأكد إن التجميع بيطابق أوامر الشغل الخام وإنه بيعيد حساب الأيام المتغيرة بس
+
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from maintenance.kpi_snapshots import (
+    last_rollup_time, raw_monthly_trends, rollup_kpi_snapshots, snapshot_monthly_trends,
+)
+from maintenance.kpi_utils import get_monthly_trends
+from maintenance.models import (
+    CalibrationRecord, Device, DeviceCategory, DowntimeEvent, KPISnapshot, KPISnapshotCursor, ServiceRequest,
+    WorkOrder,
+)
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class KPISnapshotTest(TestCase):
+    """تجميع KPISnapshot والقراءة منه"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # الساعة 6 مساءً ثابتة: مواعيد الحل كلها الضهر فمبتقعش في فترات التشغيل اللي بعد now
+        today = timezone.localdate()
+        cls.now = timezone.make_aware(datetime.combine(today, time(18, 0)))
+        cls.noon = lambda days_ago: timezone.make_aware(
+            datetime.combine(today - timedelta(days=days_ago), time(12, 0))
+        )
+
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        cls.user = User.objects.create_user(username='snapshot_user', password='testpass123')
+        cls.department = Department.objects.create(name='قسم', hospital=hospital)
+        category = DeviceCategory.objects.create(name='فئة')
+
+        cls.devices = []
+        for i in range(3):
+            room = Room.objects.create(number=str(i), ward=ward, department=cls.department, room_type='regular_ROOM')
+            cls.devices.append(Device.objects.create(
+                name=f'جهاز {i}', category=category, department=cls.department, room=room
+            ))
+
+        cls.work_orders = []
+        for i, (device, days_ago, request_type, status) in enumerate([
+            (0, 1, 'corrective', 'closed'),
+            (0, 1, 'preventive', 'in_progress'),
+            (0, 40, 'breakdown', 'resolved'),
+            (1, 3, 'corrective', 'new'),
+            (2, 70, 'preventive', 'qa_verified'),
+        ]):
+            sr = ServiceRequest.objects.create(
+                device=cls.devices[device], reporter=cls.user, title=f'بلاغ {i}', status='assigned',
+                request_type=request_type,
+            )
+            wo = WorkOrder.objects.create(service_request=sr, title=f'أمر {i}', created_by=cls.user)
+            created_at = cls.noon(days_ago)
+            fields = {'created_at': created_at, 'updated_at': created_at, 'status': status}
+            if status in ('closed', 'resolved', 'qa_verified'):
+                fields['actual_start'] = created_at
+                fields['actual_end'] = created_at + timedelta(hours=3)
+            WorkOrder.objects.filter(pk=wo.pk).update(**fields)
+            ServiceRequest.objects.filter(pk=sr.pk).update(resolution_due=created_at + timedelta(hours=24))
+            cls.work_orders.append(wo)
+
+        # توقف من الساعة 6 مساءً لحد 6 الصبح اليوم اللي بعده
+        start = cls.noon(5) + timedelta(hours=6)
+        event = DowntimeEvent.objects.create(device=cls.devices[1], start_time=start, end_time=start + timedelta(hours=12))
+        DowntimeEvent.objects.filter(pk=event.pk).update(updated_at=start + timedelta(hours=12))
+
+        calibration = CalibrationRecord.objects.create(
+            device=cls.devices[2], calibration_date=timezone.localdate(cls.noon(2)), status='completed'
+        )
+        CalibrationRecord.objects.filter(pk=calibration.pk).update(updated_at=cls.noon(2))
+
+    def setUp(self):
+        cache.clear()
+
+    def snapshot(self, device, days_ago):
+        return KPISnapshot.objects.get(device=device, date=timezone.localdate(self.noon(days_ago)))
+
+    def test_full_rollup_matches_raw_rows(self):
+        """أول تشغيل بيغطي التاريخ كله ويطابق أوامر الشغل الخام"""
+        rollup_kpi_snapshots(now=self.now)
+
+        expected = Counter(
+            (device_id, timezone.localdate(created_at))
+            for device_id, created_at in WorkOrder.objects.values_list('service_request__device_id', 'created_at')
+        )
+        actual = Counter({
+            (row.device_id, row.date): row.work_orders_created
+            for row in KPISnapshot.objects.filter(work_orders_created__gt=0)
+        })
+        self.assertEqual(actual, expected)
+
+        day = self.snapshot(self.devices[0], 1)
+        self.assertEqual((day.failures, day.preventive_work_orders, day.work_orders_completed), (1, 1, 1))
+        self.assertEqual(day.repair_count, 1)
+        self.assertAlmostEqual(day.repair_hours, 3)
+        self.assertEqual(day.department_id, self.department.pk)
+
+        self.assertEqual(self.snapshot(self.devices[1], 3).work_orders_overdue, 1)
+        self.assertEqual(self.snapshot(self.devices[2], 2).calibrations_completed, 1)
+
+    def test_downtime_is_split_across_days(self):
+        rollup_kpi_snapshots(now=self.now)
+
+        self.assertAlmostEqual(self.snapshot(self.devices[1], 5).downtime_hours, 6)
+        self.assertAlmostEqual(self.snapshot(self.devices[1], 4).downtime_hours, 6)
+
+    def test_incremental_rollup_only_touches_changed_days(self):
+        rollup_kpi_snapshots(now=self.now)
+        untouched = self.snapshot(self.devices[0], 40).computed_at
+
+        later = self.now + timedelta(hours=1)
+        WorkOrder.objects.filter(pk=self.work_orders[3].pk).update(
+            status='closed', actual_start=self.noon(3), actual_end=self.noon(3) + timedelta(hours=2),
+            updated_at=later - timedelta(minutes=5),
+        )
+        result = rollup_kpi_snapshots(now=later)
+
+        self.assertEqual((result['days'], result['device_days']), (1, 1))
+        changed = self.snapshot(self.devices[1], 3)
+        self.assertEqual((changed.work_orders_completed, changed.work_orders_overdue), (1, 0))
+        self.assertEqual(changed.computed_at, later)
+        self.assertEqual(self.snapshot(self.devices[0], 40).computed_at, untouched)
+
+        # مفيش تغييرات جديدة = مفيش شغل
+        self.assertEqual(rollup_kpi_snapshots(now=later + timedelta(hours=1))['days'], 0)
+
+    def test_deleted_work_order_marks_day_stale(self):
+        rollup_kpi_snapshots(now=self.now)
+        WorkOrder.objects.get(pk=self.work_orders[4].pk).delete()
+
+        self.assertTrue(self.snapshot(self.devices[2], 70).is_stale)
+        rollup_kpi_snapshots(now=self.now + timedelta(hours=1))
+        self.assertFalse(
+            KPISnapshot.objects.filter(device=self.devices[2], date=timezone.localdate(self.noon(70))).exists()
+        )
+
+    def test_monthly_trends_read_snapshots(self):
+        rollup_kpi_snapshots(now=self.now)
+
+        # أجيال الكاش + فيه لقطات + التجميع
+        with self.assertNumQueries(3):
+            trends = get_monthly_trends(department_id=self.department.pk, months=4)
+        self.assertEqual(trends, snapshot_monthly_trends(department_id=self.department.pk, months=4))
+        self.assertEqual([row['month'] for row in trends], sorted(row['month'] for row in trends))
+
+        month_of = lambda days_ago: timezone.localdate(self.noon(days_ago)).strftime('%Y-%m')
+        expected = Counter(month_of(days_ago) for days_ago in (1, 1, 40, 3, 70))
+        for row in trends:
+            self.assertEqual(row['total_work_orders'], expected.get(row['month'], 0))
+
+        # الأعطال والتوقف والمعايرات بتتقري من اللقطات
+        failures = Counter(month_of(days_ago) for days_ago in (1, 40, 3))
+        downtime = Counter({month_of(5): 6})
+        downtime[month_of(4)] += 6
+        calibrations = Counter({month_of(2): 1})
+        for row in trends:
+            self.assertEqual(row['failures'], failures.get(row['month'], 0))
+            self.assertAlmostEqual(row['downtime_hours'], downtime.get(row['month'], 0))
+            self.assertEqual(row['calibrations_completed'], calibrations.get(row['month'], 0))
+
+    def test_raw_fallback_matches_snapshots(self):
+        # قبل أول تجميع الداشبورد بيحسب من الخام، والأرقام لازم ما تتغيرش لما اللقطات تبدأ
+        raw = raw_monthly_trends(department_id=self.department.pk, months=4, now=self.now)
+        rollup_kpi_snapshots(now=self.now)
+        self.assertEqual(raw, snapshot_monthly_trends(
+            department_id=self.department.pk, months=4, today=timezone.localdate(self.now)
+        ))
+        self.assertEqual(sum(row['failures'] for row in raw), 3)
+
+    def test_cursor_advances_when_nothing_is_written(self):
+        rollup_kpi_snapshots(now=self.now)
+        later = self.now + timedelta(hours=1)
+
+        self.assertEqual(rollup_kpi_snapshots(now=later)['rows'], 0)
+        self.assertEqual(last_rollup_time(), later)
+        self.assertEqual(KPISnapshotCursor.objects.get().last_run_at, later)
+
+        # التغيير اللي قبل التشغيل الفاضي مبيتحسبش تاني
+        WorkOrder.objects.filter(pk=self.work_orders[3].pk).update(updated_at=later - timedelta(minutes=5))
+        self.assertEqual(rollup_kpi_snapshots(now=later + timedelta(hours=1))['days'], 0)
@@ -0,0 +1,226 @@
+# اختبارات إرسال طابور الإشعارات على دفعات
+# السيرفر هنا خادم SMTP محلي بسيط على 127.0.0.1 بيسجل الرسايل وعدد الاتصالات
+
+import socketserver
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from maintenance import notification_dispatch
+from maintenance.notification_dispatch import (
+    claim_batch, dispatch_pending, enqueue_notifications, requeue_stale_claims
+)
+from maintenance.models import EmailLog, NotificationPreference, NotificationQueue, SystemNotification
+
+User = get_user_model()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """جلسة SMTP واحدة: بترفض أي مستلم فيه reject وتسجل باقي الرسايل"""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 stand-in ESMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 stand-in')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                if 'reject' in command:
+                    self.reply('550 mailbox unavailable')
+                else:
+                    recipients.append(command.split(':', 1)[1].strip(' <>'))
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 end with .')
+                while self.rfile.readline().rstrip(b'\r\n') != b'.':
+                    pass
+                with server.lock:
+                    server.messages.extend(recipients)
+                self.reply('250 queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+
+class _SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+
+
+class NotificationDispatchTest(TestCase):
+    """حجز الدفعات والإرسال على اتصال واحد وتسجيل النتايج"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.smtp = _SMTPStandIn()
+        threading.Thread(target=cls.smtp.serve_forever, daemon=True).start()
+        cls.email_settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=cls.smtp.server_address[1],
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='', EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+        )
+        cls.email_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.email_settings.disable()
+        cls.smtp.shutdown()
+        cls.smtp.server_close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'tech{i}', email=f'tech{i}@example.com', password='testpass123')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.smtp.connections = 0
+        self.smtp.messages = []
+
+    def enqueue(self, users, **kwargs):
+        return enqueue_notifications([
+            {'recipient': user, 'title': 'انتهاك SLA', 'message': 'بلاغ متأخر', 'notification_type': 'sla_breach'}
+            for user in users
+        ], **kwargs)
+
+    def test_enqueue_bulk_creates_notifications(self):
+        with self.assertNumQueries(4):  # savepoint + إشعارات + طابور + release
+            entries = self.enqueue(self.users * 4)
+
+        self.assertEqual(len(entries), 20)
+        self.assertEqual(SystemNotification.objects.filter(status='pending').count(), 20)
+        self.assertEqual(NotificationQueue.objects.filter(status='pending').count(), 20)
+
+    def test_batches_share_one_smtp_connection(self):
+        self.enqueue(self.users * 2)
+
+        result = dispatch_pending(batch_size=4)
+
+        self.assertEqual((result['batches'], result['claimed'], result['sent']), (3, 10, 10))
+        self.assertEqual(self.smtp.connections, 3)
+        self.assertEqual(sorted(self.smtp.messages), sorted(user.email for user in self.users * 2))
+        self.assertFalse(NotificationQueue.objects.exclude(status='completed').exists())
+        self.assertEqual(SystemNotification.objects.filter(status='sent', sent_at__isnull=False).count(), 10)
+        self.assertEqual(EmailLog.objects.filter(status='sent').count(), 10)
+        self.assertGreater(result['per_second'], 0)
+
+    def test_claims_do_not_overlap(self):
+        self.enqueue(self.users)
+
+        first = claim_batch(batch_size=3)
+        second = claim_batch(batch_size=3)
+        third = claim_batch(batch_size=3)
+
+        self.assertEqual((len(first), len(second), third), (3, 2, []))
+        self.assertFalse({entry.pk for entry in first} & {entry.pk for entry in second})
+
+    def test_refused_recipient_is_retried_then_failed(self):
+        rejected = User.objects.create_user(username='bad', email='reject@example.com', password='testpass123')
+        entry, = self.enqueue([rejected], max_attempts=2)
+        self.enqueue(self.users[:2])
+
+        result = dispatch_pending()
+        self.assertEqual((result['sent'], result['retried']), (2, 1))
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), ('pending', 1))
+        self.assertIn('550', entry.last_error)
+        self.assertGreater(entry.scheduled_for, timezone.now())
+
+        result = dispatch_pending(now=entry.scheduled_for)
+        self.assertEqual(result['failed'], 1)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'failed')
+        self.assertEqual(entry.notification.status, 'failed')
+        self.assertEqual(EmailLog.objects.filter(notification=entry.notification, status='failed').count(), 2)
+
+    def test_email_preferences_are_respected(self):
+        NotificationPreference.objects.create(user=self.users[0], email_sla_breaches=False)
+        self.enqueue(self.users[:2])
+
+        result = dispatch_pending()
+
+        self.assertEqual((result['sent'], result['app_only']), (1, 1))
+        self.assertEqual(self.smtp.messages, [self.users[1].email])
+        self.assertEqual(SystemNotification.objects.filter(status='sent').count(), 2)
+
+    def test_stale_claims_are_requeued(self):
+        self.enqueue(self.users[:2])
+        claimed = claim_batch()
+        later = timezone.now() + timedelta(hours=1)
+
+        self.assertEqual(requeue_stale_claims(now=later), len(claimed))
+        self.assertEqual(dispatch_pending(now=later)['sent'], 2)
+
+    def test_lost_claims_are_not_sent(self):
+        self.enqueue(self.users[:2])
+        later = timezone.now() + timedelta(hours=1)
+        real_claim = notification_dispatch.claim_batch
+
+        def claim_then_time_out(**kwargs):
+            # الدفعة اتأخرت ورجعت للطابور قبل الإرسال
+            entries = real_claim(**kwargs)
+            requeue_stale_claims(now=later)
+            return entries
+
+        with mock.patch.object(notification_dispatch, 'claim_batch', side_effect=claim_then_time_out):
+            result = notification_dispatch.dispatch_batch()
+
+        self.assertEqual((result['claimed'], result['sent'], result['lost']), (2, 0, 2))
+        self.assertEqual(self.smtp.messages, [])
+        self.assertEqual(NotificationQueue.objects.filter(status='pending', attempts=0).count(), 2)
+        self.assertFalse(EmailLog.objects.exists())
+
+    def test_results_are_written_only_by_the_current_claim(self):
+        self.enqueue(self.users[:2])
+        later = timezone.now() + timedelta(hours=1)
+        real_send = notification_dispatch._send_emails
+        taken = []
+
+        def send_then_lose_claim(entries):
+            results = real_send(entries)
+            # عامل تاني خد الدفعة بعد ما رجعت للطابور
+            requeue_stale_claims(now=later)
+            taken.extend(claim_batch(now=later))
+            return results
+
+        with mock.patch.object(notification_dispatch, '_send_emails', side_effect=send_then_lose_claim):
+            result = notification_dispatch.dispatch_batch()
+
+        self.assertEqual((result['sent'], result['lost']), (0, 2))
+        self.assertEqual(len(taken), 2)
+        # النتيجة متكتبتش فوق حجز العامل التاني
+        self.assertEqual(
+            NotificationQueue.objects.filter(status='processing', claim_token=taken[0].claim_token).count(), 2
+        )
+        self.assertFalse(EmailLog.objects.exists())
@@ -0,0 +1,114 @@
+# اختبارات لقطة الأدوار والصلاحيات
+# بنتأكد إن الأسئلة المتكررة مش بتعمل استعلامات وإن تغيير المجموعات بيبطل اللقطة
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+
+from maintenance import permissions
+from maintenance.context_processors import permissions_context
+from maintenance.models import Device
+
+User = get_user_model()
+
+
+class RoleSnapshotTest(TestCase):
+    """أسئلة الأدوار من الذاكرة مع الإبطال لما المجموعات تتغير"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.supervisor = Group.objects.create(name='Supervisor')
+        cls.technician = Group.objects.create(name='Technician')
+        cls.view_device = Permission.objects.get(codename='view_device', content_type__app_label='maintenance')
+        cls.change_device = Permission.objects.get(codename='change_device', content_type__app_label='maintenance')
+        cls.supervisor.permissions.add(cls.view_device)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='perm_user', password='testpass123')
+        self.user.groups.add(self.supervisor)
+
+    def fresh_user(self):
+        # كائن جديد زي أول الطلب، من غير اللقطة المتعلقة على القديم
+        return User.objects.get(pk=self.user.pk)
+
+    def test_checks_are_answered_in_memory(self):
+        user = self.fresh_user()
+        with self.assertNumQueries(2):
+            self.assertTrue(permissions.has_role(user, 'Supervisor'))
+
+        with self.assertNumQueries(0):
+            self.assertFalse(permissions.has_role(user, 'Admin'))
+            self.assertTrue(permissions.has_any_role(user, ['Admin', 'Supervisor']))
+            self.assertTrue(permissions.has_permission(user, 'view_device'))
+            self.assertFalse(permissions.has_permission(user, 'change_device'))
+            for _ in range(50):
+                permissions.can_assign_service_request(user)
+                permissions.can_manage_users(user)
+
+    @mock.patch.object(permissions, 'is_shared_cache', return_value=True)
+    def test_snapshot_is_shared_across_requests(self, _):
+        permissions.get_role_snapshot(self.fresh_user())
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            checker = permissions.PermissionChecker(user)
+            self.assertEqual(checker.user_roles, ['Supervisor'])
+            self.assertTrue(checker.can_view_reports())
+
+    def test_local_cache_keeps_snapshot_per_request(self):
+        """الكاش المحلي مش بيشوف إبطال العمليات التانية، فكل طلب بيحمل لقطته"""
+        permissions.get_role_snapshot(self.fresh_user())
+
+        user = self.fresh_user()
+        with self.assertNumQueries(2):
+            permissions.get_role_snapshot(user)
+
+    @mock.patch.object(permissions, 'is_shared_cache', return_value=True)
+    def test_group_membership_change_invalidates(self, _):
+        permissions.get_role_snapshot(self.fresh_user())
+
+        self.user.groups.add(self.technician)
+        self.assertTrue(permissions.has_role(self.fresh_user(), 'Technician'))
+
+        self.supervisor.user_set.remove(self.user)
+        self.assertFalse(permissions.has_role(self.fresh_user(), 'Supervisor'))
+
+        self.technician.user_set.clear()
+        self.assertEqual(permissions.get_user_roles(self.fresh_user()), [])
+
+    @mock.patch.object(permissions, 'is_shared_cache', return_value=True)
+    def test_group_permission_change_invalidates(self, _):
+        self.assertFalse(permissions.has_permission(self.fresh_user(), 'change_device'))
+
+        self.supervisor.permissions.add(self.change_device)
+        self.assertTrue(permissions.has_permission(self.fresh_user(), 'change_device'))
+
+    def test_inactive_user_has_no_permissions(self):
+        self.assertTrue(permissions.has_permission(self.fresh_user(), 'view_device'))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(permissions.has_permission(self.fresh_user(), 'view_device'))
+
+    def test_work_order_owner_checks_use_ids(self):
+        from maintenance.models import WorkOrder
+
+        work_order = WorkOrder(assignee_id=self.user.pk)
+        user = self.fresh_user()
+        permissions.get_role_snapshot(user)
+        with self.assertNumQueries(0):
+            self.assertTrue(permissions.can_edit_work_order(user, work_order))
+            self.assertTrue(permissions.can_view_work_order(user, work_order))
+
+    def test_context_processor(self):
+        request = RequestFactory().get('/')
+        request.user = self.fresh_user()
+        context = permissions_context(request)
+
+        self.assertEqual(context['user_roles'], ['Supervisor'])
+        with self.assertNumQueries(0):
+            self.assertTrue(context['perms_checker'].can_view_device(Device()))
@@ -0,0 +1,165 @@
+# اختبارات تقويم توقعات الصيانة الوقائية
+# الجداول بتتفرد لمواعيدها لحد الأفق، والتعديل بيكتب الفرق بس، والتجميعات استعلام واحد
+
+import json
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from maintenance.models import Device, DeviceCategory, JobPlan, PMForecastOccurrence, PreventiveMaintenanceSchedule
+from maintenance.pm_forecast import (
+    due_by_department, expand_schedule, sync_forecast, week_start, workload_histogram,
+)
+from maintenance.pm_generation import generate_due_pm_work_orders
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class PMForecastTest(TestCase):
+    """المواعيد المتوقعة بتفضل مطابقة للجداول"""
+
+    @classmethod
+    def setUpTestData(cls):
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        cls.manager = User.objects.create_user(username='forecast_manager', password='testpass123', hospital=hospital)
+        cls.tech = User.objects.create_user(username='forecast_tech', password='testpass123')
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        cls.radiology = Department.objects.create(name='أشعة', hospital=hospital)
+        cls.lab = Department.objects.create(name='معمل', hospital=hospital)
+        cls.room = Room.objects.create(number='1', ward=ward, department=cls.radiology, room_type='regular_ROOM')
+        category = DeviceCategory.objects.create(name='أجهزة')
+        cls.job_plan = JobPlan.objects.create(
+            name='فحص', device_category=category, estimated_hours=2, created_by=cls.manager,
+        )
+        cls.devices = [
+            Device.objects.create(
+                name=f'جهاز {n}', serial_number=f'FC-{n}', model='M', category=category,
+                department=department, room=cls.room,
+            )
+            for n, department in enumerate([cls.radiology, cls.radiology, cls.lab])
+        ]
+        cls.today = date.today()
+
+    def _schedule(self, device, frequency='weekly', assigned_to=None, **kwargs):
+        return PreventiveMaintenanceSchedule.objects.create(
+            name=f'جدول {device.name}', device=device, job_plan=self.job_plan, frequency=frequency,
+            next_due_date=kwargs.pop('next_due_date', self.today), assigned_to=assigned_to,
+            created_by=self.manager, **kwargs,
+        )
+
+    def test_schedule_save_expands_to_horizon(self):
+        schedule = self._schedule(self.devices[0])
+
+        dates = list(schedule.forecast_occurrences.values_list('due_date', flat=True))
+        self.assertEqual(dates, expand_schedule(schedule, self.today + timedelta(days=90)))
+        self.assertEqual(len(dates), 13)
+        self.assertEqual(dates[1], self.today + timedelta(weeks=1))
+
+    def test_end_date_and_usage_based_frequency(self):
+        bounded = self._schedule(self.devices[0], end_date=self.today + timedelta(days=20))
+        after_use = self._schedule(self.devices[1], frequency='after_use')
+
+        self.assertEqual(bounded.forecast_occurrences.count(), 3)
+        self.assertEqual(after_use.forecast_occurrences.count(), 1)
+
+    def test_schedule_change_writes_only_the_difference(self):
+        schedule = self._schedule(self.devices[0])
+        first_ids = set(schedule.forecast_occurrences.values_list('pk', flat=True))
+
+        schedule.assigned_to = self.tech
+        schedule.save()
+        self.assertEqual(set(schedule.forecast_occurrences.values_list('pk', flat=True)), first_ids)
+        self.assertEqual(set(schedule.forecast_occurrences.values_list('assignee', flat=True)), {self.tech.pk})
+
+        schedule.frequency = 'monthly'
+        schedule.save()
+        self.assertEqual(schedule.forecast_occurrences.count(), 3)
+
+        schedule.is_active = False
+        schedule.save()
+        self.assertFalse(schedule.forecast_occurrences.exists())
+
+    def test_full_sync_is_idempotent_in_constant_queries(self):
+        for device in self.devices:
+            self._schedule(device)
+
+        # جداول + مواعيد موجودة + الدفعة الفاضية + تنظيف الصفوف اليتيمة
+        with self.assertNumQueries(4):
+            result = sync_forecast()
+        self.assertEqual((result['created'], result['updated'], result['deleted']), (0, 0, 0))
+        self.assertEqual(result['unchanged'], 3 * 13)
+
+    def test_generation_rolls_the_calendar_forward(self):
+        schedule = self._schedule(self.devices[0])
+
+        generate_due_pm_work_orders(notify=False)
+
+        schedule.refresh_from_db()
+        first = schedule.forecast_occurrences.first()
+        self.assertEqual(first.due_date, schedule.next_due_date)
+        self.assertFalse(schedule.forecast_occurrences.filter(due_date=self.today).exists())
+
+    def test_department_and_workload_aggregates(self):
+        self._schedule(self.devices[0], assigned_to=self.tech)
+        self._schedule(self.devices[1], frequency='monthly', assigned_to=self.tech)
+        self._schedule(self.devices[2])
+        end = self.today + timedelta(days=27)
+
+        with self.assertNumQueries(1):
+            departments = {row['department__name']: row['occurrences'] for row in due_by_department(self.today, end)}
+        self.assertEqual(departments, {'أشعة': 4 + 1, 'معمل': 4})
+
+        with self.assertNumQueries(1):
+            workload = list(workload_histogram(self.today, end, assignee=self.tech))
+        self.assertEqual(workload[0]['week_start'], week_start(self.today))
+        self.assertEqual((workload[0]['occurrences'], float(workload[0]['hours'])), (2, 4.0))
+        self.assertEqual(sum(row['occurrences'] for row in workload), 5)
+
+    def test_job_plan_hours_propagate(self):
+        schedule = self._schedule(self.devices[0])
+
+        self.job_plan.estimated_hours = 5
+        self.job_plan.save()
+        self.assertEqual(set(schedule.forecast_occurrences.values_list('estimated_hours', flat=True)), {5})
+        self.assertEqual(PMForecastOccurrence.objects.count(), 13)
+
+    def test_forecast_api(self):
+        self._schedule(self.devices[0], assigned_to=self.tech)
+        self._schedule(self.devices[2])
+        self.client.force_login(self.manager)
+
+        response = self.client.get(reverse('maintenance:cmms:api_pm_forecast'), {
+            'end': (self.today + timedelta(days=13)).isoformat(), 'department': self.radiology.pk,
+        })
+        data = json.loads(response.content)
+        self.assertEqual(data['by_department'][0]['occurrences'], 2)
+        self.assertEqual(len(data['occurrences']), 2)
+        self.assertEqual(data['workload'][0]['technician'], self.tech.username)
+
+    def test_forecast_api_validates_parameters_and_hospital(self):
+        url = reverse('maintenance:cmms:api_pm_forecast')
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(url, {'department': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'technician': '1; drop'}).status_code, 400)
+
+        self.client.force_login(self.tech)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_pages_show_the_forecast(self):
+        self._schedule(self.devices[0], assigned_to=self.tech)
+        self.client.force_login(self.manager)
+
+        response = self.client.get(reverse('maintenance:cmms:pm_schedule_list'))
+        self.assertEqual(sum(week['occurrences'] for week in response.context['forecast_weeks']), 8)
+
+        response = self.client.get(reverse('maintenance:maintenance_schedule', args=[self.devices[0].pk]))
+        self.assertEqual(
+            [occurrence.due_date for occurrence in response.context['upcoming_occurrences']][:2],
+            [self.today, self.today + timedelta(days=7)],
+        )
@@ -0,0 +1,165 @@
+# اختبارات توليد أوامر الصيانة الوقائية على دفعات
+# عدد الاستعلامات ثابت مهما زاد عدد الجداول، وكل فني بياخد إشعار ملخص واحد
+
+from datetime import date, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from maintenance.models import (
+    Device, DeviceCategory, JobPlan, NotificationQueue, PreventiveMaintenanceSchedule,
+    SearchDocument, ServiceRequest, SystemNotification, WorkOrder,
+)
+from maintenance.pm_generation import WorkOrderNumbers, generate_due_pm_work_orders
+from maintenance.signals import check_and_generate_pm_work_orders
+from maintenance.sla_resolver import resolver
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class PMGenerationTest(TestCase):
+    """الجداول المستحقة بتتقرا مرة وتتكتب bulk مع الحفاظ على قواعد generate_work_order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='pm_manager', password='testpass123')
+        cls.tech_a = User.objects.create_user(username='pm_tech_a', password='testpass123')
+        cls.tech_b = User.objects.create_user(username='pm_tech_b', password='testpass123')
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        cls.department = Department.objects.create(name='قسم', hospital=hospital)
+        cls.room = Room.objects.create(number='1', ward=ward, department=cls.department, room_type='regular_ROOM')
+        cls.category = DeviceCategory.objects.create(name='أشعة')
+        cls.job_plan = JobPlan.objects.create(
+            name='فحص دوري', device_category=cls.category, estimated_hours=3, created_by=cls.manager,
+        )
+        cls.today = date.today()
+
+    def setUp(self):
+        resolver.clear()
+
+    def _schedule(self, n, assigned_to=None, frequency='monthly', next_due=None):
+        device = Device.objects.create(
+            name=f'جهاز {n}', serial_number=f'PM-{n}', model='M', category=self.category,
+            department=self.department, room=self.room,
+        )
+        return PreventiveMaintenanceSchedule.objects.create(
+            name=f'جدول {n}', device=device, job_plan=self.job_plan, frequency=frequency,
+            next_due_date=next_due or self.today, assigned_to=assigned_to, created_by=self.manager,
+        )
+
+    def test_constant_queries_regardless_of_schedule_count(self):
+        # المصفوفة بتتحمل مرة واحدة للعملية كلها فمنحسبهاش هنا
+        resolver.matrix
+        for n in range(3):
+            self._schedule(n, assigned_to=self.tech_a)
+        with self.assertNumQueries(self._queries_for_run()):
+            generate_due_pm_work_orders(notify=False)
+
+        for n in range(3, 10):
+            self._schedule(n, assigned_to=self.tech_a)
+        with self.assertNumQueries(self._queries_for_run()):
+            result = generate_due_pm_work_orders(notify=False)
+        self.assertEqual(result['created'], 7)
+
+    def _queries_for_run(self):
+        # جداول + أوامر مفتوحة + أوامر النهارده + بلاغات مفتوحة + أرقام الشهر
+        # + savepoint + بلاغات + أوامر + جداول + savepoint + فهرس البحث (savepoint + قراءة + مسح + إضافة + savepoint)
+        # + تقويم التوقعات (مواعيد موجودة + savepoint + مسح موعد النهارده + savepoint)
+        # المسح من غير SELECT قبله لأن مفيش post_delete عام على كل الموديلات
+        # + توقف الأجهزة (توقفات مفتوحة + إنشاء التوقفات + سجل التحويلات)
+        # (جيل كاش الداشبورد بيزيد بعد الـ commit)
+        return 22
+
+    def test_matches_legacy_work_order_fields(self):
+        schedule = self._schedule(1, assigned_to=self.tech_a)
+
+        generate_due_pm_work_orders()
+
+        work_order = WorkOrder.objects.select_related('service_request').get(pm_schedule=schedule)
+        request = work_order.service_request
+        self.assertEqual(
+            (request.priority, request.status, request.request_type, request.reporter, request.assigned_to),
+            ('urgent', 'assigned', 'preventive', self.manager, self.tech_a),
+        )
+        self.assertIsNotNone(request.resolution_due)
+        self.assertEqual(
+            (work_order.wo_type, work_order.priority, work_order.assignee, float(work_order.estimated_hours)),
+            ('preventive', 'urgent', self.tech_a, 3.0),
+        )
+        # البلاغ بيدخل فهرس البحث رغم إن bulk_create مش بيبعت post_save
+        self.assertTrue(SearchDocument.objects.filter(entity='service_request', object_id=request.pk).exists())
+
+        schedule.refresh_from_db()
+        self.assertGreater(schedule.next_due_date, self.today)
+
+    def test_skips_open_work_orders_and_busy_devices(self):
+        first = self._schedule(1)
+        second = PreventiveMaintenanceSchedule.objects.create(
+            name='جدول تاني لنفس الجهاز', device=first.device, job_plan=self.job_plan,
+            frequency='weekly', next_due_date=self.today, created_by=self.manager,
+        )
+        self.assertEqual(generate_due_pm_work_orders()['created'], 1)
+
+        # التشغيل التاني: الأمر لسه مفتوح فمفيش حاجة جديدة حتى لو الميعاد رجع
+        PreventiveMaintenanceSchedule.objects.filter(pk__in=[first.pk, second.pk]).update(next_due_date=self.today)
+        result = generate_due_pm_work_orders()
+        self.assertEqual((result['created'], result['skipped']), (0, 2))
+        self.assertEqual(WorkOrder.objects.filter(pm_schedule__device=first.device).count(), 1)
+
+    def test_work_order_numbers_continue_the_month_sequence(self):
+        numbers = WorkOrderNumbers()
+        existing = self._schedule(0)
+        WorkOrder.objects.create(
+            wo_number=f'{numbers.prefix}0041', title='قديم', created_by=self.manager,
+            service_request=ServiceRequest.objects.create(device=existing.device, reporter=self.manager, title='قديم'),
+        )
+        PreventiveMaintenanceSchedule.objects.filter(pk=existing.pk).update(next_due_date=self.today + timedelta(days=3))
+        for n in range(1, 4):
+            self._schedule(n)
+
+        generate_due_pm_work_orders()
+        created = WorkOrder.objects.filter(pm_schedule__isnull=False).order_by('wo_number')
+        self.assertEqual(
+            list(created.values_list('wo_number', flat=True)),
+            [f'{numbers.prefix}{n:04d}' for n in (42, 43, 44)],
+        )
+
+    def test_one_digest_per_assignee(self):
+        for n in range(3):
+            self._schedule(n, assigned_to=self.tech_a)
+        self._schedule(3, assigned_to=self.tech_b)
+        self._schedule(4)
+
+        result = generate_due_pm_work_orders()
+
+        self.assertEqual(result['notifications'], 3)
+        digest = SystemNotification.objects.get(recipient=self.tech_a, notification_type='preventive_maintenance')
+        self.assertEqual(len(digest.message.splitlines()), 3)
+        self.assertIsNone(digest.work_order)
+        # الجدول من غير فني بيبلغ منشئه
+        self.assertTrue(SystemNotification.objects.filter(recipient=self.manager).exists())
+        self.assertEqual(NotificationQueue.objects.count(), 3)
+
+    def test_dry_run_writes_nothing(self):
+        schedule = self._schedule(1)
+
+        out = StringIO()
+        call_command('generate_pm_work_orders', '--dry-run', stdout=out)
+        self.assertIn('Would generate 1 work orders', out.getvalue())
+        self.assertFalse(WorkOrder.objects.exists())
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.next_due_date, self.today)
+
+    def test_legacy_entry_points_delegate(self):
+        self._schedule(1)
+        self._schedule(2, next_due=self.today + timedelta(days=10))
+
+        self.assertEqual(check_and_generate_pm_work_orders(), 1)
+        self.assertEqual(PreventiveMaintenanceSchedule.check_and_generate_work_orders(), 0)
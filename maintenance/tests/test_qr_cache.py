@@ -0,0 +1,122 @@
+# اختبارات كاش صور QR ونقطة الرسم عند الطلب
+# الصورة بتتحدد بالتوكن بس، فالبصمة هي المفتاح وهي الـ ETag
+
+import os
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from core.qr_cache import QRImageCache, image_cache, image_digest
+from core.qr_render import render_png, render_svg
+from maintenance.models import Device, DeviceCategory
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class QRImageCacheTest(SimpleTestCase):
+    """LRU محدود بالحجم ومفتاحه بصمة المحتوى"""
+
+    def test_same_payload_renders_once(self):
+        cache = QRImageCache(max_bytes=10 ** 6)
+        digest, content_type, image = cache.get('device:abc')
+        self.assertEqual((digest, content_type, image), (image_digest('device:abc'), 'image/png', render_png('device:abc')))
+
+        cache.get('device:abc')
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+        self.assertNotEqual(cache.get('device:abc', 'svg')[0], digest)
+
+    def test_bounded_by_bytes_least_recently_used_first(self):
+        size = len(render_png('device:a'))
+        cache = QRImageCache(max_bytes=size * 2 + size // 2)
+        cache.get('device:a')
+        cache.get('device:b')
+        cache.get('device:a')  # a أحدث استخدام دلوقتي
+        cache.get('device:c')
+
+        self.assertEqual(cache.stats()['entries'], 2)
+        misses = cache.stats()['misses']
+        cache.get('device:a')
+        self.assertEqual(cache.stats()['misses'], misses)
+        cache.get('device:b')
+        self.assertEqual(cache.stats()['misses'], misses + 1)
+
+
+class QRImageEndpointTest(TestCase):
+    """نقطة /general/qr/image.<fmt> مع ETag و Cache-Control"""
+
+    @classmethod
+    def setUpTestData(cls):
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        cls.user = User.objects.create_user(username='qr_cache_user', password='testpass123', hospital=hospital)
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        department = Department.objects.create(name='قسم الأشعة', hospital=hospital)
+        room = Room.objects.create(number='1', ward=ward, department=department, room_type='regular_ROOM')
+        cls.device = Device.objects.create(
+            name='جهاز', serial_number='SN-1', model='M', category=DeviceCategory.objects.create(name='فئة'),
+            department=department, room=room,
+        )
+        cls.device.refresh_from_db()
+
+    def setUp(self):
+        image_cache.clear()
+        self.client.force_login(self.user)
+
+    def test_png_with_etag_and_revalidation(self):
+        url = self.device.qr_png_url
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response.content, render_png(self.device.qr_token))
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['ETag'], f'"{image_digest(self.device.qr_token)}"')
+
+        revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(image_cache.stats()['misses'], 1)
+
+    def test_svg(self):
+        response = self.client.get(self.device.qr_svg_url)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(response.content, render_svg(self.device.qr_token))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('general:qr_image', args=['gif']), {'data': 'x'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('general:qr_image', args=['png'])).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse('general:qr_image', args=['png']), {'data': 'x' * 600}).status_code, 400
+        )
+
+    def test_mixin_download_uses_token(self):
+        response = self.client.get(reverse('general:download_entity_qr', args=['maintenance.device', self.device.pk]))
+        self.assertEqual(response.content, render_png(self.device.qr_token))
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_download_is_scoped_to_hospital(self):
+        url = reverse('general:download_entity_qr', args=['maintenance.device', self.device.pk])
+        self.client.force_login(User.objects.create_user(username='no_hospital', password='testpass123'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # موديل QRCodeMixin بس مش في القائمة المسموحة
+        self.assertEqual(
+            self.client.get(reverse('general:download_entity_qr', args=['manager.ward', 1])).status_code, 404
+        )
+
+    def test_regenerate_command_writes_no_files(self):
+        qr_dir = os.path.join(settings.MEDIA_ROOT, 'qr_codes')
+        before = set(os.listdir(qr_dir)) if os.path.isdir(qr_dir) else set()
+
+        call_command('regenerate_qr_codes', '--model', 'Device', stdout=open(os.devnull, 'w'))
+        self.device.refresh_from_db()
+
+        self.assertEqual(self.device.qr_token, self.device.generate_qr_token())
+        self.assertEqual(set(os.listdir(qr_dir)) if os.path.isdir(qr_dir) else set(), before)
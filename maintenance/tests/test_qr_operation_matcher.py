@@ -0,0 +1,117 @@
+# اختبارات شجرة مطابقة عمليات QR
+# نفس نتيجة المطابقة القديمة (أول عملية بالـ id)، من غير استعلامات بعد أول بناء
+
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from maintenance.models import OperationDefinition, OperationStep
+from maintenance.qr_operation_matcher import compile_validator, invalidate, matcher
+from maintenance.qr_operations import QROperationsManager
+
+
+def entity(entity_type, entity_id=1, **data):
+    return {'type': entity_type, 'id': entity_id, 'data': data}
+
+
+class QROperationMatcherTest(TestCase):
+    """المطابقة من الشجرة المبنية في الذاكرة"""
+
+    def setUp(self):
+        invalidate()
+        self.usage = self._operation('DEVICE_USAGE', ['user', 'device', 'patient'])
+        self.end_usage = self._operation('END_DEVICE_USAGE', ['user', 'device', 'patient'])
+        self.transfer = self._operation('DEVICE_TRANSFER', ['user', 'device', 'department'])
+
+    def _operation(self, code, entity_types, **kwargs):
+        operation = OperationDefinition.objects.create(name=code.title(), code=code, **kwargs)
+        for order, entity_type in enumerate(entity_types, start=1):
+            OperationStep.objects.create(operation=operation, order=order, entity_type=entity_type)
+        return operation
+
+    def test_first_operation_by_id_wins(self):
+        scans = [entity('user'), entity('device'), entity('patient')]
+
+        self.assertEqual(matcher.match(scans), self.usage)
+        self.assertEqual(matcher.match(scans[:2]), None)
+        self.assertEqual(matcher.match([entity('user'), entity('device'), entity('department')]), self.transfer)
+        self.assertIsNone(matcher.match([]))
+
+    def test_validators_select_between_same_sequences(self):
+        OperationStep.objects.filter(operation=self.usage, entity_type='device').update(
+            validation_rule={'status': 'available'},
+        )
+        OperationStep.objects.filter(operation=self.usage, entity_type='patient').update(allowed_entity_ids=['7', 8])
+        invalidate()
+
+        self.assertEqual(matcher.match([entity('user'), entity('device', status='available'), entity('patient', 8)]), self.usage)
+        self.assertEqual(matcher.match([entity('user'), entity('device', status='in_use'), entity('patient', 8)]), self.end_usage)
+        self.assertEqual(matcher.match([entity('user'), entity('device', status='available'), entity('patient', 9)]), self.end_usage)
+
+    def test_legacy_string_rules(self):
+        self.assertTrue(compile_validator('{"status": "available"}', '')(entity('device', status='available')))
+        self.assertFalse(compile_validator('{"status": "available"}', '')(entity('device')))
+        self.assertTrue(compile_validator('ICU', '')(entity('bed', ward='ICU-2')))
+        self.assertTrue(compile_validator({}, '["3"]')(entity('device', 3)))
+        self.assertIsNone(compile_validator({}, []))
+        # JSON مش dict بيرجع لفحص النص
+        self.assertTrue(compile_validator('123', '')(entity('device', room='123')))
+        self.assertFalse(compile_validator('123', '')(entity('device', room='45')))
+        self.assertTrue(compile_validator(7, '')(entity('device', floor=7)))
+
+    def test_optional_steps_and_inactive_operations_are_skipped(self):
+        OperationStep.objects.create(operation=self.transfer, order=4, entity_type='room', is_required=False)
+        self.usage.is_active = False
+        self.usage.save()
+
+        self.assertEqual(matcher.match([entity('user'), entity('device'), entity('patient')]), self.end_usage)
+        self.assertEqual(matcher.match([entity('user'), entity('device'), entity('department')]), self.transfer)
+
+    def test_built_once_and_rebuilt_after_changes(self):
+        scans = [entity('user'), entity('device'), entity('patient')]
+        # البصمة + تعريفات + خطوات
+        with self.assertNumQueries(3):
+            matcher.match(scans)
+        with self.assertNumQueries(0):
+            for _ in range(20):
+                matcher.match(scans)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cleaning = self._operation('DEVICE_CLEANING', ['user', 'device'])
+        self.assertEqual(matcher.match(scans[:2]), cleaning)
+        with self.captureOnCommitCallbacks(execute=True):
+            cleaning.steps.filter(entity_type='device').delete()
+        self.assertIsNone(matcher.match(scans[:2]))
+
+    def test_changes_from_another_process_are_seen_after_the_check_interval(self):
+        scans = [entity('user'), entity('device'), entity('patient')]
+        self.assertEqual(matcher.match(scans), self.usage)
+        version = matcher.current_version()
+
+        # تعديل من عملية تانية: مفيش إبطال محلي، بس البصمة اتغيرت
+        OperationStep.objects.filter(operation=self.usage, entity_type='device').update(
+            validation_rule={'status': 'available'}, updated_at=timezone.now() + timedelta(seconds=1),
+        )
+        self.assertNotEqual(matcher.current_version(), version)
+        self.assertEqual(matcher.match(scans), self.usage)
+
+        matcher._checked_at = 0
+        self.assertEqual(matcher.match(scans), self.end_usage)
+
+    def test_next_entity_types(self):
+        self._operation('DEVICE_CLEANING', ['user', 'device'])
+
+        self.assertEqual(matcher.next_entity_types(['user']), {'device': ['DEVICE_CLEANING', 'DEVICE_TRANSFER', 'DEVICE_USAGE', 'END_DEVICE_USAGE']})
+        self.assertEqual(matcher.next_entity_types(['user', 'device']), {
+            'patient': ['DEVICE_USAGE', 'END_DEVICE_USAGE'],
+            'department': ['DEVICE_TRANSFER'],
+        })
+        self.assertEqual(matcher.next_entity_types(['patient']), {})
+
+    def test_manager_delegates_to_matcher(self):
+        manager = QROperationsManager()
+        scans = [entity('user'), entity('device')]
+
+        self.assertIsNone(manager.match_operation(scans))
+        self.assertEqual(set(manager.next_entity_types(scans)), {'patient', 'department'})
@@ -0,0 +1,136 @@
+# اختبارات رسم صور QR على دفعات
+# الحفظ مش بيرسم صور؛ صور المعمل بتترسم مجمعة أو أول ما حد ينزلها
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core import qr_render
+from laboratory.models import LabRequest, LabRequestItem, Test
+from maintenance.job_queue import sync_jobs
+from maintenance.models import Device, DeviceCategory, ScheduledJob
+from manager.models import Building, Department, Floor, Patient, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class QRRenderTest(TestCase):
+    """رسم صور QR خارج مسار الحفظ"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=cls.hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        cls.department = Department.objects.create(name='قسم الأشعة', hospital=cls.hospital)
+        cls.room = Room.objects.create(number='1', ward=ward, department=cls.department, room_type='regular_ROOM')
+        cls.category = DeviceCategory.objects.create(name='فئة')
+        cls.user = User.objects.create_user(username='qr_user', password='testpass123', hospital=cls.hospital)
+
+    def make_device(self, name='جهاز'):
+        return Device.objects.create(
+            name=name, serial_number=f'SN-{name}', model='M', category=self.category,
+            department=self.department, room=self.room,
+        )
+
+    def test_save_assigns_token_without_rendering(self):
+        device = self.make_device()
+        device.refresh_from_db()
+
+        self.assertTrue(device.qr_token)
+        self.assertFalse(device.qr_code)
+
+    def make_lab_request(self, tests=30):
+        patient = Patient.objects.create(
+            first_name='محمد', last_name='علي', gender='male', address='-', phone_number='1',
+            national_id='111', hospital=self.hospital,
+        )
+        lab_request = LabRequest.objects.create(patient=patient, requested_by=self.user)
+        for i in range(tests):
+            LabRequestItem.objects.create(request=lab_request, test=Test.objects.create(english_name=f'Test {i}'))
+        return lab_request
+
+    def test_bulk_created_rows_get_tokens(self):
+        Patient.objects.bulk_create([
+            Patient(
+                first_name=f'مريض {i}', last_name='اختبار', gender='male', address='-',
+                phone_number=str(i), national_id=f'N{i}', hospital=self.hospital,
+                mrn=f'MRN-{i}', medical_file_number=f'MF-{i}',
+            )
+            for i in range(3)
+        ])
+
+        result = qr_render.render_pending(['manager.patient'], workers=1)
+        self.assertEqual(result['tokens'], {'manager.patient': 3})
+        self.assertFalse(Patient.objects.filter(qr_token__isnull=True).exists())
+        # موديلات QRCodeMixin ملهاش صور محفوظة
+        self.assertFalse(Patient.objects.exclude(qr_code='').exclude(qr_code__isnull=True).exists())
+
+    def test_lab_items_render_off_the_save_path(self):
+        self.make_lab_request()
+
+        self.assertEqual(LabRequestItem.objects.exclude(sample_qr='').count(), 0)
+        result = qr_render.render_pending(
+            ['laboratory.labrequest', 'laboratory.labrequestitem'], batch_size=7, workers=1
+        )
+        self.assertEqual(result['rendered'], {'laboratory.labrequest': 1, 'laboratory.labrequestitem': 30})
+
+        item = LabRequestItem.objects.first()
+        payload = reverse('laboratory:sample_scan', args=[str(item.sample_token)])
+        with item.sample_qr.open('rb') as image:
+            self.assertEqual(image.read(), qr_render.render_png(payload))
+        # كل الصفوف اترسمت، فالتشغيلة الجاية مش بتلاقي حاجة
+        self.assertEqual(qr_render.render_pending(['laboratory.labrequestitem'], workers=1)['total'], 0)
+
+    def test_process_pool_batch(self):
+        self.make_lab_request(tests=qr_render.POOL_THRESHOLD)
+
+        result = qr_render.render_pending(['laboratory.labrequestitem'], workers=2)
+        self.assertEqual(result['total'], qr_render.POOL_THRESHOLD)
+        item = LabRequestItem.objects.last()
+        payload = reverse('laboratory:sample_scan', args=[str(item.sample_token)])
+        with item.sample_qr.open('rb') as image:
+            self.assertEqual(image.read(), qr_render.render_png(payload))
+
+    def test_first_download_renders_lazily(self):
+        item = self.make_lab_request(tests=1).items.get()
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('general:download_entity_qr', args=['laboratory.labrequestitem', item.pk]))
+        self.assertEqual(response.status_code, 200)
+        item.refresh_from_db()
+        self.assertTrue(item.sample_qr)
+        with item.sample_qr.open('rb') as image:
+            self.assertEqual(b''.join(response.streaming_content), image.read())
+
+        self.assertEqual(
+            self.client.get(reverse('general:download_entity_qr', args=['maintenance.nothing', 1])).status_code, 404
+        )
+
+    def test_lab_request_page_does_not_render(self):
+        lab_request = self.make_lab_request(tests=1)
+        url = lab_request.qr_png_url
+
+        self.assertTrue(url.startswith(reverse('general:qr_image', args=['png'])))
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, qr_render.render_png(lab_request.get_scan_url()))
+        lab_request.refresh_from_db()
+        self.assertFalse(lab_request.qr_code)
+
+        qr_render.render_pending()
+        lab_request.refresh_from_db()
+        self.assertEqual(lab_request.qr_png_url, lab_request.qr_code.url)
+
+    def test_save_triggers_render_job_after_commit(self):
+        sync_jobs()
+        later = timezone.now() + timezone.timedelta(minutes=5)
+        ScheduledJob.objects.filter(name='qr_render').update(next_run_at=later)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_lab_request(tests=1)
+        self.assertLess(ScheduledJob.objects.get(name='qr_render').next_run_at, later)
@@ -0,0 +1,89 @@
+# اختبارات فهرس رموز QR
+# هنا بنختبر إن البحث عن الكيان من الـ hash بيتم باستعلام واحد مهما كبر الجدول
+
+from unittest import mock
+
+from django.test import TestCase
+
+from maintenance.models import QRTokenIndex, SLADefinition
+from maintenance.qr_resolver import (
+    backfill_qr_index, compute_entity_hash, resolve_bare_hash, resolve_entity_hash
+)
+from maintenance.views import find_entity_by_hash, parse_qr_code
+from manager.models import Department
+from superadmin.models import Hospital
+
+
+class QRResolverTest(TestCase):
+    """اختبارات حل رموز QR عن طريق الفهرس"""
+
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        self.department = Department.objects.create(name='قسم اختبار', hospital=self.hospital)
+
+    def test_new_entity_is_indexed_on_save(self):
+        """إنشاء كيان جديد يضيفه للفهرس تلقائياً"""
+        token_hash = compute_entity_hash('department', self.department.pk)
+        self.assertTrue(
+            QRTokenIndex.objects.filter(
+                entity_type='department', token_hash=token_hash, object_id=self.department.pk
+            ).exists()
+        )
+
+    def test_other_models_do_not_touch_the_index(self):
+        """الإشارات متوصلة بموديلات الـ hash بس"""
+        with mock.patch('maintenance.qr_resolver.entity_type_for_model') as lookup:
+            SLADefinition.objects.create(name='SLA', response_time_hours=1, resolution_time_hours=4)
+        lookup.assert_not_called()
+
+    def test_resolve_uses_single_query(self):
+        """الحل باستعلام واحد بغض النظر عن حجم الجدول"""
+        token_hash = compute_entity_hash('department', self.department.pk)
+        for size in (100, 5000):
+            QRTokenIndex.objects.bulk_create([
+                QRTokenIndex(
+                    entity_type='department',
+                    token_hash=compute_entity_hash('department', 10 ** 6 + pk),
+                    object_id=10 ** 6 + pk,
+                )
+                for pk in range(size)
+            ], ignore_conflicts=True)
+            with self.assertNumQueries(1):
+                self.assertEqual(resolve_entity_hash('department', token_hash), self.department.pk)
+
+    def test_unindexed_rows_miss_until_backfilled(self):
+        """الصفوف اللي مش في الفهرس مش بتتفهرس وقت المسح، الـ backfill هو اللي بيضيفها"""
+        QRTokenIndex.objects.all().delete()
+        token_hash = compute_entity_hash('department', self.department.pk)
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(resolve_entity_hash('department', token_hash))
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_bare_hash(token_hash), (None, None))
+        self.assertFalse(QRTokenIndex.objects.exists())
+
+        backfill_qr_index(['department'])
+        self.assertEqual(find_entity_by_hash('department', token_hash), self.department.pk)
+
+    def test_backfill_indexes_missing_rows(self):
+        """الـ backfill يفهرس كل الصفوف الناقصة"""
+        QRTokenIndex.objects.all().delete()
+        counts = backfill_qr_index(['department'])
+
+        self.assertEqual(counts['department'], Department.objects.count())
+        self.assertEqual(backfill_qr_index(['department'])['department'], 0)
+
+    def test_unknown_hash(self):
+        """hash غير موجود يرجع None"""
+        self.assertIsNone(resolve_entity_hash('department', '000000000000'))
+        self.assertIsNone(resolve_entity_hash('unknown', '000000000000'))
+
+    def test_bare_hash_and_parse_qr_code(self):
+        """رمز بدون نوع الكيان ورمز entity_type:hash"""
+        token_hash = compute_entity_hash('department', self.department.pk)
+
+        self.assertEqual(resolve_bare_hash(token_hash), ('department', self.department.pk))
+
+        entity_type, entity_id, entity_data, error = parse_qr_code(f"department:{token_hash}")
+        self.assertIsNone(error)
+        self.assertEqual((entity_type, entity_id), ('department', self.department.pk))
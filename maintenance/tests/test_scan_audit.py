@@ -0,0 +1,241 @@
+# اختبارات سجل مسح QR المؤجل
+# التسجيل من غير استعلامات، والكتابة بـ bulk_create، والـ spool بيرجع السجلات بعد وقوع العملية
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from maintenance import scan_audit
+from maintenance.models import QRScanLog
+from maintenance.scheduler_config import SCHEDULER_CONFIG
+from maintenance.views import log_qr_scan
+
+User = get_user_model()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class ScanAuditBufferTest(TestCase):
+    """الطابور والـ spool والكتابة على دفعات"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='audit_user', password='testpass123')
+
+    def setUp(self):
+        self.spool_dir = Path(tempfile.mkdtemp())
+        config = mock.patch.dict(SCHEDULER_CONFIG['scan_audit'], {
+            'spool_dir': str(self.spool_dir), 'background': False,
+            'batch_size': 5, 'flush_interval_ms': 60000,
+        })
+        config.start()
+        self.addCleanup(config.stop)
+        self.buffer = scan_audit.ScanAuditBuffer()
+        self.addCleanup(self.buffer.shutdown)
+
+    def _record(self, n, **fields):
+        values = {
+            'qr_code': f'device:{n}', 'entity_type': 'device', 'entity_id': str(n),
+            'entity_data': {'name': f'جهاز {n}'}, 'scanned_by_id': self.user.pk, 'device_type': 'scanner',
+        }
+        return self.buffer.record(**{**values, **fields})
+
+    def _spool_lines(self):
+        return [line for path in self.spool_dir.glob('*.jsonl') for line in path.read_text(encoding='utf-8').splitlines()]
+
+    def test_recording_does_not_query_and_is_spooled(self):
+        with self.assertNumQueries(0):
+            for n in range(4):
+                self._record(n)
+
+        self.assertEqual(self.buffer.pending(), 4)
+        self.assertEqual([json.loads(line)['qr_code'] for line in self._spool_lines()], [f'device:{n}' for n in range(4)])
+        self.assertFalse(QRScanLog.objects.exists())
+
+    def test_batch_size_flushes_in_one_insert_with_scan_times(self):
+        scanned_at = timezone.now() - timedelta(minutes=3)
+        for n in range(4):
+            self._record(n, scanned_at=scanned_at)
+        # savepoint + insert + release
+        with self.assertNumQueries(3):
+            self._record(4, scanned_at=scanned_at)
+
+        self.assertEqual(QRScanLog.objects.count(), 5)
+        self.assertEqual(set(QRScanLog.objects.values_list('scanned_at', flat=True)), {scanned_at})
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(self._spool_lines(), [])
+        self.assertEqual(self.buffer.stats()['batches'], 1)
+
+    def test_interval_flushes_on_next_record(self):
+        with mock.patch.dict(SCHEDULER_CONFIG['scan_audit'], {'flush_interval_ms': 0}):
+            self._record(1)
+
+        self.assertEqual(QRScanLog.objects.count(), 1)
+
+    def test_database_errors_keep_records_queued_and_spooled(self):
+        for n in range(3):
+            self._record(n)
+        with mock.patch('maintenance.scan_audit.write_rows', side_effect=OperationalError('database is locked')):
+            self.assertEqual(self.buffer.flush(), 0)
+
+        self.assertEqual(self.buffer.pending(), 3)
+        self.assertEqual(len(self._spool_lines()), 3)
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(QRScanLog.objects.count(), 3)
+
+    def test_any_write_error_keeps_records_queued_and_spooled(self):
+        for n in range(3):
+            self._record(n)
+        with mock.patch('maintenance.scan_audit.write_rows', side_effect=RuntimeError('bad row')):
+            with self.assertLogs('maintenance.scan_audit', 'ERROR'):
+                self.assertEqual(self.buffer.flush(), 0)
+
+        self.assertEqual(self.buffer.pending(), 3)
+        self.assertEqual(len(self._spool_lines()), 3)
+
+    def test_spool_lines_are_fsynced(self):
+        with mock.patch('maintenance.scan_audit.os.fsync') as fsync:
+            self._record(1)
+        fsync.assert_called_once()
+
+    def test_background_thread_fsyncs_new_lines_once(self):
+        # مع الـ thread التسجيل ما بيستناش الديسك، وfsync واحد بيغطي كل السطور الجديدة
+        self.buffer._thread = mock.Mock()
+        self.addCleanup(setattr, self.buffer, '_thread', None)
+        with mock.patch('maintenance.scan_audit.os.fsync') as fsync:
+            for n in range(3):
+                self._record(n)
+            fsync.assert_not_called()
+            self.buffer.sync_spool()
+            self.buffer.sync_spool()
+        fsync.assert_called_once()
+
+    def test_update_during_a_write_is_applied_after_it(self):
+        # التعديل ما بيستناش الكتابة: بيتشال لحد ما الدفعة تتكتب وبعدين بيتعمل
+        queued = self._record(1)
+        write_rows = scan_audit.write_rows
+
+        def write_with_update(rows):
+            self.assertTrue(self.buffer.update(queued['reference'], flow_name='usage'))
+            return write_rows(rows)
+
+        with mock.patch('maintenance.scan_audit.write_rows', side_effect=write_with_update):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(QRScanLog.objects.get().flow_name, 'usage')
+
+    def test_update_during_a_failed_write_stays_queued(self):
+        queued = self._record(1)
+
+        def failing_write(rows):
+            self.buffer.update(queued['reference'], flow_name='usage')
+            raise OperationalError('database is locked')
+
+        with mock.patch('maintenance.scan_audit.write_rows', side_effect=failing_write):
+            with self.assertLogs('maintenance.scan_audit', 'WARNING'):
+                self.buffer.flush()
+        self.buffer.flush()
+        self.assertEqual(QRScanLog.objects.get().flow_name, 'usage')
+
+    def test_update_reaches_queued_and_written_records(self):
+        queued = self._record(1)
+        self.assertTrue(self.buffer.update(queued['reference'], flow_name='usage', flow_executed=True))
+        self.assertEqual(json.loads(self._spool_lines()[-1])['fields'], {'flow_name': 'usage', 'flow_executed': True})
+        self.buffer.flush()
+        self.assertEqual(QRScanLog.objects.get(reference=queued['reference']).flow_name, 'usage')
+
+        # اتكتب خلاص: التعديل بيروح لقاعدة البيانات
+        self.assertTrue(self.buffer.update(queued['reference'], session_id='S-1'))
+        self.assertEqual(QRScanLog.objects.get().session_id, 'S-1')
+
+    def test_shutdown_flushes_and_removes_the_spool(self):
+        self._record(1)
+        self.buffer.shutdown()
+
+        self.assertEqual(QRScanLog.objects.count(), 1)
+        self.assertEqual(list(self.spool_dir.iterdir()), [])
+
+    def test_spool_of_a_dead_process_is_replayed_once(self):
+        scanned_at = timezone.now() - timedelta(hours=1)
+        rows = [
+            {'qr_code': f'device:{n}', 'entity_type': 'device', 'entity_id': str(n), 'entity_data': {},
+             'scanned_by_id': None, 'device_type': 'mobile', 'scanned_at': scanned_at}
+            for n in range(3)
+        ]
+        path = self.spool_dir / f'qrscan-{dead_pid()}.jsonl'
+        # آخر سطر متقطع زي ما العملية ماتت وهي بتكتبه
+        rows[1]['reference'] = 'b5a1f4c2-0c1e-4f55-9d7b-2f0f7f6a1e10'
+        update = json.dumps({'update': rows[1]['reference'], 'fields': {'flow_name': 'usage'}})
+        path.write_text(
+            ''.join(scan_audit._encode(row) + '\n' for row in rows) + update + '\n' + '{"qr_code": "dev', encoding='utf-8',
+        )
+        live = self.spool_dir / f'qrscan-{os.getpid()}.jsonl'
+        live.write_text(scan_audit._encode(rows[0]) + '\n', encoding='utf-8')
+
+        with self.assertLogs('maintenance.scan_audit', 'WARNING'):
+            self.assertEqual(scan_audit.replay_spool(), 3)
+        self.assertEqual(scan_audit.replay_spool(), 0)
+        self.assertEqual(QRScanLog.objects.filter(scanned_at=scanned_at).count(), 3)
+        self.assertEqual(QRScanLog.objects.get(flow_name='usage').entity_id, '1')
+        self.assertFalse(path.exists())
+        self.assertTrue(live.exists())
+
+    def test_log_qr_scan_queues_instead_of_inserting(self):
+        request = RequestFactory().post('/', HTTP_X_FORWARDED_FOR='10.0.0.7, 10.0.0.1')
+        with mock.patch.object(scan_audit, 'buffer', self.buffer), self.assertNumQueries(0):
+            scan_log = log_qr_scan(
+                'device:9|sig=abc', 'device', 9, {'name': 'x'}, user=self.user, request=request, device_type='scanner',
+            )
+
+        self.assertIsNone(scan_log.id)
+        self.assertEqual((scan_log.ip_address, scan_log.token_signature), ('10.0.0.7', 'abc'))
+        self.buffer.flush()
+        self.assertEqual(QRScanLog.objects.get().scanned_by, self.user)
+
+    def _scan_api(self, **data):
+        with mock.patch.object(scan_audit, 'buffer', self.buffer), \
+                mock.patch('maintenance.views.parse_qr_code', return_value=('device', 5, {'name': 'x'}, None)):
+            return self.client.post(reverse('maintenance:scan_qr_code_api'), {'qr_code': 'device:5', **data})
+
+    def test_scan_api_returns_the_log_reference(self):
+        response = self._scan_api(device_type='scanner')
+
+        self.assertEqual(response.status_code, 200)
+        self.buffer.flush()
+        self.assertEqual(json.loads(response.content)['scan_id'], str(QRScanLog.objects.get().reference))
+
+    def test_scan_is_logged_when_the_flow_fails(self):
+        with mock.patch('core.secure_qr.QRContextFlow.start_session', side_effect=RuntimeError('flow down')):
+            response = self._scan_api(device_type='mobile', user_id=self.user.pk)
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.buffer.pending(), 1)
+
+
+class ScanAuditIntegrityTest(TransactionTestCase):
+    """سطر فيه مشكلة ما يوقعش الدفعة كلها (قيود SQLite بتتفحص مع الـ commit)"""
+
+    def test_invalid_rows_do_not_drop_the_batch(self):
+        user = User.objects.create_user(username='audit_integrity', password='testpass123')
+        buffer = scan_audit.ScanAuditBuffer()
+        with mock.patch.dict(SCHEDULER_CONFIG['scan_audit'], {'spool_dir': None, 'background': False}):
+            for n, scanned_by_id in enumerate([user.pk, user.pk + 1000, user.pk], start=1):
+                buffer.record(qr_code=f'device:{n}', entity_type='device', entity_id=str(n), scanned_by_id=scanned_by_id)
+            with self.assertLogs('maintenance.scan_audit', 'WARNING'):
+                self.assertEqual(buffer.flush(), 2)
+
+        self.assertEqual(sorted(QRScanLog.objects.values_list('entity_id', flat=True)), ['1', '3'])
@@ -0,0 +1,214 @@
+# اختبارات تجميع مسحات QR بالساعة
+# التجميع بيكمل من آخر سجل، والخريطة الحرارية والأجهزة الخاملة بيقروا من الصفوف المجمعة
+
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from maintenance import scan_rollups
+from maintenance.models import (
+    Device, DeviceCategory, QRScanLastSeen, QRScanLog, QRScanRollup, QRScanRollupCursor, ScanHistory, ScanSession,
+)
+from maintenance.scheduler_config import SCHEDULER_CONFIG
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+# الاتنين 2026-03-02 الساعة 9 الصبح بالتوقيت المحلي
+MONDAY_9AM = timezone.make_aware(datetime(2026, 3, 2, 9, 15))
+
+# التنظيف مقفول افتراضياً
+RETENTION = {'raw_retention_days': 90, 'hourly_retention_days': 180, 'history_retention_days': 180}
+
+
+class ScanRollupTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='rollup_user', password='testpass123')
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        cls.icu = Department.objects.create(name='العناية', hospital=hospital)
+        cls.er = Department.objects.create(name='الطوارئ', hospital=hospital)
+        cls.room = Room.objects.create(number='1', ward=ward, department=cls.er, room_type='regular_ROOM')
+        category = DeviceCategory.objects.create(name='فئة')
+        cls.devices = [
+            Device.objects.create(
+                name=f'جهاز {n}', serial_number=f'RU-{n}', model='M', category=category,
+                department=cls.icu if n < 2 else cls.er, room=cls.room,
+            )
+            for n in range(3)
+        ]
+
+    def _log(self, entity_type, entity_id, scanned_at, **fields):
+        return QRScanLog.objects.create(
+            qr_code=f'{entity_type}:{entity_id}', entity_type=entity_type, entity_id=str(entity_id),
+            scanned_at=scanned_at, **fields,
+        )
+
+    def _rollup(self, **filters):
+        return {
+            (row.bucket, row.entity_type, row.department_id, row.scanner_id, row.flow_name): row.scans
+            for row in QRScanRollup.objects.filter(**filters)
+        }
+
+    def test_scans_are_counted_per_hour_and_dimension(self):
+        device = self.devices[0]
+        self._log('device', device.pk, MONDAY_9AM, scanner_id='S1', flow_name='usage')
+        self._log('device', device.pk, MONDAY_9AM + timedelta(minutes=30), scanner_id='S1', flow_name='usage')
+        self._log('device', self.devices[2].pk, MONDAY_9AM)
+        self._log('room', self.room.pk, MONDAY_9AM + timedelta(hours=1))
+        self._log('patient', 'MRN-1', MONDAY_9AM)
+
+        result = scan_rollups.rollup_scans()
+
+        nine = MONDAY_9AM.replace(minute=0)
+        self.assertEqual(result['scans'], 5)
+        self.assertEqual(self._rollup(granularity='hour'), {
+            (nine, 'device', self.icu.pk, 'S1', 'usage'): 2,
+            (nine, 'device', self.er.pk, '', ''): 1,
+            (nine + timedelta(hours=1), 'room', self.er.pk, '', ''): 1,
+            (nine, 'patient', None, '', ''): 1,
+        })
+        seen = QRScanLastSeen.objects.get(entity_type='device', entity_id=str(device.pk))
+        self.assertEqual((seen.scans, seen.last_scanned_at, seen.department_id), (2, MONDAY_9AM + timedelta(minutes=30), self.icu.pk))
+
+    def test_rollup_is_incremental_and_counts_late_logs_in_their_hour(self):
+        device = self.devices[0]
+        self._log('device', device.pk, MONDAY_9AM)
+        scan_rollups.rollup_scans()
+
+        with self.assertNumQueries(2):
+            # المؤشر + سجلات جديدة (مفيش)
+            self.assertEqual(scan_rollups.rollup_scans()['scans'], 0)
+
+        # سجل مؤجل اتكتب بعد التجميع بوقت مسح قديم
+        self._log('device', device.pk, MONDAY_9AM + timedelta(minutes=5))
+        self._log('device', device.pk, MONDAY_9AM + timedelta(days=1))
+        self.assertEqual(scan_rollups.rollup_scans(batch_size=1)['scans'], 2)
+
+        nine = MONDAY_9AM.replace(minute=0)
+        self.assertEqual(self._rollup(granularity='hour'), {
+            (nine, 'device', self.icu.pk, '', ''): 2,
+            (nine + timedelta(days=1), 'device', self.icu.pk, '', ''): 1,
+        })
+        self.assertEqual(QRScanLastSeen.objects.get(entity_id=str(device.pk)).scans, 3)
+
+    def test_logs_committed_out_of_order_are_picked_up_from_gaps(self):
+        logs = [self._log('device', self.devices[0].pk, MONDAY_9AM) for _ in range(3)]
+        # السجل الأوسط لسه في transaction مفتوحة وقت التجميع
+        late = QRScanLog.objects.filter(pk=logs[1].pk)
+        fields = late.values('qr_code', 'entity_type', 'entity_id', 'scanned_at').get()
+        late.delete()
+
+        result = scan_rollups.rollup_scans(now=MONDAY_9AM)
+        self.assertEqual((result['scans'], result['gaps'], result['last_log_id']), (2, 1, logs[2].pk))
+
+        QRScanLog.objects.create(pk=logs[1].pk, **fields)
+        result = scan_rollups.rollup_scans(now=MONDAY_9AM + timedelta(minutes=5))
+        self.assertEqual((result['scans'], result['gaps']), (1, 0))
+        self.assertEqual(QRScanRollup.objects.get().scans, 3)
+
+        # الفجوة اللي متتملاش بتتساب بعد gap_timeout
+        QRScanLog.objects.filter(pk=logs[2].pk).delete()
+        self._log('device', self.devices[0].pk, MONDAY_9AM)
+        QRScanRollupCursor.objects.update(last_log_id=logs[1].pk)
+        self.assertEqual(scan_rollups.rollup_scans(now=MONDAY_9AM)['gaps'], 1)
+        self.assertEqual(scan_rollups.rollup_scans(now=MONDAY_9AM + timedelta(hours=1))['gaps'], 0)
+
+    def test_heatmap_reads_weekday_hour_cells(self):
+        for minutes in (0, 10, 20):
+            self._log('device', self.devices[0].pk, MONDAY_9AM + timedelta(minutes=minutes))
+        self._log('device', self.devices[2].pk, MONDAY_9AM + timedelta(days=2, hours=5))
+        scan_rollups.rollup_scans()
+        now = MONDAY_9AM + timedelta(days=3)
+
+        data = scan_rollups.heatmap(days=7, now=now)
+        self.assertEqual(data['total'], 4)
+        self.assertEqual(data['matrix'][0][9], 3)
+        self.assertEqual(data['matrix'][2][14], 1)
+        self.assertEqual(data['by_department'][0], {'department_id': self.icu.pk, 'department': 'العناية', 'scans': 3})
+
+        icu = scan_rollups.heatmap(days=7, department_id=self.er.pk, now=now)
+        self.assertEqual(icu['total'], 1)
+
+    def test_idle_assets_lists_never_scanned_first(self):
+        now = MONDAY_9AM + timedelta(days=60)
+        self._log('device', self.devices[0].pk, now - timedelta(days=1))
+        self._log('device', self.devices[1].pk, now - timedelta(days=40))
+        scan_rollups.rollup_scans()
+
+        # العدد + الصفحة
+        with self.assertNumQueries(2):
+            data = scan_rollups.idle_assets(days=30, now=now)
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['never_scanned'], 1)
+        self.assertEqual([asset['id'] for asset in data['assets']], [self.devices[2].pk, self.devices[1].pk])
+        self.assertEqual(data['assets'][1]['idle_days'], 40)
+
+        icu = scan_rollups.idle_assets(days=30, department_id=self.icu.pk, now=now)
+        self.assertEqual([asset['id'] for asset in icu['assets']], [self.devices[1].pk])
+        with self.assertRaises(ValueError):
+            scan_rollups.idle_assets(entity_type='patient')
+
+    def test_compact_deletes_rolled_up_logs_and_downsamples_hours(self):
+        now = MONDAY_9AM + timedelta(days=400)
+        old = [self._log('device', self.devices[0].pk, MONDAY_9AM + timedelta(hours=h)) for h in range(3)]
+        scan_rollups.rollup_scans()
+        # اتكتب بعد التجميع فلسه محتاج يتجمع قبل ما يتمسح
+        pending = self._log('device', self.devices[0].pk, MONDAY_9AM)
+
+        session = ScanSession.objects.create(user=self.user, status='completed')
+        active = ScanSession.objects.create(user=self.user, status='active')
+        for scan_session in (session, active):
+            ScanHistory.objects.create(session=scan_session, entity_type='device', entity_id=1)
+        ScanHistory.objects.update(scanned_at=MONDAY_9AM)
+
+        with mock.patch.dict(SCHEDULER_CONFIG['scan_rollups'], RETENTION):
+            result = scan_rollups.compact(now=now)
+
+        self.assertEqual(result['raw_logs'], 3)
+        self.assertEqual(list(QRScanLog.objects.values_list('pk', flat=True)), [pending.pk])
+        self.assertFalse(QRScanLog.objects.filter(pk__in=[log.pk for log in old]).exists())
+        self.assertEqual(result['hourly_rows'], 3)
+        self.assertEqual(self._rollup(), {
+            (scan_rollups.day_bucket(MONDAY_9AM), 'device', self.icu.pk, '', ''): 3,
+        })
+        self.assertEqual(list(ScanHistory.objects.values_list('session', flat=True)), [active.pk])
+
+        # التجميع بعد التقليل بيكتب صف ساعة جديد جنب صف اليوم
+        scan_rollups.rollup_scans()
+        self.assertEqual(QRScanRollup.objects.filter(granularity='hour').get().scans, 1)
+
+    def test_retention_is_off_by_default(self):
+        self._log('device', self.devices[0].pk, MONDAY_9AM)
+        scan_rollups.rollup_scans()
+        result = scan_rollups.compact(now=MONDAY_9AM + timedelta(days=1000))
+        self.assertEqual((result['raw_logs'], result['hourly_rows'], result['history_rows']), (0, 0, 0))
+        self.assertEqual(QRScanLog.objects.count(), 1)
+
+    def test_dashboard_endpoints(self):
+        self._log('device', self.devices[0].pk, timezone.now())
+        scan_rollups.rollup_scans()
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('maintenance:dashboard:scan_heatmap_api'), {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['total'], 1)
+
+        response = self.client.get(reverse('maintenance:dashboard:idle_assets_api'), {'department': self.icu.pk})
+        self.assertEqual([asset['id'] for asset in json.loads(response.content)['assets']], [self.devices[1].pk])
+
+        self.assertEqual(self.client.get(reverse('maintenance:dashboard:idle_assets_api'), {'entity_type': 'user'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('maintenance:dashboard:scan_heatmap_api'), {'days': 'x'}).status_code, 400)
+        for name in ('scan_heatmap_api', 'idle_assets_api'):
+            response = self.client.get(reverse(f'maintenance:dashboard:{name}'), {'department': 'icu'})
+            self.assertEqual(response.status_code, 400)
@@ -0,0 +1,252 @@
+# اختبارات حالة جلسة المسح في الكاش
+# كل مسحة بتضيف عنصر واحد من غير ما تقرا ScanHistory، والكتابة بتحصل مرة واحدة عند إنهاء الجلسة
+
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from maintenance import scan_session_state as scan_state
+from maintenance.models import (
+    DashboardCacheGeneration, Device, DeviceCategory, DeviceCleaningLog, DeviceTransferLog, ScanHistory, ScanSession,
+)
+from maintenance.qr_operations import QROperationsManager
+from maintenance.scheduler_config import SCHEDULER_CONFIG
+from maintenance.views import save_scan_session
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class ScanSessionStateTest(TestCase):
+    """الحالة بتتبني مرة وبتتزود مع كل مسحة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='scan_user', password='testpass123')
+
+    def setUp(self):
+        cache.clear()
+        self.session = ScanSession.objects.create(user=self.user, status='active')
+        # التأجيل بيشتغل مع الكاش المشترك بس (الاختبارات على LocMem)
+        patcher = mock.patch.object(scan_state, 'is_shared_cache', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _scan(self, entity_type, entity_id, **data):
+        return scan_state.append(self.session, f'{entity_type}:{entity_id}', entity_type, entity_id, data or None)
+
+    def test_appending_scans_does_not_query(self):
+        scan_state.load(self.session)
+        with self.assertNumQueries(0):
+            self._scan('user', self.user.pk, username='scan_user')
+            for n in range(10):
+                self._scan('device', n, status='available')
+            state = scan_state.load(self.session)
+
+        self.assertEqual(state.count, 11)
+        self.assertEqual(state.entity_types[:2], ['user', 'device'])
+        self.assertEqual(state.last('device')['id'], 9)
+        self.assertTrue(state.has('user'))
+        self.assertFalse(state.has('patient'))
+        self.assertEqual(ScanHistory.objects.count(), 0)
+
+    def test_manager_reads_entities_from_state(self):
+        self._scan('user', self.user.pk)
+        self._scan('device', 4, status='available')
+
+        with self.assertNumQueries(0):
+            entities = QROperationsManager().get_scanned_entities(self.session)
+        self.assertEqual([(e['type'], e['id'], e['data']) for e in entities], [
+            ('user', self.user.pk, {}),
+            ('device', 4, {'status': 'available'}),
+        ])
+
+    def test_commit_writes_history_once_with_scan_times(self):
+        for n in range(5):
+            self._scan('device', n)
+        scanned = [scan_state.scanned_time(e) for e in scan_state.load(self.session).entities]
+
+        # savepoint + insert + تصحيح أوقات المسح + release
+        with self.assertNumQueries(4):
+            self.assertEqual(scan_state.commit(self.session), 5)
+
+        rows = list(ScanHistory.objects.filter(session=self.session).order_by('pk'))
+        self.assertEqual([row.entity_id for row in rows], list(range(5)))
+        self.assertEqual([row.scanned_at for row in rows], scanned)
+        self.assertIsNone(cache.get(scan_state._key(self.session.session_id)))
+
+    def test_state_is_rebuilt_from_history_after_a_cache_miss(self):
+        ScanHistory.objects.create(
+            session=self.session, scanned_code='user:1', entity_type='user', entity_id=self.user.pk,
+            entity_data=json.dumps({'username': 'scan_user'}),
+        )
+        ScanHistory.objects.create(session=self.session, entity_type='device', entity_id=3, is_valid=False)
+
+        with self.assertNumQueries(1):
+            state = scan_state.load(self.session)
+        self.assertEqual(state.entities[0]['data'], {'username': 'scan_user'})
+        self.assertEqual(state.count, 1)
+
+        with self.assertNumQueries(0):
+            scan_state.load(self.session)
+
+    def test_pending_rows_are_bounded(self):
+        with mock.patch.dict(SCHEDULER_CONFIG['scan_sessions'], {'max_pending': 3}):
+            for n in range(7):
+                self._scan('device', n)
+
+        self.assertEqual(ScanHistory.objects.count(), 6)
+        self.assertEqual(len(scan_state.load(self.session).pending), 1)
+        self.assertEqual(scan_state.load(self.session).count, 7)
+
+    def test_history_written_per_scan_when_deferral_is_off(self):
+        with mock.patch.dict(SCHEDULER_CONFIG['scan_sessions'], {'defer_history': False}):
+            self._scan('device', 1)
+
+        self.assertEqual(ScanHistory.objects.count(), 1)
+        self.assertEqual(scan_state.load(self.session).pending, [])
+
+    def test_deferral_is_off_without_a_shared_cache(self):
+        with mock.patch.object(scan_state, 'is_shared_cache', return_value=False):
+            self.assertFalse(scan_state.defer_history())
+            self._scan('device', 1)
+
+        self.assertEqual(ScanHistory.objects.count(), 1)
+
+    def test_idle_sessions_are_expired_and_flushed(self):
+        idle = ScanSession.objects.create(user=self.user, status='active')
+        for n in range(3):
+            scan_state.append(idle, f'device:{n}', 'device', n)
+        self._scan('device', 9)
+        now = timezone.now() + timedelta(hours=1)
+        # الجلسة التانية اتعملت من بدري بس لسه بتمسح
+        ScanSession.objects.update(updated_at=now - timedelta(hours=2))
+        state = scan_state.load(self.session)
+        state.entities[-1]['scanned_at'] = (now - timedelta(minutes=5)).isoformat()
+        state.save()
+
+        self.assertEqual(scan_state.expire_idle_sessions(now=now), {'expired': 1, 'history_rows': 3})
+
+        self.assertEqual(ScanSession.objects.get(pk=idle.pk).status, 'expired')
+        self.assertEqual(ScanSession.objects.get(pk=self.session.pk).status, 'active')
+        self.assertEqual(ScanHistory.objects.filter(session=idle).count(), 3)
+        self.assertIsNone(cache.get(scan_state._key(idle.session_id)))
+        self.assertEqual(scan_state.expire_idle_sessions(now=now)['expired'], 0)
+
+    def test_appends_from_stale_states_are_not_lost(self):
+        # طلبين قروا الحالة قبل ما أي واحد فيهم يكتب
+        first = scan_state.load(self.session)
+        second = scan_state.load(self.session)
+        scan_state.append(self.session, 'device:1', 'device', 1, state=first)
+        scan_state.append(self.session, 'device:2', 'device', 2, state=second)
+
+        state = scan_state.load(self.session)
+        self.assertEqual([e['id'] for e in state.entities], [1, 2])
+        self.assertEqual(len(state.pending), 2)
+        self.assertEqual([e['id'] for e in second.entities], [1, 2])
+
+    def test_flushing_a_stale_state_does_not_duplicate_rows(self):
+        self._scan('device', 1)
+        stale = scan_state.load(self.session)
+        self.assertEqual(scan_state.flush(scan_state.load(self.session)), 1)
+        self.assertEqual(scan_state.flush(stale), 0)
+        self.assertEqual(scan_state.commit(self.session, stale), 0)
+        self.assertEqual(ScanHistory.objects.count(), 1)
+
+    def test_busy_session_raises_after_waiting(self):
+        with mock.patch.object(scan_state, 'LOCK_WAIT', 0):
+            with scan_state.session_lock(self.session):
+                with self.assertRaises(scan_state.ScanSessionBusy):
+                    self._scan('device', 1)
+        # القفل اتفك وبيقبل المسحة
+        self._scan('device', 1)
+        self.assertEqual(scan_state.load(self.session).count, 1)
+
+
+class SaveScanSessionTest(TestCase):
+    """حفظ الجلسة بيحمل الكيانات ويكتب السجلات على دفعات"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='scan_saver', password='testpass123')
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        cls.department = Department.objects.create(name='قسم', hospital=hospital)
+        cls.target = Department.objects.create(name='قسم تاني', hospital=hospital)
+        cls.room = Room.objects.create(number='1', ward=ward, department=cls.department, room_type='regular_ROOM')
+        category = DeviceCategory.objects.create(name='فئة')
+        cls.devices = [
+            Device.objects.create(
+                name=f'جهاز {n}', serial_number=f'SS-{n}', model='M', category=category,
+                department=cls.department, room=cls.room,
+            )
+            for n in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def _session(self, scans):
+        session = ScanSession.objects.create(user=self.user, status='active')
+        state = None
+        for entity_type, entity_id in scans:
+            state = scan_state.append(session, f'{entity_type}:{entity_id}', entity_type, entity_id, state=state)
+        return session
+
+    def _save(self, session, operation_type):
+        request = self.factory.post(
+            '/maintenance/api/scan-session/save/',
+            data=json.dumps({'session_id': str(session.session_id), 'operation_type': operation_type}),
+            content_type='application/json',
+        )
+        request.user = self.user
+        response = save_scan_session(request)
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content)
+
+    def test_transfer_moves_every_scanned_device(self):
+        session = self._session(
+            [('user', self.user.pk)] + [('device', d.pk) for d in self.devices[:3]]
+            + [('device', self.devices[0].pk), ('department', self.target.pk)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self._save(session, 'transfer')
+
+        self.assertEqual(len(result['created_records']), 3)
+        # bulk_update مش بيبعت post_save: القسمين اتبطل كاشهم
+        self.assertEqual(
+            set(DashboardCacheGeneration.objects.values_list('scope', flat=True)),
+            {str(self.department.pk), str(self.target.pk)},
+        )
+        self.assertEqual(
+            set(Device.objects.filter(department=self.target).values_list('pk', flat=True)),
+            {d.pk for d in self.devices[:3]},
+        )
+        log = DeviceTransferLog.objects.get(device=self.devices[1])
+        self.assertEqual((log.from_department, log.to_department, log.to_room), (self.department, self.target, self.room))
+        self.assertEqual(ScanHistory.objects.filter(session=session).count(), 6)
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'completed')
+
+    def test_query_count_does_not_grow_with_devices(self):
+        def queries(devices):
+            session = self._session([('user', self.user.pk)] + [('device', d.pk) for d in devices])
+            with CaptureQueriesContext(connection) as captured:
+                self._save(session, 'clean')
+            return len(captured)
+
+        self.assertEqual(queries(self.devices[:1]), queries(self.devices))
+        self.assertEqual(DeviceCleaningLog.objects.count(), 5)
+        self.assertEqual(Device.objects.filter(clean_status='clean').count(), 4)
@@ -0,0 +1,135 @@
+# اختبارات فهرس البحث الموحد
+# بنتأكد إن الإشارات بتحدث الفهرس وإن النتايج مرتبة ومقسمة لصفحات ومظللة
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from maintenance import search_index
+from maintenance.models import Device, DeviceCategory, SearchDocument, ServiceRequest, SparePart, Supplier
+from manager.models import Building, Department, Floor, Patient, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class SearchIndexTest(TestCase):
+    """تحديث الفهرس من الإشارات والبحث المرتب"""
+
+    @classmethod
+    def setUpTestData(cls):
+        search_index.ensure_fts()
+
+        cls.hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=cls.hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        department = Department.objects.create(name='قسم الأشعة', hospital=cls.hospital)
+        room = Room.objects.create(number='1', ward=ward, department=department, room_type='regular_ROOM')
+        cls.user = User.objects.create_user(username='search_user', password='testpass123')
+        cls.category = DeviceCategory.objects.create(name='فئة')
+
+        cls.ct = Device.objects.create(
+            name='جهاز أشعة مقطعية', serial_number='CT-2024-77', model='Revolution',
+            category=cls.category, department=department, room=room,
+        )
+        cls.monitor = Device.objects.create(
+            name='شاشة مراقبة', serial_number='MON-1', model='Monitor <b>X</b>',
+            category=cls.category, department=department, room=room,
+        )
+        cls.request = ServiceRequest.objects.create(
+            device=cls.ct, reporter=cls.user, title='عطل في الأشعة', description='الجهاز لا يعمل', status='assigned',
+        )
+
+    def hit_ids(self, query, **kwargs):
+        return [(hit['type'], hit['id']) for hit in search_index.search(query, **kwargs)['hits']]
+
+    def test_signals_keep_index_current(self):
+        self.assertEqual(self.hit_ids('CT-2024'), [('device', self.ct.pk)])
+
+        self.ct.serial_number = 'NEW-SERIAL'
+        self.ct.save()
+        self.assertEqual(self.hit_ids('CT-2024'), [])
+        self.assertEqual(self.hit_ids('new serial'), [('device', self.ct.pk)])
+
+        self.monitor.delete()
+        self.assertFalse(SearchDocument.objects.filter(entity='device', object_id=self.monitor.pk).exists())
+
+    def test_arabic_normalization(self):
+        # أشعة / اشعه / الأشعة كلهم نفس الكلمة بعد التوحيد وأداة التعريف
+        self.assertIn(('device', self.ct.pk), self.hit_ids('اشعه'))
+        self.assertIn(('service_request', self.request.pk), self.hit_ids('الاشعة'))
+
+    def test_title_matches_rank_first_and_are_highlighted(self):
+        Supplier.objects.create(name='مورد', notes='', contact_person='مراقبة الجودة', created_by=self.user)
+
+        result = search_index.search('مراقبة')
+        self.assertEqual((result['hits'][0]['type'], result['hits'][0]['id']), ('device', self.monitor.pk))
+        self.assertEqual(result['count'], 2)
+        # التظليل على النص الأصلي مش الموحد
+        self.assertEqual(result['hits'][0]['title'], 'شاشة <mark>مراقبة</mark>')
+
+        snippet = search_index.search('Monitor')['hits'][0]['snippet']
+        self.assertIn('&lt;b&gt;', snippet)
+        self.assertIn('<mark>Monitor</mark>', snippet)
+
+    def test_pagination(self):
+        SparePart.objects.bulk_create([
+            SparePart(name=f'فلتر {i}', part_number=f'FL-{i:03d}', device_category=self.category, created_by=self.user)
+            for i in range(25)
+        ])
+        search_index.rebuild_index(['spare_part'])
+
+        first = search_index.search('فلتر', page_size=10)
+        last = search_index.search('فلتر', page=3, page_size=10)
+        self.assertEqual((first['count'], first['num_pages'], len(first['hits'])), (25, 3, 10))
+        self.assertEqual(len(last['hits']), 5)
+        self.assertFalse({hit['id'] for hit in first['hits']} & {hit['id'] for hit in last['hits']})
+
+    def test_patients_are_scoped_to_hospital(self):
+        mine = Patient.objects.create(
+            first_name='محمد', last_name='علي', gender='male', address='-', phone_number='1',
+            national_id='111', hospital=self.hospital,
+        )
+        other = Patient.objects.create(
+            first_name='محمد', last_name='حسن', gender='male', address='-', phone_number='2',
+            national_id='222', hospital=self.hospital,
+        )
+        # إنشاء مستشفى تاني بينشئ أقسام بنفس الأسماء، فبننقل المستند بس
+        SearchDocument.objects.filter(entity='patient', object_id=other.pk).update(hospital_id=self.hospital.pk + 1)
+
+        self.assertEqual(
+            self.hit_ids('محمد', entities=['patient'], hospital_id=self.hospital.pk), [('patient', mine.pk)]
+        )
+        self.assertEqual(self.hit_ids(mine.mrn, entities=['patient'], hospital_id=self.hospital.pk)[0][1], mine.pk)
+
+    def test_fallback_without_fts(self):
+        expected = self.hit_ids('اشعه')
+        with mock.patch.object(search_index, 'fts_available', return_value=False):
+            fallback = search_index.search('اشعه')
+
+        self.assertEqual(sorted((hit['type'], hit['id']) for hit in fallback['hits']), sorted(expected))
+        self.assertTrue(all('<mark>' in hit['title'] for hit in fallback['hits']))
+
+    def test_rebuild_index(self):
+        SearchDocument.objects.all().delete()
+        counts = search_index.rebuild_index()
+
+        self.assertEqual((counts['device'], counts['service_request']), (2, 1))
+        self.assertEqual(self.hit_ids('Revolution'), [('device', self.ct.pk)])
+
+    def test_highlight_maps_back_to_original_text(self):
+        # "أشعة" بالتشكيل بتطابق "اشعه" والتظليل بيغطي الكلمة الأصلية كلها
+        self.request.description = 'الجهاز لا يعمل بعد الأَشِعّة'
+        self.request.save()
+
+        hit = search_index.search('اشعه', entities=['service_request'])['hits'][0]
+        self.assertEqual(hit['title'], 'عطل في <mark>الأشعة</mark>')
+        self.assertIn('<mark>الأَشِعّة</mark>', hit['snippet'])
+
+    def test_patient_search_requires_hospital(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('manager:patient_search_api'), {'q': 'محمد'})
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,88 @@
+# اختبارات توليد مصفوفة SLA المجمع
+# عدد الاستعلامات ثابت مهما زاد عدد الخلايا، والتشغيل التاني مش بيكتب حاجة
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from maintenance.models import DeviceCategory, SLADefinition, SLAMatrix
+from maintenance.sla_matrix import IMPACTS, SEVERITIES, sync_sla_matrix
+
+CELLS_PER_DEFINITION = len(SEVERITIES) * len(IMPACTS)
+
+
+class SLAMatrixSyncTest(TestCase):
+    """مقارنة المصفوفة المطلوبة بالموجودة في الذاكرة وكتابة الفرق مجمع"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.urgent = SLADefinition.objects.create(
+            name='عاجل', priority='high', response_time_hours=4, resolution_time_hours=24
+        )
+        cls.normal = SLADefinition.objects.create(
+            name='عادي', response_time_hours=8, resolution_time_hours=48
+        )
+
+    def test_new_category_gets_full_matrix_in_constant_queries(self):
+        # savepoint + insert الفئة + تعريفات + خلايا موجودة + bulk_create + savepoint
+        with self.assertNumQueries(6):
+            category = DeviceCategory.objects.create(name='أشعة')
+
+        cells = SLAMatrix.objects.filter(device_category=category)
+        self.assertEqual(cells.count(), 2 * CELLS_PER_DEFINITION)
+        self.assertEqual(set(cells.filter(sla_definition=self.urgent).values_list('priority', flat=True)), {'high'})
+        self.assertEqual(set(cells.filter(sla_definition=self.normal).values_list('priority', flat=True)), {'medium'})
+
+    def test_times_match_model_calculation(self):
+        category = DeviceCategory.objects.create(name='أشعة')
+
+        for cell in SLAMatrix.objects.filter(device_category=category).select_related('sla_definition'):
+            self.assertEqual(
+                (cell.response_time_hours, cell.resolution_time_hours), cell.calculate_sla_times()
+            )
+
+    def test_second_run_writes_nothing(self):
+        DeviceCategory.objects.create(name='أشعة')
+
+        with self.assertNumQueries(3):
+            result = sync_sla_matrix()
+        self.assertEqual(result['created'], 0)
+        self.assertEqual(result['unchanged'], 2 * CELLS_PER_DEFINITION)
+
+    def test_definition_change_recalculates_existing_cells(self):
+        category = DeviceCategory.objects.create(name='أشعة')
+        self.urgent.response_time_hours = 40
+        self.urgent.save()
+
+        cell = SLAMatrix.objects.select_related('sla_definition').get(
+            device_category=category, sla_definition=self.urgent, severity='medium', impact='moderate'
+        )
+        self.assertEqual(cell.response_time_hours, cell.calculate_sla_times()[0])
+        self.assertEqual(SLAMatrix.objects.filter(device_category=category).count(), 2 * CELLS_PER_DEFINITION)
+
+    def test_new_definition_covers_existing_categories(self):
+        categories = [DeviceCategory.objects.create(name=f'فئة {i}') for i in range(3)]
+
+        SLADefinition.objects.create(name='جديد', priority='low')
+        for category in categories:
+            self.assertEqual(SLAMatrix.objects.filter(device_category=category).count(), 3 * CELLS_PER_DEFINITION)
+
+    def test_regenerate_deactivates_stale_cells(self):
+        category = DeviceCategory.objects.create(name='أشعة')
+        SLADefinition.objects.filter(pk=self.urgent.pk).update(priority='critical')
+
+        result = sync_sla_matrix(recalculate=True, deactivate_missing=True)
+        self.assertEqual(result['created'], CELLS_PER_DEFINITION)
+        self.assertEqual(result['deactivated'], CELLS_PER_DEFINITION)
+        active = SLAMatrix.objects.filter(device_category=category, sla_definition=self.urgent, is_active=True)
+        self.assertEqual(set(active.values_list('priority', flat=True)), {'critical'})
+
+    def test_update_command_repairs_drifted_times(self):
+        category = DeviceCategory.objects.create(name='أشعة')
+        SLAMatrix.objects.filter(device_category=category, severity='low').update(response_time_hours=999)
+
+        out = StringIO()
+        call_command('update_sla_matrix', stdout=out)
+        self.assertIn(f'updated {2 * len(IMPACTS)} SLA', out.getvalue())
+        self.assertFalse(SLAMatrix.objects.filter(response_time_hours=999).exists())
@@ -0,0 +1,135 @@
+# اختبارات فهرس SLA اللي في الذاكرة
+# فرز مئات البلاغات بياخد استعلام واحد، والفهرس بيتحمل من جديد لما الإصدار يتغير
+
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from maintenance import sla_resolver
+from maintenance.kpi_engine import DeviceKPIEngine
+from maintenance.models import Device, DeviceCategory, JobPlan, ServiceRequest, SLADefinition, SLAMatrix
+from maintenance.sla_matrix import IMPACTS, SEVERITIES
+from maintenance.sla_resolver import default_sla_times, resolver
+from manager.models import Building, Department, Floor, Room, Ward
+from superadmin.models import Hospital
+
+User = get_user_model()
+
+
+class SLAResolverTest(TestCase):
+    """إجابات SLA من الذاكرة مع إعادة التحميل عند تغيير الإصدار"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.definition = SLADefinition.objects.create(
+            name='عاجل', priority='high', response_time_hours=4, resolution_time_hours=24
+        )
+        cls.category = DeviceCategory.objects.create(name='أشعة')
+
+    def setUp(self):
+        # الداتا بترجع مع كل اختبار فمنبدأش بنسخة من اختبار تاني
+        resolver.clear()
+
+    def test_bulk_triage_costs_one_query(self):
+        keys = [(self.category.pk, severity, impact, 'high') for severity in SEVERITIES for impact in IMPACTS]
+        # بصمة الإصدار بتتقري من القاعدة مرة كل CMMS_SLA_RESOLVER_CHECK_INTERVAL
+        resolver._refresh()
+        with self.assertNumQueries(1):
+            for _ in range(20):
+                matches = [resolver.lookup(*key) for key in keys]
+
+        cell = SLAMatrix.objects.get(device_category=self.category, severity='critical', impact='extensive')
+        self.assertIn((cell.pk, cell.resolution_time_hours), [(m.matrix_id, m.resolution_time_hours) for m in matches])
+        self.assertIsNone(resolver.lookup(self.category.pk, 'critical', 'extensive', 'low'))
+
+    def test_first_active_cell_wins(self):
+        cell = SLAMatrix.objects.get(device_category=self.category, severity='high', impact='moderate')
+        second = SLADefinition.objects.create(name='إضافي', priority='high', response_time_hours=1)
+        self.assertEqual(resolver.lookup(self.category.pk, 'high', 'moderate', 'high').matrix_id, cell.pk)
+
+        cell.is_active = False
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            cell.save()
+        # الإبطال بعد الـ commit
+        self.assertIn(sla_resolver.invalidate, callbacks)
+        self.assertEqual(resolver.lookup(self.category.pk, 'high', 'moderate', 'high').sla_definition_id, second.pk)
+
+    @override_settings(CMMS_SLA_RESOLVER_CHECK_INTERVAL=0)
+    def test_reloads_when_another_process_changes_the_matrix(self):
+        resolver.lookup(self.category.pk, 'low', 'minor', 'high')
+
+        # update() مش بيبعت إشارات؛ كأن عملية تانية عدلت، والبصمة من القاعدة اتغيرت
+        SLAMatrix.objects.filter(device_category=self.category, severity='low').update(
+            resolution_time_hours=99, updated_at=timezone.now() + timezone.timedelta(seconds=1),
+        )
+        self.assertEqual(resolver.lookup(self.category.pk, 'low', 'minor', 'high').resolution_time_hours, 99)
+
+    def test_resolve_times_falls_back_to_multipliers(self):
+        self.assertEqual(
+            resolver.resolve_times(self.category.pk, 'critical', 'extensive', 'low')[:2],
+            default_sla_times('critical', 'extensive', 'low'),
+        )
+
+    def test_kpi_engine_reads_category_definitions(self):
+        SLADefinition.objects.create(name='أ فئة', device_category=self.category, resolution_time_hours=30)
+        JobPlan.objects.create(
+            name='خطة', device_category=self.category, estimated_hours=3,
+            created_by=User.objects.create_user(username='plan_user', password='testpass123'),
+        )
+
+        engine = DeviceKPIEngine()
+        self.assertEqual(engine.sla_hours, {self.category.pk: 30})
+        self.assertEqual(float(engine.job_plan_hours[self.category.pk]), 3.0)
+
+
+class ServiceRequestTriageTest(TestCase):
+    """البلاغات والـ AJAX بياخدوا أوقاتهم من الفهرس"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='sla_user', password='testpass123')
+        hospital = Hospital.objects.create(name='مستشفى اختبار', address='العنوان')
+        building = Building.objects.create(name='مبنى', hospital=hospital)
+        floor = Floor.objects.create(name='دور', building=building)
+        ward = Ward.objects.create(name='جناح', floor=floor)
+        department = Department.objects.create(name='قسم الأشعة', hospital=hospital)
+        room = Room.objects.create(number='1', ward=ward, department=department, room_type='regular_ROOM')
+        # تعريفين بنفس الأولوية فكل خانة ليها خليتين
+        SLADefinition.objects.create(name='أ', response_time_hours=4, resolution_time_hours=24)
+        SLADefinition.objects.create(name='ب', response_time_hours=8, resolution_time_hours=48)
+        cls.device = Device.objects.create(
+            name='جهاز', serial_number='SN-1', model='M', category=DeviceCategory.objects.create(name='فئة'),
+            department=department, room=room,
+        )
+
+    def setUp(self):
+        resolver.clear()
+
+    def test_service_request_due_dates_from_matrix(self):
+        cell = SLAMatrix.objects.filter(
+            device_category=self.device.category, severity='high', impact='significant', priority='medium'
+        ).order_by('pk').first()
+
+        request = ServiceRequest.objects.create(
+            device=self.device, reporter=self.user, title='عطل', severity='high', impact='significant',
+        )
+        self.assertEqual(request.estimated_hours, cell.resolution_time_hours)
+        # أكتر من خلية لنفس الخانة كانت بتوقع get() فمكانش بيتعمل أمر شغل
+        self.assertTrue(request.work_orders.exists())
+
+    def test_ajax_calculate_sla_times(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('maintenance:ajax_calculate_sla_times'),
+            json.dumps({'device_id': self.device.pk, 'severity': 'low', 'impact': 'minor', 'priority': 'medium'}),
+            content_type='application/json',
+        ).json()
+
+        match = resolver.lookup(self.device.category_id, 'low', 'minor', 'medium')
+        self.assertEqual(
+            (response['resolution_time'], response['sla_id'], response['sla_name']),
+            (match.resolution_time_hours, match.matrix_id, 'أ'),
+        )
@@ -0,0 +1,80 @@
+# اختبارات التصدير بالتدفق
+# هنا بنتأكد إن ملفات XLSX و CSV و NDJSON بتطلع كاملة وإن الصفوف مش بتتكرر
+
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase
+from openpyxl import load_workbook
+
+from maintenance.models import DeviceCategory, SparePart
+from maintenance.streaming_export import WIDTH_SAMPLE_ROWS, export_response, json_response
+from maintenance.views_spare_parts import export_spare_parts_csv
+
+User = get_user_model()
+
+HEADERS = ['ID', 'Name', 'Notes']
+
+
+def make_rows(count):
+    return ([i, f'row {i}', 'x' * (i % 7)] for i in range(count))
+
+
+def content_of(response):
+    return b''.join(response.streaming_content)
+
+
+class StreamingExportTest(TestCase):
+    """مخرجات streaming_export"""
+
+    def test_xlsx_contains_every_row_once(self):
+        count = WIDTH_SAMPLE_ROWS + 50
+        response = export_response('xlsx', 'report', HEADERS, make_rows(count), sheet_title='Report')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="report.xlsx"')
+
+        sheet = load_workbook(io.BytesIO(content_of(response)))['Report']
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(list(rows[0]), HEADERS)
+        self.assertEqual([row[0] for row in rows[1:]], list(range(count)))
+        self.assertTrue(sheet['A1'].font.bold)
+        self.assertEqual(sheet.column_dimensions['B'].width, len('row 199') + 2)
+
+    def test_xlsx_accepts_a_list(self):
+        rows = list(make_rows(WIDTH_SAMPLE_ROWS + 3))
+        sheet = load_workbook(io.BytesIO(content_of(export_response('xlsx', 'r', HEADERS, rows)))).active
+        self.assertEqual(sheet.max_row, len(rows) + 1)
+
+    def test_csv_and_ndjson(self):
+        body = content_of(export_response('csv', 'r', HEADERS, make_rows(3))).decode()
+        self.assertEqual(list(csv.reader(io.StringIO(body)))[2], ['1', 'row 1', 'x'])
+
+        lines = content_of(export_response('ndjson', 'r', HEADERS, make_rows(3))).decode().splitlines()
+        self.assertEqual(json.loads(lines[1]), {'ID': 1, 'Name': 'row 1', 'Notes': 'x'})
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_response('pdf', 'r', HEADERS, [])
+
+    def test_json_document(self):
+        data = {'name': 'قسم', 'values': [1, 2]}
+        self.assertEqual(json.loads(content_of(json_response('r.json', data))), data)
+
+    def test_spare_parts_export_streams_all_parts(self):
+        user = User.objects.create_user(username='export_user', password='testpass123')
+        category = DeviceCategory.objects.create(name='فئة')
+        for i in range(5):
+            SparePart.objects.create(
+                part_number=f'SP-{i}', name=f'قطعة {i}', device_category=category, created_by=user
+            )
+
+        request = RequestFactory().get('/export-csv/')
+        request.user = user
+        rows = list(csv.reader(io.StringIO(content_of(export_spare_parts_csv(request)).decode())))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(sorted(row[1] for row in rows[1:]), [f'SP-{i}' for i in range(5)])
+
+        request = RequestFactory().get('/export-csv/', {'format': 'ndjson'})
+        request.user = user
+        self.assertEqual(len(content_of(export_spare_parts_csv(request)).splitlines()), 5)
@@ -64,6 +64,7 @@ urlpatterns = [
     
     # جداول الصيانة الوقائية (PM Schedules)
     path('pm-schedules/', views_cmms.pm_schedule_list, name='pm_schedule_list'),
+    path('pm-schedules/forecast/', views_cmms.api_pm_forecast, name='api_pm_forecast'),
     path('pm-schedules/create/', views_cmms.pm_schedule_create, name='pm_schedule_create'),
     path('pm-schedules/<int:schedule_id>/', views_cmms.pm_schedule_detail, name='pm_schedule_detail'),
     path('pm-schedules/<int:schedule_id>/update/', views_cmms.pm_schedule_update, name='pm_schedule_update'),
@@ -14,4 +14,6 @@ urlpatterns = [
     
     # API URLs
     path('api/data/', views_dashboard.dashboard_api_data, name='dashboard_api_data'),
+    path('api/scans/heatmap/', views_dashboard.scan_heatmap_api, name='scan_heatmap_api'),
+    path('api/scans/idle-assets/', views_dashboard.idle_assets_api, name='idle_assets_api'),
 ]
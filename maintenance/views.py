@@ -402,21 +402,24 @@ def update_all_badges_qr(request):
     import hashlib
     import uuid
     
-    badges_without_qr = Badge.objects.filter(qr_code__isnull=True) | Badge.objects.filter(qr_code='')
-    updated_count = 0
+    badges_without_qr = list(Badge.objects.filter(Q(qr_code__isnull=True) | Q(qr_code='')))
+    # الأكواد الموجودة بتتحمل مرة واحدة بدل استعلام exists لكل بطاقة
+    taken = set(Badge.objects.exclude(qr_code__isnull=True).exclude(qr_code='').values_list('qr_code', flat=True))
     
     for badge in badges_without_qr:
         # Generate QR code
-        qr_data = f"user:{badge.user.pk}"
+        qr_data = f"user:{badge.user_id}"
         qr_code = hashlib.sha256(f"{qr_data}:{badge.badge_number}:{timezone.now()}:{uuid.uuid4().hex[:4]}".encode()).hexdigest()[:16]
         
         # Ensure QR code is unique
-        while Badge.objects.filter(qr_code=qr_code).exists():
+        while qr_code in taken:
             qr_code = hashlib.sha256(f"{qr_data}:{badge.badge_number}:{timezone.now()}:{uuid.uuid4().hex[:8]}".encode()).hexdigest()[:16]
         
+        taken.add(qr_code)
         badge.qr_code = qr_code
-        badge.save()
-        updated_count += 1
+    
+    Badge.objects.bulk_update(badges_without_qr, ['qr_code'], batch_size=500)
+    updated_count = len(badges_without_qr)
     
     if updated_count > 0:
         messages.success(request, f'تم تحديث {updated_count} بطاقة بأكواد QR جديدة')
@@ -1425,6 +1428,12 @@ def maintenance_schedule(request, device_id):
     # جلب أوامر العمل المرتبطة بالجهاز
     work_orders = WorkOrder.objects.filter(service_request__device=device).order_by('-created_at')[:5]
     
+    # المواعيد القادمة من تقويم التوقعات (pm_forecast) بدل حسابها من الجداول
+    from .pm_forecast import forecast
+    upcoming_occurrences = forecast(start=timezone.localdate()).filter(device=device).select_related(
+        'schedule', 'assignee'
+    ).order_by('due_date')[:10]
+    
     if request.method == 'POST':
         form_type = request.POST.get('form_type', 'preventive')
         
@@ -1489,6 +1498,7 @@ def maintenance_schedule(request, device_id):
         'calibration_records': calibration_records,
         'maintenance_logs': maintenance_logs,
         'work_orders': work_orders,
+        'upcoming_occurrences': upcoming_occurrences,
         'form': form,
         'calibration_form': calibration_form
     })
@@ -1742,76 +1752,24 @@ def ajax_calculate_sla_times(request):
                 'error': 'جميع الحقول مطلوبة'
             })
         
-        # الحصول على الجهاز
-        device = get_object_or_404(Device, pk=device_id)
+        # الحصول على فئة الجهاز
+        category_id = get_object_or_404(Device.objects.only('category'), pk=device_id).category_id
         
-        # البحث عن SLA Matrix المناسب
+        # البحث عن SLA Matrix المناسب من الفهرس اللي في الذاكرة
         try:
-            from .models import SLAMatrix
-            sla_matrix = SLAMatrix.objects.filter(
-                device_category=device.category,
-                severity=severity,
-                impact=impact,
-                priority=priority,
-                is_active=True
-            ).first()
+            from .sla_resolver import resolver
+            response_time, resolution_time, sla_matrix = resolver.resolve_times(
+                category_id, severity, impact, priority
+            )
             
-            if sla_matrix:
-                return JsonResponse({
-                    'success': True,
-                    'response_time': sla_matrix.response_time_hours,
-                    'resolution_time': sla_matrix.resolution_time_hours,
-                    'sla_name': sla_matrix.sla_definition.name,
-                    'sla_id': sla_matrix.id
-                })
-            else:
-                # حساب أوقات افتراضية إذا لم توجد مصفوفة SLA
-                # معاملات الخطورة (كلما ارتفعت الخطورة، قل الوقت المسموح)
-                severity_multipliers = {
-                    'low': 2.0,      # منخفض - وقت أكثر
-                    'medium': 1.0,   # متوسط - وقت عادي
-                    'high': 0.5,     # عالي - وقت أقل
-                    'critical': 0.25 # حرج - وقت أقل بكثير
-                }
-                
-                # معاملات التأثير (كلما ارتفع التأثير، قل الوقت المسموح)
-                impact_multipliers = {
-                    'minimal': 2.0,    # طفيف - وقت أكثر
-                    'moderate': 1.0,   # متوسط - وقت عادي
-                    'significant': 0.5, # كبير - وقت أقل
-                    'extensive': 0.25  # واسع - وقت أقل بكثير
-                }
-                
-                # معاملات الأولوية (كلما ارتفعت الأولوية، قل الوقت المسموح)
-                priority_multipliers = {
-                    'low': 2.0,      # منخفض - وقت أكثر
-                    'medium': 1.0,   # متوسط - وقت عادي
-                    'high': 0.5,     # عالي - وقت أقل
-                    'critical': 0.25 # حرج - وقت أقل بكثير
-                }
-                
-                # حساب المعاملات
-                severity_factor = severity_multipliers.get(severity, 1.0)
-                impact_factor = impact_multipliers.get(impact, 1.0)
-                priority_factor = priority_multipliers.get(priority, 1.0)
-                
-                # أوقات افتراضية للطوارئ (قيم أساسية أعلى)
-                base_response = 12  # 12 ساعة
-                base_resolution = 36  # 36 ساعة
-                
-                # المعامل النهائي (متوسط الثلاثة عوامل)
-                final_multiplier = (severity_factor + impact_factor + priority_factor) / 3
-                
-                response_time = max(1, int(base_response * final_multiplier))
-                resolution_time = max(2, int(base_resolution * final_multiplier))
-                
-                return JsonResponse({
-                    'success': True,
-                    'response_time': response_time,
-                    'resolution_time': resolution_time,
-                    'sla_name': 'حساب افتراضي',
-                    'sla_id': None
-                })
+            return JsonResponse({
+                'success': True,
+                'response_time': response_time,
+                'resolution_time': resolution_time,
+                # حساب افتراضي إذا لم توجد مصفوفة SLA
+                'sla_name': sla_matrix.sla_name if sla_matrix else 'حساب افتراضي',
+                'sla_id': sla_matrix.matrix_id if sla_matrix else None
+            })
                 
         except Exception as e:
             return JsonResponse({
@@ -2041,15 +1999,30 @@ from .models import (
     ScanSession, ScanHistory, DeviceDailyUsageLog, DeviceUsageLogItem,
     DeviceTransferLog, PatientTransferLog, DeviceHandoverLog, DeviceAccessory, DeviceAccessoryUsageLog
 )
+from django.db import transaction
+from . import scan_session_state as scan_state
+from .dashboard_cache import invalidate_department
+from .search_index import index_objects
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Device fields each save_scan_session operation updates
+SCAN_OPERATION_DEVICE_FIELDS = {
+    'clean': ['clean_status', 'last_cleaned_by', 'last_cleaned_at'],
+    'sterilize': ['sterilization_status', 'last_sterilized_by', 'last_sterilized_at'],
+    'maintenance': ['status', 'last_maintained_by', 'last_maintained_at'],
+}
+
 def log_qr_scan(qr_code, entity_type, entity_id, entity_data, user=None, device_type='unknown', scanner_id=None, request=None, is_secure=False, is_ephemeral=False, session_id=None, flow_name=None, flow_executed=False):
     """
-    Log QR scan to database for tracking and analytics with secure token support
+    Log QR scan for tracking and analytics with secure token support.
+    The record is queued in the write-behind buffer (maintenance.scan_audit) and reaches
+    QRScanLog within scan_audit.flush_interval_ms, so the returned log is unsaved (no id);
+    its reference identifies the row and can be passed to scan_audit.update().
     """
     from .models import QRScanLog
+    from . import scan_audit
     
     # Get IP address
     ip_address = None
@@ -2068,13 +2041,13 @@ def log_qr_scan(qr_code, entity_type, entity_id, entity_data, user=None, device_
     if '|sig=' in qr_code:
         token_signature = qr_code.split('|sig=')[-1]
     
-    # Create log entry
-    scan_log = QRScanLog.objects.create(
+    # Queue log entry
+    fields = scan_audit.record(
         qr_code=qr_code,
         entity_type=entity_type,
         entity_id=entity_id,
         entity_data=entity_data,
-        scanned_by=user,
+        scanned_by_id=user.pk if user else None,
         device_type=device_type,
         scanner_id=scanner_id,
         ip_address=ip_address,
@@ -2088,7 +2061,7 @@ def log_qr_scan(qr_code, entity_type, entity_id, entity_data, user=None, device_
         scanned_at=timezone.now()
     )
     
-    return scan_log
+    return QRScanLog(**fields)
 
 
 def get_entity_detail_url(entity_type, entity_id):
@@ -2114,44 +2087,13 @@ def get_entity_detail_url(entity_type, entity_id):
 
 def find_entity_by_hash(entity_type, hash_value):
     """
-    Find entity ID by reverse-engineering the hash
+    Find entity ID for an `entity_type:hash` label via the indexed QRTokenIndex
     """
-    import hashlib
-    from django.apps import apps
-    from django.conf import settings
-    
-    # Map entity types to models
-    model_mapping = {
-        'device': ('maintenance', 'Device'),
-        'patient': ('manager', 'Patient'),
-        'bed': ('manager', 'Bed'),
-        'user': ('hr', 'CustomUser'),
-        'customuser': ('hr', 'CustomUser'),
-        'accessory': ('maintenance', 'DeviceAccessory'),
-        'deviceaccessory': ('maintenance', 'DeviceAccessory'),
-        'department': ('manager', 'Department'),
-        'doctor': ('manager', 'Doctor'),
-    }
-    
-    if entity_type not in model_mapping:
-        return None
-    
-    app_label, model_name = model_mapping[entity_type]
-    
+    from .qr_resolver import resolve_entity_hash
+
     try:
-        model_class = apps.get_model(app_label, model_name)
-        
-        # Try to find the entity by checking all IDs
-        # This is not the most efficient but works for the hash system
-        for entity in model_class.objects.all():
-            hash_input = f"{entity_type}_{entity.pk}_{settings.SECRET_KEY}"
-            calculated_hash = hashlib.sha256(hash_input.encode()).hexdigest()[:12]
-            
-            if calculated_hash == hash_value:
-                return entity.pk
-                
-        return None
-    except:
+        return resolve_entity_hash(entity_type, hash_value)
+    except Exception:
         return None
 
 
@@ -2209,35 +2151,17 @@ def parse_qr_code(raw_value):
             # This looks like a hash - try to find the entity
             potential_hash = qr_code
             
-            # Map entity types to models - search in order of most common
-            model_mapping = [
-                ('device', 'maintenance', 'Device'),
-                ('patient', 'manager', 'Patient'),
-                ('user', 'hr', 'CustomUser'),
-                ('bed', 'manager', 'Bed'),
-                ('accessory', 'maintenance', 'DeviceAccessory'),
-                ('department', 'manager', 'Department'),
-                ('doctor', 'manager', 'Doctor'),
-            ]
-            
+            from .qr_resolver import resolve_bare_hash
+
             entity_found = False
-            for entity_type_check, app_label, model_name in model_mapping:
-                try:
-                    model_class = apps.get_model(app_label, model_name)
-                    
-                    # Try to find the entity by checking all IDs
-                    for entity in model_class.objects.all():
-                        hash_input = f"{entity_type_check}_{entity.pk}_{settings.SECRET_KEY}"
-                        calculated_hash = hashlib.sha256(hash_input.encode()).hexdigest()[:12]
-                        
-                        if calculated_hash == potential_hash:
-                            entity_type = entity_type_check
-                            entity_id = entity.pk
-                            entity_found = True
-                            pass  # Check pending operation
-                except Exception as e:
-                    pass  # Error checking pending operationype
-                    continue
+            try:
+                found_type, found_id = resolve_bare_hash(potential_hash)
+            except Exception:
+                found_type, found_id = None, None
+            if found_type:
+                entity_type = found_type
+                entity_id = found_id
+                entity_found = True
             
             if not entity_found:
                 return None, None, None, f"Entity not found for hash: {potential_hash}"
@@ -2268,32 +2192,7 @@ def parse_qr_code(raw_value):
                 }
                 
                 if entity_type in model_mapping:
-                    app_label, model_name = model_mapping[entity_type]
-                    try:
-                        model_class = apps.get_model(app_label, model_name)
-                        
-                        # Initialize entity_id as None
-                        entity_id = None
-                        
-                        # Try to find the entity by checking all IDs
-                        count = 0
-                        for entity in model_class.objects.all():
-                            hash_input = f"{entity_type}_{entity.pk}_{settings.SECRET_KEY}"
-                            calculated_hash = hashlib.sha256(hash_input.encode()).hexdigest()[:12]
-                            count += 1
-                            
-                            if count <= 5:  # Show first 5 for debug
-                                pass  # Checking entity
-                            
-                            if calculated_hash == potential_hash:
-                                entity_id = entity.pk
-                                # Debug: FOUND! Entity matches hash
-                                break
-                        
-                        # Debug: Checked entities
-                    except Exception as e:
-                        # Debug: Error searching for entity
-                        entity_id = None
+                    entity_id = find_entity_by_hash(entity_type, potential_hash)
                 else:
                     # Debug: Entity type not in model_mapping
                     entity_id = None
@@ -2637,6 +2536,7 @@ def scan_qr_code_api(request):
     # Debug: scan_qr_code_api called
     
     from core.secure_qr import QRContextFlow
+    from . import scan_audit
     
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
@@ -2684,8 +2584,9 @@ def scan_qr_code_api(request):
         # Initialize flow tracking variables
         flow_name = None
         flow_executed = False
+        flow_response = None
         
-        # Log the scan with enhanced data (initial log, will update if flow matches)
+        # Log the scan first (queued, written in bulk in the background), so a failing flow is still logged
         try:
             is_secure = entity_data.get('token_uuid') is not None if entity_data else False
             is_ephemeral = entity_data.get('ephemeral', False) if entity_data else False
@@ -2729,20 +2630,12 @@ def scan_qr_code_api(request):
                 flow_info = flow_result['flow']
                 flow_name = flow_info['name']
                 
-                # Update scan log with flow information
-                scan_log.flow_name = flow_name
-                scan_log.session_id = session_id
-                
                 if flow_result.get('auto_execute'):
                     # Execute flow automatically
                     execution = QRContextFlow.execute_flow(session_id)
                     flow_executed = True
                     
-                    # Update scan log
-                    scan_log.flow_executed = True
-                    scan_log.save()
-                    
-                    return JsonResponse({
+                    flow_response = {
                         'success': True,
                         'flow_matched': True,
                         'flow_name': flow_info['name'],
@@ -2752,12 +2645,10 @@ def scan_qr_code_api(request):
                         'session_id': session_id,
                         'entity_data': entity_data,
                         'message': f"تم تنفيذ العملية: {flow_info['config']['description']}"
-                    })
+                    }
                 else:
                     # Flow requires confirmation
-                    scan_log.save()
-                    
-                    return JsonResponse({
+                    flow_response = {
                         'success': True,
                         'flow_matched': True,
                         'flow_name': flow_info['name'],
@@ -2766,10 +2657,15 @@ def scan_qr_code_api(request):
                         'session_id': session_id,
                         'entity_data': entity_data,
                         'message': f"تأكيد العملية: {flow_info['config']['description']}"
-                    })
+                    }
+                
+                # Update scan log with flow information
+                scan_audit.update(
+                    scan_log.reference, flow_name=flow_name, session_id=session_id, flow_executed=flow_executed,
+                )
             else:
                 # No flow matched yet, continue scanning
-                return JsonResponse({
+                flow_response = {
                     'success': True,
                     'flow_matched': False,
                     'scan_count': flow_result.get('scan_count', 1),
@@ -2779,7 +2675,10 @@ def scan_qr_code_api(request):
                     'entity_id': entity_id,
                     'entity_data': entity_data,
                     'message': f'تم مسح {entity_type}:{entity_id}'
-                })
+                }
+        
+        if flow_response is not None:
+            return JsonResponse(flow_response)
         
         # Handle based on device type (if no context flow)
         elif device_type == 'scanner':
@@ -2787,7 +2686,7 @@ def scan_qr_code_api(request):
             return JsonResponse({
                 'success': True,
                 'logged': True,
-                'scan_id': scan_log.id,
+                'scan_id': str(scan_log.reference),
                 'entity_type': entity_type,
                 'entity_id': entity_id,
                 'entity_name': entity_data.get('name', str(entity_id)),
@@ -2804,7 +2703,7 @@ def scan_qr_code_api(request):
             return JsonResponse({
                 'success': True,
                 'logged': True,
-                'scan_id': scan_log.id,
+                'scan_id': str(scan_log.reference),
                 'entity_type': entity_type,
                 'entity_id': entity_id,
                 'entity_data': entity_data,
@@ -2924,6 +2823,7 @@ def scan_qr_code(request):
         
         # Special handling for first user scan - create new session
         scan_session = None
+        session_state = None
         
         # If scanning a user (Badge) and no session_id provided, create new session
         if entity_type == 'user' and not session_id:
@@ -2946,14 +2846,7 @@ def scan_qr_code(request):
                 'full_name': request.user.get_full_name() if hasattr(request.user, 'get_full_name') else str(request.user),
                 'user_id': request.user.id
             }
-            scan_history = ScanHistory.objects.create(
-                session=scan_session,
-                scanned_code=qr_code,
-                entity_type='user',
-                entity_id=request.user.id,
-                entity_data=json.dumps(user_data),
-                is_valid=True
-            )
+            scan_state.append(scan_session, qr_code, 'user', request.user.id, user_data)
             
             # Return redirect to scan session with session_id
             return JsonResponse({
@@ -2975,6 +2868,7 @@ def scan_qr_code(request):
                     if ops_manager.check_session_timeout(scan_session):
                         scan_session.status = 'expired'
                         scan_session.save()
+                        scan_state.commit(scan_session)
                         scan_session = None
                 except ScanSession.DoesNotExist:
                     pass
@@ -2986,16 +2880,15 @@ def scan_qr_code(request):
                     'error': 'لا توجد جلسة نشطة. يرجى البدء بمسح بطاقة المستخدم أولاً'
                 })
             
-            # Add scan to history for non-user entities
+            # Add scan to history for non-user entities (buffered in the session state until commit)
             if scan_session and entity_type != 'user':
-                scan_history = ScanHistory.objects.create(
-                    session=scan_session,
-                    scanned_code=qr_code,
-                    entity_type=entity_type,
-                    entity_id=entity_id,
-                    entity_data=json.dumps(entity_data) if entity_data else None,
-                    is_valid=True
-                )
+                try:
+                    session_state = scan_state.append(scan_session, qr_code, entity_type, entity_id, entity_data)
+                except scan_state.ScanSessionBusy:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'الجلسة مشغولة بمسحة تانية، حاول مرة أخرى'
+                    }, status=409)
         
         # Return session_id in response for JavaScript to use
         response_data = {
@@ -3055,7 +2948,9 @@ def scan_qr_code(request):
                     pass
         
         # Get all scanned entities and match to operations
-        scanned_entities = ops_manager.get_scanned_entities(scan_session)
+        if session_state is None:
+            session_state = scan_state.load(scan_session)
+        scanned_entities = session_state.entities
         
         # Initialize these before processing
         operation_executed = False
@@ -3246,11 +3141,13 @@ def scan_qr_code(request):
                 'status': execution_result.status,
                 'message': execution_message
             } if execution_result else None,
+            # الأنواع اللي ممكن تكمل التسلسل الحالي لعملية معرفة
+            'next_entity_types': ops_manager.next_entity_types(scanned_entities) if not matched_operation else {},
             'session_status': {
                 'user': scan_session.user.get_full_name() if scan_session.user else None,
                 'patient': str(scan_session.patient) if scan_session.patient else None,
                 'bed': str(scan_session.bed) if scan_session.bed else None,
-                'scan_count': scan_session.scan_history.count(),
+                'scan_count': session_state.count,
                 'current_operation': scan_session.current_operation.name if hasattr(scan_session, 'current_operation') and scan_session.current_operation else None,
             }
         }
@@ -3264,8 +3161,7 @@ def scan_qr_code(request):
         # Check for User + Device sequence to determine available operations
         if entity_type == 'device' and scan_session:
             # Check if we have a user scan in this session
-            user_scans = scan_session.scan_history.filter(entity_type='user')
-            if user_scans.exists():
+            if session_state.has('user'):
                 # We have User + Device, now determine available operations
                 try:
                     device = apps.get_model('maintenance', 'Device').objects.get(pk=entity_id)
@@ -3507,10 +3403,12 @@ def scan_qr_code(request):
                     notifications.append(f"🔧 تم تعيين الجهاز كمستخدم: {device.name}")
                 
                 # Check if we have accessories scanned in this session that need linking
-                accessory_scans = scan_session.scan_history.filter(entity_type='accessory')
-                for accessory_scan in accessory_scans:
+                accessories = session_state.resolve(apps.get_model('maintenance', 'DeviceAccessory'), 'accessory')
+                for accessory_id in session_state.ids('accessory'):
                     try:
-                        accessory = apps.get_model('maintenance', 'DeviceAccessory').objects.get(pk=accessory_scan.entity_id)
+                        accessory = accessories.get(accessory_id)
+                        if accessory is None:
+                            continue
                         
                         # Check if accessory is already linked to this device
                         if accessory.device_id == device.id:
@@ -3595,11 +3493,10 @@ def scan_qr_code(request):
                 notifications.append(f"🔧 تم مسح الملحق: {accessory.name}")
                 
                 # Check if we have a device scanned in this session
-                device_scans = scan_session.scan_history.filter(entity_type='device')
-                if device_scans.exists():
+                last_device_scan = session_state.last('device')
+                if last_device_scan:
                     # Get the last scanned device
-                    last_device_scan = device_scans.last()
-                    target_device = apps.get_model('maintenance', 'Device').objects.get(pk=last_device_scan.entity_id)
+                    target_device = apps.get_model('maintenance', 'Device').objects.get(pk=last_device_scan['id'])
                     
                     # Check if accessory is already linked to this device
                     if accessory.device_id == target_device.id:
@@ -3811,233 +3708,228 @@ def save_scan_session(request):
         except ScanSession.DoesNotExist:
             return JsonResponse({'error': 'Session not found'}, status=404)
         
+        state = scan_state.load(scan_session)
+        user = scan_session.user or request.user
+        now = timezone.now()
         created_records = []
+        warnings = []
         
-        # Handle different operation types
-        if operation_type == 'usage':
-            # Create DeviceDailyUsageLog
-            usage_log = DeviceDailyUsageLog.objects.create(
-                user=scan_session.user or request.user,
-                patient=scan_session.patient,
-                bed=scan_session.bed,
-                department=scan_session.bed.department if scan_session.bed and hasattr(scan_session.bed, 'department') else None,
-                operation_type='surgery',  # Map 'usage' to valid choice
-                notes=notes,
-                is_completed=True,
-                completed_at=timezone.now()
-            )
-            
-            # Add scanned devices to the log
-            device_scans = scan_session.scan_history.filter(entity_type='device')
-            for scan in device_scans:
-                try:
-                    device = Device.objects.get(pk=scan.entity_id)
-                    DeviceUsageLogItem.objects.create(
+        with transaction.atomic():
+            # Handle different operation types
+            if operation_type == 'usage':
+                bed = scan_session.bed
+                usage_log = DeviceUsageLog.objects.create(
+                    user=user,
+                    patient=scan_session.patient,
+                    bed=bed,
+                    department_id=bed.room.department_id if bed and bed.room_id else None,
+                    operation_type='surgery',  # Map 'usage' to valid choice
+                    notes=notes,
+                    is_completed=True,
+                    completed_at=now
+                )
+                
+                # Add scanned devices to the log and mark them in use
+                devices = state.resolve(Device, 'device')
+                items = []
+                for scan in state.unique('device'):
+                    device = devices.get(scan['id'])
+                    if device is None:
+                        continue
+                    items.append(DeviceUsageLogItem(
                         usage_log=usage_log,
                         device=device,
-                        notes=f"Scanned at {scan.scanned_at.strftime('%H:%M:%S')}"
-                    )
-                    # Update device status
+                        notes=f"Scanned at {scan_state.scanned_time(scan).strftime('%H:%M:%S')}"
+                    ))
                     device.in_use = True
                     device.current_patient = scan_session.patient
-                    device.usage_start_time = timezone.now()
-                    device.save()
-                except Device.DoesNotExist:
-                    continue
-            
-            # Add scanned accessories
-            accessory_scans = scan_session.scan_history.filter(entity_type='accessory')
-            for scan in accessory_scans:
-                try:
-                    accessory = DeviceAccessory.objects.get(pk=scan.entity_id)
-                    DeviceAccessoryUsageLog.objects.create(
+                    device.usage_start_time = now
+                DeviceUsageLogItem.objects.bulk_create(items)
+                Device.objects.bulk_update(
+                    [item.device for item in items], ['in_use', 'current_patient', 'usage_start_time'],
+                )
+                
+                # Add scanned accessories
+                accessories = state.resolve(DeviceAccessory, 'accessory')
+                accessory_logs = []
+                for scan in state.unique('accessory'):
+                    accessory = accessories.get(scan['id'])
+                    if accessory is None:
+                        continue
+                    accessory_logs.append(DeviceAccessoryUsageLog(
                         usage_log=usage_log,
                         accessory=accessory,
-                        notes=f"Scanned at {scan.scanned_at.strftime('%H:%M:%S')}"
-                    )
-                    # Update accessory status
+                        notes=f"Scanned at {scan_state.scanned_time(scan).strftime('%H:%M:%S')}"
+                    ))
                     accessory.status = 'in_use'
-                    accessory.save()
-                except DeviceAccessory.DoesNotExist:
-                    continue
-            
-            created_records.append({'type': 'usage_log', 'id': usage_log.id})
-        
-        elif operation_type == 'transfer':
-            # Handle device transfers
-            device_scans = scan_session.scan_history.filter(entity_type='device')
-            location_scans = scan_session.scan_history.filter(entity_type__in=['department', 'room', 'bed'])
+                    accessory.updated_at = now
+                DeviceAccessoryUsageLog.objects.bulk_create(accessory_logs)
+                DeviceAccessory.objects.bulk_update(
+                    [log.accessory for log in accessory_logs], ['status', 'updated_at'],
+                )
+                
+                created_records.append({'type': 'usage_log', 'id': usage_log.id})
             
-            for device_scan in device_scans:
-                try:
-                    device = Device.objects.get(pk=device_scan.entity_id)
-                    
-                    # Get target location
-                    to_department = None
-                    to_room = None
-                    to_bed = None
-                    
-                    for loc_scan in location_scans:
-                        if loc_scan.entity_type == 'department':
-                            to_department = Department.objects.get(pk=loc_scan.entity_id)
-                        elif loc_scan.entity_type == 'room':
-                            to_room = Room.objects.get(pk=loc_scan.entity_id)
-                        elif loc_scan.entity_type == 'bed':
-                            to_bed = Bed.objects.get(pk=loc_scan.entity_id)
-                    
-                    # Create transfer log
-                    transfer_log = DeviceTransferLog.objects.create(
-                        device=device,
-                        from_department=device.department,
-                        from_room=device.room,
-                        from_bed=device.bed,
-                        to_department=to_department or device.department,
-                        to_room=to_room or device.room,
-                        to_bed=to_bed,
-                        moved_by=scan_session.user or request.user,
-                        note=notes
-                    )
-                    
-                    # Update device location
-                    if to_department:
-                        device.department = to_department
-                    if to_room:
-                        device.room = to_room
-                    if to_bed:
-                        device.bed = to_bed
-                    device.save()
-                    
-                    created_records.append({'type': 'device_transfer', 'id': transfer_log.id})
-                    
-                except (Device.DoesNotExist, Department.DoesNotExist, Room.DoesNotExist, Bed.DoesNotExist):
-                    continue
-        
-        elif operation_type == 'patient_transfer':
-            # Handle patient transfers
-            patient_scans = scan_session.scan_history.filter(entity_type='patient')
-            bed_scans = scan_session.scan_history.filter(entity_type='bed')
+            elif operation_type == 'transfer':
+                # Target location: the last scanned department/room/bed
+                targets = {}
+                for entity_type, model in (('department', Department), ('room', Room), ('bed', Bed)):
+                    scan = state.last(entity_type)
+                    targets[entity_type] = state.resolve(model, entity_type).get(scan['id']) if scan else None
+                    if scan and targets[entity_type] is None:
+                        # A scanned location that no longer exists cancels the transfer
+                        targets = None
+                        break
+                
+                if targets is not None:
+                    to_department, to_room, to_bed = targets['department'], targets['room'], targets['bed']
+                    devices = state.objects(Device, 'device')
+                    transfer_logs = []
+                    for device in devices:
+                        transfer_logs.append(DeviceTransferLog(
+                            device=device,
+                            from_department_id=device.department_id,
+                            from_room_id=device.room_id,
+                            from_bed_id=device.bed_id,
+                            to_department_id=to_department.id if to_department else device.department_id,
+                            to_room_id=to_room.id if to_room else device.room_id,
+                            to_bed=to_bed,
+                            moved_by=user,
+                            note=notes
+                        ))
+                        # Update device location
+                        if to_department:
+                            device.department = to_department
+                        if to_room:
+                            device.room = to_room
+                        if to_bed:
+                            device.bed = to_bed
+                    DeviceTransferLog.objects.bulk_create(transfer_logs)
+                    Device.objects.bulk_update(devices, ['department', 'room', 'bed'])
+                    # The department decides the device's hospital in the search index
+                    index_objects(Device, [device.pk for device in devices])
+                    # bulk_update sends no post_save: both ends of each move lose or gain KPIs
+                    for department_id in {
+                        department_id for log in transfer_logs
+                        for department_id in (log.from_department_id, log.to_department_id)
+                    }:
+                        invalidate_department(department_id)
+                    created_records.extend({'type': 'device_transfer', 'id': log.id} for log in transfer_logs)
             
-            for patient_scan in patient_scans:
-                for bed_scan in bed_scans:
-                    try:
-                        patient = Patient.objects.get(pk=patient_scan.entity_id)
-                        to_bed = Bed.objects.get(pk=bed_scan.entity_id)
-                        
-                        # Get current patient location (from admission)
-                        current_admission = patient.admission_set.filter(discharge_date__isnull=True).first()
-                        
-                        # Create transfer log
-                        transfer_log = PatientTransferLog.objects.create(
+            elif operation_type == 'patient_transfer':
+                # Handle patient transfers
+                patients = state.resolve(Patient, 'patient')
+                beds = state.resolve(Bed.objects.select_related('room'), 'bed')
+                
+                # Current location of every patient (open admission)
+                admissions = {}
+                for admission in apps.get_model('manager', 'Admission').objects.filter(
+                    patient_id__in=list(patients), discharge_date__isnull=True,
+                ).order_by('pk'):
+                    admissions.setdefault(admission.patient_id, admission)
+                
+                transfer_logs = []
+                for patient_id in state.ids('patient'):
+                    patient = patients.get(patient_id)
+                    if patient is None:
+                        continue
+                    for bed_id in state.ids('bed'):
+                        to_bed = beds.get(bed_id)
+                        if to_bed is None:
+                            continue
+                        current_admission = admissions.get(patient_id)
+                        transfer_logs.append(PatientTransferLog(
                             patient=patient,
-                            from_department=current_admission.department if current_admission else None,
-                            from_bed=current_admission.bed if current_admission else None,
-                            to_department=to_bed.department,
+                            from_department_id=current_admission.department_id if current_admission else None,
+                            from_bed_id=current_admission.bed_id if current_admission else None,
+                            to_department_id=to_bed.room.department_id,
                             to_room=to_bed.room,
                             to_bed=to_bed,
-                            moved_by=scan_session.user or request.user,
+                            moved_by=user,
                             note=notes
-                        )
-                        
+                        ))
                         # Update patient location
                         if current_admission:
                             current_admission.bed = to_bed
-                            current_admission.department = to_bed.department
-                            current_admission.save()
-                        
+                            current_admission.department_id = to_bed.room.department_id
                         # Update bed status
                         to_bed.status = 'occupied'
-                        to_bed.save()
-                        
-                        created_records.append({'type': 'patient_transfer', 'id': transfer_log.id})
-                        
-                    except (Patient.DoesNotExist, Bed.DoesNotExist):
-                        continue
-        
-        elif operation_type == 'handover':
-            # Handle device handovers
-            device_scans = scan_session.scan_history.filter(entity_type='device')
-            user_scans = scan_session.scan_history.filter(entity_type__in=['user', 'customuser', 'doctor'])
+                
+                if transfer_logs:
+                    PatientTransferLog.objects.bulk_create(transfer_logs)
+                    apps.get_model('manager', 'Admission').objects.bulk_update(
+                        list(admissions.values()), ['bed', 'department'],
+                    )
+                    Bed.objects.bulk_update(list(beds.values()), ['status'])
+                created_records.extend({'type': 'patient_transfer', 'id': log.id} for log in transfer_logs)
             
-            if len(user_scans) >= 2:
-                from_user_scan = user_scans[0]
-                to_user_scan = user_scans[1]
+            elif operation_type == 'handover':
+                # Handle device handovers: the first scanned user hands over to the second
+                user_scans = state.of_type(*scan_state.USER_TYPES)
                 
-                # Get users
-                try:
-                    if from_user_scan.entity_type == 'doctor':
-                        from_user = Doctor.objects.get(pk=from_user_scan.entity_id).user
-                    else:
-                        from_user = User.objects.get(pk=from_user_scan.entity_id)
-                    
-                    if to_user_scan.entity_type == 'doctor':
-                        to_user = Doctor.objects.get(pk=to_user_scan.entity_id).user
-                    else:
-                        to_user = User.objects.get(pk=to_user_scan.entity_id)
+                if len(user_scans) >= 2:
+                    Doctor = apps.get_model('manager', 'Doctor')
+                    try:
+                        from_user, to_user = [
+                            Doctor.objects.get(pk=scan['id']).user if scan['type'] == 'doctor'
+                            else User.objects.get(pk=scan['id'])
+                            for scan in user_scans[:2]
+                        ]
+                    except (User.DoesNotExist, Doctor.DoesNotExist):
+                        from_user = to_user = None
                     
-                    for device_scan in device_scans:
-                        try:
-                            device = Device.objects.get(pk=device_scan.entity_id)
-                            
-                            # Create handover log
-                            handover_log = DeviceHandoverLog.objects.create(
-                                device=device,
-                                from_user=from_user,
-                                to_user=to_user,
-                                note=notes
-                            )
-                            
-                            created_records.append({'type': 'device_handover', 'id': handover_log.id})
-                            
-                        except Device.DoesNotExist:
-                            continue
-                            
-                except (User.DoesNotExist, Doctor.DoesNotExist):
-                    pass
-        
-        # Handle cleaning/sterilization/maintenance operations
-        elif operation_type in ['clean', 'sterilize', 'maintenance']:
-            device_scans = scan_session.scan_history.filter(entity_type='device')
+                    if from_user and to_user:
+                        handover_logs = DeviceHandoverLog.objects.bulk_create([
+                            DeviceHandoverLog(device=device, from_user=from_user, to_user=to_user, note=notes)
+                            for device in state.objects(Device, 'device')
+                        ])
+                        created_records.extend({'type': 'device_handover', 'id': log.id} for log in handover_logs)
             
-            for device_scan in device_scans:
-                try:
-                    device = Device.objects.get(pk=device_scan.entity_id)
-                    user = scan_session.user or request.user
-                    
+            # Handle cleaning/sterilization/maintenance operations
+            elif operation_type in ['clean', 'sterilize', 'maintenance']:
+                updated = []
+                logs = []
+                for device in state.objects(Device, 'device'):
                     if operation_type == 'clean':
                         device.clean_status = 'clean'
                         device.last_cleaned_by = user
-                        device.last_cleaned_at = timezone.now()
-                        DeviceCleaningLog.objects.create(device=device, last_cleaned_by=user)
+                        device.last_cleaned_at = now
+                        logs.append(DeviceCleaningLog(device=device, cleaned_by=user))
                     
                     elif operation_type == 'sterilize':
                         device.sterilization_status = 'sterilized'
                         device.last_sterilized_by = user
-                        device.last_sterilized_at = timezone.now()
-                        DeviceSterilizationLog.objects.create(device=device, last_sterilized_by=user)
+                        device.last_sterilized_at = now
+                        logs.append(DeviceSterilizationLog(device=device, sterilized_by=user))
                     
                     elif operation_type == 'maintenance':
                         # التحقق من إمكانية تغيير حالة الجهاز
-                        if device.can_change_status():
-                            device.status = 'working'
-                            device.last_maintained_by = user
-                            device.last_maintained_at = timezone.now()
-                            DeviceMaintenanceLog.objects.create(device=device, last_maintained_by=user)
-                        else:
-                            warnings.append("⚠️ لا يمكن تغيير حالة الجهاز - يوجد أوامر عمل مفتوحة")
+                        if not device.can_change_status():
+                            warnings.append(f"⚠️ لا يمكن تغيير حالة الجهاز {device.name} - يوجد أوامر عمل مفتوحة")
+                            continue
+                        device.status = 'working'
+                        device.last_maintained_by = user
+                        device.last_maintained_at = now
+                        logs.append(DeviceMaintenanceLog(device=device, maintained_by=user))
                     
-                    device.save()
+                    updated.append(device)
                     created_records.append({'type': f'device_{operation_type}', 'device_id': device.id})
-                    
-                except Device.DoesNotExist:
-                    continue
-        # Mark session as completed
-        scan_session.status = 'completed'
-        scan_session.save()
+                
+                if logs:
+                    type(logs[0]).objects.bulk_create(logs)
+                Device.objects.bulk_update(updated, SCAN_OPERATION_DEVICE_FIELDS[operation_type])
+            
+            # Write the buffered scan history and mark session as completed
+            scan_state.flush(state)
+            scan_session.status = 'completed'
+            scan_session.save()
+        scan_state.discard(scan_session)
         
         return JsonResponse({
             'success': True,
             'operation_type': operation_type,
             'created_records': created_records,
+            'warnings': warnings,
             'message': f'تم حفظ عملية {operation_type} بنجاح'
         })
     
@@ -4265,70 +4157,47 @@ def custody_dashboard(request):
 
 @login_required
 def export_device_usage_logs(request):
-    """Export device usage logs to Excel"""
+    """Export device usage logs to Excel (or ?format=csv / ndjson), streamed row by row"""
     try:
-        from django.http import HttpResponse
-        import openpyxl
-        from openpyxl.styles import Font, Alignment
         from datetime import datetime
-        
-        # Create workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Device Usage Logs"
-        
-        # Headers
+        from .streaming_export import EXPORT_FORMATS, export_response, iter_rows
+
+        export_format = request.GET.get('format', 'xlsx')
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'صيغة غير مدعومة: {export_format}')
+
         headers = [
             'Session ID', 'User', 'Patient', 'Operation Type', 'Procedure Name',
             'Created At', 'Started At', 'Completed At', 'Status', 'Notes'
         ]
-        
-        # Write headers
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-        
-        # Get data
-        usage_logs = DeviceUsageLog.objects.select_related(
-            'user', 'patient', 'created_by', 'completed_by'
-        ).order_by('-created_at')
-        
-        # Write data
-        for row, log in enumerate(usage_logs, 2):
-            ws.cell(row=row, column=1, value=str(log.session_id))
-            ws.cell(row=row, column=2, value=log.user.get_full_name() if log.user else '')
-            ws.cell(row=row, column=3, value=str(log.patient) if log.patient else '')
-            ws.cell(row=row, column=4, value=log.get_operation_type_display())
-            ws.cell(row=row, column=5, value=log.procedure_name or '')
-            ws.cell(row=row, column=6, value=log.created_at.strftime('%Y-%m-%d %H:%M:%S') if log.created_at else '')
-            ws.cell(row=row, column=7, value=log.started_at.strftime('%Y-%m-%d %H:%M:%S') if log.started_at else '')
-            ws.cell(row=row, column=8, value=log.completed_at.strftime('%Y-%m-%d %H:%M:%S') if log.completed_at else '')
-            ws.cell(row=row, column=9, value=log.get_status_display())
-            ws.cell(row=row, column=10, value=log.notes or '')
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Create response
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+        def format_time(value):
+            return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+        def log_row(log):
+            return [
+                str(log.session_id),
+                log.user.get_full_name() if log.user else '',
+                str(log.patient) if log.patient else '',
+                log.get_operation_type_display(),
+                log.procedure_name or '',
+                format_time(log.created_at),
+                format_time(log.started_at),
+                format_time(log.completed_at),
+                log.get_status_display(),
+                log.notes or '',
+            ]
+
+        usage_logs = DeviceUsageLog.objects.select_related('user', 'patient').order_by('-created_at')
+
+        return export_response(
+            export_format,
+            f'device_usage_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}',
+            headers,
+            iter_rows(usage_logs, log_row),
+            sheet_title='Device Usage Logs',
         )
-        response['Content-Disposition'] = f'attachment; filename="device_usage_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
-        
-        wb.save(response)
-        return response
-        
+
     except Exception as e:
         from django.contrib import messages
         from django.shortcuts import redirect
@@ -4509,6 +4378,7 @@ def reset_scan_session(request):
                     )
                     session.status = 'cancelled'
                     session.save()
+                    scan_state.commit(session)
                 except ScanSession.DoesNotExist:
                     pass
             
@@ -4544,6 +4414,9 @@ def get_session_status(request, session_id):
             user=request.user
         )
         
+        # Scans still buffered in the session state are written before reading the history
+        if session.status == 'active':
+            scan_state.flush(scan_state.load(session))
         scan_history = session.scan_history.all().order_by('-scanned_at')
         
         return JsonResponse({
@@ -4590,6 +4463,7 @@ def end_scan_session(request):
                 )
                 session.status = 'completed'
                 session.save()
+                scan_state.commit(session)
                 
                 return JsonResponse({
                     'success': True,
@@ -4710,8 +4584,8 @@ def generate_qr_code(request):
             response_data['message'] = f'Ephemeral QR code generated for {entity_type}, valid for {SecureQRToken.EPHEMERAL_DURATION} seconds'
         else:
             response_data['message'] = f'Static QR code generated for {entity_type}'
-            if hasattr(entity, 'qr_code') and entity.qr_code:
-                response_data['qr_code_url'] = entity.qr_code.url
+            if hasattr(entity, 'qr_png_url') and entity.qr_token:
+                response_data['qr_code_url'] = entity.qr_png_url
         
         return JsonResponse(response_data)
     
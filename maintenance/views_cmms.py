@@ -942,13 +942,10 @@ def sla_matrix_regenerate(request):
     """
     if request.method == 'POST':
         try:
-            from .models import SLAMatrix, DeviceCategory, SLADefinition, SEVERITY_CHOICES, IMPACT_CHOICES, PRIORITY_CHOICES
+            from .models import SLADefinition
+            from .sla_matrix import sync_sla_matrix
             
-            # حذف جميع مدخلات المصفوفة الموجودة
-            SLAMatrix.objects.all().delete()
-            
-            # الحصول على جميع الفئات وتعريفات SLA الموجودة (المنشأة يدوياً)
-            categories = DeviceCategory.objects.all()
+            # الحصول على جميع تعريفات SLA الموجودة (المنشأة يدوياً)
             available_slas = list(SLADefinition.objects.all())
             
             if not available_slas:
@@ -957,35 +954,18 @@ def sla_matrix_regenerate(request):
                     'message': 'لا توجد تعريفات SLA. يرجى إنشاء تعريفات SLA أولاً.'
                 })
             
-            # إنشاء جميع التركيبات: عدد الفئات × 4 severity × 4 impact × عدد SLA
-            severity_choices = [choice[0] for choice in SEVERITY_CHOICES]
-            impact_choices = [choice[0] for choice in IMPACT_CHOICES]
-            
-            created_count = 0
-            
-            # إضافة priority_choices
-            priority_choices = [choice[0] for choice in PRIORITY_CHOICES]
-            
-            for category in categories:
-                for sla in available_slas:
-                    # تحديد الأولوية المرتبطة بهذا SLA
-                    sla_priority = sla.priority if sla.priority else 'medium'  # افتراضي متوسط
-                    
-                    for severity in severity_choices:
-                        for impact in impact_choices:
-                            # إنشاء مدخل فقط للأولوية المطابقة لأولوية SLA
-                            SLAMatrix.objects.create(
-                                device_category=category,
-                                severity=severity,
-                                impact=impact,
-                                priority=sla_priority,
-                                sla_definition=sla
-                            )
-                            created_count += 1  
+            # بدل حذف المصفوفة كلها وإعادة إنشائها خلية خلية: مقارنة في الذاكرة
+            # وإنشاء الناقص وإعادة حساب الموجود وإيقاف اللي مبقاش مطلوب في transaction واحدة
+            result = sync_sla_matrix(
+                definitions=available_slas, recalculate=True, deactivate_missing=True
+            )
+            created_count = result['created']
             
             return JsonResponse({
                 'success': True,
                 'created_count': created_count,
+                'updated_count': result['updated'],
+                'deactivated_count': result['deactivated'],
                 'message': f'تم إنشاء {created_count} مدخل جديد في مصفوفة SLA'
             })
             
@@ -1583,6 +1563,9 @@ def job_plan_step_delete(request, step_id):
     messages.success(request, 'تم حذف الخطوة بنجاح')
     return redirect('maintenance:cmms:job_plan_detail', plan_id=job_plan.id)
 
+# عدد الأسابيع اللي بتتعرض في ملخص التوقعات في صفحة الجداول
+PM_LIST_FORECAST_WEEKS = 8
+
 @login_required
 def pm_schedule_list(request):
     """
@@ -1658,9 +1641,25 @@ def pm_schedule_list(request):
     from maintenance.models import Device
     devices = Device.objects.all()
     
+    # حمل الصيانة الوقائية المتوقع للأسابيع الجاية من تقويم التوقعات (نفس بيانات api_pm_forecast)
+    from datetime import timedelta
+    from .pm_forecast import due_by_week
+    forecast_weeks = []
+    if request.user.hospital_id:
+        today = timezone.localdate()
+        forecast_weeks = [
+            {'week_start': row['week_start'], 'occurrences': row['occurrences'], 'hours': float(row['hours'] or 0)}
+            for row in due_by_week(
+                today, today + timedelta(weeks=PM_LIST_FORECAST_WEEKS, days=-1),
+                department=int(department_filter) if department_filter.isdigit() else None,
+                hospital=request.user.hospital_id,
+            )
+        ]
+    
     context = {
         'schedules': page_obj,  # Template expects 'schedules', not 'pm_schedules'
         'pm_schedules': page_obj,  # Keep both for compatibility
+        'forecast_weeks': forecast_weeks,
         'status_filter': status_filter,
         'device_filter': device_filter,
         'frequency_filter': frequency_filter,
@@ -1683,6 +1682,82 @@ def pm_schedule_list(request):
     
     return render(request, 'maintenance/cmms/pm_schedule_list.html', context)
 
+@login_required
+def api_pm_forecast(request):
+    """
+    API لتوقعات الصيانة الوقائية من تقويم المواعيد المحسوب مسبقاً
+
+    الباراميترات (كلها اختيارية):
+    - start / end: الفترة بصيغة YYYY-MM-DD (الافتراضي من النهارده لحد آخر الأفق)
+    - department: رقم القسم
+    - technician: رقم الفني
+
+    بترجع التجميع بالقسم وبالأسبوع وحمل كل فني في كل أسبوع، كل واحد استعلام تجميع واحد
+    النتايج لأجهزة مستشفى المستخدم بس
+    """
+    from datetime import timedelta
+    from django.utils.dateparse import parse_date
+    from .pm_forecast import due_by_department, due_by_week, forecast, workload_histogram
+    from .scheduler_config import get_config
+
+    try:
+        today = timezone.localdate()
+        start = parse_date(request.GET.get('start', '')) or today
+        end = parse_date(request.GET.get('end', '')) or today + timedelta(days=get_config('pm_forecast.horizon_days', 90))
+    except ValueError:
+        return JsonResponse({'error': 'تاريخ غير صحيح'}, status=400)
+    try:
+        department = int(request.GET['department']) if request.GET.get('department') else None
+        technician = int(request.GET['technician']) if request.GET.get('technician') else None
+    except ValueError:
+        return JsonResponse({'error': 'رقم القسم أو الفني غير صحيح'}, status=400)
+    hospital = request.user.hospital_id
+    if not hospital:
+        return JsonResponse({'error': 'المستخدم غير مرتبط بمستشفى'}, status=403)
+
+    by_department = due_by_department(start, end, hospital)
+    if department:
+        by_department = by_department.filter(department_id=department)
+
+    occurrences = forecast(start, end, department, technician, hospital).select_related('schedule', 'device')[:500]
+
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'by_department': [
+            {
+                'department_id': row['department_id'],
+                'department': row['department__name'] or 'غير محدد',
+                'occurrences': row['occurrences'],
+                'hours': float(row['hours'] or 0),
+            }
+            for row in by_department
+        ],
+        'by_week': [
+            {'week_start': row['week_start'].isoformat(), 'occurrences': row['occurrences'], 'hours': float(row['hours'] or 0)}
+            for row in due_by_week(start, end, department, technician, hospital)
+        ],
+        'workload': [
+            {
+                'technician_id': row['assignee_id'],
+                'technician': row['assignee__username'] or 'غير معين',
+                'week_start': row['week_start'].isoformat(),
+                'occurrences': row['occurrences'],
+                'hours': float(row['hours'] or 0),
+            }
+            for row in workload_histogram(start, end, department, technician, hospital)
+        ],
+        'occurrences': [
+            {
+                'schedule_id': occurrence.schedule_id,
+                'schedule': occurrence.schedule.name,
+                'device': occurrence.device.name,
+                'due_date': occurrence.due_date.isoformat(),
+            }
+            for occurrence in occurrences
+        ],
+    })
+
 @login_required
 def pm_schedule_create(request):
     """
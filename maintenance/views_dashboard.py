@@ -17,6 +17,7 @@ from .kpi_utils import (
     calculate_work_order_stats,
     calculate_spare_parts_stats
 )
+from .kpi_engine import DeviceKPIEngine
 from .models import Device
 from .models import ServiceRequest, WorkOrder, SparePart
 from manager.models import Department
@@ -351,9 +352,10 @@ def device_performance_dashboard(request):
     worst_performing_devices = sorted(device_scores, key=lambda x: x['score'])[:10]
     
     # حساب الإحصائيات العامة
-    avg_mtbf = calculate_mtbf(department_id=department_id)
-    avg_mttr = calculate_mttr(department_id=department_id) 
-    avg_uptime = calculate_availability(department_id=department_id)
+    kpi_engine = DeviceKPIEngine(department_id=department_id)
+    avg_mtbf = kpi_engine.mtbf()
+    avg_mttr = kpi_engine.mttr()
+    avg_uptime = kpi_engine.availability()
     
     # حساب الإحصائيات الحقيقية بناءً على البيانات المحسوبة
     if device_scores:
@@ -1278,11 +1280,61 @@ def dashboard_api_data(request):
         # التنبيهات الحرجة
         data = get_critical_alerts(department_id=department_id)
         
+    elif data_type == 'cache_stats':
+        # عدادات كاش الداشبورد (إصابة / إخفاق)
+        from .dashboard_cache import get_cache_stats
+        data = get_cache_stats()
+        
     else:
         data = {'error': 'نوع البيانات غير صحيح'}
     
     return JsonResponse(data, safe=False)
 
+@login_required
+def scan_heatmap_api(request):
+    """
+    خريطة حرارية لمسحات QR (يوم الأسبوع × الساعة) من التجميعات بالساعة
+    ?days=30&department=<id>&entity_type=device
+    """
+    try:
+        days = int(request.GET.get('days', 30))
+        department_id = int(request.GET['department']) if request.GET.get('department') else None
+    except ValueError:
+        return JsonResponse({'error': 'قيمة غير صحيحة'}, status=400)
+
+    from .scan_rollups import heatmap
+    data = heatmap(
+        days=max(days, 1),
+        department_id=department_id,
+        entity_type=request.GET.get('entity_type') or None,
+    )
+    return JsonResponse(data)
+
+@login_required
+def idle_assets_api(request):
+    """
+    الأجهزة (أو الملحقات/الغرف/الأسرة) اللي ما اتمسحتش من مدة
+    ?days=30&department=<id>&entity_type=device&limit=100
+    """
+    try:
+        days = int(request.GET.get('days', 30))
+        limit = int(request.GET.get('limit', 100))
+        department_id = int(request.GET['department']) if request.GET.get('department') else None
+    except ValueError:
+        return JsonResponse({'error': 'قيمة غير صحيحة'}, status=400)
+
+    from .scan_rollups import idle_assets
+    try:
+        data = idle_assets(
+            entity_type=request.GET.get('entity_type', 'device'),
+            days=max(days, 1),
+            department_id=department_id,
+            limit=min(max(limit, 1), 1000),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(data)
+
 @login_required
 def device_detail_kpis(request, device_id):
     """
@@ -1341,13 +1393,9 @@ def export_dashboard_report(request):
     
     if export_format == 'json':
         # جلب البيانات الشاملة
+        from .streaming_export import json_response
         dashboard_data = get_dashboard_summary(department_id=department_id)
-        response = HttpResponse(
-            json.dumps(dashboard_data, indent=2, ensure_ascii=False, default=str),
-            content_type='application/json; charset=utf-8'
-        )
-        response['Content-Disposition'] = 'attachment; filename="cmms_dashboard_report.json"'
-        return response
+        return json_response('cmms_dashboard_report.json', dashboard_data)
     
     # إنشاء تقرير PDF شامل
     response = HttpResponse(content_type='application/pdf')
@@ -4,11 +4,11 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.template.loader import get_template
 from django.conf import settings
-import json
 from datetime import datetime
 from io import BytesIO
 from manager.models import Department
 from .models import Device
+from .streaming_export import EXPORT_FORMATS, export_response, iter_rows, json_response
 
 try:
     from reportlab.pdfgen import canvas
@@ -23,10 +23,23 @@ try:
 except ImportError:
     REPORTLAB_AVAILABLE = False
 
+DEVICE_REPORT_HEADERS = ['اسم الجهاز', 'الرقم التسلسلي', 'الشركة المصنعة', 'الحالة', 'الغرفة']
+
+
+def _device_report_row(device):
+    return [
+        device.name,
+        device.serial_number,
+        device.manufacturer,
+        device.status,
+        device.room.number if device.room else 'غير محدد',
+    ]
+
+
 @login_required
 @require_http_methods(["GET", "POST"])
 def export_department_devices_report(request, department_id):
-    """تصدير تقرير أجهزة القسم بصيغة PDF"""
+    """تصدير تقرير أجهزة القسم بصيغة PDF (أو ?format=xlsx / csv / ndjson بالتدفق)"""
     
     try:
         # التحقق من الصلاحيات - تبسيط مؤقت للاختبار
@@ -36,33 +49,37 @@ def export_department_devices_report(request, department_id):
             pass
         
         department = get_object_or_404(Department, id=department_id)
-        devices = Device.objects.filter(department=department)
+        devices = Device.objects.filter(department=department).select_related('room')
+        
+        # الصيغ الجدولية بتتكتب صف صف من غير ما نحمّل كل الأجهزة
+        export_format = request.GET.get('format', 'pdf')
+        if export_format in EXPORT_FORMATS:
+            return export_response(
+                export_format,
+                f'تقرير_أجهزة_{department.name}',
+                DEVICE_REPORT_HEADERS,
+                iter_rows(devices, _device_report_row),
+                sheet_title='Devices',
+            )
         
         if not REPORTLAB_AVAILABLE:
             # إذا لم تكن reportlab متوفرة، أرسل JSON
+            from django.db.models import Count, Q
+            counts = devices.aggregate(
+                total_devices=Count('id'),
+                working=Count('id', filter=Q(status='working')),
+                needs_maintenance=Count('id', filter=Q(status='needs_maintenance')),
+                out_of_order=Count('id', filter=Q(status='out_of_order')),
+            )
             report_data = {
                 'department': department.name,
-                'total_devices': devices.count(),
-                'working': devices.filter(status='working').count(),
-                'needs_maintenance': devices.filter(status='needs_maintenance').count(),
-                'out_of_order': devices.filter(status='out_of_order').count(),
+                **counts,
                 'devices': [
-                    {
-                        'name': device.name,
-                        'serial_number': device.serial_number,
-                        'manufacturer': device.manufacturer,
-                        'status': device.status,
-                        'room': device.room.number if device.room else 'غير محدد'
-                    }
-                    for device in devices
+                    dict(zip(['name', 'serial_number', 'manufacturer', 'status', 'room'], _device_report_row(device)))
+                    for device in devices.iterator()
                 ]
             }
-            response = HttpResponse(
-                json.dumps(report_data, ensure_ascii=False, indent=2),
-                content_type='application/json; charset=utf-8'
-            )
-            response['Content-Disposition'] = f'attachment; filename="تقرير_أجهزة_{department.name}.json"'
-            return response
+            return json_response(f'تقرير_أجهزة_{department.name}.json', report_data)
         
         # إنشاء PDF
         response = HttpResponse(content_type='application/pdf')
@@ -6,7 +6,6 @@ from django.db.models import Q, Sum, F
 from django.utils import timezone
 from datetime import timedelta
 from django.http import HttpResponse, JsonResponse
-import csv
 
 from .models import (
     Supplier, SparePart, SparePartRequest, SparePartTransaction, 
@@ -1190,17 +1189,18 @@ def api_device_downtime_stats(request, device_id):
 
 @login_required
 def export_spare_parts_csv(request):
-    """تصدير قطع الغيار بصيغة CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="spare_parts.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Name', 'Part Number', 'Description', 'Current Stock', 'Minimum Stock', 
-                    'Unit', 'Storage Location', 'Unit Cost', 'Supplier', 'Status'])
-    
-    spare_parts = SparePart.objects.all().select_related('primary_supplier')
-    for part in spare_parts:
-        writer.writerow([
+    """تصدير قطع الغيار بصيغة CSV (أو ?format=xlsx / ndjson) على دفعات"""
+    from .streaming_export import EXPORT_FORMATS, export_response, iter_rows
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+
+    headers = ['Name', 'Part Number', 'Description', 'Current Stock', 'Minimum Stock',
+               'Unit', 'Storage Location', 'Unit Cost', 'Supplier', 'Status']
+
+    def part_row(part):
+        return [
             part.name,
             part.part_number,
             part.description,
@@ -1211,6 +1211,8 @@ def export_spare_parts_csv(request):
             part.unit_cost,
             part.primary_supplier.name if part.primary_supplier else '',
             part.status
-        ])
-    
-    return response
\ No newline at end of file
+        ]
+
+    spare_parts = SparePart.objects.all().select_related('primary_supplier')
+    return export_response(export_format, 'spare_parts', headers, iter_rows(spare_parts, part_row),
+                           sheet_title='Spare Parts')
\ No newline at end of file
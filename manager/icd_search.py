@@ -0,0 +1,319 @@
+"""
+ICD-11 search engine used by the diagnosis autocomplete.
+
+The spreadsheet is parsed once into an ``ICDIndex`` holding:
+  * the codes in sorted order (prefix look-ups are a bisect),
+  * word indexes (sorted vocabulary -> posting lists) over the normalised
+    English and Arabic titles, for word-prefix matches,
+  * a trigram inverted index over that vocabulary for matches in the middle
+    of a word.
+
+The index is pickled next to the workbook and only rebuilt when the workbook's
+size or mtime changes, and nothing is loaded until the first search.
+"""
+
+import heapq
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+import zipfile
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+from pathlib import Path
+
+from django.conf import settings
+
+from core.text_normalization import normalize_arabic
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 1
+DEFAULT_LIMIT = 20
+
+_WORD_SPLIT = re.compile(r'[^\w]+')
+
+# Header names accepted for each column (compared case-insensitively)
+COLUMNS = {
+    'code': ('code',),
+    'title': ('title', 'title_en', 'english'),
+    'title_ar': ('arabic', 'title_ar', 'arabic title'),
+}
+
+
+def normalize(text):
+    """Casefold, strip Arabic diacritics/tatweel and unify alef/ta marbuta/ya forms"""
+    return ' '.join(normalize_arabic(str(text or '').casefold()).split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ICDIndex:
+    """
+    Immutable in-memory index over (code, title, title_ar) rows.
+
+    Entry ids are assigned in tie-break order (shorter title first, then code),
+    so within a match tier the best hits are simply the smallest ids and can be
+    read lazily off the merged, already-sorted posting lists.
+    """
+
+    def __init__(self, rows):
+        rows = {row[0]: row for row in rows if row[0]}.values()
+        rows = sorted(rows, key=lambda row: (len(row[1] or row[2]), row[0].upper()))
+        self.codes = [row[0] for row in rows]
+        self.titles = [row[1] for row in rows]
+        self.titles_ar = [row[2] for row in rows]
+        self.search_text = [normalize(f'{row[1]} {row[2]}') for row in rows]
+
+        by_code = sorted(range(len(rows)), key=lambda entry_id: self.codes[entry_id].upper())
+        self.code_keys = [self.codes[entry_id].upper() for entry_id in by_code]
+        self.code_ids = array('I', by_code)
+
+        first_words, words = {}, {}
+        for entry_id, row in enumerate(rows):
+            for title in row[1:3]:
+                title_words = [word for word in _WORD_SPLIT.split(normalize(title)) if word]
+                if title_words:
+                    _post(first_words, title_words[0], entry_id)
+                for word in title_words:
+                    _post(words, word, entry_id)
+        self.first_words = first_words
+        self.first_vocab = sorted(first_words)
+        self.words = words
+        self.vocab = sorted(words)
+
+        # trigram -> positions in vocab, for fragments in the middle of a word
+        grams = {}
+        for position, word in enumerate(self.vocab):
+            for gram in trigrams(word):
+                _post(grams, gram, position)
+        self.grams = grams
+
+    def __len__(self):
+        return len(self.codes)
+
+    # ───────────── candidate lookups ─────────────
+
+    def _code_matches(self, code_term, limit):
+        """(exact, prefix) code hits in code order"""
+        start = bisect_left(self.code_keys, code_term)
+        exact, prefix = [], []
+        for position in range(start, len(self.code_keys)):
+            key = self.code_keys[position]
+            if not key.startswith(code_term) or len(exact) + len(prefix) >= limit:
+                break
+            (exact if key == code_term else prefix).append(self.code_ids[position])
+        return exact + prefix
+
+    @staticmethod
+    def _prefixed(vocab, prefix):
+        start = bisect_left(vocab, prefix)
+        words = []
+        for position in range(start, len(vocab)):
+            if not vocab[position].startswith(prefix):
+                break
+            words.append(vocab[position])
+        return words
+
+    def _containing(self, fragment):
+        """Vocabulary words containing ``fragment`` (trigram intersection, then confirmed)"""
+        if len(fragment) < 3:
+            return self._prefixed(self.vocab, fragment)
+        grams = sorted(trigrams(fragment), key=lambda gram: len(self.grams.get(gram, ())))
+        if grams[0] not in self.grams:
+            return []
+        positions = set(self.grams[grams[0]])
+        for gram in grams[1:]:
+            positions.intersection_update(self.grams.get(gram, ()))
+        return [self.vocab[position] for position in positions if fragment in self.vocab[position]]
+
+    @staticmethod
+    def _merged(postings, words):
+        """Sorted, de-duplicated ids of the entries containing any of ``words``"""
+        return (entry_id for entry_id, _ in groupby(heapq.merge(*(postings[word] for word in words))))
+
+    def _phrase(self, term):
+        """Sorted ids whose text contains the multi-word ``term``"""
+        parts = term.split()
+        candidates = None
+        for part in sorted(parts, key=len, reverse=True):
+            ids = set(self._merged(self.words, self._containing(part)))
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return []
+        return sorted(entry_id for entry_id in candidates if term in self.search_text[entry_id])
+
+    # ───────────── ranking ─────────────
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """
+        Up to ``limit`` dicts {code, title, title_ar}, ranked by tier:
+        exact code, code prefix, title starts with the term, a title word starts
+        with it, anywhere in a title; shorter titles first within a tier.
+        """
+        term = normalize(query)
+        if not term:
+            return []
+
+        found = self._code_matches(term.upper().replace(' ', ''), limit)
+        seen = set(found)
+
+        def take(entry_ids):
+            for entry_id in entry_ids:
+                if len(found) >= limit:
+                    return
+                if entry_id not in seen:
+                    seen.add(entry_id)
+                    found.append(entry_id)
+
+        if ' ' not in term:
+            take(self._merged(self.first_words, self._prefixed(self.first_vocab, term)))
+            take(self._merged(self.words, self._prefixed(self.vocab, term)))
+            if len(found) < limit and len(term) >= 3:
+                take(self._merged(self.words, self._containing(term)))
+        elif len(found) < limit:
+            # phrases: the same tiers, read from the (sorted) phrase matches
+            padded = f' {term}'
+            tiers = ([], [], [])
+            for entry_id in self._phrase(term):
+                titles = (normalize(self.titles[entry_id]), normalize(self.titles_ar[entry_id]))
+                if any(title.startswith(term) for title in titles):
+                    tiers[0].append(entry_id)
+                    if len(tiers[0]) >= limit:
+                        break
+                elif padded in f' {self.search_text[entry_id]}':
+                    tiers[1].append(entry_id)
+                else:
+                    tiers[2].append(entry_id)
+            for tier in tiers:
+                take(tier)
+
+        return [
+            {'code': self.codes[entry_id], 'title': self.titles[entry_id], 'title_ar': self.titles_ar[entry_id]}
+            for entry_id in found
+        ]
+
+
+def _post(postings, key, entry_id):
+    """Append ``entry_id`` once; ids arrive in ascending order so lists stay sorted"""
+    ids = postings.get(key)
+    if ids is None:
+        postings[key] = array('I', (entry_id,))
+    elif ids[-1] != entry_id:
+        ids.append(entry_id)
+
+
+# ───────────── workbook / artifact handling ─────────────
+
+def source_path():
+    return Path(getattr(settings, 'ICD11_XLSX_PATH', Path(settings.BASE_DIR) / 'static' / 'icd11.xlsx'))
+
+
+def artifact_path():
+    path = getattr(settings, 'ICD11_INDEX_PATH', None)
+    return Path(path) if path else source_path().with_suffix('.index.pickle')
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return INDEX_FORMAT, stat.st_size, stat.st_mtime_ns
+
+
+def read_workbook(path):
+    """Yield (code, title, title_ar) rows from the first sheet"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell or '').strip().casefold() for cell in next(rows, ())]
+        positions = {}
+        for field, names in COLUMNS.items():
+            positions[field] = next((header.index(name) for name in names if name in header), None)
+        if positions['code'] is None:
+            raise ValueError(f'{path}: no "Code" column in header {header}')
+
+        def cell(row, field):
+            index = positions[field]
+            value = row[index] if index is not None and index < len(row) else None
+            return str(value).strip() if value is not None else ''
+
+        for row in rows:
+            yield cell(row, 'code'), cell(row, 'title'), cell(row, 'title_ar')
+    finally:
+        workbook.close()
+
+
+def build_index(path=None, artifact=None):
+    """Parse the workbook, write the pickle artifact and return the index"""
+    path = Path(path or source_path())
+    artifact = Path(artifact or artifact_path())
+    fingerprint = _fingerprint(path)
+    index = ICDIndex(read_workbook(path))
+
+    tmp = artifact.parent / f'{artifact.name}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as handle:
+            pickle.dump({'fingerprint': fingerprint, 'index': index}, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, artifact)
+    except OSError as exc:
+        # still usable for this process, it just gets rebuilt next start
+        logger.warning('[ICD-11] could not write %s: %s', artifact, exc)
+    return index
+
+
+def load_index(path=None, artifact=None):
+    """
+    Return the index for the workbook, reading the pickle when it is current
+    and rebuilding it otherwise. A missing or invalid workbook gives an empty index.
+    """
+    path = Path(path or source_path())
+    artifact = Path(artifact or artifact_path())
+    if not path.exists() or not zipfile.is_zipfile(path):
+        logger.warning('[ICD-11] %s is missing or not a valid .xlsx; autocomplete is empty', path)
+        return ICDIndex([])
+
+    try:
+        with open(artifact, 'rb') as handle:
+            payload = pickle.load(handle)
+        if payload.get('fingerprint') == _fingerprint(path):
+            return payload['index']
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, TypeError):
+        pass
+
+    started = time.perf_counter()
+    try:
+        index = build_index(path, artifact)
+    except Exception as exc:
+        logger.error('[ICD-11] could not index %s: %s', path, exc)
+        return ICDIndex([])
+    logger.info('[ICD-11] indexed %s codes in %.2fs', len(index), time.perf_counter() - started)
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide index, loaded on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load_index()
+    return _index
+
+
+def reset_index():
+    global _index
+    _index = None
+
+
+def search(query, limit=DEFAULT_LIMIT):
+    return get_index().search(query, limit=limit)
@@ -0,0 +1,60 @@
+"""
+Django management command to (re)build the ICD-11 autocomplete index
+Usage: python manage.py build_icd_index [--source path/to/icd11.xlsx] [--benchmark 1000]
+
+The index is rebuilt on demand anyway when the workbook changes; run this after
+deploying a new sheet so the first autocomplete request does not pay for it.
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from manager.icd_search import artifact_path, build_index, load_index, source_path
+
+
+class Command(BaseCommand):
+    help = 'Compile icd11.xlsx into the pickled ICD-11 search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=None, help='Workbook to index (default: settings.ICD11_XLSX_PATH)')
+        parser.add_argument('--benchmark', type=int, default=0, help='Time this many random queries afterwards')
+
+    def handle(self, *args, **options):
+        source = options['source'] or source_path()
+        started = time.perf_counter()
+        try:
+            index = build_index(source, artifact_path())
+        except Exception as exc:
+            raise CommandError(f'Could not index {source}: {exc}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index)} codes from {source} in {time.perf_counter() - started:.2f}s -> {artifact_path()}'
+        ))
+
+        started = time.perf_counter()
+        load_index(source, artifact_path())
+        self.stdout.write(f'Artifact load: {(time.perf_counter() - started) * 1000:.1f} ms')
+
+        if options['benchmark'] and len(index):
+            self._benchmark(index, options['benchmark'])
+
+    def _benchmark(self, index, count):
+        rng = random.Random(0)
+        queries = []
+        for _ in range(count):
+            entry_id = rng.randrange(len(index))
+            words = index.search_text[entry_id].split() or [index.codes[entry_id]]
+            word = rng.choice(words)
+            queries.append(rng.choice([index.codes[entry_id][:2], word[:3], word, word[1:5]]))
+
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{count} queries: median {timings[len(timings) // 2]:.3f} ms, '
+            f'p95 {timings[int(len(timings) * 0.95)]:.3f} ms, max {timings[-1]:.3f} ms'
+        )
@@ -3,7 +3,7 @@ from django.db.models.signals import post_save
 from django.dispatch          import receiver
 from django.utils             import timezone
 
-from .models import Patient, Department, Visit, Bed, Room
+from .models import Patient, Department, Visit
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import Department, SurgicalOperationsDepartment
@@ -60,53 +60,5 @@ def create_opd_visit(sender, instance, created, **kwargs):
     )
 
 
-# ───────────────────────────  AUTO QR FOR BEDS  ───────────────────────────
-@receiver(post_save, sender=Bed, dispatch_uid="bed_generate_qr_on_create")
-def bed_generate_qr_on_create(sender, instance, created, **kwargs):
-    """
-    Ensure every Bed has a QR code.
-    - On creation: generate immediately if missing.
-    - On update: backfill if qr_code/qr_token are missing.
-    """
-    # Avoid unnecessary second saves
-    needs_qr = (instance.qr_code is None or not getattr(instance.qr_code, "name", None) or not instance.qr_token)
-    if created and needs_qr:
-        try:
-            instance.generate_qr_code()
-            # save only the QR fields to avoid recursion/extra work
-            instance.save(update_fields=["qr_code", "qr_token"])
-        except Exception:
-            # Fail silently to not block bed creation; admins can regenerate via UI/API
-            pass
-    elif (not created) and needs_qr:
-        try:
-            instance.generate_qr_code()
-            instance.save(update_fields=["qr_code", "qr_token"])
-        except Exception:
-            pass
-
-
-# ───────────────────────────  AUTO QR FOR ROOMS  ───────────────────────────
-@receiver(post_save, sender=Room, dispatch_uid="room_generate_qr_on_create")
-def room_generate_qr_on_create(sender, instance, created, **kwargs):
-    """
-    Ensure every Room has a QR code.
-    - On creation: generate immediately if missing.
-    - On update: backfill if qr_code/qr_token are missing.
-    """
-    # Avoid unnecessary second saves
-    needs_qr = (instance.qr_code is None or not getattr(instance.qr_code, "name", None) or not instance.qr_token)
-    if created and needs_qr:
-        try:
-            instance.generate_qr_code()
-            # save only the QR fields to avoid recursion/extra work
-            instance.save(update_fields=["qr_code", "qr_token"])
-        except Exception:
-            # Fail silently to not block room creation; admins can regenerate via UI/API
-            pass
-    elif (not created) and needs_qr:
-        try:
-            instance.generate_qr_code()
-            instance.save(update_fields=["qr_code", "qr_token"])
-        except Exception:
-            pass
+# QR tokens for beds and rooms are assigned by maintenance.signals.generate_qr_code_on_save;
+# their images are rendered in batches by core.qr_render.
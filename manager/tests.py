@@ -1,3 +1,89 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import icd_search
+from .views import icd11_autocomplete
+
+ICD_ROWS = [
+    ("Code", "Title", "Arabic"),
+    ("BA00", "Essential hypertension", "ارتفاع ضغط الدم الأساسي"),
+    ("BA00.Z", "Essential hypertension, unspecified", "ارتفاع ضغط الدم الأساسي، غير محدد"),
+    ("BA01", "Hypertensive heart disease", "مرض القلب الناجم عن فرط ضغط الدم"),
+    ("DB10", "Appendicitis", "إلتهاب الزائدة الدودية"),
+    ("CA40", "Pneumonia", "الْتِهَابٌ رئوي"),
+    ("1A00", "Cholera", "الكوليرا"),
+]
+
+
+def write_workbook(path, rows):
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(path)
+
+
+class ICDSearchTest(SimpleTestCase):
+    """Prefix/trigram ICD-11 index and its pickled artifact"""
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.xlsx = self.tmp / "icd11.xlsx"
+        self.artifact = self.tmp / "icd11.index.pickle"
+        write_workbook(self.xlsx, ICD_ROWS)
+        self.index = icd_search.ICDIndex(icd_search.read_workbook(self.xlsx))
+
+    def codes(self, query, **kwargs):
+        return [hit["code"] for hit in self.index.search(query, **kwargs)]
+
+    def test_code_prefix_ranks_first(self):
+        self.assertEqual(self.codes("ba0"), ["BA00", "BA00.Z", "BA01"])
+        self.assertEqual(self.codes("BA00")[:2], ["BA00", "BA00.Z"])
+
+    def test_title_substring_and_word_prefix(self):
+        # title prefix beats a later word, then shorter titles first
+        self.assertEqual(self.codes("hypertens"), ["BA01", "BA00", "BA00.Z"])
+        self.assertEqual(self.codes("pendic"), ["DB10"])
+        self.assertEqual(self.codes("ch"), ["1A00"])
+        self.assertEqual(self.codes("xyz"), [])
+
+    def test_arabic_titles_are_normalised(self):
+        # hamza, ta marbuta and diacritics are ignored on both sides
+        self.assertEqual(set(self.codes("التهاب")), {"DB10", "CA40"})
+        self.assertEqual(self.codes("ضغط الدم", limit=1), ["BA00"])
+
+    def test_artifact_is_reused_until_workbook_changes(self):
+        icd_search.load_index(self.xlsx, self.artifact)
+        self.assertTrue(self.artifact.exists())
+
+        with mock.patch.object(icd_search, "read_workbook", side_effect=AssertionError("re-parsed")):
+            self.assertEqual(len(icd_search.load_index(self.xlsx, self.artifact)), 6)
+
+        write_workbook(self.xlsx, ICD_ROWS + [("XN00", "New code", "")])
+        os.utime(self.xlsx, ns=(0, os.stat(self.xlsx).st_mtime_ns + 10**9))
+        self.assertEqual(icd_search.load_index(self.xlsx, self.artifact).search("new")[0]["code"], "XN00")
+
+    def test_invalid_workbook_gives_empty_index(self):
+        empty = self.tmp / "empty.xlsx"
+        empty.write_bytes(b"")
+        self.assertEqual(icd_search.load_index(empty, self.artifact).search("ba"), [])
+
+    def test_autocomplete_view_loads_lazily(self):
+        icd_search.reset_index()
+        self.addCleanup(icd_search.reset_index)
+        with override_settings(ICD11_XLSX_PATH=self.xlsx, ICD11_INDEX_PATH=self.artifact):
+            self.assertIsNone(icd_search._index)
+            request = RequestFactory().get("/ajax/icd11-autocomplete/", {"term": "append"})
+            payload = json.loads(icd11_autocomplete(request).content)
+
+        self.assertEqual(payload[0]["value"], "DB10")
+        self.assertEqual(payload[0]["label"], "DB10 – Appendicitis")
+        self.assertEqual(payload[0]["title_ar"], "إلتهاب الزائدة الدودية")
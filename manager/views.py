@@ -20,6 +20,8 @@ from .models import Patient, MedicalRecord
 from django.db.models import Q
 
 from .models import PDFSettings 
+from .icd_search import search as icd_search
+from maintenance import search_index
 from . import views
 from .models import   TestOrder, TestResult
 
@@ -2481,57 +2483,17 @@ class FollowUpCreateView(LoginRequiredMixin, HospitalmanagerRequiredMixin, Creat
         messages.success(self.request, "Follow-up scheduled successfully.")
         return super().form_valid(form)
 
-ICD11_PATH = os.path.join(settings.BASE_DIR, "static", "icd11.xlsx")   # adjust if needed
-
-try:
-    import pandas as pd
-    _icd_df = (
-        pd.read_excel(ICD11_PATH, engine="openpyxl")[["Code", "Title"]]
-        .fillna("")
-        .astype(str)
-    )
-except Exception as exc:            # file missing or bad format
-    print(f"[ICD-11] could not load {ICD11_PATH}: {exc}")
-    import pandas as pd
-    _icd_df = pd.DataFrame(columns=["Code", "Title"])
-
-
 @require_GET
 def icd11_autocomplete(request):
     """
     jQuery‑UI style autocomplete end‑point.
-    GET parameter:  ?term=<typed_text>
-    Returns:    [ {"label": "BA00 – Essential hypertension", "value": "BA00"}, ... ]
+    GET parameter:  ?term=<typed_text>  (or ?q=)
+    Returns:    [ {"label": "BA00 – Essential hypertension", "value": "BA00", "code": ..., "title": ..., "title_ar": ...}, ... ]
     """
-    term = request.GET.get("term", "").strip().lower()
-    if not term or _icd_df.empty:
-        return JsonResponse([], safe=False)
-
-    # match codes that START with the term OR titles that CONTAIN the term
-    mask = (
-        _icd_df["Code"].str.lower().str.startswith(term)
-        | _icd_df["Title"].str.lower().str.contains(term)
-    )
-    subset = _icd_df[mask].head(20)          #  ‑‑ limit to 20 suggestions
-    suggestions = [
-        {"label": f"{row.Code} \u2013 {row.Title}", "value": row.Code}
-        for _, row in subset.iterrows()
-    ]
-    return JsonResponse(suggestions, safe=False)
-
-@require_GET
-def icd11_autocomplete(request):
-    term = request.GET.get("term", "").strip().lower()
-    if not term or _icd_df.empty:
-        return JsonResponse([], safe=False)
-    mask = (
-        _icd_df["Code"].str.lower().str.startswith(term)
-        | _icd_df["Title"].str.lower().str.contains(term)
-    )
-    subset = _icd_df[mask].head(20)
+    term = (request.GET.get("term") or request.GET.get("q") or "").strip()
     suggestions = [
-        {"label": f"{row.Code} – {row.Title}", "value": row.Code}
-        for _, row in subset.iterrows()
+        {"label": f"{hit['code']} \u2013 {hit['title'] or hit['title_ar']}", "value": hit["code"], **hit}
+        for hit in icd_search(term, limit=20)
     ]
     return JsonResponse(suggestions, safe=False)
 
@@ -3255,30 +3217,44 @@ def patient_dashboard(request, patient_id):
 def patient_search_api(request):
     """
     API for patient search autocomplete
+    Ranked matches from the unified search index (maintenance.search_index),
+    scoped to the user's hospital. ?q=...&page=1
     """
+    if not request.user.hospital_id:
+        # without a hospital the search would run across every hospital's patients
+        return JsonResponse({'patients': [], 'error': 'No hospital assigned to this user'}, status=403)
+
     query = request.GET.get('q', '').strip()
     if len(query) < 2:
         return JsonResponse({'patients': []})
-    
-    patients = Patient.objects.filter(
-        Q(first_name__icontains=query) |
-        Q(last_name__icontains=query) |
-        Q(mrn__icontains=query),
-        hospital=request.user.hospital
-    ).values(
-        'id', 'first_name', 'last_name', 'mrn', 'date_of_birth'
-    )[:20]
-    
+
+    page = request.GET.get('page', '1')
+    result = search_index.search(
+        query, entities=['patient'], hospital_id=request.user.hospital_id,
+        page=int(page) if page.isdigit() else 1,
+    )
+    hits = {hit['id']: hit for hit in result['hits']}
+    patients = Patient.objects.filter(pk__in=hits, hospital=request.user.hospital).in_bulk()
+
     patient_list = []
-    for p in patients:
+    for patient_id, hit in hits.items():
+        p = patients.get(patient_id)
+        if p is None:
+            continue
         patient_list.append({
-            'id': p['id'],
-            'name': f"{p['first_name']} {p['last_name']}",
-            'mrn': p['mrn'],
-            'dob': p['date_of_birth'].strftime('%Y-%m-%d') if p['date_of_birth'] else '',
-            'display': f"{p['first_name']} {p['last_name']} (MRN: {p['mrn']})"
+            'id': p.id,
+            'name': f"{p.first_name} {p.last_name}",
+            'mrn': p.mrn,
+            'dob': p.date_of_birth.strftime('%Y-%m-%d') if p.date_of_birth else '',
+            'display': f"{p.first_name} {p.last_name} (MRN: {p.mrn})",
+            'highlight': hit['title'],
         })
-    
-    return JsonResponse({'patients': patient_list})
+
+    return JsonResponse({
+        'patients': patient_list,
+        'count': result['count'],
+        'page': result['page'],
+        'num_pages': result['num_pages'],
+    })
 
     
\ No newline at end of file